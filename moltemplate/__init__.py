@@ -2,7 +2,8 @@ from .ttree import BasicUISettings, BasicUIParseArgs, EraseTemplateFiles, \
     StackableCommand, PopCommand, PopRightCommand, PopLeftCommand, \
     PushCommand, PushLeftCommand, PushRightCommand, ScopeCommand, \
     WriteVarBindingsFile, StaticObj, InstanceObj, ExtractFormattingCommands, \
-    BasicUI, ScopeBegin, ScopeEnd, WriteFileCommand, Render
+    BasicUI, ScopeBegin, ScopeEnd, WriteFileCommand, \
+    InstanceWriteFileCommand, Render
 
 from .ttree_lex import TtreeShlex, split, LineLex, SplitQuotedString, \
     EscCharStrToChar, SafelyEncodeString, RemoveOuterQuotes, MaxLenStr, \
@@ -10,13 +11,21 @@ from .ttree_lex import TtreeShlex, split, LineLex, SplitQuotedString, \
     VarRef, VarNPtr, VarBinding, SplitTemplate, SplitTemplateMulti, \
     TableFromTemplate, ExtractCatName, DeleteLinesWithBadVars, TemplateLexer
 
+from .ttree_assignments_index import AssignmentsIndex, \
+    WriteAssignmentsIndex, OpenAssignmentsIndex
+
+from .ttree_template_cache import TemplateCache, OpenTemplateCache
+
+from .dump_frame_index import DumpFrameIndex, ScanFrames, OpenDumpFrameIndex
+
 from .nbody_graph_search import Disconnected, NotUndirected, Edge, Vertex, \
      Dgraph, Ugraph, SortVertsByDegree, DFS, GraphMatcher 
 
 from .nbody_by_type_lib import GenInteractions_int, GenInteractions_str
 
 from .lttree import LttreeSettings, LttreeParseArgs, TransformAtomText, \
-    TransformEllipsoidText, AddAtomTypeComments, ExecCommands, WriteFiles
+    TransformEllipsoidText, AddAtomTypeComments, ExecCommands, WriteFiles, \
+    DataAtomsTable, PruneUnusedTypes
 
 from .lttree_styles import AtomStyle2ColNames, ColNames2AidAtypeMolid, \
     ColNames2Coords, ColNames2Vects, ColNames2Vects, data_atoms, data_masses
@@ -37,6 +46,7 @@ from .ttree_render import main
 from .ltemplify import main, Ltemplify
 from .dump2data import main
 from .raw2data import main
+from .read_coords import main, ReadCoords, CoordsSnapshot
 from .extract_lammps_data import main
 from .mol22lt import main, ConvertMol22Lt
 from .amber2lt import main, ConvertAmber2Lt, ConvertAmberSections2Lt, ConvertAtomDescr2Lt, ConvertMass2Lt, ConvertBond2Lt, ConvertAngle2Lt, ConvertDihedral2Lt, ConvertImproper2Lt, ConvertPair2Lt
@@ -44,9 +54,11 @@ from .genpoly_lt import main, GenPoly, GPSettings
 from .genpoly_modify_lt import main, GenPolyMod, GPModSettings, DistributePeriodic, DistributeRandom
 from .interpolate_curve import main, ResampleCurve, CalcNaturalCubicSplineCoeffs, SplineEval, SplineEvalD1, SplineEvalD2, SplineInterpEval, SplineInterpEvalD1, SplineInterpEvalD2, SplineCurvature2D, SplineInterpCurvature2D
 from .nbody_by_type import main
+from .lttree_pipeline import main, Pipeline
 
 __all__ = [# General modules for parsing and rendering text templates:
-           'ttree','ttree_lex','ttree_render',
+           'ttree','ttree_lex','ttree_render','ttree_assignments_index',
+           'ttree_template_cache',
            # General modules for handling force-fields:
            'nbody_graph_search','nbody_by_type_lib','nbody_by_type',
            'nbody_Angles','nbody_Bonds','nbody_Dihedrals','nbody_Impropers',
@@ -60,7 +72,8 @@ __all__ = [# General modules for parsing and rendering text templates:
            'pdbsort',
            # LAMMPS specific:
            'lttree','lttree_styles','lttree_check','lttree_postprocess',
-           'dump2data', 'raw2data',
+           'lttree_pipeline',
+           'dump2data', 'dump_frame_index', 'raw2data', 'read_coords',
            'extract_lammps_data',
            'ltemplify',
            'postprocess_coeffs','postprocess_input_script',
@@ -18,6 +18,12 @@ A reference DATA file is needed (argument).
 
    options:
 ./dump2data.py [-t t -atomstyle style] orig.data < dump.lammpstrj > new.data
+./dump2data.py [-multi -jobs n] orig.data -in dump.lammpstrj
+
+   (When the dump file is specified using "-in", an index of the snapshots in
+    the file is saved in "dump.lammpstrj.idx", so that the snapshots you want
+    can be found without reading the entire file.  See dump_frame_index.py.
+    Use "-no-index" to disable this.)
 
 """
 
@@ -28,8 +34,17 @@ g_date_str = '2022-1-06'
 g_version_str = '0.62.0'
 
 import sys
+import os
+import io
 from collections import defaultdict
 from operator import itemgetter, attrgetter
+import numpy as np
+
+try:
+    from .dump_frame_index import OpenDumpFrameIndex
+except (ImportError, SystemError, ValueError):
+    # not installed as a package
+    from dump_frame_index import OpenDumpFrameIndex
 
 
 class InputError(Exception):
@@ -62,6 +77,8 @@ class MiscSettings(object):
         self.mol_id_intervals = []
         self.scale = None
         self.in_coord_file_name = ''
+        self.use_frame_index = True
+        self.num_jobs = 1
 
 
 
@@ -565,6 +582,19 @@ def ParseArgs(argv,
             misc_settings.in_coord_file_name = argv[i+1]
             del(argv[i:i + 2])
 
+        elif (argv[i].lower() == '-no-index'):
+            misc_settings.use_frame_index = False
+            del(argv[i:i + 1])
+
+        elif (argv[i].lower() == '-jobs'):
+            if ((i + 1 >= len(argv)) or (not str.isdigit(argv[i + 1])) or
+                (int(argv[i + 1]) < 1)):
+                raise InputError('Error(dump2data): ' + argv[i] + ' flag should be followed by a positive integer\n'
+                                 '       indicating the number of processes to use when converting\n'
+                                 '       multiple snapshots from the dump file (trajectory).\n')
+            misc_settings.num_jobs = int(argv[i + 1])
+            del(argv[i:i + 2])
+
         elif ((argv[i][0] == '-') and (__name__ == "__main__")):
             raise InputError(
                 'Error(dump2data): Unrecogized command line argument \"' + argv[i] + '\"\n')
@@ -577,6 +607,7 @@ dump2data.py orig_file.data < dump.lammpstrj > new_file.data
       (This extracts last snapshot, uses "full" atom_style.)
     Additional options:
 dump2data.py -t t -atomstyle style orig.data < dump.lammpstrj > new.data
+dump2data.py -multi -jobs n orig.data -in dump.lammpstrj
 """
 
     # if __name__ == "__main__":
@@ -885,6 +916,11 @@ class SnapshotData(object):
     a single snapshot (a.k.a. frame, save-point), and store them in
     separate variables containing to the coordinates, atom types,
     molecule-ID numbers, etc... of the atoms at that moment in the simulation.
+    The information about the atoms is stored in columns (one entry per atom,
+    in the order they appear in the dump file).  Numeric data (coordinates,
+    velocities, image flags) are stored in (N,3) numpy arrays.  Other data
+    (atom-IDs, atom types, molecule-IDs) are stored in lists of strings.
+    The text for each column is only generated when the snapshot is written.
     """
     def __init__(self,
                  lines=[],
@@ -892,12 +928,15 @@ class SnapshotData(object):
                  data_settings=None):
 
         self.dump_column_names = []
-        self.coords = defaultdict(list)
-        self.coords_ixiyiz = defaultdict(list)
-        self.vects = defaultdict(list)
-        self.velocities = defaultdict(list)
-        self.atomtypes = defaultdict(list)
-        self.molids = defaultdict(list)
+        self.atomids = []
+        self.atomtypes = []
+        self.molids = None
+        self.coords = np.zeros((0, 3))
+        self.coords_text = None   # (only used if the coordinates are rounded)
+        self.coords_ixiyiz = None
+        self.velocities = np.zeros((0, 3))
+        self.vects = None
+        self.row_of_atomid = {}
         self.xlo_str = self.xhi_str = None
         self.ylo_str = self.yhi_str = None
         self.zlo_str = self.zhi_str = None
@@ -908,6 +947,11 @@ class SnapshotData(object):
         i_atomid = i_atomtype = i_molid = -1
         i_x = i_y = i_z = i_xu = i_yu = i_zu = -1
         i_xs = i_ys = i_zs = i_xsu = i_ysu = i_zsu = -1
+        avec = bvec = cvec = None
+        # The lines of text in the "ITEM: ATOMS" section are not parsed until
+        # the entire snapshot has been read (see _ParseAtoms()).
+        atom_lines = []
+        atom_columns = None
 
         for line in lines:
 
@@ -916,6 +960,9 @@ class SnapshotData(object):
             if (line.find('ITEM:') == 0):
                 section = line
                 if (section.find('ITEM: ATOMS ') == 0):
+                    if len(atom_lines) > 0:
+                        raise InputError('Error(dump2data): More than one \"ITEM: ATOMS\" section in the same snapshot.\n' +
+                                         '       (excerpt below)\n' + line)
                     self.dump_column_names = line[12:].split()
                     i_atomid, i_atomtype, i_molid = \
                         ColNames2AidAtypeMolid(self.dump_column_names)
@@ -988,6 +1035,18 @@ class SnapshotData(object):
                     if 'vz' in self.dump_column_names:
                         i_vz = self.dump_column_names.index('vz')
 
+                    atom_columns = (i_atomid, i_atomtype, i_molid,
+                                    (i_x, i_y, i_z),
+                                    (i_xu, i_yu, i_zu),
+                                    (i_xs, i_ys, i_zs),
+                                    (i_xsu, i_ysu, i_zsu),
+                                    (x_already_unwrapped,
+                                     y_already_unwrapped,
+                                     z_already_unwrapped),
+                                    (i_ix, i_iy, i_iz),
+                                    (i_vx, i_vy, i_vz),
+                                    ii_vects)
+
                 elif (section.find('ITEM: BOX BOUNDS') == 0):
                     avec = [1.0, 0.0, 0.0]
                     bvec = [0.0, 1.0, 0.0]
@@ -999,12 +1058,7 @@ class SnapshotData(object):
             elif ((len(line) > 0) and (line[0] != '#')):
                 if (section.find('ITEM: TIMESTEP') == 0):
                     self.timestep_str = line
-                    self.coords = defaultdict(list)
-                    self.coords_ixiyiz = defaultdict(list)
-                    self.vects = defaultdict(list)
-                    self.velocities = defaultdict(list)
-                    self.atomtypes = defaultdict(list)
-                    self.molids = defaultdict(list)
+                    atom_lines = []
                     self.xlo_str = self.xhi_str = None
                     self.ylo_str = self.yhi_str = None
                     self.zlo_str = self.zhi_str = None
@@ -1097,160 +1151,253 @@ class SnapshotData(object):
                             cvec = [xz, yz, zhi-zlo]
 
                 elif (section.find('ITEM: ATOMS') == 0):
-                    tokens = line.split()
-                    atomid = tokens[i_atomid]
-                    atomtype = tokens[i_atomtype]
-                    self.atomtypes[atomid] = atomtype
-                    if i_molid:
-                        molid = tokens[i_molid]
-                        self.molids[atomid] = molid
-
-                    if ((i_x != -1) and (i_y != -1) and (i_z != -1)):
-                        x = float(tokens[i_x])  # i_x determined above
-                        y = float(tokens[i_y])
-                        z = float(tokens[i_z])
-
-                    elif ((i_xu != -1) and (i_yu != -1) and (i_zu != -1)):
-                        x = float(tokens[i_xu])  # i_x determined above
-                        y = float(tokens[i_yu])
-                        z = float(tokens[i_zu])
-
-                    elif ((i_xs != -1) and (i_ys != -1) and (i_zs != -1)):
-                        xs = float(tokens[i_xs])  # i_xs determined above
-                        ys = float(tokens[i_ys])
-                        zs = float(tokens[i_zs])
-
-                        x = float(self.xlo_str) + xs * \
-                            avec[0] + ys * bvec[0] + zs * cvec[0]
-                        y = float(self.ylo_str) + xs * \
-                            avec[1] + ys * bvec[1] + zs * cvec[1]
-                        z = float(self.zlo_str) + xs * \
-                            avec[2] + ys * bvec[2] + zs * cvec[2]
-
-                    # avec, bvec, cvec described here:
-                    # https://lammps.sandia.gov/doc/Howto_triclinic.html
-
-                    elif ((i_xsu != -1) and (i_ysu != -1) and (i_zsu != -1)):
-                        xsu = float(tokens[i_xsu])  # i_xs determined above
-                        ysu = float(tokens[i_ysu])
-                        zsu = float(tokens[i_zsu])
-
-                        x = float(self.xlo_str) + xsu * \
-                            avec[0] + ysu * bvec[0] + zsu * cvec[0]
-                        y = float(self.ylo_str) + xsu * \
-                            avec[1] + ysu * bvec[1] + zsu * cvec[1]
-                        z = float(self.zlo_str) + xsu * \
-                            avec[2] + ysu * bvec[2] + zsu * cvec[2]
-
-                    # Now deal with ix, iy, iz
-                    if (i_ix != -1) and (not x_already_unwrapped):
-                        ix = int(tokens[i_ix])
-                        if (misc_settings.center_snapshot or
-                            (misc_settings.output_format != 'data')):
-                            #sys.stderr.write('atomid='+str(atomid)+', ix = '+str(ix)+', avec='+str(avec)+'\n')
-                            x += ix * avec[0]
-                            y += ix * avec[1]
-                            z += ix * avec[2]
-                        else:
-                            if atomid not in self.coords_ixiyiz:
-                                self.coords_ixiyiz[atomid] = ["0", "0", "0"]
-                            self.coords_ixiyiz[atomid][0] = str(ix)
-
-                    if (i_iy != -1) and (not y_already_unwrapped):
-                        iy = int(tokens[i_iy])
-                        if (misc_settings.center_snapshot or
-                            (misc_settings.output_format != 'data')):
-                            #sys.stderr.write('atomid='+str(atomid)+', iy = '+str(iy)+', bvec='+str(bvec)+'\n')
-                            x += iy * bvec[0]
-                            y += iy * bvec[1]
-                            z += iy * bvec[2]
-                        else:
-                            if atomid not in self.coords_ixiyiz:
-                                self.coords_ixiyiz[atomid] = ["0", "0", "0"]
-                            self.coords_ixiyiz[atomid][1] = str(iy)
-
-                    if (i_iz != -1) and (not z_already_unwrapped):
-                        iz = int(tokens[i_iz])
-                        if (misc_settings.center_snapshot or
-                            (misc_settings.output_format != 'data')):
-                            #sys.stderr.write('atomid='+str(atomid)+', iz = '+str(iz)+', cvec='+str(cvec)+'\n')
-                            x += iz * cvec[0]
-                            y += iz * cvec[1]
-                            z += iz * cvec[2]
-                        else:
-                            if atomid not in self.coords_ixiyiz:
-                                self.coords_ixiyiz[atomid] = ["0", "0", "0"]
-                            self.coords_ixiyiz[atomid][2] = str(iz)
-
-                    #self.coords[atomid] = [str(x), str(y), str(z)]
-                    self.coords[atomid] = [x, y, z]
-
-                    vx = 0.0
-                    vy = 0.0
-                    vz = 0.0
-                    if i_vx != -1:
-                        vx = float(tokens[i_vx])
-                    if i_vy != -1:
-                        vy = float(tokens[i_vy])
-                    if i_vz != -1:
-                        vz = float(tokens[i_vz])
-
-                    self.velocities[atomid] = [vx, vy, vz]
-
-                    # NOTE:
-                    # There can be multiple "vects" associated with each atom
-                    # (for example, dipole moments, ellipsoid directions, etc..)
-
-                    if atomid not in self.vects:
-                        self.vects[atomid] = [
-                            None for I in range(0, len(ii_vects))]
-
-                    for I in range(0, len(ii_vects)):
-                        i_vx = ii_vects[I][0]
-                        i_vy = ii_vects[I][1]
-                        i_vz = ii_vects[I][2]
-                        vx_str = tokens[i_vx]
-                        vy_str = tokens[i_vy]
-                        vz_str = tokens[i_vz]
-
-                        # Now the annoying part:
-                        # Which vect is it (mux,muy,muz) or (quati,quatj,quatk)?
-                        # The columns could be listed in a different order
-                        # in the data file and in the dump file.
-                        # Figure out which vector it is in the data file (stored
-                        # in the integer "I_data") so that column names match.
-                        name_vx = self.dump_column_names[i_vx]
-                        name_vy = self.dump_column_names[i_vy]
-                        name_vz = self.dump_column_names[i_vz]
-                        i_vx_data = 0
-                        I_data = -1
-                        # This code is dreadful and inneficient.
-                        # I never want to touch this code again. (Hope it
-                        # works)
-                        while i_vx_data < len(data_settings.column_names):
-                            if name_vx == data_settings.column_names[i_vx_data]:
-                                I_data = 0
-                                while I_data < len(data_settings.ii_vects):
-                                    if (self.dump_column_names[ii_vects[I][0]] ==
-                                        data_settings.column_names[data_settings.ii_vects[I_data][0]]):
-                                        # (This checks the first component, ([0]) I should also 
-                                        # check [1] and [2], but the code is slow enough already.
-                                        # THIS IS TERRIBLE CODE.
-                                        break
-                                    I_data += 1
-
-                            if (0 <= I_data) and (I_data < len(data_settings.ii_vects)):
-                                break
-
-                            i_vx_data += 1
-
-                        if (0 <= I_data) and (I_data < len(data_settings.ii_vects)):
-                            self.vects[atomid][I_data] = (vx_str,vy_str,vz_str)
-                        else:
-                            raise InputError('Error(dump2data): You have a vector coordinate in your dump file named \"' + name_vx + '\"\n'
-                                             '       However there are no columns with this name in your data file\n'
-                                             '       (or the column was not in the expected place).\n'
-                                             '       Hence, the atom styles in the dump and data files do not match.')
+                    atom_lines.append(line)
+
+        if len(atom_lines) > 0:
+            if atom_columns is None:
+                raise InputError('Error(dump2data): The \"ITEM: ATOMS\" section of the dump file\n'
+                                 '       does not specify the names of the columns.\n')
+            self._ParseAtoms(atom_lines, atom_columns, (avec, bvec, cvec),
+                             misc_settings, data_settings)
+
+
+    def _ParseAtoms(self,
+                    atom_lines,
+                    atom_columns,
+                    box_vects,
+                    misc_settings,
+                    data_settings):
+        """
+        Split the lines from the "ITEM: ATOMS" section into columns,
+        and convert them into the coordinates (and other information)
+        of each atom.  ("atom_columns" stores the location of each column.
+        "box_vects" stores the avec, bvec, cvec vectors of the unit cell.)
+        """
+        (i_atomid, i_atomtype, i_molid,
+         i_xyz, i_xyzu, i_xyzs, i_xyzsu, already_unwrapped,
+         i_ixiyiz, i_vxvyvz, ii_vects) = atom_columns
+        avec, bvec, cvec = box_vects
+
+        # Split the text into a table of strings (one row per atom)
+        num_rows = len(atom_lines)
+        num_cols = len(self.dump_column_names)
+        tokens = ' '.join(atom_lines).split()
+        if len(tokens) != num_rows * num_cols:
+            tokens = []
+            for line in atom_lines:
+                line_tokens = line.split()
+                if len(line_tokens) < num_cols:
+                    raise InputError('Error(dump2data): Missing columns in the \"ITEM: ATOMS\" section of the dump file.\n' +
+                                     '       (excerpt below)\n' + line)
+                tokens += line_tokens[:num_cols]
+        table = np.array(tokens, dtype=object).reshape(num_rows, num_cols)
+        del tokens
+
+        # If the same atom appears more than once, only the last one counts.
+        self.atomids = table[:, i_atomid].tolist()
+        self.row_of_atomid = dict(zip(self.atomids, range(0, num_rows)))
+        if len(self.row_of_atomid) != num_rows:
+            rows = np.array(list(self.row_of_atomid.values()), dtype=int)
+            table = table[rows]
+            self.atomids = list(self.row_of_atomid.keys())
+            self.row_of_atomid = dict(zip(self.atomids,
+                                          range(0, len(self.atomids))))
+
+        self.atomtypes = table[:, i_atomtype].tolist()
+        if i_molid != None:
+            self.molids = table[:, i_molid].tolist()
+
+        # Read the coordinates.  (Scaled coordinates are converted using
+        # avec, bvec, cvec described here:
+        # https://lammps.sandia.gov/doc/Howto_triclinic.html)
+        if -1 not in i_xyz:
+            xyz = [table[:, i].astype(float) for i in i_xyz]
+        elif -1 not in i_xyzu:
+            xyz = [table[:, i].astype(float) for i in i_xyzu]
+        elif ((-1 not in i_xyzs) or (-1 not in i_xyzsu)):
+            if -1 not in i_xyzs:
+                s = [table[:, i].astype(float) for i in i_xyzs]
+            else:
+                s = [table[:, i].astype(float) for i in i_xyzsu]
+            xyz = [float(self.xlo_str) +
+                   s[0] * avec[0] + s[1] * bvec[0] + s[2] * cvec[0],
+                   float(self.ylo_str) +
+                   s[0] * avec[1] + s[1] * bvec[1] + s[2] * cvec[1],
+                   float(self.zlo_str) +
+                   s[0] * avec[2] + s[1] * bvec[2] + s[2] * cvec[2]]
+        else:
+            raise InputError('Error(dump2data): \"ATOMS\" section of dump file has an inconsistent\n'
+                             '       set of \"x\", \"y\", \"z\" columns.\n')
+
+        # Now deal with ix, iy, iz
+        unwrap = (misc_settings.center_snapshot or
+                  (misc_settings.output_format != 'data'))
+        for d, cell_vect in enumerate((avec, bvec, cvec)):
+            if (i_ixiyiz[d] == -1) or already_unwrapped[d]:
+                continue
+            image = table[:, i_ixiyiz[d]].astype(int)
+            if unwrap:
+                xyz[0] = xyz[0] + image * cell_vect[0]
+                xyz[1] = xyz[1] + image * cell_vect[1]
+                xyz[2] = xyz[2] + image * cell_vect[2]
+            else:
+                if self.coords_ixiyiz is None:
+                    self.coords_ixiyiz = np.zeros((len(self.atomids), 3),
+                                                  dtype=int)
+                self.coords_ixiyiz[:, d] = image
+        self.coords = np.column_stack(xyz)
+
+        self.velocities = np.zeros((len(self.atomids), 3))
+        for d in range(0, 3):
+            if i_vxvyvz[d] != -1:
+                self.velocities[:, d] = table[:, i_vxvyvz[d]].astype(float)
+
+        # NOTE:
+        # There can be multiple "vects" associated with each atom
+        # (for example, dipole moments, ellipsoid directions, etc..)
+        # The columns could be listed in a different order in the data file
+        # and in the dump file.  Figure out which vect it is in the data
+        # file (stored in "I_data") so that the column names match.
+        # (The components of these vectors are stored as strings, in an
+        #  (N, number of vects, 3) array.)
+        self.vects = None
+        if len(ii_vects) > 0:
+            self.vects = np.full((len(self.atomids), len(ii_vects), 3), None,
+                                 dtype=object)
+        for I in range(0, len(ii_vects)):
+            name_vx = self.dump_column_names[ii_vects[I][0]]
+            I_data = 0
+            while I_data < len(data_settings.ii_vects):
+                if (name_vx ==
+                    data_settings.column_names[data_settings.ii_vects[I_data][0]]):
+                    break
+                I_data += 1
+            if I_data == len(data_settings.ii_vects):
+                raise InputError('Error(dump2data): You have a vector coordinate in your dump file named \"' + name_vx + '\"\n'
+                                 '       However there are no columns with this name in your data file\n'
+                                 '       (or the column was not in the expected place).\n'
+                                 '       Hence, the atom styles in the dump and data files do not match.')
+            self.vects[:, I_data, :] = table[:, ii_vects[I]]
+
+
+    def Scale(self, scale):
+        """ Multiply all of the coordinates by "scale". """
+        self.coords = self.coords * scale
+        self.coords_text = None
+
+
+    def Center(self):
+        """
+        Move the atoms so that their average position is at the origin.
+        (The resulting coordinates are rounded to 7 significant digits.)
+        """
+        if len(self.atomids) == 0:
+            return
+        # Add up the coordinates in order (as opposed to numpy.sum(), which
+        # adds them pairwise), so that the result does not depend on numpy.
+        cm = np.cumsum(np.vstack(([0.0, 0.0, 0.0], self.coords)),
+                       axis=0)[-1] / float(len(self.atomids))
+        text = ["%.7g" % x for x in (self.coords - cm).ravel().tolist()]
+        self.coords_text = np.array(text, dtype=object).reshape(-1, 3)
+        self.coords = self.coords_text.astype(float)
+        self.coords_ixiyiz = np.zeros((len(self.atomids), 3), dtype=int)
+
+
+    def CoordsText(self, scale=None):
+        """
+        Return an (N,3) array of strings containing the coordinates of the
+        atoms (multiplied by "scale", if specified).
+        """
+        if (self.coords_text is not None) and (scale is None):
+            return self.coords_text
+        coords = self.coords
+        if scale is not None:
+            coords = scale * coords
+        text = [str(x) for x in coords.ravel().tolist()]
+        return np.array(text, dtype=object).reshape(-1, 3)
+
+
+    def SelectedRows(self, misc_settings):
+        """
+        Return the rows (atoms) which were selected by the user (using the
+        -id, -type, and -mol arguments), sorted by (integer) atom-ID.
+        """
+        atomids = np.fromiter(map(int, self.atomids), dtype=np.int64,
+                              count=len(self.atomids))
+        selected = InIntervalUnionArray(atomids,
+                                        misc_settings.atom_id_intervals)
+        if len(misc_settings.atom_type_intervals) > 0:
+            atomtypes = np.fromiter(map(int, self.atomtypes), dtype=np.int64,
+                                    count=len(self.atomtypes))
+            selected &= InIntervalUnionArray(atomtypes,
+                                             misc_settings.atom_type_intervals)
+        if len(misc_settings.mol_id_intervals) > 0:
+            if self.molids is None:
+                raise InputError('Error(dump2data): Your trajectory file lacks molecule-id information.\n')
+            molids = np.fromiter(map(int, self.molids), dtype=np.int64,
+                                 count=len(self.molids))
+            selected &= InIntervalUnionArray(molids,
+                                             misc_settings.mol_id_intervals)
+        rows = np.argsort(atomids, kind='stable')
+        return rows[selected[rows]]
+
+
+    def AtomColumns(self):
+        """
+        Return the coordinates, image flags, vects, velocities, atom types,
+        and molecule-IDs of the atoms, as dictionary-like objects indexed by
+        atom-ID (which is what WriteSnapshotToData() expects).
+        """
+        coords = self.coords
+        if self.coords_text is not None:
+            coords = self.coords_text
+        return (AtomColumn(self.row_of_atomid, coords),
+                AtomColumn(self.row_of_atomid, self.coords_ixiyiz,
+                           lambda ixiyiz: [str(i) for i in ixiyiz]),
+                AtomColumn(self.row_of_atomid, self.vects,
+                           lambda vects: [tuple(vxvyvz)
+                                          if vxvyvz[0] is not None else None
+                                          for vxvyvz in vects]),
+                AtomColumn(self.row_of_atomid, self.velocities),
+                AtomColumn(self.row_of_atomid, self.atomtypes),
+                AtomColumn(self.row_of_atomid, self.molids))
+
+
+
+class AtomColumn(object):
+    """
+    A read-only dictionary-like view of one of the columns of a SnapshotData
+    object, indexed by atom-ID.  "column" is either a list, or a numpy array
+    (in which case each row is converted to a list).  If "column" is None,
+    the view is empty.  ("convert" is an optional function which is
+    applied to each result.)
+    """
+    def __init__(self, row_of_atomid, column, convert=None):
+        self.row_of_atomid = row_of_atomid
+        self.column = column
+        self.convert = convert
+        if column is None:
+            self.row_of_atomid = {}
+
+    def __len__(self):
+        return len(self.row_of_atomid)
+
+    def __contains__(self, atomid):
+        return atomid in self.row_of_atomid
+
+    def __getitem__(self, atomid):
+        i = self.row_of_atomid[atomid]
+        value = self.column[i]
+        if isinstance(self.column, np.ndarray):
+            value = value.tolist()
+        if self.convert:
+            value = self.convert(value)
+        return value
+
+    def get(self, atomid, default=None):
+        if atomid in self.row_of_atomid:
+            return self[atomid]
+        return default
 
 
 
@@ -1271,6 +1418,256 @@ def InIntervalUnion(i, intervals):
     return accept
 
 
+def InIntervalUnionArray(a, intervals):
+    """
+    A version of InIntervalUnion() which accepts a numpy array of integers
+    (and returns an array of bools).
+    """
+    accept = np.full(len(a), len(intervals) == 0)
+    for interval in intervals:
+        assert(len(interval) == 2)
+        if interval[1] == 0:
+            accept |= (interval[0] <= a)
+        else:
+            accept |= ((interval[0] <= a) & (a <= interval[1]))
+    return accept
+
+
+
+
+
+def SelectSnapshot(timestep_str, is_last, misc_settings):
+    """
+    Should we write the coordinates in this snapshot?
+    ("timestep_str" is the timestep of the snapshot, and "is_last" indicates
+     whether it is the last snapshot in the dump file.)
+    """
+    write_this_snapshot = False
+
+    if misc_settings.multi:
+
+        write_this_snapshot = True
+        if (misc_settings.tstart and
+            (int(timestep_str) < misc_settings.tstart)):
+            write_this_snapshot = False
+        if (misc_settings.tstop and
+            (int(timestep_str) > misc_settings.tstop)):
+            write_this_snapshot = False
+
+        if misc_settings.tstart:
+            tstart = misc_settings.tstart
+        else:
+            tstart = 0
+
+        if ((int(timestep_str) - tstart)
+                %
+            misc_settings.skip_interval) != 0:
+            write_this_snapshot = False
+
+    else:
+        if misc_settings.last_snapshot:
+            if is_last:
+                write_this_snapshot = True
+        else:
+            assert(misc_settings.timestep_str)
+            if (int(timestep_str) ==
+                int(misc_settings.timestep_str)):
+                write_this_snapshot = True
+
+    return write_this_snapshot
+
+
+
+def ConvertSnapshot(lines, num_snapshot, misc_settings, data_settings):
+    """
+    Parse the lines of text from a single snapshot in a dump file, and
+    convert them into the format requested by the user.  ("num_snapshot" is
+    the number of snapshots which have been selected so far, including this
+    one.  It is used to choose the name of the file when -multi is used.)
+    Returns the timestep of the snapshot, the name of the file that was
+    created (if any), and the text which should be printed to the stdout.
+    """
+
+    # Now parse the text in these lines
+
+    snapshot = SnapshotData(lines,
+                            misc_settings,
+                            data_settings)
+
+    # Check for consistency
+    if misc_settings.scale != None:
+        snapshot.Scale(misc_settings.scale)
+
+    if len(snapshot.atomids) != snapshot.natoms:
+        err_msg = 'Number of lines in \"ITEM: ATOMS\" section disagrees with\n' \
+            + '           \"ITEM: NUMBER OF ATOMS\" declared earlier in this file.\n'
+        raise InputError(err_msg)
+
+    # Additional processing needed?
+    if misc_settings.center_snapshot:
+        snapshot.Center()
+
+    # Now start writing the snapshot:
+    out_file = io.StringIO()
+    out_file_name = None
+
+    # Print the snapshot
+    # First check which format to output the data:
+    if misc_settings.output_format == 'raw':
+        # Print out the coordinates in simple 3-column text
+        # format.  Only write the atoms that were selected by the user.
+        # (I don't offer this feature for 'data' files because
+        #  it is harder to implement for this file type.)
+        rows = snapshot.SelectedRows(misc_settings)
+        # (Note: If misc_settings.scale != None, the coordinates are scaled
+        #  again when they are written.)
+        coords_text = snapshot.CoordsText(misc_settings.scale)[rows]
+        out_file.writelines([xyz[0] + ' ' + xyz[1] + ' ' + xyz[2] + '\n'
+                             for xyz in coords_text.tolist()])
+        out_file.write('\n')
+
+    elif ((misc_settings.output_format == 'xyz') or
+          (misc_settings.output_format == 'xyz-id') or
+          (misc_settings.output_format == 'xyz-mol') or
+          (misc_settings.output_format == 'xyz-type-mol')):
+            # Print out the coordinates in simple 3-column text
+            # format
+        out_file.write(str(len(snapshot.atomids)) + '\n')
+        descr_str = 'LAMMPS data from timestep ' + snapshot.timestep_str
+        out_file.write(descr_str + '\n')
+        rows = snapshot.SelectedRows(misc_settings)
+        coords_text = snapshot.CoordsText(misc_settings.scale)[rows]
+
+        if misc_settings.output_format == 'xyz':
+            first_columns = [snapshot.atomtypes[i] for i in rows]
+        elif misc_settings.output_format == 'xyz-id':
+            first_columns = [snapshot.atomids[i] for i in rows]
+        elif misc_settings.output_format == 'xyz-mol':
+            if snapshot.molids is None:
+                raise InputError('-xyz-mol ERROR: Your trajectory file lacks molecule-id information.\n')
+            first_columns = [snapshot.molids[i] for i in rows]
+        elif misc_settings.output_format == 'xyz-type-mol':
+            if snapshot.molids is None:
+                raise InputError('-xyz-type-mol ERROR: Your trajectory file lacks molecule-id information.\n')
+            first_columns = [snapshot.atomtypes[i] + '_' + snapshot.molids[i]
+                             for i in rows]
+        out_file.writelines([first_column + ' ' +
+                             xyz[0] + ' ' + xyz[1] + ' ' + xyz[2] + '\n'
+                             for first_column, xyz in
+                             zip(first_columns, coords_text.tolist())])
+
+    else:
+        # Parse the DATA file specified by the user
+        # and replace appropriate lines or fields with
+        # the corresponding text from the DUMP file.
+        descr_str = 'LAMMPS data from timestep ' + snapshot.timestep_str
+        if (misc_settings.multi and
+            (misc_settings.output_format == 'data')):
+            out_file_name = data_settings.file_name + '.'\
+                + str(num_snapshot)
+            out_file = open(out_file_name, 'w')
+
+        coords, coords_ixiyiz, vects, velocities, atomtypes, molids = \
+            snapshot.AtomColumns()
+        WriteSnapshotToData(out_file,
+                            descr_str,
+                            misc_settings,
+                            data_settings,
+                            snapshot.dump_column_names,
+                            snapshot.natoms,
+                            coords,
+                            coords_ixiyiz,
+                            vects,
+                            velocities,
+                            atomtypes,
+                            molids,
+                            snapshot.xlo_str, snapshot.xhi_str,
+                            snapshot.ylo_str, snapshot.yhi_str,
+                            snapshot.zlo_str, snapshot.zhi_str,
+                            snapshot.xy_str, snapshot.xz_str, snapshot.yz_str)
+
+        if (misc_settings.multi and
+            (misc_settings.output_format == 'data')):
+            out_file.close()
+            return snapshot.timestep_str, out_file_name, ''
+
+    return snapshot.timestep_str, out_file_name, out_file.getvalue()
+
+
+
+
+
+def WriteConvertedSnapshot(num_snapshot, converted):
+    """
+    Print the result of ConvertSnapshot() (and report what was done).
+    """
+    timestep_str, out_file_name, text = converted
+    sys.stderr.write('  (writing snapshot ' + str(num_snapshot) +
+                     ' at timestep ' + timestep_str + ')\n')
+    if out_file_name != None:
+        sys.stderr.write(
+            '  (creating file \"' + out_file_name + '\")\n')
+    sys.stdout.write(text)
+
+
+
+# variables shared with the processes created by ConvertFrames()
+g_convert_job = None
+
+
+def _ConvertFrame(job):
+    """
+    Convert a single snapshot (whose location in the dump file is stored
+    in "job").  (Invoked by ConvertFrames().)
+    """
+    num_snapshot, i_begin, i_end = job
+    text, misc_settings, data_settings = g_convert_job
+    lines = io.StringIO(text[i_begin:i_end].decode('utf-8'),
+                        newline=None).readlines()
+    return ConvertSnapshot(lines, num_snapshot, misc_settings, data_settings)
+
+
+def ConvertFrames(frames, selected, misc_settings, data_settings):
+    """
+    Convert the snapshots from the dump file whose locations are stored in
+    "frames" (a DumpFrameIndex), and whose indices are in the list "selected".
+    The snapshots are read directly from the file (skipping the others).
+    If misc_settings.num_jobs > 1, then the snapshots are converted by
+    separate processes (which are created using "fork"), however the
+    results are printed in the original order.
+    """
+    global g_convert_job
+    num_jobs = misc_settings.num_jobs
+    if hasattr(os, 'sched_getaffinity'):
+        num_jobs = min(num_jobs, len(os.sched_getaffinity(0)))
+    num_jobs = min(num_jobs, len(selected))
+    jobs = [(num_snapshot,) + frames.FrameRange(i)
+            for num_snapshot, i in enumerate(selected, 1)]
+    if num_jobs > 1:
+        try:
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            context = multiprocessing.get_context('fork')
+        except (ImportError, ValueError):
+            sys.stderr.write('Warning: Unable to create processes using \"fork\".\n'
+                             '         Running in a single process instead.\n')
+            num_jobs = 1
+    g_convert_job = (frames.text, misc_settings, data_settings)
+    try:
+        if num_jobs > 1:
+            sys.stdout.flush()
+            with ProcessPoolExecutor(max_workers=num_jobs,
+                                     mp_context=context) as executor:
+                for job, converted in zip(jobs,
+                                          executor.map(_ConvertFrame, jobs)):
+                    WriteConvertedSnapshot(job[0], converted)
+        else:
+            for job in jobs:
+                WriteConvertedSnapshot(job[0], _ConvertFrame(job))
+    finally:
+        g_convert_job = None
+
+
 
 
 
@@ -1298,265 +1695,85 @@ def main():
         # Store the x,y,z coordinates in the "coords" associative array
         # (indexed by atom id, which could be non-numeric in general).
 
-        section = ''
+        # If the dump file was specified using "-in", then use an index of
+        # the snapshots in the file to find the snapshots we want.
+        # (Otherwise, read the file one line at a time.)
+        frames = None
+        if ((misc_settings.in_coord_file_name != '') and
+            misc_settings.use_frame_index):
+            frames = OpenDumpFrameIndex(misc_settings.in_coord_file_name)
+
+        if frames != None:
+            try:
+                selected = [i for i in range(0, len(frames))
+                            if SelectSnapshot(frames.timesteps[i],
+                                              i == len(frames) - 1,
+                                              misc_settings)]
+                ConvertFrames(frames, selected, misc_settings, data_settings)
+            finally:
+                frames.Close()
 
-        num_snapshots_out = 0
-
-        if misc_settings.in_coord_file_name != '':
-            in_coord_file = open(misc_settings.in_coord_file_name)
         else:
-            in_coord_file = sys.stdin
-
-        # Skip to the first line containing 'ITEM: TIMESTEP'
-        end_of_file = False
-        while not end_of_file:
-            line = in_coord_file.readline()
-            if line == '':
-                end_of_file = True
-            elif line == 'ITEM: TIMESTEP\n':
-                break
-
+            section = ''
 
-        # lines_current_snapshot stores the lines of text that store
-        # information about the current snapshot.  Since we have read a line
-        # containing 'ITEM: TIMESTEP\n', we should add it to this text.
-        lines_current_snapshot = ['ITEM: TIMESTEP\n']
+            num_snapshots_out = 0
 
+            if misc_settings.in_coord_file_name != '':
+                in_coord_file = open(misc_settings.in_coord_file_name)
+            else:
+                in_coord_file = sys.stdin
 
-        # Now begin parsing the file:
-
-        while not end_of_file:
-
-            # Select the lines of text from the current snapshot
-            # (ie. frame, timestep)
-            timestep_str = ''
-            next_line_is_timestep = True
+            # Skip to the first line containing 'ITEM: TIMESTEP'
+            end_of_file = False
             while not end_of_file:
                 line = in_coord_file.readline()
                 if line == '':
                     end_of_file = True
                 elif line == 'ITEM: TIMESTEP\n':
                     break
-                else:
-                    if next_line_is_timestep:
-                        timestep_str = line.strip()
-                        next_line_is_timestep = False
-                    lines_current_snapshot.append(line)
 
-            # Should we write the coordinates in this snapshot?
-            write_this_snapshot = False
 
-            if misc_settings.multi:
+            # lines_current_snapshot stores the lines of text that store
+            # information about the current snapshot.  Since we have read a line
+            # containing 'ITEM: TIMESTEP\n', we should add it to this text.
+            lines_current_snapshot = ['ITEM: TIMESTEP\n']
 
-                write_this_snapshot = True
-                if (misc_settings.tstart and
-                    (int(timestep_str) < misc_settings.tstart)):
-                    write_this_snapshot = False
-                if (misc_settings.tstop and
-                    (int(timestep_str) > misc_settings.tstop)):
-                    write_this_snapshot = False
-
-                if misc_settings.tstart:
-                    tstart = misc_settings.tstart
-                else:
-                    tstart = 0
-
-                if ((int(timestep_str) - tstart)
-                        %
-                    misc_settings.skip_interval) != 0:
-                    write_this_snapshot = False
 
-            else:
-                if misc_settings.last_snapshot:
-                    if end_of_file:
-                        write_this_snapshot = True
-                else:
-                    assert(misc_settings.timestep_str)
-                    if (int(timestep_str) ==
-                        int(misc_settings.timestep_str)):
-                        write_this_snapshot = True
-
-            if write_this_snapshot:
-
-                # Now parse the text in these lines
-
-                snapshot = SnapshotData(lines_current_snapshot,
-                                        misc_settings,
-                                        data_settings)
-
-                # Check for consistency
-                if misc_settings.scale != None:
-                    for atomid in snapshot.coords:
-                        for d in range(0, 3):
-                            crd = float(snapshot.coords[atomid][d])
-                            snapshot.coords[atomid][d]=str(crd*misc_settings.scale)
-
-                if len(snapshot.coords) != snapshot.natoms:
-                    err_msg = 'Number of lines in \"ITEM: ATOMS\" section disagrees with\n' \
-                        + '           \"ITEM: NUMBER OF ATOMS\" declared earlier in this file.\n'
-                    raise InputError(err_msg)
-
-                num_snapshots_out += 1
-
-                # Additional processing needed?
-                if misc_settings.center_snapshot:
-                    cm = [0.0, 0.0, 0.0]
-                    for atomid in snapshot.coords:
-                        for d in range(0, 3):
-                            cm[d] += float(snapshot.coords[atomid][d])
-                    for d in range(0, 3):
-                        cm[d] /= float(len(snapshot.coords))
-                    for atomid in snapshot.coords:
-                        for d in range(0, 3):
-                            snapshot.coords[atomid][d] = "%.7g" % (
-                                float(snapshot.coords[atomid][d]) - cm[d])
-                        snapshot.coords_ixiyiz[atomid] = ["0", "0", "0"]
-                    if misc_settings.output_format != 'data':
-                        for atomid in snapshot.coords:
-                            snapshot.coords_ixiyiz[atomid] = ["0", "0", "0"]
-
-                # Now start writing the snapshot:
-                sys.stderr.write('  (writing snapshot ' + str(num_snapshots_out) +
-                                 ' at timestep ' + snapshot.timestep_str + ')\n')
-
-                # Print the snapshot
-                # First check which format to output the data:
-                if misc_settings.output_format == 'raw':
-                    # Print out the coordinates in simple 3-column text
-                    # format
-                    for atomid, xyz in iter(sorted(snapshot.coords.items(), key=GetIntAtomID)):
-                        # Check and see if whether the atom is one of the
-                        # atoms that was selected by the user.  If not discard.
-                        # (I don't offer this feature for 'data' files because
-                        #  it is harder to implement for this file type.)
-                        if not InIntervalUnion(int(atomid),
-                                misc_settings.atom_id_intervals):
-                            continue
-                        atype = snapshot.atomtypes[atomid]
-                        if not InIntervalUnion(int(atype),
-                                misc_settings.atom_type_intervals):
-                            continue
-                        molid = snapshot.molids[atomid]
-                        if not InIntervalUnion(int(molid),
-                                misc_settings.mol_id_intervals):
-                            continue
-
-                        # Write the coordinates
-                        if misc_settings.scale == None:
-                            sys.stdout.write(
-                                str(xyz[0]) + ' ' + str(xyz[1]) + ' ' + str(xyz[2]) + '\n')
-                        else:
-                            # Only convert to float and back if
-                            # misc_settings.scale != None
-                            sys.stdout.write(str(misc_settings.scale * float(xyz[0])) + ' ' +
-                                             str(misc_settings.scale * float(xyz[1])) + ' ' +
-                                             str(misc_settings.scale * float(xyz[2])) + '\n')
-                    sys.stdout.write('\n')
-
-                elif ((misc_settings.output_format == 'xyz') or
-                      (misc_settings.output_format == 'xyz-id') or
-                      (misc_settings.output_format == 'xyz-mol') or
-                      (misc_settings.output_format == 'xyz-type-mol')):
-                        # Print out the coordinates in simple 3-column text
-                        # format
-                    sys.stdout.write(str(len(snapshot.coords)) + '\n')
-                    descr_str = 'LAMMPS data from timestep ' + snapshot.timestep_str
-                    sys.stdout.write(descr_str + '\n')
-                    for atomid, xyz in iter(sorted(snapshot.coords.items(), key=GetIntAtomID)):
-
-                        # Check and see if whether the atom is one of the
-                        # atoms that was selected by the user. If not discard.
-                        if not InIntervalUnion(int(atomid),
-                                misc_settings.atom_id_intervals):
-                            continue
-                        atype = snapshot.atomtypes[atomid]
-                        if not InIntervalUnion(int(atype),
-                                misc_settings.atom_type_intervals):
-                            continue
-                        molid = snapshot.molids[atomid]
-                        if not InIntervalUnion(int(molid),
-                                misc_settings.mol_id_intervals):
-                            continue
-
-                        if ((misc_settings.output_format == 'xyz') or
-                            (misc_settings.output_format == 'xyz-type)')):
-                            atomtype = snapshot.atomtypes.get(atomid)
-                            if atomtype == None:
-                                raise InputError('xyz ERROR: Your trajectory file lacks atom-type information\n')
-                            first_column = str(atomtype)
-                        elif misc_settings.output_format == 'xyz-id':
-                            first_column = str(atomid)
-                        elif misc_settings.output_format == 'xyz-mol':
-                            molid = snapshot.molids.get(atomid)
-                            if molid == None:
-                                raise InputError('-xyz-mol ERROR: Your trajectory file lacks molecule-id information.\n')
-                            sys.stderr.write(str(molid)+'\n')
-                            first_column = str(molid)
-                        elif misc_settings.output_format == 'xyz-type-mol':
-                            atomtype = snapshot.atomtypes.get(atomid)
-                            if atomtype == None:
-                                raise InputError('xyz-type-mol ERROR: Your trajectory file lacks atom-type information.\n')
-                            molid = snapshot.molids.get(atomid)
-                            if molid == None:
-                                raise InputError('-xyz-type-mol ERROR: Your trajectory file lacks molecule-id information.\n')
-                            first_column = str(atomtype)+'_'+str(molid)
-                        if misc_settings.scale == None:
-                            sys.stdout.write(first_column + ' ' +
-                                             str(xyz[0]) + ' ' +
-                                             str(xyz[1]) + ' ' +
-                                             str(xyz[2]) + '\n')
-                        else:
-                            # Only convert to float and back if
-                            # misc_settings.scale != None
-                            sys.stdout.write(first_column + ' ' +
-                                             str(misc_settings.scale * float(xyz[0])) + ' ' +
-                                             str(misc_settings.scale * float(xyz[1])) + ' ' +
-                                             str(misc_settings.scale * float(xyz[2])) + '\n')
-
-                else:
-                    # Parse the DATA file specified by the user
-                    # and replace appropriate lines or fields with
-                    # the corresponding text from the DUMP file.
-                    descr_str = 'LAMMPS data from timestep ' + snapshot.timestep_str
-                    if (misc_settings.multi and
-                        (misc_settings.output_format == 'data')):
-                        out_file_name = data_settings.file_name + '.'\
-                            + str(num_snapshots_out)
-                        sys.stderr.write(
-                            '  (creating file \"' + out_file_name + '\")\n')
-                        out_file = open(out_file_name, 'w')
-                    else:
-                        out_file = sys.stdout
-
-                    WriteSnapshotToData(out_file,
-                                        descr_str,
-                                        misc_settings,
-                                        data_settings,
-                                        snapshot.dump_column_names,
-                                        snapshot.natoms,
-                                        snapshot.coords,
-                                        snapshot.coords_ixiyiz,
-                                        snapshot.vects,
-                                        snapshot.velocities,
-                                        snapshot.atomtypes,
-                                        snapshot.molids,
-                                        snapshot.xlo_str, snapshot.xhi_str,
-                                        snapshot.ylo_str, snapshot.yhi_str,
-                                        snapshot.zlo_str, snapshot.zhi_str,
-                                        snapshot.xy_str, snapshot.xz_str, snapshot.yz_str)
-
-                    if (misc_settings.multi and
-                        (misc_settings.output_format == 'data')):
-                        out_file.close()
-
-
-            # Clear the contents of lines_current_snapshot
-            # so that it is ready for the next snapshot.
-            lines_current_snapshot = ['ITEM: TIMESTEP\n']
-            # ('ITEM: TIMESTEP\n' is a line we read earlier)
+            # Now begin parsing the file:
 
-        if misc_settings.in_coord_file_name != '':
-            in_coord_file.close()
+            while not end_of_file:
+
+                # Select the lines of text from the current snapshot
+                # (ie. frame, timestep)
+                timestep_str = ''
+                next_line_is_timestep = True
+                while not end_of_file:
+                    line = in_coord_file.readline()
+                    if line == '':
+                        end_of_file = True
+                    elif line == 'ITEM: TIMESTEP\n':
+                        break
+                    else:
+                        if next_line_is_timestep:
+                            timestep_str = line.strip()
+                            next_line_is_timestep = False
+                        lines_current_snapshot.append(line)
+
+                if SelectSnapshot(timestep_str, end_of_file, misc_settings):
+                    num_snapshots_out += 1
+                    WriteConvertedSnapshot(num_snapshots_out,
+                                           ConvertSnapshot(lines_current_snapshot,
+                                                           num_snapshots_out,
+                                                           misc_settings,
+                                                           data_settings))
+
+                # Clear the contents of lines_current_snapshot
+                # so that it is ready for the next snapshot.
+                lines_current_snapshot = ['ITEM: TIMESTEP\n']
+                # ('ITEM: TIMESTEP\n' is a line we read earlier)
+
+            if misc_settings.in_coord_file_name != '':
+                in_coord_file.close()
 
         for warning_str in warning_strings:
             sys.stderr.write(warning_str + '\n')
@@ -0,0 +1,261 @@
+# Author: Andrew Jewett (jewett.aij at g mail)
+# License: MIT License  (See LICENSE.md)
+# Copyright (c) 2014
+# All rights reserved.
+
+"""
+A binary index for LAMMPS dump files (trajectories), so that programs
+which only need a few of the snapshots (such as dump2data.py) can jump
+directly to them, instead of reading every line of a (potentially huge) file.
+
+The index is stored in a separate file (by default, the name of the dump
+file followed by ".idx").  For every snapshot (a.k.a. frame) in the dump file,
+it stores the location (byte offset) where the snapshot begins (ie. the
+"ITEM: TIMESTEP" line), the timestep, and the number of atoms.
+
+The index also stores the size of the dump file when it was indexed,
+and checksums of the beginning and the end of the portion of the file that
+was indexed.  If the dump file has grown since then (for example, because
+the simulation is still running), only the new portion of the file is read,
+and the index is updated.  If the file was modified in any other way, the
+index is discarded and created again (see OpenDumpFrameIndex()).
+
+"""
+
+import os
+import sys
+import mmap
+import struct
+import zlib
+from array import array
+
+
+g_index_magic = b'DUMPIDX1'
+# header: magic, file size, crc32 (head), crc32 (tail), number of frames
+g_index_header = struct.Struct('<8sQQQQ')
+
+# The number of bytes at the beginning and end of the file to check
+g_checksum_size = 4096
+
+g_frame_marker = b'ITEM: TIMESTEP'
+g_natoms_marker = b'ITEM: NUMBER OF ATOMS'
+
+
+def _Checksum(text, i_begin, i_end):
+    return zlib.crc32(text[max(i_begin, 0):i_end]) & 0xffffffff
+
+
+def _AtLineStart(text, i):
+    return (i == 0) or (text[i - 1:i] in (b'\n', b'\r'))
+
+
+def _AtLineEnd(text, i):
+    return (i == len(text)) or (text[i:i + 1] in (b'\n', b'\r'))
+
+
+def _FindLine(text, marker, i_begin, i_end):
+    """
+    Return the location of the first line in text[i_begin:i_end] which
+    contains nothing other than "marker" (or -1 if there are none).
+
+    """
+    i = text.find(marker, i_begin, i_end)
+    while i != -1:
+        if (_AtLineStart(text, i) and
+            _AtLineEnd(text, i + len(marker))):
+            return i
+        i = text.find(marker, i + 1, i_end)
+    return -1
+
+
+def _NextLine(text, i, i_end):
+    """
+    Return the line following the line which begins at location i
+    (as well as the location where that line ends).
+
+    """
+    i = text.find(b'\n', i, i_end)
+    if i == -1:
+        return b'', i_end
+    j = text.find(b'\n', i + 1, i_end)
+    if j == -1:
+        j = i_end
+    return text[i + 1:j], j
+
+
+def ScanFrames(text, i_begin=0):
+    """
+    Generate (offset, timestep, natoms) tuples for each of the snapshots
+    in the dump file whose contents are "text" (a bytes or mmap object),
+    beginning at location i_begin (which should be at the start of a line).
+    If the "ITEM: NUMBER OF ATOMS" section is missing, natoms is -1.
+    (A ValueError is raised if a timestep is not an integer.)
+
+    """
+    size = len(text)
+    i = _FindLine(text, g_frame_marker, i_begin, size)
+    while i != -1:
+        timestep_str, i_line_end = _NextLine(text, i, size)
+        i_next = _FindLine(text, g_frame_marker, i_line_end, size)
+        i_end = i_next if i_next != -1 else size
+        natoms = -1
+        i_natoms = _FindLine(text, g_natoms_marker, i_line_end, i_end)
+        if i_natoms != -1:
+            natoms_str, i_line_end = _NextLine(text, i_natoms, i_end)
+            if natoms_str.strip():
+                natoms = int(natoms_str)
+        yield i, int(timestep_str), natoms
+        i = i_next
+
+
+class DumpFrameIndex(object):
+    """
+    The locations, timesteps, and number of atoms of every snapshot in a
+    LAMMPS dump file.  The text of each snapshot is read (using mmap)
+    on demand, by invoking FrameText().
+
+    """
+
+    def __init__(self, dump_filename, index_filename=None):
+        if index_filename is None:
+            index_filename = dump_filename + '.idx'
+        self.dump_filename = dump_filename
+        self.index_filename = index_filename
+        self.offsets = array('Q')
+        self.timesteps = array('q')
+        self.natoms = array('q')
+        self.size = 0
+        self.modified = False
+        self.f_dump = open(dump_filename, 'rb')
+        self.text = b''
+        try:
+            if os.fstat(self.f_dump.fileno()).st_size > 0:
+                self.text = mmap.mmap(self.f_dump.fileno(), 0,
+                                      access=mmap.ACCESS_READ)
+        except Exception:
+            self.Close()
+            raise
+
+    def Close(self):
+        if isinstance(self.text, mmap.mmap):
+            self.text.close()
+        self.text = b''
+        self.f_dump.close()
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def _HeadTailChecksums(self, size):
+        return (_Checksum(self.text, 0, min(size, g_checksum_size)),
+                _Checksum(self.text, size - g_checksum_size, size))
+
+    def Load(self):
+        """
+        Read the index file (if it exists).  Returns False if the index file
+        is missing, damaged, or does not match the dump file.
+        (In that case, the index is empty.)
+
+        """
+        try:
+            with open(self.index_filename, 'rb') as f:
+                header = f.read(g_index_header.size)
+                if len(header) != g_index_header.size:
+                    return False
+                (magic, size, crc_head, crc_tail,
+                 num_frames) = g_index_header.unpack(header)
+                if ((magic != g_index_magic) or
+                    (size > len(self.text)) or
+                    ((crc_head, crc_tail) != self._HeadTailChecksums(size))):
+                    return False
+                columns = (array('Q'), array('q'), array('q'))
+                for column in columns:
+                    column.fromfile(f, num_frames)
+                    if sys.byteorder != 'little':
+                        column.byteswap()
+        except (IOError, OSError, EOFError, struct.error):
+            return False
+        self.offsets, self.timesteps, self.natoms = columns
+        self.size = size
+        return True
+
+    def Update(self):
+        """
+        Index the portion of the dump file which has not been indexed yet.
+        (The last snapshot indexed earlier is read again, in case the
+         file was still being written at the time.)
+
+        """
+        if self.size == len(self.text):
+            return
+        i_begin = 0
+        if len(self.offsets) > 0:
+            i_begin = self.offsets.pop()
+            self.timesteps.pop()
+            self.natoms.pop()
+        for offset, timestep, natoms in ScanFrames(self.text, i_begin):
+            self.offsets.append(offset)
+            self.timesteps.append(timestep)
+            self.natoms.append(natoms)
+        self.size = len(self.text)
+        self.modified = True
+
+    def Save(self):
+        """ Write the index file (if anything has changed). """
+        if not self.modified:
+            return
+        crc_head, crc_tail = self._HeadTailChecksums(self.size)
+        tmp_filename = self.index_filename + '.' + str(os.getpid()) + '.tmp'
+        try:
+            with open(tmp_filename, 'wb') as f:
+                f.write(g_index_header.pack(g_index_magic, self.size,
+                                            crc_head, crc_tail,
+                                            len(self.offsets)))
+                for column in (self.offsets, self.timesteps, self.natoms):
+                    if sys.byteorder != 'little':
+                        column = array(column.typecode, column)
+                        column.byteswap()
+                    column.tofile(f)
+            os.replace(tmp_filename, self.index_filename)
+            self.modified = False
+        except (IOError, OSError):
+            # The index is optional.  Ignore read-only or full file systems.
+            try:
+                os.remove(tmp_filename)
+            except OSError:
+                pass
+
+    def FrameRange(self, i):
+        """ Return the location where the i'th snapshot begins and ends. """
+        i_end = self.size
+        if i + 1 < len(self.offsets):
+            i_end = self.offsets[i + 1]
+        return self.offsets[i], i_end
+
+    def FrameText(self, i):
+        """ Return the text of the i'th snapshot (as bytes). """
+        i_begin, i_end = self.FrameRange(i)
+        return self.text[i_begin:i_end]
+
+
+def OpenDumpFrameIndex(dump_filename, save=True):
+    """
+    Return a DumpFrameIndex for the file "dump_filename" which is up to date.
+    If an index file exists, it is read (and updated if the dump file has
+    grown since then).  Otherwise the dump file is indexed, and (if save=True)
+    a new index file is created.  Returns None if the dump file can not be
+    indexed (for example, if it contains a timestep which is not an integer).
+
+    """
+    try:
+        frames = DumpFrameIndex(dump_filename)
+    except (IOError, OSError, ValueError):
+        return None
+    try:
+        frames.Load()
+        frames.Update()
+    except ValueError:
+        frames.Close()
+        return None
+    if save:
+        frames.Save()
+    return frames
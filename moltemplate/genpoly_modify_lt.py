@@ -63,6 +63,206 @@ class InputError(Exception):
 
 
 
+class FreeSiteTree(object):
+    """
+    Keep track of the vacant sites in a 1-D lattice (the "occupancy" array,
+    a list of True,False values), so that we can quickly find the nearest
+    interval containing "width" consecutive vacant sites (FindNearest()).
+    The lattice is stored in a binary tree (a "segment tree").  Each node
+    in the tree stores the length of the longest run of vacant sites in the
+    range of sites it covers, as well as the number of vacant sites at the
+    beginning and at the end of that range.  This way, finding the nearest
+    interval (or occupying sites) takes O(log N) time, instead of O(N*width).
+    (For periodic lattices, the tree contains 2 copies of the lattice, so that
+     intervals which wrap around the end of the lattice are not interrupted.)
+    Usually, the target site itself is available.  So the tree is not built
+    (which takes O(N) time) until the first time it is needed.
+    """
+
+    def __init__(self,
+                 occupancy,            # an array of True,False values
+                 is_periodic=False):   # consider "wrap around" indexing?
+        self.occupancy = occupancy
+        self.is_periodic = is_periodic
+        self.size = 0    # number of leaves in the tree (a power of 2)
+        self.pref = None # number of vacant sites at the start of each node
+        self.suf = None  # number of vacant sites at the end of each node
+        self.best = None # longest run of vacant sites in each node
+
+    def _Pull(self, k, n):
+        """ Update node k from its children (each containing n sites). """
+        pref = self.pref
+        suf = self.suf
+        l = 2*k
+        r = l+1
+        if pref[l] < n:
+            pref[k] = pref[l]
+        else:
+            pref[k] = n + pref[r]
+        if suf[r] < n:
+            suf[k] = suf[r]
+        else:
+            suf[k] = n + suf[l]
+        self.best[k] = max(self.best[l], self.best[r], suf[l] + pref[r])
+
+    def _Build(self):
+        # The leaves of the tree are stored in [size, 2*size).  Node k has
+        # children 2*k and 2*k+1.  (The root is node 1.)  Leaves which are
+        # beyond the end of the lattice are considered to be occupied.
+        leaves = [0 if occupied else 1 for occupied in self.occupancy]
+        if self.is_periodic:
+            leaves = leaves + leaves
+        size = 1
+        while size < len(leaves):
+            size *= 2
+        leaves += [0 for i in range(len(leaves), size)]
+        self.size = size
+        pref = [0 for k in range(0, size)] + leaves
+        suf = list(pref)
+        best = list(pref)
+        # Now fill the tree, one level at a time (this is equivalent to
+        # invoking self._Pull(k, n) for every node, but faster).
+        n = 1
+        k_begin = size // 2
+        while k_begin > 0:
+            children = slice(2*k_begin, 4*k_begin, 2)
+            pref_l = pref[children]
+            suf_l = suf[children]
+            children = slice(2*k_begin+1, 4*k_begin, 2)
+            pref_r = pref[children]
+            suf_r = suf[children]
+            best_lr = map(max, best[2*k_begin:4*k_begin:2],
+                          best[2*k_begin+1:4*k_begin:2])
+            pref[k_begin:2*k_begin] = [l if l < n else n + r
+                                       for l, r in zip(pref_l, pref_r)]
+            suf[k_begin:2*k_begin] = [r if r < n else n + l
+                                      for l, r in zip(suf_l, suf_r)]
+            best[k_begin:2*k_begin] = [b if b > l + r else l + r
+                                       for b, l, r in zip(best_lr,
+                                                          suf_l, pref_r)]
+            n *= 2
+            k_begin //= 2
+        self.pref = pref
+        self.suf = suf
+        self.best = best
+
+    def _SetOccupied(self, i):
+        k = self.size + i
+        self.pref[k] = self.suf[k] = self.best[k] = 0
+        n = 1
+        k //= 2
+        while k > 0:
+            self._Pull(k, n)
+            n *= 2
+            k //= 2
+
+    def _First(self, k, lo, n, x, w, carry):
+        """
+        Find the first site p>=x (in node k, covering sites lo,...,lo+n-1),
+        such that sites p,...,p+w-1 are vacant.  "carry" is the number of
+        consecutive vacant sites (>=x) immediately before site lo.
+        Returns p (or -1), and the number of consecutive vacant sites (>=x)
+        immediately before site lo+n.
+        """
+        if lo + n <= x:
+            return -1, 0
+        if lo >= x:
+            if carry + self.pref[k] >= w:
+                return lo - carry, 0
+            if self.best[k] < w:
+                if self.pref[k] == n:
+                    return -1, carry + n
+                return -1, self.suf[k]
+        n //= 2
+        p, carry = self._First(2*k, lo, n, x, w, carry)
+        if p == -1:
+            p, carry = self._First(2*k+1, lo+n, n, x, w, carry)
+        return p, carry
+
+    def _Last(self, k, lo, n, y, w, carry):
+        """
+        Find the last site p (in node k, covering sites lo,...,lo+n-1),
+        such that sites p,...,p+w-1 are vacant, and p+w<=y.  "carry" is the
+        number of consecutive vacant sites (<y) immediately after site lo+n-1.
+        Returns p (or -1), and the number of consecutive vacant sites (<y)
+        beginning at site lo.
+        """
+        if lo >= y:
+            return -1, 0
+        if lo + n <= y:
+            if carry + self.suf[k] >= w:
+                return lo + n + carry - w, 0
+            if self.best[k] < w:
+                if self.suf[k] == n:
+                    return -1, carry + n
+                return -1, self.pref[k]
+        n //= 2
+        p, carry = self._Last(2*k+1, lo+n, n, y, w, carry)
+        if p == -1:
+            p, carry = self._Last(2*k, lo, n, y, w, carry)
+        return p, carry
+
+    def IsAvailable(self, i, width):
+        """ Are sites i, i+1, ..., i+width-1 all vacant? """
+        N = len(self.occupancy)
+        if (not self.is_periodic) and (i+width > N):
+            return False
+        for d in range(0, width):
+            if self.occupancy[(i+d) % N]:
+                return False
+        return True
+
+    def FindNearest(self,
+                    i,      # target index. look for a position closest to i
+                    width): # number of needed consecutive vacant sites
+        """
+        Look for an interval containing "width" vacant sites in the occupancy
+        array whose start is nearest to location i.  (If two intervals are
+        equally close, choose the one before i.)  Returns -1 if there are
+        none (within a distance of N/2, for periodic lattices).
+        """
+        N = len(self.occupancy)
+        if self.is_periodic:
+            j_stop = N // 2
+        else:
+            j_stop = max(-width+N-i, i)
+        if j_stop <= 0:
+            return -1
+        # Check and see if site i is available.
+        if (0 <= i) and (i < N) and self.IsAvailable(i, width):
+            return i
+        # If not, find the nearest available sites before and after site i.
+        if self.best is None:
+            self._Build()
+        w = max(width, 0)
+        if self.is_periodic:
+            w = min(w, N)
+        J = -1
+        if i >= 0:
+            p, carry = self._Last(1, 0, self.size, min(i, N-1)+w, w, 0)
+            if (p != -1) and (i - p < j_stop):
+                J = p
+        if i < N:
+            p, carry = self._First(1, 0, self.size, max(i, 0), w, 0)
+            if (p != -1) and (p < N) and (p - i < j_stop):
+                if (J == -1) or (p - i < i - J):
+                    J = p
+        return J
+
+    def Occupy(self, i, width):
+        """ Mark sites i, i+1, ..., i+width-1 as occupied. """
+        N = len(self.occupancy)
+        for d in range(0, width):
+            assert(self.occupancy[(i+d) % N] == False)
+            self.occupancy[(i+d) % N] = True
+            if self.best is not None:
+                self._SetOccupied((i+d) % N)
+                if self.is_periodic:
+                    self._SetOccupied((i+d) % N + N)
+
+
+
+
 def FindNearestAvailableSite(i, # target index. look for a position closest to i
                              width,  # number of needed consecutive vacant sites
                              occupancy,     # an array of True,False values
@@ -70,44 +270,9 @@ def FindNearestAvailableSite(i, # target index. look for a position closest to i
     """
     Look for an interval containing "width" vacant sites in the occupancy array
     (an array of True or False values) whose start is nearest to location i.
+    (If you need to do this many times, use a FreeSiteTree instead.)
     """
-    N = len(occupancy)
-    # Check and see if site i is available.  If not, skip to the next site,
-    # (either before or after this site).
-    if is_periodic:
-        j_stop = N // 2
-    else:
-        j_stop = max(-width+N-i, i)
-    occupied = True
-    for j in range(0, j_stop):
-        occupied = True
-        for s in (-1, 1):
-            if i+s*j < 0:
-                continue
-            if i+s*j >= N:
-                continue
-            # Is location "i+s*j" available for an object of size "width"?
-            # If so, all sites from [i+s*j, i+s*j+width) must not be occupied.
-            occupied = False
-            for d in range(0, width):
-                if not is_periodic:
-                    if i+s*j+d < 0:
-                        occupied = True
-                        continue
-                    if i+s*j+d >= N:
-                        occupied = True
-                        continue
-                if occupancy[(i+s*j+d) % N]:
-                    occupied = True
-                    break
-            if not occupied:
-                break
-        if not occupied:
-            break
-    if occupied:
-        return -1
-    else:
-        return i+s*j
+    return FreeSiteTree(occupancy, is_periodic).FindNearest(i, width)
 
 
 
@@ -137,6 +302,7 @@ def DistributePeriodic(widths,       # width of each object (>0)
         max_width = max(widths)
     N = len(occupancy)
     locations = [-1 for im in range(0, Nm)]
+    free_sites = FreeSiteTree(occupancy, is_periodic)
 
     if is_periodic:
         Nreduced = N
@@ -152,15 +318,13 @@ def DistributePeriodic(widths,       # width of each object (>0)
         i = offset + (N*im) // Nm  # next location?
         # If we didn't have to worry about occupancy, then we would de done now.
         # However if it is occupied, we have to find nearby unnoccupied sites:
-        J = FindNearestAvailableSite(i, widths[im], occupancy, is_periodic)
+        J = free_sites.FindNearest(i, widths[im])
         if J == -1:
             raise InputError('Error('+g_program_name+
                              '): Not enough available sites.\n')
         else:
             locations[im] = J
-            for d in range(0, widths[im]):
-                assert(occupancy[(J+d) % N] == False)
-                occupancy[(J+d) % N] = True
+            free_sites.Occupy(J, widths[im])
 
     for im in range(0, Nm):          # error check: make sure that we remembered
         assert(locations[im] != -1) # to specify all the entries in locations[]
@@ -237,6 +401,7 @@ def _DistributeRandom(widths,           # width of each object (>0)
     # Ir =  which position in the reduced size lattice are we considering?
     # I  =  which position in the full size lattice are we considering?
 
+    free_sites = FreeSiteTree(occupancy, is_periodic)
     i = 0
     for ir in range(0, Nreduced):
         im = occupancy_reduced[ir]
@@ -244,16 +409,11 @@ def _DistributeRandom(widths,           # width of each object (>0)
             # Then "i" is the target site (in the original lattice) for
             # the im'th object we want to place.  Figure out whether site "i"
             # is available.  If not, find the nearest available site.
-            J = FindNearestAvailableSite(i+offset,
-                                         widths[im],
-                                         occupancy,
-                                         is_periodic)
+            J = free_sites.FindNearest(i+offset, widths[im])
             if J == -1:
                 return None   #packing was unsuccessful during this attempt
             locations[im] = J
-            for d in range(0, widths[im]):
-                assert(occupancy[(J+d) % N] == False)
-                occupancy[(J+d) % N] = True
+            free_sites.Occupy(J, widths[im])
             i += widths[im]
         else:
             i += 1
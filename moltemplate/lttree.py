@@ -32,9 +32,16 @@ g_program_name = __file__.split('/')[-1]  # ='lttree.py'
 g_date_str = '2022-6-05'
 g_version_str = '0.80.4'
 
+# If "-check-syntax" was used, and an error occurred before the checks were
+# completed, then exit with this status.  (moltemplate.sh uses this status to
+# distinguish mistakes in the user's files from other errors.)
+g_check_syntax_exit_status = 3
+
 
 import os
 import sys
+import re
+import operator
 from collections import defaultdict
 
 try:
@@ -42,10 +49,11 @@ try:
         StackableCommand, PopCommand, PopRightCommand, PopLeftCommand, \
         PushCommand, PushLeftCommand, PushRightCommand, ScopeCommand, \
         WriteVarBindingsFile, StaticObj, InstanceObj, \
-        BasicUI, ScopeBegin, ScopeEnd, WriteFileCommand, Render
+        BasicUI, ScopeBegin, ScopeEnd, WriteFileCommand, \
+        InstanceWriteFileCommand, Render
     from .ttree_lex import InputError, TextBlock, DeleteLinesWithBadVars, \
         TemplateLexer, TableFromTemplate, VarRef, TextBlock, ErrorLeader, \
-        SplitQuotedString
+        SplitQuotedString, HasWildcard, HasRE, VarNameToRegex, MatchesPattern
     from .lttree_styles import AtomStyle2ColNames, ColNames2AidAtypeMolid, \
         ColNames2Coords, ColNames2Vects, \
         data_atoms, data_prefix, data_masses, \
@@ -61,14 +69,21 @@ try:
         data_boundary, data_pbc, data_prefix_no_space, in_init, in_settings, \
         in_prefix
     from .ttree_matrix_stack import AffineTransform, MultiAffineStack, \
-        LinTransform, Matrix2Quaternion, MultQuat
+        LinTransform, Matrix2Quaternion, MultQuat, AffineStack, \
+        AffineCompose, AffineInverse
+    from .ttree_assignments_index import WriteAssignmentsIndex
 except (ImportError, SystemError, ValueError):
     # not installed as a package
     from ttree import *
     from ttree_lex import *
     from lttree_styles import *
     from ttree_matrix_stack import *
+    from ttree_assignments_index import WriteAssignmentsIndex
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 
 try:
@@ -78,6 +93,16 @@ except NameError:
     basestring = unicode = str
 
 
+def _LttreeCheck():
+    """ Import the lttree_check module (when it is needed). """
+    try:
+        from . import lttree_check
+    except (ImportError, SystemError, ValueError):
+        # not installed as a package
+        import lttree_check
+    return lttree_check
+
+
 class LttreeSettings(BasicUISettings):
 
     def __init__(self,
@@ -95,6 +120,7 @@ class LttreeSettings(BasicUISettings):
         # The next 6 members store keep track of the different columns
         # of the "Data Atoms" section of a LAMMPS data file:
         self.column_names = []  # <--A list of column names (optional)
+        self.atom_style_specified = False # <--was "-atomstyle" used?
         self.ii_coords = []  # <--A list of triplets of column indexes storing coordinate data
         self.ii_vects = []  # <--A list of triplets of column indexes storing directional data
         #   (such as dipole or ellipsoid orientations)
@@ -102,7 +128,53 @@ class LttreeSettings(BasicUISettings):
         self.i_atomtype = None  # <--An integer indicating which column has the atomtype
         self.i_molid = None  # <--An integer indicating which column has the molid, if applicable
         self.print_full_atom_type_name_in_masses = False # <--how to print atom type names in the "Masses" section of a DATA file?
-
+        self.prune_unused_types = False # <--discard types not needed by "Data Atoms"?
+        self.render_jobs = 1 # <--number of processes used to render the files
+        self.index_assignments = False # <--index "ttree_assignments.txt"?
+        self.check_syntax = False # <--check for common mistakes? (see lttree_check.py)
+        self.syntax_checked = False # <--have those checks been completed?
+        self.allow_wildcards = True # <--allow "*" or "?" in *_coeff commands?
+
+    def CheckParsedTree(self, static_tree_root):
+        if self.check_syntax:
+            CheckSyntaxCheapTree = _LttreeCheck().CheckSyntaxCheapTree
+            CheckSyntaxCheapTree(static_tree_root)
+
+    def CheckStaticTree(self, static_tree_root, replace_var_pairs):
+        if self.check_syntax:
+            sys.stderr.write(' done\nchecking for common mistakes...')
+            CheckStaticTree = _LttreeCheck().CheckStaticTree
+            # (The "Data Atoms" columns are only checked if the user
+            #  specified the atom_style.  Otherwise "full" is just a guess.)
+            column_names = []
+            if self.atom_style_specified:
+                column_names = self.column_names
+            CheckStaticTree(static_tree_root,
+                            replace_var_pairs,
+                            column_names,
+                            self.allow_wildcards)
+        self.syntax_checked = True
+
+    def ErrorExitStatus(self):
+        """
+        The exit status to use if an error occurs.  (This is
+        g_check_syntax_exit_status if the error was found while reading or
+        checking the files with "-check-syntax", and -1 otherwise.)
+
+        """
+        if self.check_syntax and not self.syntax_checked:
+            return g_check_syntax_exit_status
+        return -1
+
+    def PruneVars(self,
+                  static_tree_root,
+                  instance_tree_root,
+                  static_commands,
+                  instance_commands):
+        if self.prune_unused_types:
+            PruneUnusedTypes(static_tree_root,
+                             static_commands,
+                             instance_commands)
 
 
 
@@ -132,6 +204,7 @@ def LttreeParseArgs(argv, settings, main=False, show_warnings=True):
                                  '       atom_style name (or single quoted string containing a space-separated\n'
                                  '       list of column names such as: atom-ID atom-type q x y z molecule-ID.)\n')
             settings.column_names = AtomStyle2ColNames(argv[i + 1])
+            settings.atom_style_specified = True
             sys.stderr.write('\n    \"' + data_atoms + '\" column format:\n')
             sys.stderr.write(
                 '    ' + (' '.join(settings.column_names)) + '\n\n')
@@ -220,6 +293,35 @@ def LttreeParseArgs(argv, settings, main=False, show_warnings=True):
             settings.print_full_atom_type_name_in_masses = False
             del(argv[i:i + 1])
 
+        elif (argv[i].lower() == '-prune-unused-types'):
+            settings.prune_unused_types = True
+            del(argv[i:i + 1])
+
+        elif (argv[i].lower() == '-check-syntax'):
+            settings.check_syntax = True
+            del(argv[i:i + 1])
+
+        elif (argv[i].lower() == '-index-assignments'):
+            settings.index_assignments = True
+            del(argv[i:i + 1])
+
+        elif argv[i].lower() in ('-allow-wildcards', '-allowwildcards'):
+            settings.allow_wildcards = True
+            del(argv[i:i + 1])
+
+        elif argv[i].lower() in ('-forbid-wildcards', '-forbidwildcards'):
+            settings.allow_wildcards = False
+            del(argv[i:i + 1])
+
+        elif (argv[i].lower() == '-render-jobs'):
+            if ((i + 1 >= len(argv)) or
+                (not str.isdigit(argv[i + 1])) or
+                (int(argv[i + 1]) < 1)):
+                raise InputError('Error: ' + argv[i] + ' flag should be followed by a positive integer\n'
+                                 '       (the number of processes to use).\n')
+            settings.render_jobs = int(argv[i + 1])
+            del(argv[i:i + 2])
+
         elif (argv[i].find('-') == 0) and main:
             # elif (__name__ == "__main__"):
             raise InputError('Error(' + g_program_name + '):\n'
@@ -304,67 +406,445 @@ def LttreeParseArgs(argv, settings, main=False, show_warnings=True):
     return
 
 
-def TransformAtomText(text, matrix, settings):
+# The categories of the (static) variables which PruneUnusedTypes() discards
+g_prunable_categories = ('atom', 'bond', 'angle', 'dihedral', 'improper')
+
+
+def _TemplateLineVarRefs(tmpl_list):
+    """ Split a template into lines, and return a list of the VarRefs
+    (for @variables) which appear on each line, as well as the first two
+    words on each line (variables are represented by the word "@"). """
+    lines = [[]]
+    words = [[]]
+    for entry in tmpl_list:
+        if isinstance(entry, VarRef):
+            if entry.prefix[:1] == '@':
+                lines[-1].append(entry)
+            if len(words[-1]) < 2:
+                words[-1].append('@')
+        else:
+            text_lines = entry.text.split('\n')
+            for i in range(0, len(text_lines)):
+                if i > 0:
+                    lines.append([])
+                    words.append([])
+                if len(words[-1]) < 2:
+                    words[-1] += text_lines[i].split()[:2]
+    return lines, words
+
+
+def _IsPerTypeLine(filename, words):
+    """
+    Is this line only useful if the types it refers to are in use?
+    That is true for the lines in the "By Type" sections (the rules used to
+    generate bonded interactions), the "Data Masses" and "Data ... Coeffs"
+    sections, and for commands in the "In" files which set the properties of
+    a type (the "*_coeff", "mass", and "set type" commands).
+    Other commands (for example "group" or "fix shake" commands)
+    are not per-type lines.  (Comments are also considered per-type lines.)
+
+    """
+    if (filename.startswith((data_bonds_by_type,
+                             data_angles_by_type,
+                             data_dihedrals_by_type,
+                             data_impropers_by_type)) or
+        (filename == data_masses) or
+        (filename.startswith(data_prefix) and filename.endswith(' Coeffs'))):
+        return True
+    if len(words) == 0:
+        return True
+    return (words[0].endswith('_coeff') or
+            (words[0] == 'mass') or
+            (words[0][:1] == '#') or
+            ((words[0] == 'set') and (words[1:2] == ['type'])))
+
+
+def _FullName(var_ref):
+    # (Note: var_ref.binding is not updated by ReplaceVars(). Use nptr instead.)
+    nptr = var_ref.nptr
+    return nptr.cat_node.categories[nptr.cat_name].bindings[nptr.leaf_node].full_name
+
+
+def PruneUnusedTypes(static_tree_root, static_commands, instance_commands):
+    """
+    Delete the @atom, @bond, @angle, @dihedral, and @improper types which can
+    not possibly appear in the system.  Force-field files typically define
+    thousands of types, only a few of which are used in a given simulation.
+    The atom types in use are the ones which appear in the "Data Atoms"
+    section.  The other types in use are either referenced directly (for
+    example in the "Data Bonds" section of a molecule), or they are
+    generated by a rule in one of the "By Type" sections (such as
+    "Data Angles By Type") whose atom types (and bond types) match types
+    which are in use.  Types which appear in any other command in the input
+    script (such as a "group" or "fix shake" command) are also kept.
+    (See _IsPerTypeLine().)  Everything else is marked as deleted, so it will
+    not be assigned a number, and the per-type lines in the templates
+    referring to it (the "pair_coeff", "mass", and "set type" commands, and
+    the lines in the "Data Masses" and "By Type" sections) are discarded.
+    (Wildcard and regex patterns are never deleted.)
+
+    """
+    used = set([])                  # leaf nodes of the types in use
+    used_names = defaultdict(list)  # cat_name -> full names of those types
+
+    def Use(var_ref):
+        leaf_node = var_ref.nptr.leaf_node
+        if leaf_node not in used:
+            used.add(leaf_node)
+            used_names[var_ref.nptr.cat_name].append(_FullName(var_ref))
+
+    # The atom types in use:
+    for command in static_commands + instance_commands:
+        if (isinstance(command, WriteFileCommand) and
+            (command.filename == data_atoms)):
+            for entry in command.tmpl_list:
+                if (isinstance(entry, VarRef) and
+                    (entry.prefix[:1] == '@') and
+                    (entry.nptr.cat_name == 'atom')):
+                    Use(entry)
+
+    # Types which are referred to explicitly by molecules (instances):
+    for command in instance_commands:
+        if (isinstance(command, WriteFileCommand) and
+            (command.filename != data_atoms)):
+            for entry in command.tmpl_list:
+                if (isinstance(entry, VarRef) and
+                    (entry.prefix[:1] == '@') and
+                    (entry.nptr.cat_name != 'atom')):
+                    Use(entry)
+
+    # Types generated by "By Type" rules which match the types in use.
+    # (Bonds are handled first, since the other rules may refer to bond types.)
+    patterns = {}   # (compiled regular expressions)
+
+    def IsInUse(var_ref):
+        full_name = _FullName(var_ref)
+        if HasRE(full_name):
+            if full_name not in patterns:
+                patterns[full_name] = re.compile(VarNameToRegex(full_name))
+            pattern = patterns[full_name]
+        elif HasWildcard(full_name):
+            pattern = full_name
+        else:
+            return var_ref.nptr.leaf_node in used
+        for name in used_names[var_ref.nptr.cat_name]:
+            if MatchesPattern(name, pattern):
+                return True
+        return False
+
+    by_type_commands = [command for command in static_commands
+                        if (isinstance(command, WriteFileCommand) and
+                            command.filename.startswith((data_bonds_by_type,
+                                                         data_angles_by_type,
+                                                         data_dihedrals_by_type,
+                                                         data_impropers_by_type)))]
+    by_type_commands.sort(
+        key=lambda command: not command.filename.startswith(data_bonds_by_type))
+    for command in by_type_commands:
+        for var_refs in _TemplateLineVarRefs(command.tmpl_list)[0]:
+            if ((len(var_refs) > 0) and
+                all([IsInUse(var_ref) for var_ref in var_refs[1:]])):
+                Use(var_refs[0])
+
+    # Types which are referred to by any other commands (such as "group"
+    # or "fix shake" commands in the "In Settings" section) must be kept.
+    # (But they do not need to be considered when applying the "By Type"
+    #  rules, because there are no atoms or bonds of those types.)
+    for command in static_commands + instance_commands:
+        if (isinstance(command, WriteFileCommand) and
+            (command.filename != data_atoms)):
+            lines, words = _TemplateLineVarRefs(command.tmpl_list)
+            for i in range(0, len(lines)):
+                if not _IsPerTypeLine(command.filename, words[i]):
+                    for var_ref in lines[i]:
+                        if var_ref.nptr.cat_name in g_prunable_categories:
+                            Use(var_ref)
+
+    # Delete everything else
+    num_deleted = 0
+    node_stack = [static_tree_root]
+    while len(node_stack) > 0:
+        node = node_stack.pop()
+        node_stack.extend(node.children.values())
+        if not hasattr(node, 'categories'):
+            continue
+        for cat_name in g_prunable_categories:
+            if cat_name not in node.categories:
+                continue
+            for leaf_node, var_binding in node.categories[cat_name].bindings.items():
+                if ((leaf_node in used) or
+                    (not isinstance(leaf_node, StaticObj)) or
+                    (leaf_node.name[:9] == '__query__') or
+                    HasWildcard(var_binding.full_name) or
+                    HasRE(var_binding.full_name) or
+                    # (Leave class definitions alone.)
+                    (leaf_node.srcloc_begin is not None) or
+                    (len(leaf_node.children) > 0)):
+                    continue
+                leaf_node.deleted = True
+                num_deleted += 1
+
+    # Now discard the lines in the templates which refer to deleted types.
+    # (These are all per-type lines.  See _IsPerTypeLine().)
+    # (We do this now, instead of leaving it to DeleteLinesWithBadVars(),
+    #  because DeleteLinesWithBadVars() would also delete the first variable
+    #  on each of these lines, which might be a type that is still in use.)
+    for command in static_commands + instance_commands:
+        if (isinstance(command, WriteFileCommand) and
+            any([(isinstance(entry, VarRef) and
+                  entry.nptr.leaf_node.IsDeleted())
+                 for entry in command.tmpl_list])):
+            # (Note: This gives instances their own copy of the template.
+            #  See InstanceWriteFileCommand in ttree.py)
+            command.tmpl_list = \
+                _DeleteLinesWithDeletedVars(command.tmpl_list)
+
+    sys.stderr.write('  (discarded ' + str(num_deleted) +
+                     ' unused types)\n')
+    return num_deleted
+
+
+def _DeleteLinesWithDeletedVars(tmpl_list):
+    """ Return a copy of a template without the lines which refer to deleted
+    variables (without deleting any other variables). """
+    new_tmpl_list = []
+    line = []
+    line_deleted = False
+    for entry in tmpl_list:
+        if isinstance(entry, VarRef):
+            line.append(entry)
+            if entry.nptr.leaf_node.IsDeleted():
+                line_deleted = True
+            continue
+        text = entry.text
+        i_newline = text.find('\n')
+        while i_newline != -1:
+            if not line_deleted:
+                line.append(TextBlock(text[:i_newline + 1], entry.srcloc))
+                new_tmpl_list += line
+            line = []
+            line_deleted = False
+            text = text[i_newline + 1:]
+            i_newline = text.find('\n')
+        if len(text) > 0:
+            line.append(TextBlock(text, entry.srcloc))
+    if not line_deleted:
+        new_tmpl_list += line
+    return new_tmpl_list
+
+
+class DataAtomsTable(object):
+    """ The contents of (a portion of) the \"Data Atoms\" section of a
+    LAMMPS data file, split into lines and columns.  The atomic coordinates
+    (and other vectors, like dipole moments) are stored in (N,3) arrays
+    (one array for each triplet of columns in settings.ii_coords and
+    settings.ii_vects), so that coordinate transformations can be applied to
+    all of the atoms at once.  The text is only regenerated when Text() is
+    invoked.  (If numpy is not available, or if there are only a few atoms,
+    lists of lists are used instead.)
+    If read_coords=False, the coordinates are not read.  (This is used for
+    the ".template" version of the same text.  See Text().)
+
+    """
+
+    def __init__(self, text, settings, read_coords=True):
+        self.settings = settings
+        self.rows = []       # each line, split into columns
+        self.comments = []   # the comment (if any) at the end of each line
+        irows = []           # which lines contain atoms?
+        for line_orig in text.split('\n'):
+            ic = line_orig.find('#')
+            if ic != -1:
+                line = line_orig[:ic]
+                comment = ' ' + line_orig[ic:].rstrip('\n')
+            else:
+                line = line_orig.rstrip('\n')
+                comment = ''
+
+            # Split the line into words (columns) using whitespace delimeters
+            columns = SplitQuotedString(line,
+                                        quotes='{',
+                                        endquote='}')
+
+            if len(columns) > 0:
+                if len(columns) == len(settings.column_names) + 3:
+                    raise InputError('Error: lttree.py does not yet support integer unit-cell counters \n'
+                                     '   within the \"' + data_atoms + '\" section of a LAMMPS data file.\n'
+                                     '   Instead please add the appropriate offsets (these offsets\n'
+                                     '   should be multiples of the cell size) to the atom coordinates\n'
+                                     '   in the data file, and eliminate the extra columns. Then try again.\n'
+                                     '   (If you get this message often, email me and I\'ll fix this limitation.)')
+                if len(columns) < len(settings.column_names):
+                    raise InputError('Error: The number of columns in your data file does not\n'
+                                     '       match the LAMMPS atom_style you selected.\n'
+                                     '       Use the -atomstyle <style> command line argument.\n'
+                                     '       (Alternatively this error can be caused by a missing } character.)\n')
+                irows.append(len(self.rows))
+            self.rows.append(columns)
+            self.comments.append(comment)
+        self.irows = irows
+        self.coord_strs = None
+        self.template = None   # (optional: the ".template" version)
+        # (total mass, and the mass-weighted sum of the atomic coordinates)
+        self.mass_sums = None  # (computed when needed, see MassSums())
+        if not read_coords:
+            self.coords = self.vects = None
+            return
+        # Atomic coordinates and direction-vectors (one array per triplet)
+        self.coords = [self._ReadColumns(cxcycz)
+                       for cxcycz in settings.ii_coords]
+        self.vects = [self._ReadColumns(cxcycz)
+                      for cxcycz in settings.ii_vects]
+
+    # (For small tables, numpy's overhead exceeds its benefits.)
+    min_rows_numpy = 32
+
+    def _ReadColumns(self, cxcycz):
+        cx, cy, cz = cxcycz
+        x = [[float(columns[cx]), float(columns[cy]), float(columns[cz])]
+             for columns in [self.rows[i] for i in self.irows]]
+        if (np is not None) and (len(x) >= DataAtomsTable.min_rows_numpy):
+            x = np.array(x, dtype=float).reshape(len(x), 3)
+        return x
+
+    def Transform(self, matrix):
+        """ Atomic coordinates transform using "affine" transformations
+        (translations plus rotations [or other linear transformations]).
+        Dipole moments and other direction-vectors are not effected by
+        translational movement.
+
+        """
+        self.coords = [DataAtomsTable._Transform(x, matrix, True)
+                       for x in self.coords]
+        self.vects = [DataAtomsTable._Transform(x, matrix, False)
+                      for x in self.vects]
+        self.coord_strs = None
+        if self.mass_sums is not None:
+            # The center of mass moves the same way the atoms do,
+            # so there is no need to add up the coordinates again.
+            tot_m, tot_mx = self.mass_sums
+            self.mass_sums = (tot_m,
+                              [matrix[d][0] * tot_mx[0] +
+                               matrix[d][1] * tot_mx[1] +
+                               matrix[d][2] * tot_mx[2] +
+                               matrix[d][3] * tot_m for d in range(0, 3)])
+
+    def MassSums(self, atomtype2mass):
+        """
+        Return the total mass of the atoms in this table, and the sum of their
+        coordinates (weighted by mass).  The mass of each atom is looked up
+        (by atom type) in the \"atomtype2mass\" dictionary.  If it is empty,
+        then every atom is given the same mass (1.0).
+        (These numbers are updated later whenever Transform() is invoked.)
+
+        """
+        if self.mass_sums is None:
+            tot_m = 0.0
+            tot_mx = [0.0, 0.0, 0.0]
+            if len(self.coords) > 0:
+                x = self.coords[0]
+                if not isinstance(x, list):
+                    x = x.tolist()
+                i_atomtype = self.settings.i_atomtype
+                for i, x_i in zip(self.irows, x):
+                    m = 1.0
+                    if len(atomtype2mass) > 0:
+                        atomtype = self.rows[i][i_atomtype]
+                        if atomtype not in atomtype2mass:
+                            raise InputError('Error(lttree): You have neglected to define the mass of atom type: \"' + atomtype + '\"\n'
+                                             'Did you specify the mass of every atom type using write(\"Masses\"){}?')
+                        m = atomtype2mass[atomtype]
+                    tot_m += m
+                    for d in range(0, 3):
+                        tot_mx[d] += m * x_i[d]
+            self.mass_sums = (tot_m, tot_mx)
+        return self.mass_sums
+
+    @staticmethod
+    def _Transform(x0, matrix, affine):
+        # Perform the same floating point operations (in the same order) as
+        # AffineTransform() and LinTransform() do, so the results are identical.
+        if isinstance(x0, list):
+            (m00, m01, m02), (m10, m11, m12), (m20, m21, m22) = \
+                [matrix[d][0:3] for d in range(0, 3)]
+            if affine:
+                m03, m13, m23 = [matrix[d][3] for d in range(0, 3)]
+                return [[0.0 + m00*a + m01*b + m02*c + m03,
+                         0.0 + m10*a + m11*b + m12*c + m13,
+                         0.0 + m20*a + m21*b + m22*c + m23]
+                        for a, b, c in x0]
+            else:
+                return [[0.0 + m00*a + m01*b + m02*c,
+                         0.0 + m10*a + m11*b + m12*c,
+                         0.0 + m20*a + m21*b + m22*c]
+                        for a, b, c in x0]
+        x = np.empty_like(x0)
+        for d in range(0, 3):
+            x_d = 0.0 + matrix[d][0] * x0[:, 0]
+            x_d += matrix[d][1] * x0[:, 1]
+            x_d += matrix[d][2] * x0[:, 2]
+            if affine:
+                x_d += matrix[d][3]  # ("b" is part of "matrix")
+            x[:, d] = x_d
+        return x
+
+    def _CoordStrs(self):
+        # Convert the coordinates to strings (only once, see Text())
+        if self.coord_strs is None:
+            self.coord_strs = []
+            for x in self.coords + self.vects:
+                if not isinstance(x, list):
+                    x = x.tolist()
+                self.coord_strs.append([[str(x_i[0]), str(x_i[1]), str(x_i[2])]
+                                        for x_i in x])
+        return self.coord_strs
+
+    def Text(self, table=None):
+        """
+        Return the text, containing the (transformed) coordinates.
+        If "table" is specified, its lines are used instead.  (It should
+        contain the same atoms, in the same order.  Typically "table" stores
+        the ".template" version of this text, with variable names in place of
+        numbers, which was read using read_coords=False.)
+
+        """
+        if table is None:
+            table = self
+        if table.irows != self.irows:
+            raise InputError('Error: The \"' + data_atoms + '\" template does not\n'
+                             '       contain the same atoms as the rendered text.\n')
+        rows = [list(columns) for columns in table.rows]
+        for ii, x_strs in zip(self.settings.ii_coords + self.settings.ii_vects,
+                              self._CoordStrs()):
+            for i, x_i in zip(self.irows, x_strs):
+                columns = rows[i]
+                for d in range(0, 3):
+                    columns[ii[d]] = x_i[d]
+        return '\n'.join([' '.join(columns) + comment
+                          for columns, comment in zip(rows, table.comments)])
+
+
+def TransformAtomText(text, matrix, settings, template_text=None):
     """ Apply transformations to the coordinates and other vector degrees
     of freedom stored in the \"Data Atoms\" section of a LAMMPS data file.
     This is the \"text\" argument.
     The \"matrix\" stores the aggregate sum of combined transformations
     to be applied.
+    If \"template_text\" (the same text, before the variables were replaced
+    by numbers) is also specified, then both texts are transformed,
+    and a tuple containing both is returned.  (The coordinates are only
+    read and transformed once.)
 
     """
 
     #sys.stderr.write('matrix_stack.M = \n'+ MatToStr(matrix) + '\n')
 
-    lines = text.split('\n')
-
-    for i in range(0, len(lines)):
-        line_orig = lines[i]
-        ic = line_orig.find('#')
-        if ic != -1:
-            line = line_orig[:ic]
-            comment = ' ' + line_orig[ic:].rstrip('\n')
-        else:
-            line = line_orig.rstrip('\n')
-            comment = ''
-
-        # Split the line into words (columns) using whitespace delimeters
-        columns = SplitQuotedString(line,
-                                    quotes='{',
-                                    endquote='}')
-
-        if len(columns) > 0:
-            if len(columns) == len(settings.column_names) + 3:
-                raise InputError('Error: lttree.py does not yet support integer unit-cell counters \n'
-                                 '   within the \"' + data_atoms + '\" section of a LAMMPS data file.\n'
-                                 '   Instead please add the appropriate offsets (these offsets\n'
-                                 '   should be multiples of the cell size) to the atom coordinates\n'
-                                 '   in the data file, and eliminate the extra columns. Then try again.\n'
-                                 '   (If you get this message often, email me and I\'ll fix this limitation.)')
-            if len(columns) < len(settings.column_names):
-                raise InputError('Error: The number of columns in your data file does not\n'
-                                 '       match the LAMMPS atom_style you selected.\n'
-                                 '       Use the -atomstyle <style> command line argument.\n'
-                                 '       (Alternatively this error can be caused by a missing } character.)\n')
-            x0 = [0.0, 0.0, 0.0]
-            x = [0.0, 0.0, 0.0]
-            # Atomic coordinates transform using "affine" transformations
-            # (translations plus rotations [or other linear transformations])
-            for cxcycz in settings.ii_coords:
-                for d in range(0, 3):
-                    x0[d] = float(columns[cxcycz[d]])
-                    AffineTransform(x, matrix, x0)  # x = matrix * x0 + b
-                for d in range(0, 3):  # ("b" is part of "matrix")
-                    columns[cxcycz[d]] = str(x[d])
-            # Dipole moments and other direction-vectors
-            # are not effected by translational movement
-            for cxcycz in settings.ii_vects:
-                for d in range(0, 3):
-                    x0[d] = float(columns[cxcycz[d]])
-                    LinTransform(x, matrix, x0)  # x = matrix * x0
-                for d in range(0, 3):
-                    columns[cxcycz[d]] = str(x[d])
-        lines[i] = ' '.join(columns) + comment
-    return '\n'.join(lines)
+    table = DataAtomsTable(text, settings)
+    table.Transform(matrix)
+    if template_text is None:
+        return table.Text()
+    template_table = DataAtomsTable(template_text, settings, read_coords=False)
+    return table.Text(), table.Text(template_table)
 
 
 
@@ -424,85 +904,125 @@ def TransformEllipsoidText(text, matrix, settings):
 
 
 
-def CalcCM(text_Atoms,
-           text_Masses=None,
-           settings=None):
-    types2masses = None
-    # Loop through the "Masses" section: what is the mass of each atom type?
-    if text_Masses != None:
-        types2masses = {}
-        lines = text_Masses.split('\n')
-        for i in range(0, len(lines)):
-            line = lines[i]
-            # Split the line into words (columns) using whitespace delimeters
-            columns = SplitQuotedString(line,
-                                        quotes='{',
-                                        endquote='}')
-        if len(columns) == 2:
-            atomtype = columns[0]
-            m = float(columns[1])
-            types2masses[atomtype] = m
-
-    lines = text_Atoms.split('\n')
-    # Pass 1 through the "Data Atoms" section: Determine each atom's mass
-    if text_Masses != None:
-        assert(settings != None)
-        for i in range(0, len(lines)):
-            line = lines[i]
-            # Split the line into words (columns) using whitespace delimeters
-            columns = SplitQuotedString(line,
-                                        quotes='{',
-                                        endquote='}')
-            atomid = columns[settings.i_atomid]
-            atomtype = columns[settings.i_atomtype]
-            if atomtype not in types2masses[atomtype]:
-                raise InputError('Error(lttree): You have neglected to define the mass of atom type: \"' + atomtype + '\"\n'
-                                 'Did you specify the mass of every atom type using write(\"Masses\"){}?')
-            atomid2mass[atomid] = atomtype2mass[atomtype]
-
-    # Pass 2 through the "Data Atoms" section: Find the center of mass.
-    for i in range(0, len(lines)):
-        line = lines[i]
+def ReadAtomTypeMasses(text_Masses):
+    """ Loop through the \"Masses\" section: what is the mass of each
+    atom type?  Returns a dictionary. """
+    atomtype2mass = {}
+    for line in text_Masses.split('\n'):
+        ic = line.find('#')
+        if ic != -1:
+            line = line[:ic]
         # Split the line into words (columns) using whitespace delimeters
         columns = SplitQuotedString(line,
                                     quotes='{',
                                     endquote='}')
-        if len(columns) > 0:
-            if len(columns) == len(settings.column_names) + 3:
-                raise InputError('Error: lttree.py does not yet support integer unit-cell counters (ix, iy, iz)\n'
-                                 '   within the \"' + data_atoms + '\" section of a LAMMPS data file.\n'
-                                 '   Instead please add the appropriate offsets (these offsets\n'
-                                 '   should be multiples of the cell size) to the atom coordinates\n'
-                                 '   in the data file, and eliminate the extra columns. Then try again.\n'
-                                 '   (If you get this message often, email me and I\'ll fix this limitation.)')
-            if len(columns) != len(settings.column_names):
-                raise InputError('Error: The number of columns in your data file does not\n'
-                                 '       match the LAMMPS atom_style you selected.\n'
-                                 '       Use the -atomstyle <style> command line argument.\n')
-            x = [0.0, 0.0, 0.0]
-            if atomids2masses != None:
-                m = atomids2masses[atomid]
-            else:
-                m = 1.0
-            tot_m += m
-            for cxcycz in settings.ii_coords:
-                for d in range(0, 3):
-                    x[d] = float(columns[cxcycz[d]])
-                    tot_x[d] += x[d]
-            # Note: dipole moments and other direction vectors don't effect
-            #       the center of mass. So I commented out the loop below.
-            # for cxcycz in settings.ii_vects:
-            #    for d in range(0,3):
-            #        v[d] = float(columns[cxcycz[d]])
-        lines[i] = ' '.join(columns)
-
+        if len(columns) >= 2:
+            atomtype2mass[columns[0]] = float(columns[1])
+    return atomtype2mass
+
+
+def CalcCM(atom_tables, atomtype2mass):
+    """ Find the center of mass of the atoms in a list of DataAtomsTables.
+    (The sums needed are stored in each table, so the text is not re-parsed.)
+    If \"atomtype2mass\" is empty, all atoms have the same mass. """
+    tot_m = 0.0
+    tot_mx = [0.0, 0.0, 0.0]
+    for table in atom_tables:
+        m, mx = table.MassSums(atomtype2mass)
+        tot_m += m
+        for d in range(0, 3):
+            tot_mx[d] += mx[d]
+    if tot_m == 0.0:
+        raise InputError('Error: Unable to find the center of mass of an object which has no atoms\n'
+                         '       (or whose atoms have no mass).\n'
+                         '       (Did you use movecm(), rotcm(), or scalecm() on an empty object?)\n')
     xcm = [0.0, 0.0, 0.0]
     for d in range(0, 3):
-        xcm[d] = tot_x[d] / tot_m
+        xcm[d] = tot_mx[d] / tot_m
     return xcm
 
 
 
+class CMTransformGroup(object):
+    """ The remaining (postponed) coordinate transformations from a
+    push() command (or an instantiation such as \"new Monomer.movecm(0,0,0)\")
+    containing movecm(), rotcm(), or scalecm() commands.  These must wait
+    until every atom affected by the push() has been rendered (ie. until the
+    matching pop() command), because the center of mass is not known until
+    then.  \"blocks\" is the list of these transformations.  Each of them begins
+    with a movecm(), rotcm(), or scalecm() command.  \"outer_matrix\" is the
+    transformation which will be applied after these transformations.
+    \"i_atoms\" and \"i_ellipsoids\" are the number of entries in the
+    \"Data Atoms\" and \"Data Ellipsoids\" lists when the push() occured.
+
+    """
+
+    __slots__ = ["blocks", "srcloc", "outer_matrix", "i_atoms",
+                 "i_ellipsoids"]
+
+    def __init__(self, blocks, srcloc, outer_matrix, i_atoms, i_ellipsoids):
+        self.blocks = blocks
+        self.srcloc = srcloc
+        self.outer_matrix = outer_matrix
+        self.i_atoms = i_atoms
+        self.i_ellipsoids = i_ellipsoids
+
+
+def _ApplyCMTransforms(group, files_content, templates_content, settings,
+                       atomtype2mass):
+    """ Carry out the postponed coordinate transformations stored in \"group\"
+    (a CMTransformGroup) on the atoms rendered since the push() command. """
+    atom_tables = files_content.get(data_atoms, [])[group.i_atoms:]
+    F = group.outer_matrix
+    Finv = [[0.0, 0.0, 0.0, 0.0] for d in range(0, 3)]
+    AffineInverse(Finv, F)
+    Mtmp = [[0.0, 0.0, 0.0, 0.0] for d in range(0, 3)]
+    M = [[0.0, 0.0, 0.0, 0.0] for d in range(0, 3)]
+    for block in group.blocks:
+        # Find the center of mass, in the coordinate system where the
+        # transformations in this block are defined (before "F" is applied).
+        xcm = [0.0, 0.0, 0.0]
+        AffineTransform(xcm, Finv, CalcCM(atom_tables, atomtype2mass))
+        B = AffineStack.CommandsToMatrix(block, group.srcloc, xcm)
+        # The atom coordinates already include "F", so apply F*B*F^-1
+        AffineCompose(Mtmp, B, Finv)
+        AffineCompose(M, F, Mtmp)
+        for table in atom_tables:
+            table.Transform(M)
+        for content in (files_content, templates_content):
+            if (content is not None) and (data_ellipsoids in content):
+                ellipsoids = content[data_ellipsoids]
+                for i in range(group.i_ellipsoids, len(ellipsoids)):
+                    ellipsoids[i] = TransformEllipsoidText(ellipsoids[i],
+                                                           M, settings)
+
+
+class AtomTypeMasses(object):
+    """ The mass of each atom type, read from the (rendered) \"Data Masses\"
+    section when it is first needed (by movecm(), rotcm(), or scalecm()). """
+
+    def __init__(self, files_content):
+        self.files_content = files_content
+        self.atomtype2mass = None
+
+    def Get(self):
+        if self.atomtype2mass is None:
+            self.atomtype2mass = ReadAtomTypeMasses(
+                ''.join(self.files_content.get(data_masses, [])))
+        return self.atomtype2mass
+
+
+def _AtomTablesToText(files_content, templates_content):
+    """ Replace the DataAtomsTables in the \"Data Atoms\" lists with text. """
+    atoms = files_content.get(data_atoms)
+    if atoms is None:
+        return
+    for i in range(0, len(atoms)):
+        table = atoms[i]
+        if isinstance(table, DataAtomsTable):
+            atoms[i] = table.Text()
+            if templates_content is not None:
+                templates_content[data_atoms][i] = table.Text(table.template)
 
 
 def AddAtomTypeComments(tmpl_list, substitute_vars, print_full_atom_type_names):
@@ -608,13 +1128,67 @@ def AddAtomTypeComments(tmpl_list, substitute_vars, print_full_atom_type_names):
 
 
 
+def _RenderWriteFileCommand(command, settings, substitute_vars,
+                            render_templates):
+    """
+    Render the text in a write() or write_once() command (omitting lines
+    which refer to deleted variables).  If render_templates is True, the text
+    is rendered both with and without substituting the variables' values.
+    Returns a tuple containing both versions of the text (the second version
+    is None if render_templates is False).  Coordinates are not transformed.
+
+    """
+    # --- Throw away lines containin references to deleted variables:---
+
+    # First: To edit the content of a template,
+    #        you need to make a deep local copy of it
+    tmpl_list = []
+    for entry in command.tmpl_list:
+        if isinstance(entry, TextBlock):
+            tmpl_list.append(TextBlock(entry.text,
+                                       entry.srcloc))  # , entry.srcloc_end))
+        else:
+            tmpl_list.append(entry)
+
+    #     Now throw away lines with deleted variables
+
+    DeleteLinesWithBadVars(tmpl_list)
+
+    # --- Now render the text ---
+    template_text = None
+    if command.filename == data_masses:
+        if not render_templates:
+            text = AddAtomTypeComments(tmpl_list,
+                                       substitute_vars,
+                                       settings.print_full_atom_type_name_in_masses)
+        else:
+            text = AddAtomTypeComments(tmpl_list,
+                                       True,
+                                       settings.print_full_atom_type_name_in_masses)
+            template_text = AddAtomTypeComments(tmpl_list,
+                                                False,
+                                                settings.print_full_atom_type_name_in_masses)
+    elif not render_templates:
+        text = Render(tmpl_list,
+                      substitute_vars)
+    else:
+        text = Render(tmpl_list, True)
+        template_text = Render(tmpl_list, False)
+    return text, template_text
+
+
+
 def _ExecCommands(command_list,
                   index,
                   global_files_content,
                   settings,
                   matrix_stack,
                   current_scope_id=None,
-                  substitute_vars=True):
+                  substitute_vars=True,
+                  global_templates_content=None,
+                  masses=None,
+                  in_cm_group=False,
+                  filenames=None):
     """
     _ExecCommands():
     The argument "commands" is a nested list of lists of
@@ -628,9 +1202,31 @@ def _ExecCommands(command_list,
     It is an associative array whose key is a string (a filename)
     and whose value is a lists of strings (of rendered templates).
 
+    If "global_templates_content" is not None, then the templates are
+    rendered both ways during the same pass: with the variables substituted
+    (stored in "global_files_content"), and without them (ie. the contents
+    of the ".template" files, stored in "global_templates_content").
+    In that case, the "substitute_vars" argument is ignored.
+
+    Coordinate transformations which are carried out relative to the
+    center of mass (movecm(), rotcm(), scalecm()) are postponed until the
+    matching pop() command.  Meanwhile, the atoms are stored in
+    DataAtomsTables (instead of text), so that the coordinates remain in
+    numeric form.  "in_cm_group" is True if the caller has postponed
+    transformations of its own, and "masses" (an AtomTypeMasses object)
+    stores the mass of each atom type.
+
+    If "filenames" is not None, then only the write() and write_once()
+    commands for these files are carried out.  (The others are skipped.)
+
     """
     files_content = defaultdict(list)
-    postprocessing_commands = []
+    templates_content = None
+    if global_templates_content is not None:
+        templates_content = defaultdict(list)
+    # The CMTransformGroup (or None) for each push() command in this scope
+    pushed_groups = []
+    num_cm_groups = 0  # (how many of them are not None?)
 
     while index < len(command_list):
         command = command_list[index]
@@ -652,6 +1248,17 @@ def _ExecCommands(command_list,
                 matrix_stack.PopLeft(which_stack=command.context_node)
             else:
                 assert(False)
+            # (Push and pop commands always occur in matching pairs.)
+            if len(pushed_groups) > 0:
+                group = pushed_groups.pop()
+                if group is not None:
+                    # Now that all of the atoms affected by the push()
+                    # command have been rendered, we can find their center
+                    # of mass, and carry out the remaining transformations.
+                    _ApplyCMTransforms(group, files_content,
+                                       templates_content, settings,
+                                       masses.Get())
+                    num_cm_groups -= 1
 
         elif isinstance(command, PushCommand):
             assert(current_scope_id != None)
@@ -667,89 +1274,70 @@ def _ExecCommands(command_list,
             # ("now"=pushing transformation matrices onto the matrix stack).
             # UNFORTUNATELY POSTPONING SOME COMMANDS MAKES THE CODE UGLY
             transform_list = command.contents.split('.')
-            transform_blocks = []
-            i_post_process = -1
             #  Example:  Suppose:
             #command.contents = '.rot(30,0,0,1).movecm(0,0,0).rot(45,1,0,0).scalecm(2.0).move(-2,1,0)'
             #  then
-            #transform_list = ['rot(30,0,0,1)', 'movecm(0,0,0)', 'rot(45,1,0,0)', 'scalecm(2.0)', 'move(-2,1,0)']
+            #transform_list = ['rot(30,0,0,1)', 'movecm(0,0,0)', 'rot(45,1,0,0)', 'scalecm(2', '0)', 'move(-2,1,0)']
             # Note: the first command 'rot(30,0,0,1)' is carried out now.
             # The remaining commands are carried out during post-processing,
-            # (when processing the "ScopeEnd" command.
+            # (when processing the matching "pop" command).
             #
-            # We break up the commands into "blocks" separated by center-
-            # of-mass transformations ('movecm', 'rotcm', or 'scalecm')
+            # We break up the commands into "blocks" which begin with
+            # center-of-mass transformations ('movecm', 'rotcm', or 'scalecm')
             #
-            # transform_blocks = ['.rot(30,0,0,1)',
-            #                     '.movecm(0,0,0).rot(45,1,0,0)',
-            #                     '.scalecm(2.0).move(-2,1,0)']
-
-            i = 0
-            while i < len(transform_list):
-                transform_block = ''
-                while i < len(transform_list):
-                    transform = transform_list[i]
-                    i += 1
-                    if transform != '':
-                        transform_block += '.' + transform
-                        transform = transform.split('(')[0]
-                        if ((transform == 'movecm') or
-                            (transform == 'rotcm') or
-                            (transform == 'scalecm')):
-                            break
-                transform_blocks.append(transform_block)
-
-            if len(postprocessing_commands) == 0:
-                # The first block (before movecm, rotcm, or scalecm)
-                # can be executed now by modifying the matrix stack.
-                if isinstance(command, PushRightCommand):
-                    matrix_stack.PushCommandsRight(transform_blocks[0].strip('.'),
-                                                   command.srcloc,
-                                                   which_stack=command.context_node)
-                elif isinstance(command, PushLeftCommand):
-                    matrix_stack.PushCommandsLeft(transform_blocks[0].strip('.'),
-                                                  command.srcloc,
-                                                  which_stack=command.context_node)
-                # Everything else must be saved for later.
-                postprocessing_blocks = transform_blocks[1:]
+            # transform_blocks = ['rot(30,0,0,1)',
+            #                     'movecm(0,0,0).rot(45,1,0,0)',
+            #                     'scalecm(2.0).move(-2,1,0)']
+            # (Note: Splitting the text at '.' characters also splits the
+            #  numbers apart, but they are joined together again here.)
+
+            transform_blocks = ['']
+            for transform in transform_list:
+                if transform == '':
+                    continue
+                if transform.split('(')[0] in ('movecm', 'rotcm', 'scalecm'):
+                    transform_blocks.append('')
+                if transform_blocks[-1] != '':
+                    transform_blocks[-1] += '.'
+                transform_blocks[-1] += transform
+
+            right_not_left = isinstance(command, PushRightCommand)
+            group = None
+            if ((len(transform_blocks) > 1) and
+                ((filenames is None) or (data_atoms in filenames))):
+                # Save the remaining blocks for later.
+                group = CMTransformGroup(transform_blocks[1:],
+                                         command.srcloc,
+                                         matrix_stack.OuterMatrix(command.context_node,
+                                                                  right_not_left),
+                                         len(files_content.get(data_atoms, [])),
+                                         len(files_content.get(data_ellipsoids, [])))
+                num_cm_groups += 1
+            pushed_groups.append(group)
+
+            # The first block (before movecm, rotcm, or scalecm)
+            # can be executed now by modifying the matrix stack.
+            # (If it is empty, push the identity matrix, so that the
+            #  matching "pop" command has something to remove.)
+            if right_not_left:
+                matrix_stack.PushCommandsRight(transform_blocks[0] or 'move(0,0,0)',
+                                               command.srcloc,
+                                               which_stack=command.context_node)
             else:
-                # If we already encountered a "movecm" "rotcm" or "scalecm"
-                # then all of the command blocks must be handled during
-                # postprocessing.
-                postprocessing_blocks = transform_blocks
-
-            for transform_block in postprocessing_blocks:
-                assert(isinstance(block, basestring))
-                if isinstance(command, PushRightCommand):
-                    postprocessing_commands.append(PushRightCommand(transform_block,
-                                                                    command.srcloc,
-                                                                    command.context_node))
-                elif isinstance(command, PushLeftCommand):
-                    postprocessing_commands.append(PushLeftCommand(transform_block,
-                                                                   command.srcloc,
-                                                                   command.context_node))
+                matrix_stack.PushCommandsLeft(transform_blocks[0] or 'move(0,0,0)',
+                                              command.srcloc,
+                                              which_stack=command.context_node)
 
         elif isinstance(command, WriteFileCommand):
 
-            # --- Throw away lines containin references to deleted variables:---
-
-            # First: To edit the content of a template,
-            #        you need to make a deep local copy of it
-            tmpl_list = []
-            for entry in command.tmpl_list:
-                if isinstance(entry, TextBlock):
-                    tmpl_list.append(TextBlock(entry.text,
-                                               entry.srcloc))  # , entry.srcloc_end))
-                else:
-                    tmpl_list.append(entry)
-
-            #     Now throw away lines with deleted variables
-
-            DeleteLinesWithBadVars(tmpl_list)
+            if (filenames is not None) and (command.filename not in filenames):
+                continue
 
-            # --- Now render the text ---
-            text = Render(tmpl_list,
-                          substitute_vars)
+            text, template_text = \
+                _RenderWriteFileCommand(command,
+                                        settings,
+                                        substitute_vars,
+                                        templates_content is not None)
 
             # ---- Coordinates of the atoms, must be rotated
             # and translated after rendering.
@@ -759,14 +1347,31 @@ def _ExecCommands(command_list,
             # (after it has been rendered), and apply these transformations
             # before passing them on to the caller.
             if command.filename == data_atoms:
-                text = TransformAtomText(text, matrix_stack.M, settings)
+                if in_cm_group or (num_cm_groups > 0):
+                    # Keep these coordinates in numeric form, because
+                    # more transformations will be applied to them later.
+                    text = DataAtomsTable(text, settings)
+                    text.Transform(matrix_stack.M)
+                    if templates_content is not None:
+                        text.template = DataAtomsTable(template_text, settings,
+                                                       read_coords=False)
+                        template_text = text
+                elif templates_content is None:
+                    text = TransformAtomText(text, matrix_stack.M, settings)
+                else:
+                    text, template_text = TransformAtomText(text,
+                                                            matrix_stack.M,
+                                                            settings,
+                                                            template_text)
             elif command.filename == data_ellipsoids:
                 text = TransformEllipsoidText(text, matrix_stack.M, settings)
-            if command.filename == data_masses:
-                text = AddAtomTypeComments(tmpl_list,
-                                           substitute_vars,
-                                           settings.print_full_atom_type_name_in_masses)
+                if templates_content is not None:
+                    template_text = TransformEllipsoidText(template_text,
+                                                           matrix_stack.M,
+                                                           settings)
             files_content[command.filename].append(text)
+            if templates_content is not None:
+                templates_content[command.filename].append(template_text)
 
         elif isinstance(command, ScopeBegin):
 
@@ -787,37 +1392,22 @@ def _ExecCommands(command_list,
                                   settings,
                                   matrix_stack,
                                   command.node,
-                                  substitute_vars)
+                                  substitute_vars,
+                                  templates_content,
+                                  masses,
+                                  in_cm_group or (num_cm_groups > 0),
+                                  filenames)
 
         elif isinstance(command, ScopeEnd):
-            if data_atoms in files_content:
-                for ppcommand in postprocessing_commands:
-                    if data_masses in files_content:
-                        xcm = CalcCM(files_content[data_atoms],
-                                     files_content[data_masses],
-                                     settings)
-                    else:
-                        xcm = CalcCM(files_content[data_atoms])
-                    if isinstance(ppcommand, PushRightCommand):
-                        matrix_stack.PushCommandsRight(ppcommand.contents,
-                                                       ppcommand.srcloc,
-                                                       xcm,
-                                                       which_stack=command.context_node)
-                    elif isinstance(ppcommand, PushLeftCommand):
-                        matrix_stack.PushCommandsLeft(ppcommand.contents,
-                                                      ppcommand.srcloc,
-                                                      xcm,
-                                                      which_stack=command.context_node)
-                    files_content[data_atoms] = \
-                        TransformAtomText(files_content[data_atoms],
-                                          matrix_stack.M, settings)
-                    files_content[data_ellipsoids] = \
-                        TransformEllipsoidText(files_content[data_ellipsoids],
-                                               matrix_stack.M, settings)
-
-                for ppcommand in postprocessing_commands:
-                    matrix_stack.Pop(which_stack=command.context_node)
-                    #(same as PopRight())
+            # If there are any push() commands without a matching pop(),
+            # carry out their postponed transformations now.
+            while len(pushed_groups) > 0:
+                group = pushed_groups.pop()
+                if group is not None:
+                    _ApplyCMTransforms(group, files_content,
+                                       templates_content, settings,
+                                       masses.Get())
+                    num_cm_groups -= 1
 
             if isinstance(command.node, InstanceObj):
                 if ((command.node.children != None) and
@@ -831,11 +1421,19 @@ def _ExecCommands(command_list,
             assert(False)
             # no other command types allowed at this point
 
+    if not in_cm_group:
+        # None of the coordinates will be modified again.
+        _AtomTablesToText(files_content, templates_content)
+
     # After processing the commands in this list,
     # merge the templates with the callers template list
     for filename, tmpl_list in files_content.items():
         global_files_content[filename] += \
             files_content[filename]
+    if templates_content is not None:
+        for filename in templates_content:
+            global_templates_content[filename] += \
+                templates_content[filename]
 
     return index
 
@@ -843,7 +1441,36 @@ def _ExecCommands(command_list,
 def ExecCommands(commands,
                  files_content,
                  settings,
-                 substitute_vars=True):
+                 substitute_vars=True,
+                 templates_content=None,
+                 filenames=None):
+    """
+    Carry out the commands in the list, and store the text which would have
+    been written to each file in "files_content".  If "templates_content" is
+    specified, then the text of the ".template" files (which lack numeric
+    values for the variables) is generated during the same pass and stored
+    there.  (This is faster than invoking ExecCommands() twice.)
+    If "filenames" is specified, only the text for these files is generated.
+
+    """
+
+    if ((filenames is not None) and
+        (data_atoms not in filenames) and
+        (data_ellipsoids not in filenames)):
+        # None of these files contain coordinates, so there is no need to
+        # keep track of the coordinate transformations (or scopes).
+        for command in commands:
+            if (isinstance(command, WriteFileCommand) and
+                (command.filename in filenames)):
+                text, template_text = \
+                    _RenderWriteFileCommand(command,
+                                            settings,
+                                            substitute_vars,
+                                            templates_content is not None)
+                files_content[command.filename].append(text)
+                if templates_content is not None:
+                    templates_content[command.filename].append(template_text)
+        return
 
     matrix_stack = MultiAffineStack()
 
@@ -853,7 +1480,11 @@ def ExecCommands(commands,
                           settings,
                           matrix_stack,
                           None,
-                          substitute_vars)
+                          substitute_vars,
+                          templates_content,
+                          AtomTypeMasses(files_content),
+                          False,
+                          filenames)
     assert(index == len(commands))
 
 
@@ -867,13 +1498,117 @@ def WriteFiles(files_content, suffix='', write_to_stdout=True):
             else:
                 out_file = open(filename + suffix, 'a')
             if out_file != None:
-                out_file.write(''.join(str_list))
+                out_file.writelines(str_list)
                 if filename != '':
                     out_file.close()
 
     return
 
 
+def _FileGroups(command_lists, num_groups):
+    """
+    Divide the files written by the write() and write_once() commands into
+    (at most) "num_groups" groups of roughly equal size, which can be
+    rendered independently.  The "Data Atoms", "Data Ellipsoids", and
+    "Data Masses" files are always placed in the same group (because movecm(),
+    rotcm(), and scalecm() commands need the atom coordinates, orientations,
+    and masses).  Returns a list of sets of file names.
+
+    """
+    sizes = defaultdict(int)  # (a crude estimate of the work for each file)
+    for commands in command_lists:
+        for command in commands:
+            if (isinstance(command, WriteFileCommand) and
+                (command.filename != None)):
+                if isinstance(command, InstanceWriteFileCommand):
+                    # (same size as the class's template, which is faster)
+                    command = command.command
+                sizes[command.filename] += len(command.tmpl_list)
+    units = []  # (files which must be rendered together)
+    coord_files = set([data_atoms, data_ellipsoids, data_masses])
+    coord_unit = [filename for filename in sizes if filename in coord_files]
+    if len(coord_unit) > 0:
+        units.append(coord_unit)
+    for filename in sizes:
+        if filename not in coord_files:
+            units.append([filename])
+    # Assign the largest units first, each to the smallest group so far.
+    units.sort(key=lambda unit: -sum([sizes[filename] for filename in unit]))
+    groups = [[0, set()] for i in range(0, min(num_groups, len(units)))]
+    for unit in units:
+        group = min(groups, key=operator.itemgetter(0))
+        group[0] += sum([sizes[filename] for filename in unit])
+        group[1].update(unit)
+    return [filenames for size, filenames in groups]
+
+
+# The commands and settings used by the _RenderFileGroup() processes.
+# (These are inherited by the child processes when they are created.)
+g_render_job = None
+
+
+def _RenderFileGroup(filenames):
+    """
+    Render the files in the "filenames" group, and write them (as well as
+    their ".template" versions) to the disk.  (Invoked by RenderFiles().)
+
+    """
+    command_lists, settings = g_render_job
+    files_content = defaultdict(list)
+    templates_content = defaultdict(list)
+    for commands in command_lists:
+        ExecCommands(commands,
+                     files_content,
+                     settings,
+                     True,
+                     templates_content,
+                     filenames)
+    WriteFiles(templates_content, suffix=".template", write_to_stdout=False)
+    del templates_content
+    WriteFiles(files_content)
+    sys.stdout.flush()
+
+
+def RenderFiles(command_lists, settings, num_jobs=1):
+    """
+    Carry out the write() and write_once() commands in each of the lists of
+    commands in "command_lists", and write the resulting files (as well as
+    their ".template" versions) to the disk.  The files must be erased
+    beforehand (see EraseTemplateFiles()).
+    If num_jobs > 1, then the files are divided into groups, and each group
+    is rendered by a separate process.  (num_jobs is reduced if there are
+    fewer CPUs available.)  (Processes are created using "fork",
+    so that they can share the tree of objects and variables.  If this is
+    not available, the files are rendered by a single process instead.)
+
+    """
+    global g_render_job
+    if hasattr(os, 'sched_getaffinity'):
+        num_jobs = min(num_jobs, len(os.sched_getaffinity(0)))
+    groups = _FileGroups(command_lists, num_jobs)
+    if len(groups) > 1:
+        try:
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            context = multiprocessing.get_context('fork')
+        except (ImportError, ValueError):
+            sys.stderr.write('Warning: Unable to create processes using \"fork\".\n'
+                             '         Running in a single process instead.\n')
+            groups = [None]
+    g_render_job = (command_lists, settings)
+    try:
+        if len(groups) > 1:
+            sys.stdout.flush()
+            with ProcessPoolExecutor(max_workers=len(groups),
+                                     mp_context=context) as executor:
+                for result in executor.map(_RenderFileGroup, groups):
+                    pass
+        else:
+            _RenderFileGroup(None)
+    finally:
+        g_render_job = None
+
+
 def main():
     """
     This is is a "main module" wrapper for invoking lttree.py
@@ -895,11 +1630,11 @@ def main():
         raise InputError(
             'Error: Alas, you must upgrade to a newer version of python.')
 
-    try:
+    #settings = BasicUISettings()
+    #BasicUIParseArgs(sys.argv, settings)
+    settings = LttreeSettings()
 
-        #settings = BasicUISettings()
-        #BasicUIParseArgs(sys.argv, settings)
-        settings = LttreeSettings()
+    try:
         LttreeParseArgs([arg for arg in sys.argv],  #(deep copy of sys.argv)
                         settings, main=True, show_warnings=True)
 
@@ -925,37 +1660,20 @@ def main():
         # Coordinate transformations can be applied to the rendered text
         # as a post-processing step.
 
-        sys.stderr.write(' done\nbuilding templates...')
-
-        files_content = defaultdict(list)
-
-        ExecCommands(g_static_commands,
-                     files_content,
-                     settings,
-                     False)
-        ExecCommands(g_instance_commands,
-                     files_content,
-                     settings,
-                     False)
-
-        # Finally: write the rendered text to actual files.
+        # (Both versions of each file are generated in a single pass:
+        #  the ".template" files, and the files with the variables
+        #  substituted by values.  If settings.render_jobs > 1, then
+        #  different files are rendered by different processes.)
+        sys.stderr.write(' done\nbuilding and rendering templates...')
 
         # Erase the files that will be written to:
-        sys.stderr.write(' done\nwriting templates...')
         EraseTemplateFiles(g_static_commands)
         EraseTemplateFiles(g_instance_commands)
 
-        # Write the files as templates
-        # (with the original variable names present)
-        WriteFiles(files_content, suffix=".template", write_to_stdout=False)
-
-        # Write the files with the variables substituted by values
-        sys.stderr.write(' done\nbuilding and rendering templates...')
-        files_content = defaultdict(list)
-        ExecCommands(g_static_commands, files_content, settings, True)
-        ExecCommands(g_instance_commands, files_content, settings, True)
-        sys.stderr.write(' done\nwriting rendered templates...\n')
-        WriteFiles(files_content)
+        # Render the templates and write them to actual files.
+        RenderFiles([g_static_commands, g_instance_commands],
+                    settings,
+                    settings.render_jobs)
         sys.stderr.write(' done\n')
 
         # Now write the variable bindings/assignments table.
@@ -965,6 +1683,12 @@ def main():
         WriteVarBindingsFile(g_objectdefs)
         WriteVarBindingsFile(g_objects)
         sys.stderr.write(' done\n')
+        if settings.index_assignments:
+            # (This index is used by ttree_render.py, and it is updated by
+            #  nbody_fix_ttree_assignments.py.  See ttree_assignments_index.py)
+            sys.stderr.write('indexing \"ttree_assignments.txt\" file...')
+            WriteAssignmentsIndex('ttree_assignments.txt')
+            sys.stderr.write(' done\n')
 
     except (ValueError, InputError) as err:
         if isinstance(err, ValueError):
@@ -974,10 +1698,10 @@ def main():
                              '      that the moltemplate file contains non-numeric text in one of the\n'
                              '      .move(), .rot(), .scale(), .matrix(), or .quat() commands. If neither of\n'
                              '      these scenarios apply, please report this bug. (jewett.aij at gmail.com)\n')
-            sys.exit(-1)
+            sys.exit(settings.ErrorExitStatus())
         else:
             sys.stderr.write('\n\n' + str(err) + '\n')
-            sys.exit(-1)
+            sys.exit(settings.ErrorExitStatus())
 
     return
 
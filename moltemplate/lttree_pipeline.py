@@ -0,0 +1,527 @@
+#!/usr/bin/env python3
+
+# Author: Andrew Jewett (jewett.aij at g mail)
+# License: MIT License  (See LICENSE.md)
+# Copyright (c) 2013
+
+"""
+lttree_pipeline.py
+
+lttree_pipeline.py runs the first several stages of moltemplate.sh
+in a single python process.  Normally moltemplate.sh invokes:
+
+   lttree.py
+   remove_duplicate_atoms.py, renumber_DATA_first_column.py
+   bonds_by_type.py
+   nbody_by_type.py, nbody_fix_ttree_assignments.py, ttree_render.py
+     (once for every "Data Angles/Dihedrals/Impropers By Type" file)
+
+as separate programs, each of which must re-read (and re-parse) the
+"ttree_assignments.txt" file and the "Data Atoms", "Data Bonds" files
+generated by the previous step.  This program carries out the same steps,
+(in the same order), but passes the instance tree, the variable bindings,
+and the atom and bond tables from one step to the next in memory.
+The files it writes are identical to the files which would have been
+created by running these programs one after another.
+
+Typical usage (this is invoked by "moltemplate.sh -pipeline"):
+
+lttree_pipeline.py [lttree.py arguments...] \\
+                   [-checkff] \\
+                   [-angle-symmetry file.py] \\
+                   [-dihedral-symmetry file.py] \\
+                   [-improper-symmetry file.py] \\
+                   [-shell-vars file.sh] \\
+                   file.lt
+
+If "-shell-vars" is specified, then the names of the "By Type" files that
+were processed (and the symmetry files that were used) are saved to a file
+containing shell variable assignments.  (moltemplate.sh reads this file.)
+
+"""
+
+import sys
+import re
+import io
+from collections import defaultdict
+
+try:
+    from shlex import quote as ShellQuote
+except ImportError:
+    from pipes import quote as ShellQuote
+
+try:
+    from .ttree import BasicUI, EraseTemplateFiles, StaticObj, InstanceObj, \
+        WriteFileCommand, WriteVarBindingsFile
+    from .ttree_lex import InputError
+    from .lttree import LttreeSettings, LttreeParseArgs, ExecCommands, \
+        WriteFiles
+    from .lttree_styles import ColNames2AidAtypeMolid, \
+        data_atoms, data_bonds, data_bond_list, data_bonds_by_type, \
+        data_angles, data_dihedrals, data_impropers, \
+        data_angles_by_type, data_dihedrals_by_type, data_impropers_by_type
+    from .remove_duplicate_atoms import RemoveDuplicateAtoms
+    from .renumber_DATA_first_column import RenumberFirstColumn
+    from .bonds_by_type import LookupBondTypes
+    from .nbody_by_type import ExtractAtomTypes, ExtractBonds, \
+        ExtractTypePatterns, GenInteractions_tables, LoadBondPattern
+    from .nbody_fix_ttree_assignments import FixTtreeAssignments
+    from .ttree_render import ReadBindings, RenderTemplate
+    from .ttree_assignments_index import WriteAssignmentsIndex
+except (ImportError, SystemError, ValueError):
+    # not installed as a package
+    from ttree import *
+    from ttree_lex import *
+    from lttree import *
+    from lttree_styles import *
+    from remove_duplicate_atoms import RemoveDuplicateAtoms
+    from renumber_DATA_first_column import RenumberFirstColumn
+    from bonds_by_type import LookupBondTypes
+    from nbody_by_type import ExtractAtomTypes, ExtractBonds, \
+        ExtractTypePatterns, GenInteractions_tables, LoadBondPattern
+    from nbody_fix_ttree_assignments import FixTtreeAssignments
+    from ttree_render import ReadBindings, RenderTemplate
+    from ttree_assignments_index import WriteAssignmentsIndex
+
+
+g_program_name = __file__.split('/')[-1]  # = 'lttree_pipeline.py'
+g_date_str = '2026-10-18'
+g_version_str = '0.1.0'
+
+
+# Each entry describes one of the "By Type" loops in moltemplate.sh:
+#  (section name, "By Type" file prefix, data section, category name,
+#   default symmetry file, counter prefix, shell variable suffix)
+# (The last column indicates whether "-checkff" applies to that section.
+#  As in moltemplate.sh, it is only used for angles and dihedrals, because
+#  not every group of bonded atoms is expected to have an improper.)
+g_nbody_sections = [
+    ('Angles', data_angles_by_type, data_angles, '/angle',
+     'nbody_Angles.py', '$/angle:bytype', 'angles', True),
+    ('Dihedrals', data_dihedrals_by_type, data_dihedrals, '/dihedral',
+     'nbody_Dihedrals.py', '$/dihedral:bytype', 'dihedrals', True),
+    ('Impropers', data_impropers_by_type, data_impropers, '/improper',
+     'nbody_Impropers.py', '$/improper:bytype', 'impropers', False)
+]
+
+
+def VersionSortKey(file_name):
+    """
+    Sort key which orders file names the same way as "ls -v"
+    (sequences of digits are compared numerically).
+
+    """
+    tokens = re.split(r'(\d+)', file_name)
+    return [int(tokens[i]) if (i % 2 == 1) else tokens[i]
+            for i in range(0, len(tokens))]
+
+
+def SubgraphFromFileName(file_name):
+    """
+    Extract the text between parenthesis (if present, '' otherwise)
+    Example: file_name="Data Angles By Type (gaff_angle.py).template"
+             returns "gaff_angle.py"
+
+    """
+    if re.search(r'\(.*\)', file_name) is None:
+        return ''
+    return file_name.split('(', 1)[1].split(')')[0]
+
+
+def CommandFileNames(command_list):
+    """ Return the names of the files written to by these commands. """
+    filenames = set([])
+    for command in command_list:
+        if isinstance(command, WriteFileCommand):
+            if (command.filename != None) and (command.filename != ''):
+                filenames.add(command.filename)
+    return filenames
+
+
+class PipelineSettings(LttreeSettings):
+    def __init__(self,
+                 user_bindings_x=None,
+                 user_bindings=None,
+                 order_method='by_command'):
+
+        LttreeSettings.__init__(self,
+                                user_bindings_x,
+                                user_bindings,
+                                order_method)
+        self.check_undefined = False
+        # User-supplied replacements for the default symmetry files:
+        self.subgraph_scripts = {'angles': '',
+                                 'dihedrals': '',
+                                 'impropers': ''}
+        self.shell_vars_filename = None
+        # Number of processes to use when generating bonded interactions
+        self.num_jobs = 1
+
+
+def PipelineParseArgs(argv, settings):
+    """
+    Parse the arguments which are specific to lttree_pipeline.py
+    (and remove them from argv).  The remaining arguments are
+    passed to LttreeParseArgs().
+
+    """
+    i = 1
+    while i < len(argv):
+        if argv[i].lower() == '-checkff':
+            settings.check_undefined = True
+            del(argv[i:i + 1])
+        elif argv[i].lower() in ('-angle-symmetry',
+                                 '-dihedral-symmetry',
+                                 '-improper-symmetry'):
+            if i + 1 >= len(argv):
+                raise InputError('Error: ' + argv[i] + ' flag should be followed by the name of a python file\n'
+                                 '       containing the definition of the subgraph you are searching for\n'
+                                 '       and it\'s symmetry properties.\n'
+                                 '       (See nbody_Dihedrals.py for example.)\n')
+            section = argv[i].lower()[1:].split('-')[0] + 's'
+            settings.subgraph_scripts[section] = argv[i + 1]
+            del(argv[i:i + 2])
+        elif argv[i].lower() == '-nbody-jobs':
+            if ((i + 1 >= len(argv)) or
+                (not str.isdigit(argv[i + 1])) or
+                (int(argv[i + 1]) < 1)):
+                raise InputError('Error: ' + argv[i] + ' flag should be followed by a positive integer\n'
+                                 '       (the number of processes to use).\n')
+            settings.num_jobs = int(argv[i + 1])
+            del(argv[i:i + 2])
+        elif argv[i].lower() == '-shell-vars':
+            if i + 1 >= len(argv):
+                raise InputError('Error: ' + argv[i] + ' flag should be followed by a file name\n')
+            settings.shell_vars_filename = argv[i + 1]
+            del(argv[i:i + 2])
+        else:
+            i += 1
+
+    LttreeParseArgs(argv, settings, main=True, show_warnings=True)
+
+
+class Pipeline(object):
+    """
+    Pipeline stores the contents of the files generated by lttree.py
+    (as well as the variable bindings from "ttree_assignments.txt") in memory
+    and applies each of the steps which moltemplate.sh would have carried out
+    by invoking separate programs.
+
+    """
+
+    def __init__(self, settings):
+        self.settings = settings
+        # Data structures to store the class definitionss and instances
+        self.objectdefs = StaticObj('', None)  # The root of the static tree
+        self.objects = InstanceObj('', None)  # The root of the instance tree
+        self.static_commands = []
+        self.instance_commands = []
+        # file name --> text  ("X.template" files, and rendered "X" files)
+        self.templates = {}
+        self.rendered = {}
+        # files written by this program which lttree.py would not create
+        self.generated_files = set([])
+        self.lines_bindings = []
+        self.assignments = {}
+        # (tables extracted from "Data Atoms.template", "Data Bonds.template")
+        self.atoms_table = None
+        self.bonds_table = None
+        self.shell_vars = []
+
+    def BuildTree(self):
+        """ Equivalent to running lttree.py """
+
+        BasicUI(self.settings,
+                self.objectdefs,
+                self.objects,
+                self.static_commands,
+                self.instance_commands)
+
+        sys.stderr.write(' done\nbuilding and rendering templates...')
+        files_content = defaultdict(list)
+        templates_content = defaultdict(list)
+        ExecCommands(self.static_commands, files_content, self.settings,
+                     True, templates_content)
+        ExecCommands(self.instance_commands, files_content, self.settings,
+                     True, templates_content)
+        self.templates = self._JoinFiles(templates_content)
+        self.rendered = self._JoinFiles(files_content)
+        sys.stderr.write(' done\n')
+
+        out = io.StringIO()
+        WriteVarBindingsFile(self.objectdefs, out)
+        WriteVarBindingsFile(self.objects, out)
+        self.lines_bindings = out.getvalue().splitlines(True)
+        # (moltemplate.sh extracts the lines containing "@" before
+        #  any of the interactions by type are added.)
+        self.lines_bindings_static = [line for line in self.lines_bindings
+                                      if '@' in line]
+        # moltemplate.sh removes DOS carriage-return characters
+        # from all of the files it processes later on.
+        self.lines_bindings = [line.replace('\r', '')
+                               for line in self.lines_bindings]
+        self.assignments = ReadBindings(self.lines_bindings)
+
+    @staticmethod
+    def _JoinFiles(files_content):
+        files = {}
+        for filename, str_list in files_content.items():
+            files[filename] = ''.join(str_list)
+        return files
+
+    def _Template(self, filename):
+        return self.templates.get(filename, '').replace('\r', '')
+
+    def _SetFile(self, filename, text_template, text_rendered):
+        if ((filename not in self.templates) or
+            (filename not in self.rendered)):
+            self.generated_files.add(filename)
+        self.templates[filename] = text_template
+        self.rendered[filename] = text_rendered
+
+    def RemoveDuplicateAtoms(self):
+        """ remove_duplicate_atoms.py and renumber_DATA_first_column.py """
+        if len(self.rendered.get(data_atoms, '')) == 0:
+            return
+        lines = self.rendered[data_atoms].replace('\r', '')
+        lines = RemoveDuplicateAtoms(lines.splitlines(True))
+        self.rendered[data_atoms] = ''.join(RenumberFirstColumn(lines))
+        lines = self._Template(data_atoms).splitlines(True)
+        self.templates[data_atoms] = ''.join(RemoveDuplicateAtoms(lines))
+
+    def LookupBondTypes(self):
+        """ bonds_by_type.py """
+        if len(self._Template(data_bond_list)) == 0:
+            return
+        if len(self.rendered.get(data_bonds_by_type, '')) == 0:
+            raise InputError('Error: You have a \"Data Bond List\", section somewhere\n'
+                             '       without a \"Data Bonds By Type\" section to support it.\n'
+                             '       (Did you mean to use \"Data Bonds\" instead?)\n')
+        sys.stderr.write('Looking up bond types according to atom type\n')
+        bond_types = []
+        bond_ids = []
+        bond_pairs = []
+        LookupBondTypes(bond_types,
+                        bond_ids,
+                        bond_pairs,
+                        self._Template(data_atoms).splitlines(True),
+                        self._Template(data_bond_list).splitlines(True),
+                        self._Template(data_bonds_by_type).splitlines(True),
+                        ' '.join(self.settings.column_names),
+                        'Data Bond List',
+                        prefix='',
+                        suffix='')
+        gen_bonds = []
+        for ie in range(0, len(bond_types)):
+            gen_bonds.append(bond_ids[ie] + ' ' +
+                             bond_types[ie] + ' ' +
+                             bond_pairs[ie][0] + ' ' +
+                             bond_pairs[ie][1] + '\n')
+        # Append existing "Bonds" to the end of the generated interactions
+        text_template = ''.join(gen_bonds) + self._Template(data_bonds)
+        self._SetFile(data_bonds,
+                      text_template,
+                      RenderTemplate(io.StringIO(text_template),
+                                     data_bonds + '.template',
+                                     self.assignments))
+        sys.stderr.write('\n\n')
+
+    def _AtomsAndBonds(self):
+        # The "Data Atoms.template" and "Data Bonds.template" files do not
+        # change while the "By Type" files are processed, so parse them once.
+        if self.atoms_table is None:
+            i_atomid, i_atomtype, i_molid = \
+                ColNames2AidAtypeMolid(self.settings.column_names)
+            lines = [line for line in
+                     self._Template(data_atoms).splitlines(True)
+                     if ((len(line.strip()) > 0) and
+                         (line.strip()[0] != '#'))]
+            self.atoms_table = ExtractAtomTypes(lines, i_atomid, i_atomtype)
+            lines = [line for line in
+                     self._Template(data_bonds).splitlines(True)
+                     if ((len(line.strip()) > 0) and
+                         (line.strip()[0] != '#'))]
+            self.bonds_table = ExtractBonds(lines)
+        return self.atoms_table, self.bonds_table
+
+    def GenInteractionsByType(self,
+                              section_name,
+                              bytype_prefix,
+                              data_section,
+                              cat_name,
+                              default_subgraph,
+                              counter_prefix,
+                              var_suffix,
+                              checkff):
+        """
+        nbody_by_type.py, nbody_fix_ttree_assignments.py, ttree_render.py
+        (for every file whose name begins with bytype_prefix)
+
+        """
+        subgraph_script_override = \
+            self.settings.subgraph_scripts[var_suffix]
+        file_by_type1 = ''
+        file_by_type2 = ''
+        file_names = set([fname for fname in self.templates
+                          if ((fname != None) and
+                              (fname.find(bytype_prefix) == 0))])
+        for fname in (CommandFileNames(self.static_commands) |
+                      CommandFileNames(self.instance_commands)):
+            if fname.find(bytype_prefix) == 0:
+                file_names.add(fname)
+        file_names = sorted([fname + '.template' for fname in file_names],
+                            key=VersionSortKey)
+
+        for file_name in file_names:
+            fname = file_name[:-len('.template')]
+            if ((len(self.templates.get(fname, '')) == 0) or
+                (len(self.rendered.get(data_bonds, '')) == 0)):
+                break
+
+            sys.stderr.write('Generating ' + section_name +
+                             ' interactions by atom/bond type\n')
+
+            subgraph_script = SubgraphFromFileName(file_name)
+            # The user can also override this choice:
+            if subgraph_script_override != '':
+                subgraph_script = subgraph_script_override
+            elif subgraph_script != '':
+                subgraph_script_override = subgraph_script
+
+            if subgraph_script == '':
+                subgraph_script = default_subgraph
+            else:
+                sys.stderr.write('(using the rules in \"' +
+                                 subgraph_script + '\")\n')
+
+            file_by_type2 = file_by_type1
+            file_by_type1 = file_name
+
+            pc = subgraph_script.rfind('.py')
+            if pc != -1:
+                subgraph_script = subgraph_script[0:pc]
+            g = LoadBondPattern(subgraph_script)
+
+            ((atomids_str, atomtypes_str),
+             (bondids_str, bondtypes_str, bond_pairs)) = self._AtomsAndBonds()
+
+            typepattern_to_coefftypes = \
+                ExtractTypePatterns(self._Template(fname).splitlines(True),
+                                    g.bond_pattern)
+
+            gen_lines = GenInteractions_tables(atomids_str,
+                                               atomtypes_str,
+                                               bondids_str,
+                                               bondtypes_str,
+                                               bond_pairs,
+                                               0,
+                                               typepattern_to_coefftypes,
+                                               g.bond_pattern,
+                                               g.canonical_order,
+                                               counter_prefix,
+                                               '',
+                                               True,
+                                               (checkff and
+                                                self.settings.check_undefined),
+                                               self.settings.num_jobs)
+
+            # Append existing interactions to the end of the generated ones
+            text_template = ''.join(gen_lines) + \
+                self._Template(data_section)
+
+            sys.stderr.write('(Repairing ttree_assignments.txt file after ' +
+                             section_name.lower() + ' added.)\n')
+            self.lines_bindings, assignments_new = \
+                FixTtreeAssignments(cat_name, gen_lines, self.lines_bindings)
+            for var_name, value in assignments_new:
+                self.assignments[var_name] = value
+
+            sys.stderr.write('(Rendering ttree_assignments.tmp file after ' +
+                             section_name.lower() + ' added.)\n')
+            self._SetFile(data_section,
+                          text_template,
+                          RenderTemplate(io.StringIO(text_template),
+                                         data_section + '.template',
+                                         self.assignments))
+            sys.stderr.write('\n')
+
+        self.shell_vars.append(('SUBGRAPH_SCRIPT_' + var_suffix.upper(),
+                                subgraph_script_override))
+        self.shell_vars.append(('FILE_' + var_suffix + '_by_type1',
+                                file_by_type1))
+        self.shell_vars.append(('FILE_' + var_suffix + '_by_type2',
+                                file_by_type2))
+
+    def WriteFiles(self):
+        sys.stderr.write('writing templates...')
+        # Erase the files that will be written to:
+        EraseTemplateFiles(self.static_commands)
+        EraseTemplateFiles(self.instance_commands)
+        for filename in self.generated_files:
+            open(filename, 'w').close()
+            open(filename + '.template', 'w').close()
+        WriteFiles(dict([(filename, [text]) for filename, text
+                         in self.templates.items()]),
+                   suffix='.template', write_to_stdout=False)
+        sys.stderr.write(' done\nwriting rendered templates...\n')
+        WriteFiles(dict([(filename, [text]) for filename, text
+                         in self.rendered.items()]))
+        sys.stderr.write(' done\n')
+
+        sys.stderr.write('writing \"ttree_assignments.txt\" file...')
+        out = open('ttree_assignments.txt', 'w')
+        out.write(''.join(self.lines_bindings))
+        out.close()
+        out = open('ttree_assignments_static.txt', 'w')
+        out.write(''.join(self.lines_bindings_static))
+        out.close()
+        sys.stderr.write(' done\n')
+        if self.settings.index_assignments:
+            sys.stderr.write('indexing \"ttree_assignments.txt\" file...')
+            WriteAssignmentsIndex('ttree_assignments.txt')
+            sys.stderr.write(' done\n')
+
+        if self.settings.shell_vars_filename:
+            out = open(self.settings.shell_vars_filename, 'w')
+            for var_name, value in self.shell_vars:
+                out.write(var_name + '=' + ShellQuote(value) + '\n')
+            out.close()
+
+    def Run(self):
+        self.BuildTree()
+        self.RemoveDuplicateAtoms()
+        self.LookupBondTypes()
+        for section in g_nbody_sections:
+            self.GenInteractionsByType(*section)
+        self.WriteFiles()
+
+
+def main():
+    sys.stderr.write(g_program_name + ' v' +
+                     g_version_str + ' ' + g_date_str + ' ')
+    sys.stderr.write('\n(python version ' + str(sys.version) + ')\n')
+
+    settings = PipelineSettings()
+    try:
+        PipelineParseArgs([arg for arg in sys.argv],  #(deep copy of sys.argv)
+                          settings)
+        Pipeline(settings).Run()
+
+    except (ValueError, InputError) as err:
+        if isinstance(err, ValueError):
+            sys.stderr.write('Error converting string to numeric format.\n'
+                             '      This sometimes means you have forgotten to specify the atom style\n'
+                             '      (using the \"-atomstyle\" command).  Alternatively it could indicate\n'
+                             '      that the moltemplate file contains non-numeric text in one of the\n'
+                             '      .move(), .rot(), .scale(), .matrix(), or .quat() commands. If neither of\n'
+                             '      these scenarios apply, please report this bug. (jewett.aij at gmail.com)\n')
+            sys.exit(settings.ErrorExitStatus())
+        else:
+            sys.stderr.write('\n\n' + str(err) + '\n')
+            sys.exit(settings.ErrorExitStatus())
+
+    return
+
+
+if __name__ == '__main__':
+    main()
@@ -135,6 +135,10 @@ Note: Optional "-prefix" and "-suffix" arguments can be included to decorate
           :        :   :    :    :
     auto_847_angle 9 14827 14848 14849
 
+Note: The optional "-nbody-jobs N" argument divides the search for
+      interactions between N processes.  (Each process handles a different
+      subset of the molecules in the system.  The output is unchanged.)
+
 """
 
 g_program_name = __file__.split('/')[-1]  # = 'nbody_by_type.py'
@@ -178,21 +182,13 @@ except (ImportError, SystemError, ValueError):
 
 
 
-def GenInteractions_lines(lines_atoms,
-                          lines_bonds,
-                          lines_nbody,
-                          lines_nbodybytype,
-                          atom_style,
-                          g_bond_pattern,
-                          canonical_order,  # function to sort atoms and bonds
-                          prefix='',
-                          suffix='',
-                          report_progress=False,
-                          check_undefined=False):
-
-    column_names = AtomStyle2ColNames(atom_style)
-    i_atomid, i_atomtype, i_molid = ColNames2AidAtypeMolid(column_names)
+def ExtractAtomTypes(lines_atoms, i_atomid, i_atomtype):
+    """
+    Read the atom ID and atom type from each line of text in the "Atoms"
+    section.  (i_atomid and i_atomtype are the corresponding column numbers.)
+    Returns two lists of strings: atomids_str, atomtypes_str
 
+    """
     atomids_str = []
     atomtypes_str = []
 
@@ -210,6 +206,16 @@ def GenInteractions_lines(lines_atoms,
             atomids_str.append(EscCharStrToChar(tokens[i_atomid]))
             atomtypes_str.append(EscCharStrToChar(tokens[i_atomtype]))
 
+    return atomids_str, atomtypes_str
+
+
+def ExtractBonds(lines_bonds):
+    """
+    Read the bond ID, bond type, and the pair of atom IDs from each line of
+    text in the "Bonds" section.
+    Returns three lists: bondids_str, bondtypes_str, bond_pairs
+
+    """
     bondids_str = []
     bondtypes_str = []
     bond_pairs = []
@@ -228,6 +234,15 @@ def GenInteractions_lines(lines_atoms,
             bond_pairs.append((EscCharStrToChar(tokens[2]),
                                EscCharStrToChar(tokens[3])))
 
+    return bondids_str, bondtypes_str, bond_pairs
+
+
+def ExtractTypePatterns(lines_nbodybytype, g_bond_pattern):
+    """
+    Read the lines of text in a "By Type" section (eg. "Angles By Type"),
+    and convert them into a list of [typepattern, coefftype] pairs.
+
+    """
     typepattern_to_coefftypes = []
 
     for i in range(0, len(lines_nbodybytype)):
@@ -266,6 +281,31 @@ def GenInteractions_lines(lines_atoms,
 
             typepattern_to_coefftypes.append([typepattern, coefftype])
 
+    return typepattern_to_coefftypes
+
+
+def GenInteractions_tables(atomids_str,
+                           atomtypes_str,
+                           bondids_str,
+                           bondtypes_str,
+                           bond_pairs,
+                           num_nbody,
+                           typepattern_to_coefftypes,
+                           g_bond_pattern,
+                           canonical_order,  # function to sort atoms and bonds
+                           prefix='',
+                           suffix='',
+                           report_progress=False,
+                           check_undefined=False,
+                           num_jobs=1):
+    """
+    Same as GenInteractions_lines(), except that the atoms, bonds, and
+    "By Type" rules have already been parsed (see ExtractAtomTypes(),
+    ExtractBonds(), and ExtractTypePatterns()).  "num_nbody" is the number
+    of interactions of this type which already exist.  (The counters of the
+    new interactions start where the pre-existing interactions left off.)
+
+    """
     coefftype_to_atomids_str = GenInteractions_str(bond_pairs,
                                                    g_bond_pattern,
                                                    typepattern_to_coefftypes,
@@ -275,11 +315,12 @@ def GenInteractions_lines(lines_atoms,
                                                    bondids_str,
                                                    bondtypes_str,
                                                    report_progress,
-                                                   check_undefined)
+                                                   check_undefined,
+                                                   num_jobs)
     lines_nbody_new = []
     for coefftype, atomids_list in coefftype_to_atomids_str.items():
         for atomids_found in atomids_list:
-            n = len(lines_nbody) + len(lines_nbody_new) + 1
+            n = num_nbody + len(lines_nbody_new) + 1
             line = prefix + str(n) + suffix + ' ' + \
                 coefftype + ' ' + (' '.join(atomids_found)) + '\n'
             lines_nbody_new.append(line)
@@ -287,6 +328,81 @@ def GenInteractions_lines(lines_atoms,
     return lines_nbody_new
 
 
+def GenInteractions_lines(lines_atoms,
+                          lines_bonds,
+                          lines_nbody,
+                          lines_nbodybytype,
+                          atom_style,
+                          g_bond_pattern,
+                          canonical_order,  # function to sort atoms and bonds
+                          prefix='',
+                          suffix='',
+                          report_progress=False,
+                          check_undefined=False,
+                          num_jobs=1):
+
+    column_names = AtomStyle2ColNames(atom_style)
+    i_atomid, i_atomtype, i_molid = ColNames2AidAtypeMolid(column_names)
+
+    atomids_str, atomtypes_str = ExtractAtomTypes(lines_atoms,
+                                                  i_atomid,
+                                                  i_atomtype)
+
+    bondids_str, bondtypes_str, bond_pairs = ExtractBonds(lines_bonds)
+
+    typepattern_to_coefftypes = ExtractTypePatterns(lines_nbodybytype,
+                                                    g_bond_pattern)
+
+    return GenInteractions_tables(atomids_str,
+                                  atomtypes_str,
+                                  bondids_str,
+                                  bondtypes_str,
+                                  bond_pairs,
+                                  len(lines_nbody),
+                                  typepattern_to_coefftypes,
+                                  g_bond_pattern,
+                                  canonical_order,
+                                  prefix,
+                                  suffix,
+                                  report_progress,
+                                  check_undefined,
+                                  num_jobs)
+
+
+def LoadBondPattern(src_bond_pattern):
+    """
+    Import the python module (eg. "nbody_Angles", or a file from the
+    "nbody_alt_symmetry/" directory) which defines the bond pattern
+    and symmetry rules for this type of interaction.
+    (The module must define "bond_pattern" and "canonical_order".)
+
+    """
+    # search locations
+    package_opts = [[src_bond_pattern, __package__],
+                    ['nbody_alt_symmetry.'+src_bond_pattern, __package__]]
+
+    if __package__:
+        for i in range(0, len(package_opts)):
+            package_opts[i][0] = '.' + package_opts[i][0]
+        package_opts.append(['.'+src_bond_pattern, __package__+'.nbody_alt_symmetry'])
+
+
+    g = None
+    for name, pkg in package_opts:
+        try:
+            g = importlib.import_module(name, pkg)
+            break
+        except (ImportError, SystemError, ValueError):
+            pass
+
+    if g is None:
+        raise InputError('Error: Unable to locate file \"' +
+                         src_bond_pattern + '.py\"\n'
+                         '       (Did you mispell the file name?\n'
+                         '        Check the \"nbody_alt_symmetry/\" directory.)\n')
+    return g
+
+
 def GenInteractions_files(lines_data,
                           src_bond_pattern,
                           fname_atoms,
@@ -299,7 +415,8 @@ def GenInteractions_files(lines_data,
                           prefix='',
                           suffix='',
                           report_progress=False,
-                          check_undefined=False):
+                          check_undefined=False,
+                          num_jobs=1):
 
     if fname_atoms == None:
         lines_atoms = [
@@ -358,29 +475,10 @@ def GenInteractions_files(lines_data,
                              if((len(line.strip()) > 0)and(line.strip()[0] != '#'))]
         f.close()
 
-    # search locations
-    package_opts = [[src_bond_pattern, __package__],
-                    ['nbody_alt_symmetry.'+src_bond_pattern, __package__]]
-
-    if __package__:
-        for i in range(0, len(package_opts)):
-            package_opts[i][0] = '.' + package_opts[i][0]
-        package_opts.append(['.'+src_bond_pattern, __package__+'.nbody_alt_symmetry'])
-
-
-    g = None
-    for name, pkg in package_opts:
-        try:
-            g = importlib.import_module(name, pkg)
-            break
-        except (ImportError, SystemError, ValueError):
-            pass
-
-    if g is None:
-        sys.stderr.write('Error: Unable to locate file \"' +
-                         src_bond_pattern + '.py\"\n'
-                         '       (Did you mispell the file name?\n'
-                         '        Check the \"nbody_alt_symmetry/\" directory.)\n')
+    try:
+        g = LoadBondPattern(src_bond_pattern)
+    except InputError as err:
+        sys.stderr.write(str(err))
         sys.exit(-1)
 
     return GenInteractions_lines(lines_atoms,
@@ -393,7 +491,8 @@ def GenInteractions_files(lines_data,
                                  prefix,
                                  suffix,
                                  report_progress,
-                                 check_undefined)
+                                 check_undefined,
+                                 num_jobs)
 
 
 def main():
@@ -414,6 +513,7 @@ def main():
         prefix = ''
         suffix = ''
         check_undefined = False
+        num_jobs = 1
 
         argv = [arg for arg in sys.argv]
 
@@ -546,6 +646,15 @@ def main():
                 check_undefined = True
                 del(argv[i:i + 1])
 
+            elif argv[i].lower() == '-nbody-jobs':
+                if ((i + 1 >= len(argv)) or
+                    (not str.isdigit(argv[i + 1])) or
+                    (int(argv[i + 1]) < 1)):
+                    raise InputError('Error: ' + argv[i] + ' flag should be followed by a positive integer\n'
+                                     '       (the number of processes to use).\n')
+                num_jobs = int(argv[i + 1])
+                del(argv[i:i + 2])
+
             elif argv[i][0] == '-':
                 raise InputError('Error(' + g_program_name + '):\n'
                                  'Unrecogized command line argument \"' + argv[i] + '\"\n')
@@ -610,7 +719,8 @@ def main():
                                   prefix,
                                   suffix,
                                   True,
-                                  check_undefined)
+                                  check_undefined,
+                                  num_jobs)
 
         # Print this text to the standard out.
 
@@ -8,6 +8,7 @@
 
 
 import sys
+import os
 from collections import defaultdict
 
 
@@ -28,16 +29,330 @@ else:
 from collections import defaultdict
 
 try:
-    from .nbody_graph_search import Ugraph, GraphMatcher
-    from .ttree_lex import MatchesPattern, MatchesAll, InputError
+    from .nbody_graph_search import Ugraph, GraphMatcher, DFS
+    from .ttree_lex import MatchesPattern, MatchesAll, HasWildcard, InputError
 except (ImportError, SystemError, ValueError):
     # not installed as a package
-    from nbody_graph_search import Ugraph, GraphMatcher
-    from ttree_lex import MatchesPattern, MatchesAll, InputError
+    from nbody_graph_search import Ugraph, GraphMatcher, DFS
+    from ttree_lex import MatchesPattern, MatchesAll, HasWildcard, InputError
 
 #import gc
 
 
+class TypePatternIndex(object):
+    """
+    TypePatternIndex is used to find all of the typepatterns (from a list
+    of typepatterns) which match a given list of type strings, without
+    testing every typepattern against every list of type strings.
+    (Force fields like "gaff2.lt" or "oplsaa2024.lt" define thousands of
+     "Angles By Type" or "Dihedrals By Type" rules.)
+
+    The typepatterns are split into their individual entries (one entry
+    for each atom type and bond type).  Entries which are ordinary strings
+    are stored in a hash table (one for each position in the typepattern).
+    Entries containing wildcards ("*" or "?") or regular expressions are
+    grouped together, so that each distinct entry is only compared with
+    each distinct type string once.  The set of typepatterns which match at
+    each position is stored as a bitmask (an integer whose ith bit is 1 if
+    the ith typepattern matches).  A typepattern matches the list of type
+    strings if it matches at every position (ie. if the corresponding bit is
+    set in all of these bitmasks).
+    The results are identical to invoking MatchesAll() on every typepattern.
+
+    """
+
+    def __init__(self, typepatterns):
+        self.typepatterns = typepatterns
+        self.n = 0
+        if len(typepatterns) > 0:
+            self.n = len(typepatterns[0])
+        # For each position: entry (string) -> bitmask of typepatterns
+        self.literal_masks = [defaultdict(int) for p in range(0, self.n)]
+        # For each position: entry (wildcard or regex) -> bitmask
+        self.pattern_masks = [OrderedDict() for p in range(0, self.n)]
+        # For each position: type string -> bitmask (computed when needed)
+        self.cached_masks = [{} for p in range(0, self.n)]
+        for i in range(0, len(typepatterns)):
+            typepattern = typepatterns[i]
+            assert(len(typepattern) == self.n)
+            bit = 1 << i
+            for p in range(0, self.n):
+                entry = typepattern[p]
+                if (type(entry) is str) and (not HasWildcard(entry)):
+                    self.literal_masks[p][entry] |= bit
+                elif entry in self.pattern_masks[p]:
+                    self.pattern_masks[p][entry] |= bit
+                else:
+                    self.pattern_masks[p][entry] = bit
+
+    def PositionMask(self, p, type_str):
+        """
+        Return a bitmask indicating which typepatterns
+        match "type_str" at position p.
+
+        """
+        cached_masks = self.cached_masks[p]
+        if type_str in cached_masks:
+            return cached_masks[type_str]
+        mask = self.literal_masks[p].get(type_str, 0)
+        for entry, entry_mask in self.pattern_masks[p].items():
+            if MatchesPattern(type_str, entry):
+                mask |= entry_mask
+        cached_masks[type_str] = mask
+        return mask
+
+    def MatchMask(self, type_strings):
+        """ Return a bitmask of all of the typepatterns that match. """
+        assert(len(type_strings) == self.n)
+        if self.n == 0:
+            return (1 << len(self.typepatterns)) - 1
+        mask = self.PositionMask(0, type_strings[0])
+        p = 1
+        while (p < self.n) and (mask != 0):
+            mask &= self.PositionMask(p, type_strings[p])
+            p += 1
+        return mask
+
+    def Matches(self, type_strings):
+        """
+        Return a list of the indices of the typepatterns which match
+        type_strings (in increasing order).
+
+        """
+        return MaskToIndices(self.MatchMask(type_strings))
+
+
+def MaskToIndices(mask):
+    """ Return the positions of the bits in "mask" which are 1. """
+    indices = []
+    while mask:
+        lowest_bit = mask & (-mask)
+        indices.append(lowest_bit.bit_length() - 1)
+        mask ^= lowest_bit
+    return indices
+
+
+def _MatchSubgraph(vert_attrs, edge_pairs, edge_attrs, g_bond_pattern):
+    """
+    Find all of the matches between the bond pattern and a small graph
+    (typically a single molecule) containing len(vert_attrs) vertices,
+    connected by the edges in "edge_pairs".  (Each entry in "edge_pairs" is
+    a pair of vertex indices.  The vertex and edge attributes (atom and bond
+    types) are stored in "vert_attrs" and "edge_attrs".)
+    The matches are returned as a list of (atombondtypes, atombondids) pairs
+    in the order they are found by GraphMatcher.
+
+    """
+    G_sub = Ugraph()
+    for iv in range(0, len(vert_attrs)):
+        G_sub.AddVertex(iv)
+    for iv, jv in edge_pairs:
+        G_sub.AddEdge(iv, jv)
+    gm = GraphMatcher(G_sub, g_bond_pattern)
+    atombondtypes_found = {}
+    typed_matches = []
+    for batch in gm.MatchBatches():
+        for atombondids in batch:
+            atombondtypes = (tuple([vert_attrs[iv] for iv in atombondids[0]]),
+                             tuple([edge_attrs[ie] for ie in atombondids[1]]))
+            # (Use the same tuple object for all matches of the same type)
+            atombondtypes = atombondtypes_found.setdefault(atombondtypes,
+                                                           atombondtypes)
+            typed_matches.append((atombondtypes, atombondids))
+    return typed_matches
+
+
+# The distinct components and bond pattern used by _MatchSubgraphGroup().
+# (This is set before the worker processes are created using "fork", so
+#  it is shared with them instead of being sent along with every task.)
+g_match_job = None
+
+
+def _MatchSubgraphGroup(group):
+    """
+    Invoke _MatchSubgraph() on each of the distinct components whose indices
+    are in "group".  (This function is invoked by TypedMatchBatches(),
+    sometimes in a separate process.)
+
+    """
+    signatures, g_bond_pattern = g_match_job
+    return [_MatchSubgraph(signatures[isig][0],
+                           signatures[isig][1],
+                           signatures[isig][2],
+                           g_bond_pattern)
+            for isig in group]
+
+
+def _SignatureGroups(signatures, num_jobs):
+    """
+    Divide the distinct components (signatures) into "num_jobs" groups
+    containing similar numbers of atoms.  (Assign the largest remaining
+    component to the smallest group.)  Each group is a list of indices
+    into "signatures", in increasing order.
+
+    """
+    num_groups = max(1, min(num_jobs, len(signatures)))
+    groups = [[] for i in range(0, num_groups)]
+    group_sizes = [0 for i in range(0, num_groups)]
+    for isig in sorted(range(0, len(signatures)),
+                       key=lambda isig: len(signatures[isig][0]),
+                       reverse=True):
+        i_group = group_sizes.index(min(group_sizes))
+        group_sizes[i_group] += len(signatures[isig][0])
+        groups[i_group].append(isig)
+    for group in groups:
+        group.sort()
+    return groups
+
+
+def TypedMatchBatches(G_system,
+                      g_bond_pattern,
+                      num_jobs=1,
+                      batch_size=4096):
+    """
+    Finds the same matches as
+    GraphMatcher(G_system, g_bond_pattern).MatchBatches(), in the same order.
+    Each match (atombondids) is returned together with the atom and bond
+    types (atombondtypes) of the atoms and bonds in that match, as a pair:
+       (atombondtypes, atombondids)
+    The atom and bond types are integers stored in the "attr" attributes of
+    the vertices and edges in G_system.
+
+    Bonded interactions never span multiple molecules, so G_system is split
+    into its connected components (using DFS.Components()).  Typically most
+    of these components (molecules) are copies of a small number of molecule
+    types.  Two components are considered identical if they contain the same
+    sequence of atom types, and bonds of the same type connecting the same
+    (relative) atoms, listed in the same order.  The search for matching
+    bond patterns (and the atom and bond type lookup) is only carried out
+    once for each distinct component.  These results are reused for all of
+    the other copies of that component by translating the atom and bond ids.
+    If num_jobs > 1, then the distinct components are divided into
+    "num_jobs" groups of similar size (see _SignatureGroups()), and each
+    group is searched by a separate process.  (num_jobs is reduced if there
+    are fewer CPUs available.  Processes are created using "fork".  If this
+    is not available, a single process is used instead.)
+
+    """
+    components = DFS(G_system).Components()
+    if len(components) < 2:
+        gm = GraphMatcher(G_system, g_bond_pattern)
+        vert_attrs = [G_system.GetVert(Iv).attr
+                      for Iv in range(0, G_system.GetNumVerts())]
+        edge_attrs = [G_system.GetEdge(Ie).attr
+                      for Ie in range(0, G_system.GetNumEdges())]
+        for batch in gm.MatchBatches(batch_size):
+            yield [((tuple([vert_attrs[Iv] for Iv in atombondids[0]]),
+                     tuple([edge_attrs[Ie] for Ie in atombondids[1]])),
+                    atombondids)
+                   for atombondids in batch]
+        return
+
+    nv = G_system.GetNumVerts()
+    comp_of_vert = [0 for Iv in range(0, nv)]
+    local_iv = [0 for Iv in range(0, nv)]
+    for ic in range(0, len(components)):
+        component = components[ic]
+        for iv in range(0, len(component)):
+            Iv = component[iv]
+            comp_of_vert[Iv] = ic
+            local_iv[Iv] = iv
+
+    # Make a list of the edges in each component, and the pairs of atoms they
+    # connect (using indices into the component's (sorted) list of vertices).
+    # The order of the edges determines the order of the neighbors of each
+    # vertex, and (therefore) the order of the matches.  Hence we preserve it.
+    Ie_lists = [[] for ic in range(0, len(components))]
+    edge_pairs = [[] for ic in range(0, len(components))]
+    edge_attrs = [[] for ic in range(0, len(components))]
+    for Ie in range(0, G_system.GetNumEdges()):
+        edge = G_system.GetEdge(Ie)
+        ic = comp_of_vert[edge.start]
+        Ie_lists[ic].append(Ie)
+        edge_pairs[ic].append((local_iv[edge.start], local_iv[edge.stop]))
+        edge_attrs[ic].append(edge.attr)
+
+    # Identify the distinct components
+    signatures = []        # a list of distinct components
+    signature_ids = {}     # lookup the index of each signature in this list
+    signature_of_comp = []  # the index of each component's signature
+    for ic in range(0, len(components)):
+        signature = (tuple([G_system.GetVert(Iv).attr
+                            for Iv in components[ic]]),
+                     tuple(edge_pairs[ic]),
+                     tuple(edge_attrs[ic]))
+        isig = signature_ids.get(signature)
+        if isig is None:
+            isig = len(signatures)
+            signature_ids[signature] = isig
+            signatures.append(signature)
+        signature_of_comp.append(isig)
+    del signature_ids
+    del edge_pairs
+    del edge_attrs
+
+    # Find the matches in each of the distinct components
+    global g_match_job
+    if hasattr(os, 'sched_getaffinity'):
+        num_jobs = min(num_jobs, len(os.sched_getaffinity(0)))
+    groups = _SignatureGroups(signatures, num_jobs)
+    if len(groups) > 1:
+        try:
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            context = multiprocessing.get_context('fork')
+        except (ImportError, ValueError):
+            sys.stderr.write('Warning: Unable to create processes using \"fork\".\n'
+                             '         Running in a single process instead.\n')
+            groups = [list(range(0, len(signatures)))]
+    g_match_job = (signatures, g_bond_pattern)
+    try:
+        results = [None for isig in range(0, len(signatures))]
+        if len(groups) > 1:
+            # (There is only one task per process, so chunksize=1 is fine.)
+            with ProcessPoolExecutor(max_workers=len(groups),
+                                     mp_context=context) as executor:
+                for group, group_results in zip(groups,
+                                                executor.map(_MatchSubgraphGroup,
+                                                             groups,
+                                                             chunksize=1)):
+                    for isig, result in zip(group, group_results):
+                        results[isig] = result
+        else:
+            results = _MatchSubgraphGroup(groups[0])
+    finally:
+        g_match_job = None
+
+    # Organize the matches in each distinct component by their first vertex
+    matches_by_start = []
+    for isig in range(0, len(signatures)):
+        by_start = [[] for iv in range(0, len(signatures[isig][0]))]
+        for typed_match in results[isig]:
+            by_start[typed_match[1][0][0]].append(typed_match)
+        matches_by_start.append(by_start)
+    del results
+
+    # GraphMatcher finds all of the matches which begin with the first
+    # vertex in G_system, followed by matches beginning with the second vertex,
+    # and so on.  Loop over the vertices in G_system in the same order, and
+    # translate the (local) matches beginning from each vertex.
+    batch = []
+    for Iv in range(0, nv):
+        ic = comp_of_vert[Iv]
+        Iv_list = components[ic]
+        Ie_list = Ie_lists[ic]
+        for atombondtypes, (verts, edges) in \
+                matches_by_start[signature_of_comp[ic]][local_iv[Iv]]:
+            batch.append((atombondtypes,
+                          (tuple([Iv_list[iv] for iv in verts]),
+                           tuple([Ie_list[ie] for ie in edges]))))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if len(batch) > 0:
+        yield batch
+
+
 def GenInteractions_int(G_system,
                         g_bond_pattern,
                         typepattern_to_coefftypes,
@@ -45,7 +360,8 @@ def GenInteractions_int(G_system,
                         atomtypes_int2str,
                         bondtypes_int2str,
                         report_progress=False,  # print messages to sys.stderr?
-                        check_undefined_atomids_str = None):
+                        check_undefined_atomids_str = None,
+                        num_jobs=1):  # number of processes to use
     """
     GenInteractions() automatically determines a list of interactions
     present in a system of bonded atoms (argument "G_system"),
@@ -125,60 +441,56 @@ def GenInteractions_int(G_system,
     # atom and bond types and store all of the non-redundant ones in
     # the "interactions_by_type" variable.
 
-    gm = GraphMatcher(G_system, g_bond_pattern)
-
     interactions_by_type = defaultdict(list)
 
-    for atombondids in gm.Matches():
-        # "atombondids" is a tuple.
-        #  atombondids[0] has atomIDs from G_system corresponding to g_bond_pattern
-        #     (These atomID numbers are indices into the G_system.verts[] list.)
-        #  atombondids[1] has bondIDs from G_system corresponding to g_bond_pattern
-        #     (These bondID numbers are indices into the G_system.edges[] list.)
-
-        # It's convenient to organize the list of interactions-between-
-        # atoms in a dictionary indexed by atomtypes and bondtypes.
-        # (Because many atoms and bonds typically share the same type,
-        #  organizing the results this way makes it faster to check
-        #  whether a given interaction matches a "typepattern" defined
-        #  by the user.  We only have to check once for the whole group.)
-
-        atombondtypes = \
-            (tuple([G_system.GetVert(Iv).attr for Iv in atombondids[0]]),
-             tuple([G_system.GetEdge(Ie).attr for Ie in atombondids[1]]))
-
-        interactions_by_type[atombondtypes].append(atombondids)
-
-        if report_progress:
-            # GraphMatcher.Matches() searches for matches in an order
-            # that selects a different atomid number from G_system,
-            # starting at 0, and continuing up to the number of atoms (-1)
-            # in the system (G_system.nv-1), and using this as the first
-            # atom in the match (ie match[0][0]). This number can be used
-            # to guess much progress has been made so far.
-            oldatomid = startatomid
-            startatomid = atombondids[0][0]
-            percent_complete = (100 * startatomid) // G_system.GetNumVerts()
-            # report less often as more progress made
-            if percent_complete <= 4:
-                old_pc = (100 * oldatomid) // G_system.GetNumVerts()
-                if percent_complete > old_pc:
-                    sys.stderr.write('  ' + str(percent_complete) + '%')
-            elif percent_complete <= 8:
-                pc_d2 = (100 * startatomid) // (2 * G_system.GetNumVerts())
-                oldpc_d2 = (100 * oldatomid) // (2 * G_system.GetNumVerts())
-                if pc_d2 > oldpc_d2:
-                    sys.stderr.write('  ' + str(percent_complete) + '%')
-            elif percent_complete <= 20:
-                pc_d4 = (100 * startatomid) // (4 * G_system.GetNumVerts())
-                oldpc_d4 = (100 * oldatomid) // (4 * G_system.GetNumVerts())
-                if pc_d4 > oldpc_d4:
-                    sys.stderr.write('  ' + str(percent_complete) + '%')
-            else:
-                pc_d10 = (100 * startatomid) // (10 * G_system.GetNumVerts())
-                oldpc_d10 = (100 * oldatomid) // (10 * G_system.GetNumVerts())
-                if pc_d10 > oldpc_d10:
-                    sys.stderr.write('  ' + str(percent_complete) + '%')
+    for batch in TypedMatchBatches(G_system, g_bond_pattern, num_jobs):
+        for atombondtypes, atombondids in batch:
+            # "atombondids" is a tuple.
+            #  atombondids[0] has atomIDs from G_system corresponding to g_bond_pattern
+            #     (These atomID numbers are indices into the G_system.verts[] list.)
+            #  atombondids[1] has bondIDs from G_system corresponding to g_bond_pattern
+            #     (These bondID numbers are indices into the G_system.edges[] list.)
+
+            # It's convenient to organize the list of interactions-between-
+            # atoms in a dictionary indexed by atomtypes and bondtypes.
+            # (Because many atoms and bonds typically share the same type,
+            #  organizing the results this way makes it faster to check
+            #  whether a given interaction matches a "typepattern" defined
+            #  by the user.  We only have to check once for the whole group.)
+            #  (The atom and bond types were looked up by TypedMatchBatches())
+
+            interactions_by_type[atombondtypes].append(atombondids)
+
+            if report_progress:
+                # GraphMatcher.Matches() searches for matches in an order
+                # that selects a different atomid number from G_system,
+                # starting at 0, and continuing up to the number of atoms (-1)
+                # in the system (G_system.nv-1), and using this as the first
+                # atom in the match (ie match[0][0]). This number can be used
+                # to guess much progress has been made so far.
+                oldatomid = startatomid
+                startatomid = atombondids[0][0]
+                percent_complete = (100 * startatomid) // G_system.GetNumVerts()
+                # report less often as more progress made
+                if percent_complete <= 4:
+                    old_pc = (100 * oldatomid) // G_system.GetNumVerts()
+                    if percent_complete > old_pc:
+                        sys.stderr.write('  ' + str(percent_complete) + '%')
+                elif percent_complete <= 8:
+                    pc_d2 = (100 * startatomid) // (2 * G_system.GetNumVerts())
+                    oldpc_d2 = (100 * oldatomid) // (2 * G_system.GetNumVerts())
+                    if pc_d2 > oldpc_d2:
+                        sys.stderr.write('  ' + str(percent_complete) + '%')
+                elif percent_complete <= 20:
+                    pc_d4 = (100 * startatomid) // (4 * G_system.GetNumVerts())
+                    oldpc_d4 = (100 * oldatomid) // (4 * G_system.GetNumVerts())
+                    if pc_d4 > oldpc_d4:
+                        sys.stderr.write('  ' + str(percent_complete) + '%')
+                else:
+                    pc_d10 = (100 * startatomid) // (10 * G_system.GetNumVerts())
+                    oldpc_d10 = (100 * oldatomid) // (10 * G_system.GetNumVerts())
+                    if pc_d10 > oldpc_d10:
+                        sys.stderr.write('  ' + str(percent_complete) + '%')
 
     if report_progress:
         sys.stderr.write('  100%\n')
@@ -199,12 +511,11 @@ def GenInteractions_int(G_system,
 
         types_atoms_all_str = set([])
         types_bonds_all_str = set([])
-        for typepattern, coefftype in typepattern_to_coefftypes:
-            for atombondtypes, abidslist in interactions_by_type.items():
-                for Iv in atombondtypes[0]:
-                    types_atoms_all_str.add(atomtypes_int2str[Iv])
-                for Ie in atombondtypes[1]:
-                    types_bonds_all_str.add(bondtypes_int2str[Ie])
+        for atombondtypes, abidslist in interactions_by_type.items():
+            for Iv in atombondtypes[0]:
+                types_atoms_all_str.add(atomtypes_int2str[Iv])
+            for Ie in atombondtypes[1]:
+                types_bonds_all_str.add(bondtypes_int2str[Ie])
     # ------------------ reporting progress (end) -------------------
 
 
@@ -255,9 +566,44 @@ def GenInteractions_int(G_system,
     # ------------------ check to make sure all interactions are defined (end)
 
 
+    # Figure out which typepatterns match the atom and bond types
+    # of each group of interactions.  (Rather than comparing every
+    # typepattern with every group, use a TypePatternIndex.)
+    # Afterwards, "atombondtypes_by_rule[i]" contains the list of
+    # atombondtypes which match the ith entry in typepattern_to_coefftypes
+    # (in the same order they appear in "interactions_by_type").
+
+    type_index = TypePatternIndex([typepattern for typepattern, coefftype
+                                   in typepattern_to_coefftypes])
+    atombondtypes_by_rule = defaultdict(list)
+    for atombondtypes in interactions_by_type:
+        # express atom & bond types in a tuple of the original string
+        # format
+        types_atoms = [atomtypes_int2str[Iv] for Iv in atombondtypes[0]]
+        types_bonds = [bondtypes_int2str[Ie] for Ie in atombondtypes[1]]
+        type_strings = types_atoms + types_bonds
+        for i in type_index.Matches(type_strings):
+            atombondtypes_by_rule[i].append(atombondtypes)
+
+    if report_progress:
+        # Which typepatterns are (potentially) satisfied
+        # by the atoms and bonds present in the system?
+        available_mask = -1
+        nv = g_bond_pattern.GetNumVerts()
+        for p in range(0, type_index.n):
+            if p < nv:
+                types_all_str = types_atoms_all_str
+            else:
+                types_all_str = types_bonds_all_str
+            mask = 0
+            for type_str in types_all_str:
+                mask |= type_index.PositionMask(p, type_str)
+            available_mask &= mask
+
     count = 0
 
-    for typepattern, coefftype in typepattern_to_coefftypes:
+    for i in range(0, len(typepattern_to_coefftypes)):
+        typepattern, coefftype = typepattern_to_coefftypes[i]
 
         # ------------------ reporting progress -----------------------
         # The next interval of code is not technically necessary, but it makes
@@ -270,30 +616,7 @@ def GenInteractions_int(G_system,
             # are (potentially) satisfied by any of the atoms present in the system.
             # If any of the required atoms for this typepattern are not present
             # in this system, then skip to the next typepattern.
-            atoms_available_Iv = [False for Iv in range(
-                0, g_bond_pattern.GetNumVerts())]
-            for Iv in range(0, g_bond_pattern.GetNumVerts()):
-                for type_atom_str in types_atoms_all_str:
-                    if MatchesPattern(type_atom_str, typepattern[Iv]):
-                        atoms_available_Iv[Iv] = True
-            atoms_available = True
-            for Iv in range(0, g_bond_pattern.GetNumVerts()):
-                if not atoms_available_Iv[Iv]:
-                    atoms_available = False
-
-            bonds_available_Ie = [False for Ie in range(
-                0, g_bond_pattern.GetNumEdges())]
-            for Ie in range(0, g_bond_pattern.GetNumEdges()):
-                for type_bond_str in types_bonds_all_str:
-                    if MatchesPattern(type_bond_str,
-                                      typepattern[g_bond_pattern.GetNumVerts() + Ie]):
-                        bonds_available_Ie[Ie] = True
-            bonds_available = True
-            for Ie in range(0, g_bond_pattern.GetNumEdges()):
-                if not bonds_available_Ie[Ie]:
-                    bonds_available = False
-
-            if atoms_available and bonds_available:
+            if (available_mask >> i) & 1:
 
                 # Explanation:
                 # (Again) only if ALL of the atoms and bond requirements for
@@ -310,47 +633,40 @@ def GenInteractions_int(G_system,
 
         # ------------------ reporting progress (end) -------------------
 
-        for atombondtypes, abidslist in interactions_by_type.items():
-            # express atom & bond types in a tuple of the original string
-            # format
-            types_atoms = [atomtypes_int2str[Iv] for Iv in atombondtypes[0]]
-            types_bonds = [bondtypes_int2str[Ie] for Ie in atombondtypes[1]]
-            type_strings = types_atoms + types_bonds
-
-            # use string comparisons to check for a match with typepattern
-            if MatchesAll(type_strings, typepattern):  # <-see "ttree_lex.py"
-                for abids in abidslist:
-                    # Re-order the atoms (and bonds) in a "canonical" way.
-                    # Only add new interactions to the list after re-ordering
-                    # them and checking that they have not been added earlier.
-                    # (...well not when using the same coefftype at least.
-                    #  This prevents the same triplet of atoms from
-                    #  being used to calculate the bond-angle twice:
-                    #  once for 1-2-3 and 3-2-1, for example.)
-                    abids = canonical_order(abids)
-                    redundant = False
+        for atombondtypes in atombondtypes_by_rule[i]:
+            abidslist = interactions_by_type[atombondtypes]
+            for abids in abidslist:
+                # Re-order the atoms (and bonds) in a "canonical" way.
+                # Only add new interactions to the list after re-ordering
+                # them and checking that they have not been added earlier.
+                # (...well not when using the same coefftype at least.
+                #  This prevents the same triplet of atoms from
+                #  being used to calculate the bond-angle twice:
+                #  once for 1-2-3 and 3-2-1, for example.)
+                abids = canonical_order(abids)
+                redundant = False
+                if abids in abids_to_coefftypes:
+                    coefftypes = abids_to_coefftypes[abids]
+                    if coefftype in coefftypes:
+                        redundant = True
+               
+                if check_undefined_atomids_str:
+                    atomids_int = tuple(abids[0])
+                    atomids_matched[atomids_int] = True
+
+                if not redundant:                       
+                    
+                    # (It's too bad python does not
+                    #  have an Ordered defaultdict)
+                    if coefftype in coefftype_to_atomids:
+                        coefftype_to_atomids[coefftype].append(abids[0])
+                    else:
+                        coefftype_to_atomids[coefftype] = [abids[0]]
                     if abids in abids_to_coefftypes:
-                        coefftypes = abids_to_coefftypes[abids]
-                        if coefftype in coefftypes:
-                            redundant = True
-                   
-                    if check_undefined_atomids_str:
-                        atomids_int = tuple(abids[0])
-                        atomids_matched[atomids_int] = True
-
-                    if not redundant:                       
-                        
-                        # (It's too bad python does not
-                        #  have an Ordered defaultdict)
-                        if coefftype in coefftype_to_atomids:
-                            coefftype_to_atomids[coefftype].append(abids[0])
-                        else:
-                            coefftype_to_atomids[coefftype] = [abids[0]]
-                        if abids in abids_to_coefftypes:
-                            abids_to_coefftypes[abids].append(coefftype)
-                        else:
-                            abids_to_coefftypes[abids] = [coefftype]
-                        count += 1
+                        abids_to_coefftypes[abids].append(coefftype)
+                    else:
+                        abids_to_coefftypes[abids] = [coefftype]
+                    count += 1
 
     if report_progress:
         sys.stderr.write('  (found ' +
@@ -389,7 +705,8 @@ def GenInteractions_str(bond_pairs,
                         bondids_str,
                         bondtypes_str,
                         report_progress=False,  # print messages to sys.stderr?
-                        check_undefined=False):
+                        check_undefined=False,
+                        num_jobs=1):
 
     assert(len(atomids_str) == len(atomtypes_str))
     assert(len(bondids_str) == len(bondtypes_str))
@@ -452,7 +769,8 @@ def GenInteractions_str(bond_pairs,
                                                    atomtypes_int2str,
                                                    bondtypes_int2str,
                                                    report_progress,
-                                                   (atomids_str if check_undefined else None))
+                                                   (atomids_str if check_undefined else None),
+                                                   num_jobs)
 
     coefftype_to_atomids_str = OrderedDict()
     for coefftype, atomidss_int in coefftype_to_atomids_int.items():
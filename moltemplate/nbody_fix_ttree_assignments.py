@@ -14,6 +14,11 @@ Typical usage:
 nbody_fix_ttree_assignments.py "angles" new_Angles.template \
   < ttree_assignments.txt > ttree_assigmnents_new.txt
 
+or (to modify the ttree_assignments.txt file in place):
+
+nbody_fix_ttree_assignments.py "angles" new_Angles.template \
+  ttree_assignments.txt
+
 What it does:
 
 In this example, this program extracts the first column from
@@ -44,22 +49,246 @@ awk 'BEGIN{found=0;passed=0} {if(substr($0,0,8)=="$/angle") found=1;
 I wrote this python script (instead of using awk) just to handle quoted stings
 (and strings with other fancy characters and escape sequences).
 
+   IN-PLACE MODIFICATION
+When the name of the ttree_assignments.txt file is given as an argument,
+only the lines belonging to this category (and the lines which follow them)
+are parsed and rewritten.  The lines which precede them are not parsed.
+Usually the category is either missing, or located at the end of the file.
+In that case, the lines which precede it are left untouched on disk, and only
+the new lines are written (at the end of the file).  If an error occurs, the
+original end of the file is restored.  Otherwise (if the category is located
+in the middle of the file), a new version of the file is written, which
+replaces the old one only after it has been written completely.
+
 """
 
 import sys
+import os
+import shutil
+import tempfile
 
 try:
     from .ttree_lex import SplitQuotedString, InputError
+    from .ttree_assignments_index import OpenAssignmentsIndex
 except (ImportError, SystemError, ValueError):
     # not installed as a package
     from ttree_lex import *
+    from ttree_assignments_index import OpenAssignmentsIndex
 
 g_program_name = __file__.split('/')[-1]
 
 
+def _CatNames(cat_name):
+    return set(['$' + cat_name, '$/' + cat_name,
+                '${' + cat_name, '${/' + cat_name])
+
+
+def _FindSection(cat_name, lines):
+    """
+    Find the range of lines (from the lines of a ttree_assignments.txt file)
+    containing the variables in category "cat_name".  "lines" can be any
+    iterable.  To save time, lines which can not possibly contain the name of
+    the category (unless it is needed) are not parsed.
+    Returns (i_begin, i_end, n) where "n" is the number of lines.
+    (i_begin is -1 if the category was not found.  i_end is -1 if the
+     category extends to the end of the file.)
+
+    """
+    possible_cat_names = _CatNames(cat_name)
+    i_preexisting_begin = -1
+    i_preexisting_end = -1
+    in_section = False
+    i = -1
+    for i, line in enumerate(lines):
+        if (not in_section) and (cat_name not in line):
+            continue
+        tokens = SplitQuotedString(line.strip())  # strip comments, handle quotes
+        if len(tokens) == 2:
+            before_colon = tokens[0].split(':')[0]
+            if before_colon in possible_cat_names:
+                if i_preexisting_begin == -1:
+                    i_preexisting_begin = i
+                    in_section = True
+            else:
+                if in_section:
+                    i_preexisting_end = i
+                in_section = False
+    return i_preexisting_begin, i_preexisting_end, i + 1
+
+
+def _AssignmentLines(lines_generated, lines_preexisting, assignments_new):
+    """
+    Generate the new lines for this section of the ttree_assignments.txt file:
+    the variable names from the first column of "lines_generated", followed
+    by the pre-existing variables in "lines_preexisting", numbered in order.
+    The (variable name, value) pairs are appended to "assignments_new".
+
+    """
+    # Now add some new lines (2-column format).
+    # As with any ttree_assignment.txt file:
+    #   The first column has our generated variable names
+    #   The second column has the counter assigned to that variable
+    new_counter = 1
+    for line_orig in lines_generated:
+        line = line_orig.strip()
+        if len(line) > 0:
+            tokens = SplitQuotedString(line)  # strip comments, handle quotes
+            assignments_new.append((tokens[0], str(new_counter)))
+            yield tokens[0] + '  ' + str(new_counter) + '\n'
+            new_counter += 1
+
+    sys.stderr.write('  (adding pre-exisiting lines)\n')
+    # Append the original pre-existing interactions of that type, but assign
+    # them to higher numbers.  (Hopefully this helps to make sure that these
+    # assignments will override any of the automatic/generated assignments.)
+    for line in lines_preexisting:
+        tokens = SplitQuotedString(line.strip())  # strip comments, handle quotes
+        if len(tokens) == 2:
+            assignments_new.append((tokens[0], str(new_counter)))
+            yield tokens[0] + '  ' + str(new_counter) + '\n'
+            new_counter += 1
+
+
+def FixTtreeAssignmentsFile(cat_name, lines_generated, filename):
+    """
+    Equivalent to FixTtreeAssignments(), except that the file "filename"
+    (typically "ttree_assignments.txt") is modified.  The lines in the file
+    which precede the category "cat_name" are not parsed.
+    If that category is missing, or if it is located at the end of the file,
+    then only the end of the file is rewritten.  (If an error occurs, the
+    original text is written back.)  Otherwise, the new version of the file
+    is written to a temporary file in the same directory, which then replaces
+    the original file (using os.replace()).
+    If the file has an up-to-date index (see ttree_assignments_index.py),
+    then the index is updated as well.
+    Returns a list of (variable name, value) pairs for the variables which
+    were renumbered.
+
+    """
+    with open(filename, 'rb') as f:
+        offsets = [0]
+        def _Lines():
+            # (Keep track of where each line begins, in bytes)
+            for line in f:
+                offsets.append(offsets[-1] + len(line))
+                yield line.decode('utf-8')
+        i_begin, i_end, n = _FindSection(cat_name, _Lines())
+
+    index = OpenAssignmentsIndex(filename)
+    try:
+        assignments_new = []
+        if (i_begin == -1) or (i_end == -1):
+            # The category is either missing or located at the end of the file.
+            # Only the text following i_cut (if any) needs to be rewritten.
+            if i_begin == -1:
+                i_cut = offsets[-1]
+            else:
+                i_cut = offsets[i_begin]
+            with open(filename, 'r+b') as f:
+                f.seek(i_cut)
+                text_orig = f.read()
+                i_old_end = i_cut + len(text_orig)
+                lines_preexisting = text_orig.decode('utf-8').splitlines(True)
+                try:
+                    f.seek(i_cut)
+                    sys.stderr.write('  (adding new lines)\n')
+                    for line in _AssignmentLines(lines_generated,
+                                                 lines_preexisting,
+                                                 assignments_new):
+                        f.write(line.encode('utf-8'))
+                    i_new_end = f.tell()
+                    f.truncate()
+                except BaseException:
+                    # restore the original end of the file
+                    f.seek(i_cut)
+                    f.write(text_orig)
+                    f.truncate()
+                    raise
+        else:
+            dir_name, base_name = os.path.split(os.path.abspath(filename))
+            fd, tmp_filename = tempfile.mkstemp(prefix=base_name + '.',
+                                                suffix='.tmp',
+                                                dir=dir_name)
+            try:
+                with open(filename, 'rb') as f, os.fdopen(fd, 'wb') as out:
+                    # keep all the lines in the original file before this point.
+                    i_cut = offsets[i_begin]
+                    i_old_end = offsets[i_end]
+                    num_bytes = i_cut
+                    while num_bytes > 0:
+                        buf = f.read(min(num_bytes, 1048576))
+                        out.write(buf)
+                        num_bytes -= len(buf)
+                    lines_preexisting = \
+                        f.read(i_old_end - i_cut).decode('utf-8')
+                    lines_preexisting = lines_preexisting.splitlines(True)
+                    sys.stderr.write('  (adding new lines)\n')
+                    for line in _AssignmentLines(lines_generated,
+                                                 lines_preexisting,
+                                                 assignments_new):
+                        out.write(line.encode('utf-8'))
+                    i_new_end = out.tell()
+                    # keep all the lines in the original file after this point.
+                    shutil.copyfileobj(f, out)
+                shutil.copymode(filename, tmp_filename)
+                os.replace(tmp_filename, filename)
+            except BaseException:
+                os.remove(tmp_filename)
+                raise
+    except BaseException:
+        if index is not None:
+            index.Close()
+        raise
+
+    if index is not None:
+        # (Only the lines between i_cut and i_new_end need to be indexed.)
+        index.Update(i_cut, i_old_end, i_new_end)
+    return assignments_new
+
+def FixTtreeAssignments(cat_name, lines_generated, lines_bindings):
+    """
+    Insert the variable names from the first column of "lines_generated"
+    into the section of "lines_bindings" (the lines from a
+    ttree_assignments.txt file) which belongs to category "cat_name",
+    renumbering the variables in that category to avoid clashes.
+    Returns a tuple containing the new list of lines, and a list of
+    (variable name, value) pairs for the variables which were renumbered.
+
+    """
+    # Figure out which lines in the 'ttree_assignments.txt' file
+    # contain the variables of the type you are looking for.
+    # Make note of the relevant line numbers
+    i_preexisting_begin, i_preexisting_end, n = _FindSection(cat_name,
+                                                             lines_bindings)
+    if i_preexisting_end == -1:
+        i_preexisting_end = len(lines_bindings)
+
+    if i_preexisting_begin == -1:
+        lines_out = [line for line in lines_bindings]
+        lines_preexisting = []
+    else:
+        # keep all the lines in the original file up until the point where
+        # the variables in the category we are looking for were encountered
+        lines_out = lines_bindings[0:i_preexisting_begin]
+        lines_preexisting = lines_bindings[i_preexisting_begin:
+                                           i_preexisting_end]
+
+    sys.stderr.write('  (adding new lines)\n')
+    assignments_new = []
+    lines_out += _AssignmentLines(lines_generated,
+                                  lines_preexisting,
+                                  assignments_new)
+
+    if i_preexisting_begin != -1:
+        # keep all the lines in the original file after this point.
+        lines_out += lines_bindings[i_preexisting_end:]
+
+    return lines_out, assignments_new
+
+
 def main():
     try:
-        if (len(sys.argv) != 3):
+        if (len(sys.argv) != 3) and (len(sys.argv) != 4):
             raise InputError('Error running  \"' + g_program_name + '\"\n'
                              '   Wrong number of arguments.\n'
                              '   (This is likely a programmer error.\n'
@@ -70,87 +299,18 @@ def main():
         lines_generated = f.readlines()
         f.close()
 
-        # Selections are simply lists of 2-tuples (pairs)
-        #f = open('ttree_assignments.txt','r')
-        #lines_bindings = f.readlines()
-        # f.close()
+        if len(sys.argv) == 4:
+            # Modify the ttree_assignments.txt file in place
+            FixTtreeAssignmentsFile(cat_name, lines_generated, sys.argv[3])
+            sys.exit(0)
+
         lines_bindings = sys.stdin.readlines()
 
-        # Figure out which lines in the 'ttree_assignments.txt' file
-        # contain the variables of the type you are looking for.
-        # Make note of the relevant line numbers
-        i_preexisting_begin = -1
-        i_preexisting_end = -1
-        in_section = False
-        possible_cat_names = set(
-            ['$' + cat_name, '$/' + cat_name, '${' + cat_name, '${/' + cat_name])
-
-        preexisting_interaction_list = []
-        for i in range(0, len(lines_bindings)):
-            line = lines_bindings[i].strip()
-            tokens = SplitQuotedString(line)  # strip comments, handle quotes
-            if len(tokens) == 2:
-                before_colon = tokens[0].split(':')[0]
-                if before_colon in possible_cat_names:
-                    if i_preexisting_begin == -1:
-                        i_preexisting_begin = i
-                        in_section = True
-                else:
-                    if in_section:
-                        i_preexisting_end = i
-                    in_section = False
-
-        if i_preexisting_end == -1:
-            i_preexisting_end = len(lines_bindings)
-
-        if i_preexisting_begin == -1:
-            for line in lines_bindings:
-                sys.stdout.write(line)
-        else:
-            # write out all the lines in the original file up until the point where
-            # the variables in the category we are looking for were encountered
-            for i in range(0, i_preexisting_begin):
-                sys.stdout.write(lines_bindings[i])
-
-        sys.stderr.write('  (adding new lines)\n')
-
-        # Now add some new lines (2-column format).
-        # As with any ttree_assignment.txt file:
-        #   The first column has our generated variable names
-        #   The second column has the counter assigned to that variable
-        new_counter = 1
-        for line_orig in lines_generated:
-            line = line_orig.strip()
-            if len(line) > 0:
-                tokens = SplitQuotedString(line)  # strip comments, handle quotes
-                sys.stdout.write(tokens[0] + '  ' + str(new_counter) + '\n')
-                new_counter += 1
-
-        sys.stderr.write('  (adding pre-exisiting lines)\n')
-        if i_preexisting_begin != -1:
-            # Append the original pre-existing interactions of that type, but assign
-            # them to higher numbers.  (Hopefully this helps to make sure that these
-            # assignments will override any of the automatic/generated assignments.)
-            # As with any ttree_assignment.txt file:
-            #   The first column has our generated variable names
-            #   The second column has the counter assigned to that variable
-
-            # sys.stderr.write('  i_preexisting_begin='+
-            #                 str(i_preexisting_begin)+
-            #                 ' i_preexisting_end='+str(i_preexisting_end)+'\n')
-
-            for i in range(i_preexisting_begin, i_preexisting_end):
-                line = lines_bindings[i].strip()
-                tokens = SplitQuotedString(line)  # strip comments, handle quotes
-                if len(tokens) == 2:
-                    sys.stdout.write(tokens[0] + '  ' + str(new_counter) + '\n')
-                    new_counter += 1
-
-            #sys.stderr.write('  (writing pre-exisiting lines)\n')
-
-            # write out all the lines in the original file after this point.
-            for i in range(i_preexisting_end, len(lines_bindings)):
-                sys.stdout.write(lines_bindings[i])
+        lines_out, assignments_new = FixTtreeAssignments(cat_name,
+                                                         lines_generated,
+                                                         lines_bindings)
+        for line in lines_out:
+            sys.stdout.write(line)
 
         sys.exit(0)
 
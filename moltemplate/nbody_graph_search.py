@@ -19,7 +19,12 @@ Search for small graphs inside of big graphs.
 
 import sys
 import copy
+from array import array
 from operator import itemgetter
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 
 class GenError(Exception):
@@ -645,6 +650,50 @@ class DFS(object):
                     self.vvisited[jv] = True
                     self._Order(jv)
 
+    def Components(self):
+        """
+        Components() returns a list of the connected components of the graph.
+        Each component is a sorted list of vertex id numbers.  The components
+        are sorted by their smallest vertex id number.
+        (Direction is ignored: Two vertices joined by an edge pointing in
+         either direction belong to the same component.  Unlike Order(),
+         this function does not use recursion, so it is safe to use on
+         graphs containing very long chains of vertices.)
+
+        """
+        self.Reset()
+        # For directed graphs, we need to know the edges which point into
+        # each vertex as well as the edges which point out of it.
+        neighbors_in = [[] for iv in range(0, self.g.nv)]
+        if type(self.g) is not Ugraph:
+            for ie in range(0, self.g.ne):
+                neighbors_in[self.g.edges[ie].stop].append(
+                    self.g.edges[ie].start)
+        components = []
+        for iv_start in range(0, self.g.nv):
+            if self.vvisited[iv_start]:
+                continue
+            component = [iv_start]
+            self.vvisited[iv_start] = True
+            stack = [iv_start]
+            while len(stack) > 0:
+                iv = stack.pop()
+                for je in self.g.neighbors[iv]:
+                    jv = self.g.edges[je].stop
+                    if not self.vvisited[jv]:
+                        self.vvisited[jv] = True
+                        component.append(jv)
+                        stack.append(jv)
+                for jv in neighbors_in[iv]:
+                    if not self.vvisited[jv]:
+                        self.vvisited[jv] = True
+                        component.append(jv)
+                        stack.append(jv)
+            component.sort()
+            components.append(component)
+        self.sv = self.g.nv
+        return components
+
     def IsConnected(self):
         self.Reset()
         self._Order(0)
@@ -725,6 +774,16 @@ class GraphMatcher(object):
     is proportional to the number of vertices in the larger graph.
     (The distinction matters when one graph is much smaller than the other.)
 
+    Implementation: The small graph g is "compiled" (once) into a "plan".
+    The plan is a list containing one entry for each (directed) edge in g,
+    in the order the edges are visited during a depth-first-search of g.
+    Each entry tells the matcher which previously matched vertex the edge
+    starts from, which vertex it points to, and whether that vertex is
+    being visited for the first time.  The big graph G is converted into
+    flat (CSR-style) neighbor arrays.  The search itself is then carried out
+    using an explicit stack (a list of cursors into the neighbor arrays)
+    instead of recursion, so no (nested) generator frames are created.
+
     Limitations: At the moment, the matching process uses a simple
     depth-first-search to search the vertices of the small graph "g".
     Hence this approach fails when the smaller graph g is disconnected.
@@ -763,14 +822,6 @@ class GraphMatcher(object):
         self.ie_to_Ie = [Dgraph.NULL for Ie in range(0, self.g.ne)]
         #  (This used to be called "core_2" in the VF2 algorithm)
 
-        # Due to the large number of recursion limit
-        self.old_recursion_limit = sys.getrecursionlimit()
-        expected_max_recursion = self.g.nv
-
-        if self.old_recursion_limit < 1.5 * expected_max_recursion:
-            # Give some breathing room.
-            sys.setrecursionlimit(int(1.5 * expected_max_recursion))
-
         subgraph_searcher = DFS(self.g)
         # Perform a Depth-First-Search on the small graph.
         self.vorder_g, self.eorder_g = subgraph_searcher.Order()
@@ -788,9 +839,202 @@ class GraphMatcher(object):
         self.g.ReorderVerts(self.vorder_g, invert=True)
         self.g.ReorderEdges(self.eorder_g, invert=True)
 
+        self.CompilePlan()
+        self.CompileBigGraph()
+        self.CompileVectorized()
+
         # Initialize state
         self.Reset()
 
+    def CompilePlan(self):
+        """
+        Convert the (re-ordered) small graph "g" into a list of steps
+        (self.plan).  The i'th step matches the i'th edge of g.  It is a
+        3-tuple (iv, jv, new_vertex) where iv is the (already matched)
+        vertex the edge starts from, jv is the vertex it points to, and
+        new_vertex is True if jv has not been visited by an earlier step.
+        (Because the edges of g were re-ordered in depth-first-search order,
+         this does not depend on which vertices from G are matched with g.)
+
+        Also compute the tables needed to translate the state of the
+        search into a match (see ReformatMatch()).
+
+        """
+        self.plan = []
+        sv = 1
+        for ie in range(0, self.g.ne):
+            iv = self.g.edges[ie].start
+            jv = self.g.edges[ie].stop
+            assert(iv < sv)
+            new_vertex = (jv >= sv)
+            if new_vertex:
+                assert(jv == sv)
+                sv += 1
+            self.plan.append((iv, jv, new_vertex))
+        assert((sv == self.g.nv) or (self.g.ne == 0))
+
+        # match_verts[iv] = iv_to_Iv[vert_out[iv]]
+        self.vert_out = [self.vorder_g[iv] for iv in range(0, self.g.nv)]
+
+        # match_edges[ie] = ie_to_Ie[edge_out[ie]]
+        if type(self.g) is Dgraph:
+            self.edge_out = [self.eorder_g[ie] for ie in range(0, self.g.ne)]
+        else:
+            self.edge_out = [Dgraph.NULL for ieu in range(0, self.g.neu)]
+            for ie in range(0, self.g.ne):
+                iv = self.g.edges[ie].start
+                jv = self.g.edges[ie].stop
+                if iv <= jv:  # <-- avoid duplicating edges (iv,jv) and (jv,iv)
+                    ieu = self.g.LookupUndirectedEdgeIdx(ie)
+                    self.edge_out[ieu] = ie
+
+    def CompileBigGraph(self):
+        """
+        Store the neighbors of each vertex in the big graph "G" in flat
+        arrays (in "compressed sparse row" format):
+        The (directed) edges leaving vertex Iv are
+           self.nbr_edge[self.nbr_start[Iv] : self.nbr_start[Iv+1]]
+        and the vertices these edges point to are
+           self.nbr_vert[self.nbr_start[Iv] : self.nbr_start[Iv+1]]
+        (The edges appear in the same order as they do in G.neighbors[Iv].)
+
+        """
+        G = self.G
+        self.nbr_start = array('i', [0] * (G.nv + 1))
+        self.nbr_edge = array('i')
+        self.nbr_vert = array('i')
+        for Iv in range(0, G.nv):
+            for Je in G.neighbors[Iv]:
+                self.nbr_edge.append(Je)
+                self.nbr_vert.append(G.edges[Je].stop)
+            self.nbr_start[Iv + 1] = len(self.nbr_edge)
+        if type(G) is Dgraph:
+            self.ied_to_ieu_G = None
+        else:
+            self.ied_to_ieu_G = array('i', G.ied_to_ieu)
+
+    def CompileVectorized(self):
+        """
+        Decide whether the faster, vectorized search (see
+        _MatchBatchesVectorized()) can be used, and if so, precompute
+        the information it needs.  This is possible when:
+          1) numpy is available,
+          2) both graphs are undirected (Ugraphs),
+          3) the small graph g is a tree (which is true for all of the
+             bond patterns used by default for bonds, angles, dihedrals,
+             and impropers, including the ones in "nbody_alt_symmetry"),
+          4) the big graph G contains no loops (edges connecting a vertex to
+             itself) and no duplicate edges (multiple edges connecting the
+             same pair of vertices).
+        In that case, every (directed) edge in the plan either leads to a new
+        vertex, or it is the reverse of an edge visited earlier.  The edges
+        which lead to new vertices are the only ones which require a search.
+
+        """
+        self.vectorizable = False
+        if ((np is None) or
+                (type(self.G) is not Ugraph) or
+                (type(self.g) is not Ugraph) or
+                (self.g.nv == 0) or
+                (self.g.neu != self.g.nv - 1)):  # <-- (g is not a tree)
+            return
+
+        # Which steps of the plan lead to new vertices?
+        # Which of these steps corresponds to each undirected edge in g?
+        self.vec_steps = []
+        ieu_to_step = [Dgraph.NULL for ieu in range(0, self.g.neu)]
+        for se in range(0, len(self.plan)):
+            iv, jv, new_vertex = self.plan[se]
+            if new_vertex:
+                ieu_to_step[self.g.LookupUndirectedEdgeIdx(se)] = \
+                    len(self.vec_steps)
+                self.vec_steps.append((iv, jv))
+        assert(len(self.vec_steps) == self.g.neu)
+        # The undirected edge ieu from g is matched with the edge visited
+        # during step self.vec_edge_out[ieu]
+        self.vec_edge_out = ieu_to_step
+
+        # Check for loops and duplicate edges in G.
+        self.vec_nbr_start = np.array(self.nbr_start, dtype=np.int64)
+        self.vec_nbr_vert = np.array(self.nbr_vert, dtype=np.int64)
+        self.vec_nbr_edge = np.array(self.nbr_edge, dtype=np.int64)
+        start = np.repeat(np.arange(self.G.nv, dtype=np.int64),
+                          np.diff(self.vec_nbr_start))
+        if np.any(start == self.vec_nbr_vert):
+            return
+        pair_ids = start * self.G.nv + self.vec_nbr_vert
+        if len(np.unique(pair_ids)) != len(pair_ids):
+            return
+        self.vec_ied_to_ieu = np.array(self.ied_to_ieu_G, dtype=np.int64)
+        self.vectorizable = True
+
+    def _MatchBatchesVectorized(self, batch_size):
+        """
+        A version of MatchBatches() which uses numpy to extend the partial
+        matches found so far by one vertex at a time.  The matches it finds
+        (and their order) are identical to those found by MatchBatches().
+        (See CompileVectorized() for details.)
+        To limit the memory required, the vertices from G are processed in
+        blocks of "batch_size" vertices.  Only the matches which begin from
+        the vertices in the current block are stored at any one time.
+
+        """
+        nbr_start = self.vec_nbr_start
+        nbr_vert = self.vec_nbr_vert
+        nbr_edge = self.vec_nbr_edge
+
+        batch = []
+        for lo in range(0, self.G.nv, batch_size):
+            hi = min(lo + batch_size, self.G.nv)
+            # Each row of "verts" (and "edges") is a partial match.
+            # verts[:,iv] is the vertex from G matched with vertex iv from g.
+            # edges[:,i] is the (directed) edge from G matched during step i.
+            # Begin by matching vertex 0 from g with every vertex in the block:
+            verts = np.arange(lo, hi, dtype=np.int64).reshape(-1, 1)
+            edges = np.zeros((hi - lo, 0), dtype=np.int64)
+
+            for iv, jv in self.vec_steps:
+                assert(jv == verts.shape[1])
+                Iv = verts[:, iv]
+                # Make one copy of each partial match for every neighbor of Iv.
+                # (np.repeat() preserves the order of the rows, and the
+                #  neighbors of each vertex are visited in the same order they
+                #  appear in G.neighbors[], so the final matches are sorted the
+                #  same way they would be using MatchBatches())
+                degree = nbr_start[Iv + 1] - nbr_start[Iv]
+                irow = np.repeat(np.arange(len(Iv)), degree)
+                # the location of each neighbor in the nbr_vert and nbr_edge
+                # arrays
+                first = np.repeat(nbr_start[Iv], degree)
+                offset = np.arange(len(irow)) - \
+                    np.repeat(np.cumsum(degree) - degree, degree)
+                k = first + offset
+                Jv = nbr_vert[k]
+                Je = nbr_edge[k]
+                # Discard matches which visit the same vertex from G twice
+                keep = np.ones(len(irow), dtype=bool)
+                for iv_prev in range(0, verts.shape[1]):
+                    keep &= (verts[irow, iv_prev] != Jv)
+                irow = irow[keep]
+                verts = np.column_stack((verts[irow], Jv[keep]))
+                edges = np.column_stack((edges[irow], Je[keep]))
+
+            verts = verts[:, self.vert_out]
+            edges = self.vec_ied_to_ieu[edges[:, self.vec_edge_out]]
+
+            # (The rows are sorted by starting vertex, so the matches from
+            #  this block follow the matches from the previous blocks.)
+            batch.extend(zip(map(tuple, verts.tolist()),
+                             map(tuple, edges.tolist())))
+            del verts, edges
+            i = 0
+            while len(batch) - i >= batch_size:
+                yield batch[i:i + batch_size]
+                i += batch_size
+            batch = batch[i:]
+        if len(batch) > 0:
+            yield batch
+
     def Reset(self):
         """Reinitializes the state of the match-search algorithm.
 
@@ -823,6 +1067,19 @@ class GraphMatcher(object):
 
         (The corresponding vertices and edges from g are indicated by the order)
 
+        """
+        for batch in self.MatchBatches():
+            for match in batch:
+                yield match
+
+    def MatchBatches(self, batch_size=4096):
+        """
+        Iterator over all matches between G and g (see Matches()).
+        Matches are returned in lists containing up to "batch_size" matches.
+        (The order of the matches is the same as the order used by Matches().
+         Matches which begin from vertex Iv in G are found before matches
+         which begin from vertex Iv+1.)
+
         """
 
         self.Reset()
@@ -831,11 +1088,39 @@ class GraphMatcher(object):
             # Thus it is impossible for a subgraph of G to be isomorphic to g.
             return  # return no matches
 
+        if self.vectorizable:
+            for batch in self._MatchBatchesVectorized(batch_size):
+                yield batch
+            return
+
+        # Local variables are faster to access than attributes:
+        plan = self.plan
+        ne = len(plan)
+        nbr_start = self.nbr_start
+        nbr_edge = self.nbr_edge
+        nbr_vert = self.nbr_vert
+        voccupiedG = self.voccupiedG
+        eoccupiedG = self.eoccupiedG
+        iv_to_Iv = self.iv_to_Iv
+        ie_to_Ie = self.ie_to_Ie
+        vert_out = self.vert_out
+        edge_out = self.edge_out
+        ied_to_ieu_G = self.ied_to_ieu_G
+        NULL = Dgraph.NULL
+
+        # cursor[se] and cursor_stop[se] keep track of which of the edges
+        # in G (which emanate from vertex iv_to_Iv[plan[se][0]]) remain to
+        # be tried as candidates for matching edge se from g.
+        cursor = [0 for se in range(0, ne)]
+        cursor_stop = [0 for se in range(0, ne)]
+
+        batch = []
+
         for Iv in range(0, self.G.nv):
 
             # match vertex Iv from G with vertex 0 from graph g
-            self.iv_to_Iv[0] = Iv
-            self.voccupiedG[Iv] = True
+            iv_to_Iv[0] = Iv
+            voccupiedG[Iv] = True
 
             # Implementation:
             # In this loop we begin the search process
@@ -849,132 +1134,112 @@ class GraphMatcher(object):
             # to insure that all possible subgraphs of G
             # (which are isomorphic to g) are considered.
 
-            self.sv = 1  # we have matched one vertex already
-            self.se = 0  # we haven't matched any edges yet
-            for match in self.Match():
-                yield match
-            self.voccupiedG[Iv] = False
-
-    def Match(self):
-
-        # self.se represents how many vertices have been matched so far.
-        # We are done searching if all of the edges from 0 to self.se-1
-        # from graph g have been selected (matched with edges from graph G).
-        if self.se == self.g.ne:
-            # Note: This also gaurantees that all vertices have been visited.
-            assert(self.sv == self.g.nv)
-            yield self.ReformatMatch()
-
-        else:
-            # VF2-style recursive loop:
-
-            # We know the next edge to be matched is connected to at least
-            # one previously visited vertex from g which has already been
-            # been added to the the current match-in-progress.
-            iv = self.g.edges[self.se].start
-            Iv = self.iv_to_Iv[iv]
-            assert(iv < self.sv)  # <-- check to verify this is so
-
-            # The other vertex may or may not have been visited (matched) yet.
-            iv_neighbor = self.g.edges[self.se].stop
-
-            # Two cases:
-            # Case 1: edge self.se points to a previously visited vertex from g
-            #         This means we have a loop.
-            if iv_neighbor < self.sv:
-                # In that case, then the corresponding edge in G must
-                # connect the corresponding pair of vertices from G.
-                # (Which we know have already been assigned to vertices in g
-                #  because both iv and iv_neighbor are < self.sv)
-                Iv_neighbor = self.iv_to_Iv[iv_neighbor]
-                # Loop over all of the edges in G which connect this pair
-                # of vertices (Iv --> Iv_neighbor)
-                for Je in self.G.neighbors[Iv]:
-                    Jv = self.G.edges[Je].stop
-                    if ((Jv == Iv_neighbor) and
-                        (not self.eoccupiedG[Je])):
-
-                        # Match edge Je from big   graph G with
-                        #  edge self.se from small graph g
-                        self.ie_to_Ie[self.se] = Je
-                        self.se += 1
-                        self.eoccupiedG[Je] = True
-                        for match in self.Match():
-                            yield match
-                        self.eoccupiedG[Je] = False
-                        self.se -= 1
-                        self.ie_to_Ie[self.se] = Dgraph.NULL
-
-            # Case 2:
-            else:  # this would mean that iv_neighbor >= self.sv
-
-                # If iv_neighbor>=self.sv, then this edge points to to a vertex
-                # in g which has not yet been paired with a vertex from G.
-
-                # Loop over all of the edges in G which connect vertex
-                # Iv from G to new (unvisited) vertices in G
-                for Je in self.G.neighbors[Iv]:
-                    Jv = self.G.edges[Je].stop
-                    if (not self.voccupiedG[Jv]):
-
-                        assert(not self.eoccupiedG[Je])
-                        # Match both edge Je with je
-                        #      AND vertex Jv with jv
-                        self.ie_to_Ie[self.se] = Je
-                        self.se += 1
-                        self.eoccupiedG[Je] = True
-                        self.iv_to_Iv[self.sv] = Jv
-                        self.sv += 1
-                        self.voccupiedG[Jv] = True
-                        # Then continue the recursion
-                        for match in self.Match():
-                            yield match
-                        self.voccupiedG[Jv] = False
-                        self.sv -= 1
-                        self.iv_to_Iv[self.sv] = Dgraph.NULL
-                        self.eoccupiedG[Je] = False
-                        self.se -= 1
-                        self.ie_to_Ie[self.se] = Dgraph.NULL
+            if ne == 0:
+                batch.append((tuple([iv_to_Iv[iv] for iv in vert_out]), ()))
+                voccupiedG[Iv] = False
+                continue
+
+            se = 0  # we haven't matched any edges yet
+            cursor[0] = nbr_start[Iv]
+            cursor_stop[0] = nbr_start[Iv + 1]
+
+            while se >= 0:
+                # Find the next edge from G which can be matched with edge
+                # "se" from g.
+                iv, jv, new_vertex = plan[se]
+                k = cursor[se]
+                k_stop = cursor_stop[se]
+                Je = NULL
+                if new_vertex:
+                    # Edge "se" points to a vertex in g which has not yet been
+                    # paired with a vertex from G.  Look for edges in G which
+                    # connect Iv to new (unvisited) vertices in G
+                    while k < k_stop:
+                        if not voccupiedG[nbr_vert[k]]:
+                            Je = nbr_edge[k]
+                            Jv = nbr_vert[k]
+                            k += 1
+                            break
+                        k += 1
+                else:
+                    # Edge "se" points to a previously visited vertex from g.
+                    # (This means we have a loop.)  The corresponding edge in G
+                    # must connect the corresponding pair of vertices from G.
+                    Jv = iv_to_Iv[jv]
+                    while k < k_stop:
+                        if (nbr_vert[k] == Jv) and (not eoccupiedG[nbr_edge[k]]):
+                            Je = nbr_edge[k]
+                            k += 1
+                            break
+                        k += 1
+                cursor[se] = k
+
+                if Je == NULL:
+                    # No more candidates for edge "se".  Backtrack.
+                    se -= 1
+                    if se >= 0:
+                        # Undo the assignment made at the previous step
+                        eoccupiedG[ie_to_Ie[se]] = False
+                        ie_to_Ie[se] = NULL
+                        if plan[se][2]:
+                            jv_prev = plan[se][1]
+                            voccupiedG[iv_to_Iv[jv_prev]] = False
+                            iv_to_Iv[jv_prev] = NULL
+                    continue
+
+                # Match edge Je from big   graph G with
+                #  edge se from small graph g
+                if new_vertex:
+                    #  AND vertex Jv with jv
+                    assert(not eoccupiedG[Je])
+                    iv_to_Iv[jv] = Jv
+                    voccupiedG[Jv] = True
+
+                if se + 1 < ne:
+                    ie_to_Ie[se] = Je
+                    eoccupiedG[Je] = True
+                    se += 1
+                    Iv_next = iv_to_Iv[plan[se][0]]
+                    cursor[se] = nbr_start[Iv_next]
+                    cursor_stop[se] = nbr_start[Iv_next + 1]
+                else:
+                    # All of the edges from g have been matched.  Save the
+                    # match, and then look for alternatives for the last edge.
+                    ie_to_Ie[se] = Je
+                    if ied_to_ieu_G is None:
+                        match_edges = tuple([ie_to_Ie[ie] for ie in edge_out])
+                    else:
+                        match_edges = tuple([ied_to_ieu_G[ie_to_Ie[ie]]
+                                             for ie in edge_out])
+                    batch.append((tuple([iv_to_Iv[iv] for iv in vert_out]),
+                                  match_edges))
+                    ie_to_Ie[se] = NULL
+                    if new_vertex:
+                        voccupiedG[Jv] = False
+                        iv_to_Iv[jv] = NULL
+                    if len(batch) >= batch_size:
+                        yield batch
+                        batch = []
+
+            voccupiedG[Iv] = False
+            iv_to_Iv[0] = NULL
+
+        if len(batch) > 0:
+            yield batch
 
     def ReformatMatch(self):
-        #   (This is because we are assuming g is connected.
-        #    It should not have any orphanned vertices.)
-        # Now return the match:
-        #
-        # There are different ways of doing this
-        # version 1:
-        # match = (self.iv_to_Iv, self.ie_to_Ie) <-return a pointer to array
-        # version 2:
-        # match = ([Iv for Iv in self.iv_to_Iv], <-return a copy of the array
-        #         [Ie for Ie in self.ie_to_Ie])
-        # version 3:
-        #   Recall that the vertices and edges and g have been re-ordered,
-        #   so sort the list of Iv indices in the order they would be
-        #   matched with the original vertices from the original graph g:
-        # match = ([self.iv_to_Iv[self.vorder_g[iv]]
-        #          for iv in range(0,self.g.nv)],
-        #         [self.ie_to_Ie[self.eorder_g[ie]]
-        #          for ie in range(0,self.g.ne)])
-        # version 4: Similar to version 3 above, but we also translate
-        #            the directed edge id list into a shorter undirected
-        #            edge id list.
-        match_verts = [self.iv_to_Iv[self.vorder_g[iv]]
-                       for iv in range(0, self.g.nv)]
+        """
+        Convert the current state of the search (self.iv_to_Iv, self.ie_to_Ie)
+        into a match: a 2-tuple containing a tuple of vertex ids from G and a
+        tuple of edge ids from G, in the same order as the vertices and edges
+        of the original (un-reordered) small graph g.
+        (If g and G are Ugraphs, then the edge ids are undirected edge ids.)
 
-        if type(self.g) is Dgraph:
-            match_edges = [self.ie_to_Ie[self.eorder_g[ie]]
-                           for ie in range(0, self.g.ne)]
+        """
+        match_verts = [self.iv_to_Iv[iv] for iv in self.vert_out]
+        if self.ied_to_ieu_G is None:
+            match_edges = [self.ie_to_Ie[ie] for ie in self.edge_out]
         else:
-            #assert(atype(self.g) is Ugraph)
-            match_edges = [Dgraph.NULL for ieu in range(0, self.g.neu)]
-
-            for ie in range(0, self.g.ne):
-                iv = self.g.edges[ie].start
-                jv = self.g.edges[ie].stop
-                if iv <= jv:  # <-- avoid duplicating edges (iv,jv) and (jv,iv)
-                    ieu = self.g.LookupUndirectedEdgeIdx(ie)
-                    Ie = self.ie_to_Ie[ie]
-                    Ieu = self.G.LookupUndirectedEdgeIdx(Ie)
-                    match_edges[ieu] = Ieu
-
+            match_edges = [self.ied_to_ieu_G[self.ie_to_Ie[ie]]
+                           for ie in self.edge_out]
         return (tuple(match_verts), tuple(match_edges))
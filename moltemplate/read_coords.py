@@ -0,0 +1,481 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Author: Andrew Jewett (jewett.aij at g mail)
+# License: MIT License  (See LICENSE.md)
+# Copyright (c) 2014
+
+"""
+read_coords.py
+
+Read the atomic coordinates from a PDB, XYZ, "raw", or LAMMPS DUMP file
+(as well as the periodic boundary box, and, in the case of DUMP files,
+the orientations and velocities of the atoms, if present).
+moltemplate.sh uses this program to process the "-pdb", "-xyz", "-raw",
+and "-dump" arguments.  Each file is read only once.
+
+   usage:
+
+read_coords.py -pdb FILE  [-coords crds.dat]
+read_coords.py -xyz FILE  [-coords crds.dat]
+read_coords.py -raw FILE  [-coords crds.dat]
+read_coords.py -dump FILE [-coords crds.dat] [-quats quats.dat] \\
+                          [-velocities vels.dat]
+
+The coordinates are written to the "-coords" file (3 numbers per line),
+in a format that raw2data.py can read.  The orientations (quaternions) and
+velocities (from the last snapshot in a DUMP file) are written to the
+"-quats" and "-velocities" files.  The number of atoms, the range of their
+coordinates, and the periodic boundary box (if the file contains one)
+are printed to the standard output in the form of shell variable assignments:
+
+NUM_ATOM_COORDS=N
+COORDS_BOUNDS='xmin xmax ymin ymax zmin zmax'
+BOXSIZE_MINX=...  BOXSIZE_MAXX=...  (etc...)
+
+(The numbers are copied from the file verbatim, so no precision is lost.)
+
+"""
+
+import sys
+import re
+import shlex
+from math import sin, cos, sqrt
+from decimal import Decimal
+import numpy as np
+
+try:
+    from .ttree_lex import InputError, ErrorLeader
+except (ImportError, SystemError, ValueError):
+    # not installed as a package
+    from ttree_lex import InputError, ErrorLeader
+
+g_program_name = __file__.split('/')[-1]
+g_date_str = '2026-10-18'
+g_version_str = '0.1.0'
+
+g_usage_str = \
+    'Usage: ' + g_program_name + ' -pdb|-xyz|-raw|-dump FILE \\\n' + \
+    '       [-coords crds.dat] [-quats quats.dat] [-velocities vels.dat]\n'
+
+g_coords_formats = ('pdb', 'xyz', 'raw', 'dump')
+
+# Names of the columns in a DUMP file containing the quaternion
+# (in W,I,J,K order).  For example:
+# (I,J,K,W) from "compute orient all property/atom quati quatj quatk quatw"
+# (W,I,J,K) from "compute q      all property/atom quatw quati quatj quatk"
+g_quat_column_names = (('qw', 'quatw', 'c_q[1]', 'c_orient[4]'),
+                       ('qi', 'quati', 'qx', 'quatx', 'c_q[2]', 'c_orient[1]'),
+                       ('qj', 'quatj', 'qy', 'quaty', 'c_q[3]', 'c_orient[2]'),
+                       ('qk', 'quatk', 'qz', 'quatz', 'c_q[4]', 'c_orient[3]'))
+g_pos_column_re = re.compile(r'[xyz]')
+g_vel_column_re = re.compile(r'v[xyz]')
+g_angmom_column_re = re.compile(r'angmom[xyz]|AngularMomentum[XYZ]')
+
+
+class CoordsSnapshot(object):
+    """
+    The coordinates of the atoms (and the other information) read from a file.
+    The numbers are stored as text (in NumPy arrays of strings, one row per
+    atom), so that they can be copied into the DATA file without modification.
+    Use Coords() to convert the coordinates to numbers.
+
+    """
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.coords_text = None      # (N x 3) array
+        self.linenos = []            # where each atom appears in the file
+        self.quats_text = None       # (N x 4) array (or None)
+        self.velocities_text = None  # (N x 4) or (N x 7) array (or None)
+        # The periodic boundary box (if present in the file):
+        self.box_bounds = None       # xmin xmax ymin ymax zmin zmax
+        self.box_tilts = None        # xy xz yz (triclinic boxes only)
+
+    def __len__(self):
+        return len(self.coords_text)
+
+    def Coords(self):
+        """ Return the coordinates as an (N x 3) array of floats. """
+        try:
+            return self.coords_text.astype(float)
+        except ValueError:
+            for row, lineno in zip(self.coords_text, self.linenos):
+                for token in row:
+                    try:
+                        float(token)
+                    except ValueError:
+                        raise InputError('Error: ' +
+                                         ErrorLeader(self.file_name, lineno) +
+                                         '\n       Coordinate \"' + token +
+                                         '\" is not a number.\n')
+            raise
+
+    def MinMaxBounds(self):
+        """
+        Return the text of the smallest and largest x, y, and z coordinates
+        (in the order: xmin xmax ymin ymax zmin zmax).
+
+        """
+        coords = self.Coords()
+        bounds = []
+        for d in range(0, 3):
+            bounds.append(self.coords_text[np.argmin(coords[:, d]), d])
+            bounds.append(self.coords_text[np.argmax(coords[:, d]), d])
+        return bounds
+
+
+def _CoordsArray(rows, num_columns):
+    return np.array(rows, dtype=str).reshape(len(rows), num_columns)
+
+
+def _AwkNumStr(x):
+    """
+    Convert a number to a string, the way awk's "print" command does.
+    (The old versions of moltemplate.sh did this arithmetic using awk.)
+
+    """
+    if (x == int(x)) and (abs(x) < 1.0e16):
+        return '%d' % x
+    return '%.6g' % x
+
+
+def _ParseFloat(text, file_name, lineno):
+    try:
+        return float(text)
+    except ValueError:
+        raise InputError('Error: ' + ErrorLeader(file_name, lineno) + '\n'
+                         '       \"' + text.strip() + '\" is not a number.\n')
+
+
+def ReadCoordsRaw(lines, file_name=''):
+    """ Read every line which contains 3 numbers ("x y z"). """
+    snapshot = CoordsSnapshot(file_name)
+    coords = []
+    for lineno, line in enumerate(lines, 1):
+        tokens = line.split()
+        if len(tokens) == 3:
+            coords.append(tokens)
+            snapshot.linenos.append(lineno)
+    snapshot.coords_text = _CoordsArray(coords, 3)
+    return snapshot
+
+
+def ReadCoordsXYZ(lines, file_name=''):
+    """
+    Read an XYZ file.  The first two lines are skipped.  The coordinates are
+    the last 3 columns (on lines containing "AtomName x y z" or "x y z").
+
+    """
+    snapshot = CoordsSnapshot(file_name)
+    coords = []
+    for lineno, line in enumerate(lines, 1):
+        if lineno <= 2:
+            continue
+        tokens = line.split()
+        if len(tokens) == 4:
+            coords.append(tokens[1:4])
+        elif len(tokens) == 3:
+            coords.append(tokens)
+        else:
+            continue
+        snapshot.linenos.append(lineno)
+    snapshot.coords_text = _CoordsArray(coords, 3)
+    return snapshot
+
+
+def _Cryst1ToBox(a, b, c, alpha, beta, gamma, file_name, lineno):
+    """
+    Convert the periodic box (lengths and angles) from a PDB file's CRYST1
+    record to the format used by LAMMPS.  (The text of a, b, c is preserved.)
+    I transform the parameters from one format to the other by inverting
+    the transformation formula from the LAMMPS documentation
+    https://docs.lammps.org/Howto_triclinic.html  (which matches
+    http://www.ccl.net/cca/documents/molecular-modeling/node4.html)
+
+    """
+    angles = [_ParseFloat(angle, file_name, lineno)
+              for angle in (alpha, beta, gamma)]
+    if angles == [90.0, 90.0, 90.0]:
+        return ['0.0', a, '0.0', b, '0.0', c], None
+    PI = 3.1415926535897931
+    B = _ParseFloat(b, file_name, lineno)
+    C = _ParseFloat(c, file_name, lineno)
+    ca = cos(angles[0]*PI/180.0)
+    cb = cos(angles[1]*PI/180.0)
+    cg = cos(angles[2]*PI/180.0)
+    sg = sin(angles[2]*PI/180.0)
+    boxsize_y = B*sg
+    boxsize_z = C*sqrt(1.0+2*ca*cb*cg-ca*ca-cb*cb-cg*cg)/sg
+    box_bounds = ['0.0', a,
+                  '0.0', _AwkNumStr(boxsize_y),
+                  '0.0', _AwkNumStr(boxsize_z)]
+    box_tilts = [_AwkNumStr(B*cg),               # xy
+                 _AwkNumStr(C*cb),               # xz
+                 _AwkNumStr(C*(ca-(cg*cb))/sg)]  # yz
+    return box_bounds, box_tilts
+
+
+def ReadCoordsPDB(lines, file_name=''):
+    """
+    Read the coordinates from the ATOM and HETATM records of a PDB file
+    (in the order they appear in the file), and the periodic boundary box
+    from the CRYST1 record.  The CRYST1 records are described at:
+    http://deposit.rcsb.org/adit/docs/pdb_atom_format.html
+
+    """
+    # COMMENT:
+    # I used to sort the PDB file by (ChainID,SeqNum,InsertCode)
+    # and then extract the coordinates from the file.
+    # This turned out to be inconvenient for users.  Instead
+    # just read the coordinates in the order they appear in the file.
+    snapshot = CoordsSnapshot(file_name)
+    coords = []
+    cryst1 = None
+    cryst1_lineno = 0
+    for lineno, line in enumerate(lines, 1):
+        if line.startswith('ATOM  ') or line.startswith('HETATM'):
+            crds = [line[30:38].strip(), line[38:46].strip(),
+                    line[46:54].strip()]
+            if '' in crds:
+                raise InputError('Error: ' + ErrorLeader(file_name, lineno) +
+                                 '\n       ATOM or HETATM record is missing '
+                                 'coordinates (in columns 31-54).\n')
+            coords.append(crds)
+            snapshot.linenos.append(lineno)
+        elif (cryst1 is None) and ('CRYST1' in line):
+            cryst1 = line.rstrip('\n')
+            cryst1_lineno = lineno
+    if len(coords) == 0:
+        raise InputError('Error: File \"' + file_name +
+                         '\" is not a valid PDB file.\n'
+                         '       (It contains no ATOM or HETATM records.)\n')
+    snapshot.coords_text = _CoordsArray(coords, 3)
+    if cryst1 is None:
+        snapshot.box_bounds = ['0.0', '-1.0', '0.0', '-1.0', '0.0', '-1.0']
+    else:
+        snapshot.box_bounds, snapshot.box_tilts = \
+            _Cryst1ToBox(cryst1[7:15], cryst1[16:24], cryst1[25:33],
+                         cryst1[34:40], cryst1[41:47], cryst1[48:54],
+                         file_name, cryst1_lineno)
+    return snapshot
+
+
+def _DumpBox(box_lines, file_name, lineno):
+    """
+    Convert the "ITEM: BOX BOUNDS" section of a DUMP file into
+    (box_bounds, box_tilts).  For triclinic systems, the first two
+    columns describe a bounding box around the system, not the system
+    itself.  See https://docs.lammps.org/dump.html and
+    https://docs.lammps.org/Howto_triclinic.html
+
+    """
+    box = ['%g' % _ParseFloat(token, file_name, lineno + i)
+           for i in range(0, len(box_lines))
+           for token in box_lines[i].split()]
+    if len(box) == 6:
+        return box, None
+    elif len(box) == 9:
+        xy, xz, yz = float(box[2]), float(box[5]), float(box[8])
+        xy_plus_xz = float(Decimal(box[2]) + Decimal(box[5]))
+        xtilt = sorted([0.0, xy, xz, xy_plus_xz])
+        ytilt = sorted([0.0, yz])
+        box_bounds = [_AwkNumStr(float(box[0]) - xtilt[0]),
+                      _AwkNumStr(float(box[1]) - xtilt[3]),
+                      _AwkNumStr(float(box[3]) - ytilt[0]),
+                      _AwkNumStr(float(box[4]) - ytilt[1]),
+                      box[6],
+                      box[7]]
+        return box_bounds, [box[2], box[5], box[8]]
+    return None, None
+
+
+def ReadCoordsDump(lines, file_name=''):
+    """
+    Read the last snapshot from a LAMMPS DUMP file (sorted by atom-ID),
+    including the orientations (quaternions), velocities and angular momenta,
+    if the DUMP file contains them.  (Only the lines from the current
+    snapshot are kept in memory while the file is read.)
+
+    """
+    frame_lines = []
+    frame_lineno = 0
+    for lineno, line in enumerate(lines, 1):
+        if line.strip() == 'ITEM: TIMESTEP':
+            frame_lines = []
+            frame_lineno = lineno
+        frame_lines.append(line)
+    if frame_lineno == 0:
+        raise InputError('Error: File \"' + file_name +
+                         '\" is not a valid DUMP file.\n'
+                         '       (It contains no \"ITEM: TIMESTEP\" lines.)\n')
+
+    # Locate the sections in the last snapshot
+    natoms = None
+    box_lines = None
+    column_names = None
+    atom_lines = []
+    i = 0
+    while i < len(frame_lines):
+        line = frame_lines[i].strip()
+        lineno = frame_lineno + i
+        if line == 'ITEM: NUMBER OF ATOMS':
+            i += 1
+            natoms = int(_ParseFloat(frame_lines[i], file_name, lineno + 1))
+        elif line.startswith('ITEM: BOX BOUNDS'):
+            box_lines = frame_lines[i + 1:i + 4]
+            box_lineno = lineno + 1
+            i += 3
+        elif line.startswith('ITEM: ATOMS'):
+            column_names = line.split()[2:]
+            atom_lines = [l for l in frame_lines[i + 1:] if l.strip() != '']
+            break
+        i += 1
+    if (natoms is None) or (column_names is None):
+        raise InputError('Error: ' + ErrorLeader(file_name, frame_lineno) +
+                         '\n       Incomplete snapshot in DUMP file.\n'
+                         '       (\"ITEM: NUMBER OF ATOMS\" or \"ITEM: ATOMS\"'
+                         ' missing.)\n')
+    if len(atom_lines) != natoms:
+        raise InputError('Error: ' + ErrorLeader(file_name, frame_lineno) +
+                         '\n       The last snapshot in the DUMP file '
+                         'contains ' + str(len(atom_lines)) + ' atoms\n'
+                         '       (instead of ' + str(natoms) + ').\n')
+
+    # Find the columns of: position, quaternion, velocity, angular momentum.
+    i_pos = []
+    i_quat = [None, None, None, None]
+    i_vel = []
+    i_angmom = []
+    for i, name in enumerate(column_names):
+        if g_pos_column_re.match(name):
+            i_pos.append(i)
+        for d in range(0, 4):
+            if name in g_quat_column_names[d]:
+                i_quat[d] = i
+        if g_vel_column_re.search(name):
+            i_vel.append(i)
+        if g_angmom_column_re.search(name):
+            i_angmom.append(i)
+    if len(i_pos) < 3:
+        raise InputError('Error: ' + ErrorLeader(file_name, frame_lineno) +
+                         '\n       The DUMP file does not contain the '
+                         'x, y, z coordinates of the atoms.\n')
+
+    # Sort the atoms by atom-ID (the atoms are dumped in random order).
+    rows = [line.split() for line in atom_lines]
+    try:
+        rows.sort(key=lambda tokens: float(tokens[0]))
+    except ValueError:
+        raise InputError('Error: ' + ErrorLeader(file_name, frame_lineno) +
+                         '\n       Atom-IDs in the DUMP file must be '
+                         'numbers.\n')
+    num_columns = len(column_names)
+    for row in rows:
+        if len(row) != num_columns:
+            raise InputError('Error: ' + ErrorLeader(file_name, frame_lineno) +
+                             '\n       Expected ' + str(num_columns) +
+                             ' columns on every line of atom data:\n'
+                             '       \"' + ' '.join(row) + '\"\n')
+    table = _CoordsArray(rows, num_columns)
+
+    snapshot = CoordsSnapshot(file_name)
+    snapshot.coords_text = table[:, i_pos[0:3]]
+    snapshot.linenos = [frame_lineno] * len(rows)
+    if None not in i_quat:
+        snapshot.quats_text = table[:, i_quat]
+    # Save the velocities and, if present, angular momenta too.
+    if (len(i_vel) == 3) and (len(i_angmom) in (0, 3)):
+        snapshot.velocities_text = table[:, [0] + i_vel + i_angmom]
+    if box_lines is not None:
+        snapshot.box_bounds, snapshot.box_tilts = \
+            _DumpBox(box_lines, file_name, box_lineno)
+    return snapshot
+
+
+def ReadCoords(lines, coords_format, file_name=''):
+    """
+    Read the coordinates from a file (or from any other iterable which
+    generates lines of text) in one of the g_coords_formats formats.
+    Returns a CoordsSnapshot.
+
+    """
+    if coords_format == 'pdb':
+        return ReadCoordsPDB(lines, file_name)
+    elif coords_format == 'xyz':
+        return ReadCoordsXYZ(lines, file_name)
+    elif coords_format == 'raw':
+        return ReadCoordsRaw(lines, file_name)
+    elif coords_format == 'dump':
+        return ReadCoordsDump(lines, file_name)
+    raise InputError('Error: Unsupported coordinate file format: \"' +
+                     coords_format + '\"\n')
+
+
+def WriteTable(file_name, table):
+    with open(file_name, 'w') as f:
+        for row in table.tolist():
+            f.write(' '.join(row) + '\n')
+
+
+def main():
+    try:
+        coords_format = None
+        in_file_name = None
+        out_file_names = {}
+        argv = sys.argv
+        i = 1
+        while i < len(argv):
+            arg = argv[i].lower()
+            if i + 1 == len(argv):
+                raise InputError('Error: The ' + argv[i] + ' argument '
+                                 'should be followed by a file name.\n' +
+                                 g_usage_str)
+            if arg[1:] in g_coords_formats:
+                coords_format = arg[1:]
+                in_file_name = argv[i + 1]
+            elif arg in ('-coords', '-quats', '-velocities'):
+                out_file_names[arg[1:]] = argv[i + 1]
+            else:
+                raise InputError('Error: Unrecognized argument: \"' +
+                                 argv[i] + '\"\n' + g_usage_str)
+            i += 2
+        if coords_format is None:
+            raise InputError('Error: Expected an input file.\n' + g_usage_str)
+
+        with open(in_file_name, 'r') as f:
+            snapshot = ReadCoords(f, coords_format, in_file_name)
+
+        if 'coords' in out_file_names:
+            WriteTable(out_file_names['coords'], snapshot.coords_text)
+        if ('quats' in out_file_names) and (snapshot.quats_text is not None):
+            WriteTable(out_file_names['quats'], snapshot.quats_text)
+        if (('velocities' in out_file_names) and
+            (snapshot.velocities_text is not None)):
+            WriteTable(out_file_names['velocities'], snapshot.velocities_text)
+
+        # Print the results as shell variable assignments
+        assignments = [('NUM_ATOM_COORDS', str(len(snapshot)))]
+        if len(snapshot) > 0:
+            assignments.append(('COORDS_BOUNDS',
+                                ' '.join(snapshot.MinMaxBounds())))
+        if snapshot.box_bounds is not None:
+            for name, value in zip(('MINX', 'MAXX', 'MINY', 'MAXY',
+                                    'MINZ', 'MAXZ'), snapshot.box_bounds):
+                assignments.append(('BOXSIZE_' + name, value))
+        if snapshot.box_tilts is not None:
+            for name, value in zip(('XY', 'XZ', 'YZ'), snapshot.box_tilts):
+                assignments.append(('BOXSIZE_' + name, value))
+            assignments.append(('TRICLINIC', 'true'))
+        for name, value in assignments:
+            sys.stdout.write(name + '=' + shlex.quote(value) + '\n')
+
+    except (ValueError, InputError, IOError) as err:
+        sys.stderr.write('\n' + str(err) + '\n')
+        sys.exit(1)
+
+    return
+
+
+if __name__ == '__main__':
+    main()
@@ -22,19 +22,16 @@ except (ImportError, SystemError, ValueError):
     # not installed as a package
     from ttree_lex import SplitQuotedString
 
-def main():
-    in_stream = sys.stdin
-    f = None
-    fname = None
-    if len(sys.argv) == 2:
-        fname = sys.argv[1]
-        f = open(fname, 'r')
-        in_stream = f
-
+def RemoveDuplicateAtoms(lines):
+    """
+    Delete lines from the "Atoms" section which refer to the same atom ID.
+    (If duplicates exist, the ones that occur earlier are erased.)
+    Blank lines and comments are also removed.  "lines" is modified in place
+    (and returned for convenience).
+
+    """
     atom_ids_in_use = set([])
 
-    lines = in_stream.readlines()
-
     # Start at the end of the file and read backwards.
     # If duplicate lines exist, eliminate the ones that occur earlier in the file.
     i = len(lines)
@@ -60,6 +57,19 @@ def main():
         else:
             del lines[i]
 
+    return lines
+
+
+def main():
+    in_stream = sys.stdin
+    f = None
+    fname = None
+    if len(sys.argv) == 2:
+        fname = sys.argv[1]
+        f = open(fname, 'r')
+        in_stream = f
+
+    lines = RemoveDuplicateAtoms(in_stream.readlines())
 
     for line in lines:
         sys.stdout.write(line)
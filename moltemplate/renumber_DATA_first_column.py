@@ -18,21 +18,15 @@
 import sys
 from operator import itemgetter
 
-def main():
-    in_stream = sys.stdin
-    f = None
-    fname = None
-    if len(sys.argv) == 2:
-        fname = sys.argv[1]
-        f = open(fname, 'r')
-        in_stream = f
-
+def RenumberFirstColumn(lines):
+    """
+    Renumber the integers at the beginning of every line so that they are
+    contiguous (starting at 1), while preserving their relative order.
+    Returns a list of (renumbered) lines.
 
-    lines = in_stream.readlines()
+    """
     column1_iorig_columnsAfter1 = []
 
-    # Start at the end of the file and read backwards.
-    # If duplicate lines exist, eliminate the ones that occur earlier in the file.
     i = 0
     while i < len(lines):
         line_orig = lines[i]
@@ -65,10 +59,26 @@ def main():
 
     column1_iorig_columnsAfter1.sort(key=itemgetter(1))
 
+    lines_out = []
     for i in range(0, len(column1_iorig_columnsAfter1)):
         column1 = column1_iorig_columnsAfter1[i][0]
         columnsAfter1 = column1_iorig_columnsAfter1[i][2]
-        sys.stdout.write(str(column1) + ' ' + columnsAfter1 + '\n')
+        lines_out.append(str(column1) + ' ' + columnsAfter1 + '\n')
+
+    return lines_out
+
+
+def main():
+    in_stream = sys.stdin
+    f = None
+    fname = None
+    if len(sys.argv) == 2:
+        fname = sys.argv[1]
+        f = open(fname, 'r')
+        in_stream = f
+
+    for line in RenumberFirstColumn(in_stream.readlines()):
+        sys.stdout.write(line)
 
     if f != None:
         f.close()
@@ -94,6 +94,7 @@ ttree.py
 lttree.py
 lttree_check.py
 lttree_postprocess.py
+lttree_pipeline.py
 nbody_by_type.py
 nbody_fix_ttree_assignments.py
 nbody_reorder_atoms.py
@@ -104,8 +105,12 @@ remove_duplicate_atoms.py
 remove_duplicates_nbody.py
 renumber_DATA_first_column.py
 ttree_render.py
+ttree_assignments_index.py
+ttree_template_cache.py
 dump2data.py
+dump_frame_index.py
 raw2data.py
+read_coords.py
 EOF
 )
 
@@ -133,6 +138,9 @@ LTTREE_CHECK_COMMAND="$PYTHON_COMMAND \"${PY_SCR_DIR}/lttree_check.py\""
 # command that invokes lttree_postprocess.py
 LTTREE_POSTPROCESS_COMMAND="$PYTHON_COMMAND \"${PY_SCR_DIR}/lttree_postprocess.py\""
 
+# command that invokes lttree_pipeline.py (if the user selects "-pipeline")
+LTTREE_PIPELINE_COMMAND="$PYTHON_COMMAND \"${PY_SCR_DIR}/lttree_pipeline.py\""
+
 
 # -----------------------------------------------------------
 # If everything worked, then running ttree usually
@@ -209,7 +217,6 @@ in_charges="In Charges"
 # ---------------------------------------------------------------
 
 tmp_atom_coords="tmp_atom_coords.dat"  #<-temporary file for storing coordinates
-tmp_dump="tmp_dump.dat"
 tmp_ellips_quat="tmp_ellips_quat.dat"
 
 
@@ -217,7 +224,6 @@ MOLTEMPLATE_TEMP_FILES=$(cat <<EOF
 *.template
 ttree_assignments.txt
 $tmp_atom_coords
-$tmp_dump
 $tmp_ellips_quat
 $data_masses
 $data_pair_coeffs
@@ -397,6 +403,32 @@ Optional arguments:
                 "bond coeff", "angle coeff", "dihedral coeff", and
 		"improper coeff" commands.
 
+-pipeline       Run lttree.py, and generate the bonds, angles, dihedrals and
+                impropers "By Type" in a single python process (using
+                lttree_pipeline.py) instead of invoking a separate program
+                for each step.  This avoids re-reading the (potentially large)
+                "ttree_assignments.txt" file many times.  The results are the same.
+
+-nbody-jobs N   Use N processes to generate the angles, dihedrals, and
+                impropers "By Type".  (The molecules in the system are divided
+                between these processes.  The results are the same.)
+
+-render-jobs N  Use N processes to render the output files (such as
+                "Data Atoms", "Data Bonds", and "In Settings").  (Each file is
+                rendered by one of these processes.  The results are the same.)
+
+-prune-unused-types  Discard the atom types (and bond, angle, dihedral, and
+                improper types) which are not needed by the atoms in the
+                "Data Atoms" section (or by the "By Type" rules which apply
+                to them).  Force-field files define thousands of types which
+                are usually not used.  With this option, the unused types are
+                not numbered, and they are omitted from the output files.
+
+(Note: The templates in large files, such as the force-field files, can be
+       cached, so that they do not need to be parsed every time.
+       To enable the cache, set the MOLTEMPLATE_CACHE_DIR environment
+       variable to the name of the directory where it should be stored.)
+
 EOF
 )
 
@@ -425,7 +457,7 @@ fi
 
 # --- Did the user specify a file containing atomic coordinates?
 
-rm -f "$tmp_atom_coords" "$tmp_dump" "$tmp_ellips_quat"
+rm -f "$tmp_atom_coords" "$tmp_ellips_quat"
 
 # Optional files containing atom coordinates:
 PDB_FILE=""
@@ -449,8 +481,10 @@ RD_ID_FILTER=""
 RD_TYPE_FILTER=""
 SETTINGS_MOLC=""
 CHECKFF=""
+NBODY_JOBS="1"
 RUN_VMD_AT_END=""
 APPEND_EXAMPLE_SCRIPT=""
+USE_PIPELINE=""
 
 
 ARGC=0
@@ -491,6 +525,16 @@ while [ "$i" -lt "$ARGC" ]; do
         fi
     elif [ "$A" = "-checkff" ]; then
         CHECKFF="$A"
+    elif [ "$A" = "-pipeline" ]; then
+        USE_PIPELINE="true"
+    elif [ "$A" = "-nbody-jobs" ]; then
+        if [ "$i" -eq "$ARGC" ]; then
+            echo "ERROR: Expected a number following the -nbody-jobs argument" >&2
+            exit 7
+        fi
+        i=$((i+1))
+        eval A=\${ARGV${i}}
+        NBODY_JOBS="$A"
     elif [ "$A" = "-overlay-bonds" ]; then
         # In that case, do not remove duplicate bond interactions
         unset REMOVE_DUPLICATE_BONDS
@@ -554,7 +598,10 @@ while [ "$i" -lt "$ARGC" ]; do
             exit 8
         fi
         #echo "  (extracting coordinates from \"$RAW_FILE\")" >&2
-        awk '{if (NF==3) {print $0}}' < "$RAW_FILE" > "$tmp_atom_coords"
+        if ! COORDS_VARS=`$PYTHON_COMMAND "${PY_SCR_DIR}/read_coords.py" -raw "$RAW_FILE" -coords "$tmp_atom_coords"`; then
+            exit 8
+        fi
+        eval "$COORDS_VARS"
 
     elif [ "$A" = "-bond-symmetry" ]; then
         # Change the atom ordering rules in a 2-body bonded interaction:
@@ -629,12 +676,10 @@ while [ "$i" -lt "$ARGC" ]; do
             exit 8
         fi
         #echo "  (extracting coordinates from \"$XYZ_FILE\")" >&2
-
-        # "isnum(x)" returns 1 or 0 depending upon whether or not
-        # a string is numeric.
-        #http://rosettacode.org/wiki/Determine_if_a_string_is_numeric#AWK
-
-        awk '{if (NR>2) {if (NF==4) {print $2" "$3" "$4} else {if (NF==3) {print $1" "$2" "$3}}}}' < "$XYZ_FILE" > "$tmp_atom_coords"
+        if ! COORDS_VARS=`$PYTHON_COMMAND "${PY_SCR_DIR}/read_coords.py" -xyz "$XYZ_FILE" -coords "$tmp_atom_coords"`; then
+            exit 8
+        fi
+        eval "$COORDS_VARS"
 
     elif [ "$A" = "-pdb" ]; then
         if [ "$i" -eq "$ARGC" ]; then
@@ -653,72 +698,18 @@ while [ "$i" -lt "$ARGC" ]; do
             exit 10
         fi
         #echo "  (extracting coordinates from \"$PDB_FILE\")" >&2
-        if grep -q '^ATOM  \|^HETATM' "$PDB_FILE"; then
-            # Extract the coordinates from the PDB file:
-
-            # COMMENT:
-            # I used to sort the PDB file by (ChainID,SeqNum,InsertCode)
-            # and then extract the coordinates from the file.
-            # This turned out to be inconvenient for users.  Instead
-            # just read the coordinates in the order they appear in the file:
-
-            awk '/^ATOM  |^HETATM/{print substr($0,31,8)" "substr($0,39,8)" "substr($0,47,8)}' \
-                < "$PDB_FILE" \
-                > "$tmp_atom_coords"
-
-        else
+        # Extract the coordinates (in the order they appear in the file),
+        # and the periodic bounding-box information (from the CRYST1 record).
+        # (This sets BOXSIZE_MINX, BOXSIZE_MAXX, ..., and, if the box is
+        #  triclinic, BOXSIZE_XY, BOXSIZE_XZ, BOXSIZE_YZ, and TRICLINIC.)
+        if ! COORDS_VARS=`$PYTHON_COMMAND "${PY_SCR_DIR}/read_coords.py" -pdb "$PDB_FILE" -coords "$tmp_atom_coords"`; then
             echo "$SYNTAX_MSG" >&2
             echo "-----------------------" >&2
             echo "" >&2
             echo "Error: File \"$PDB_FILE\" is not a valid PDB file." >&2
             exit 11
         fi
-        # Now extract the periodic bounding-box informatio from the PDB file
-        # The CRYST1 records are described at:
-        # http://deposit.rcsb.org/adit/docs/pdb_atom_format.html
-        BOXSIZE_A=-1.0
-        BOXSIZE_B=-1.0
-        BOXSIZE_C=-1.0
-        ALPHA=" 90.00"  #Note: The space before the number in " 90.00" is intentional.
-        BETA=" 90.00"   #      Later we will check to see if the system is triclinic
-        GAMMA=" 90.00"  #      by comparing these strings for equality with " 90.00"
-        if grep -qF "CRYST1" "$PDB_FILE"; then
-            BOXSIZE_A=`awk '/CRYST1/{print substr($0,8,8)}' < "$PDB_FILE"`
-            BOXSIZE_B=`awk '/CRYST1/{print substr($0,17,8)}' < "$PDB_FILE"`
-            BOXSIZE_C=`awk '/CRYST1/{print substr($0,26,8)}' < "$PDB_FILE"`
-            ALPHA=`awk '/CRYST1/{print substr($0,35,6)}' < "$PDB_FILE"`
-            BETA=`awk '/CRYST1/{print substr($0,42,6)}' < "$PDB_FILE"`
-            GAMMA=`awk '/CRYST1/{print substr($0,49,6)}' < "$PDB_FILE"`
-        fi
-        if [ `echo "$ALPHA!=90.0"|bc` -eq 1 ] || [ `echo "$BETA!=90.0"|bc` -eq 1 ] || [ `echo "$GAMMA!=90.0"|bc` -eq 1 ]; then
-            # I transform the parameters from one format to the other by inverting
-            # the transformation formula from the LAMMPS documentation 
-            # https://docs.lammps.org/Howto_triclinic.html  (which matches
-            # http://www.ccl.net/cca/documents/molecular-modeling/node4.html)
-            TRICLINIC="true"
-            PI=3.1415926535897931
-            BOXSIZE_X=$BOXSIZE_A
-            BOXSIZE_Y=`awk -v PI="$PI" -v BOXSIZE_B="$BOXSIZE_B" -v GAMMA="$GAMMA" 'BEGIN{print BOXSIZE_B*sin(GAMMA*PI/180.0)}'`
-            BOXSIZE_XY=`awk -v PI="$PI" -v BOXSIZE_B="$BOXSIZE_B" -v GAMMA="$GAMMA" 'BEGIN{print BOXSIZE_B*cos(GAMMA*PI/180.0)}'`
-            BOXSIZE_XZ=`awk -v PI="$PI" -v BOXSIZE_C="$BOXSIZE_C" -v BETA="$BETA"   'BEGIN{print BOXSIZE_C*cos(BETA*PI/180.0)}'`
-            BOXSIZE_YZ=`awk -v PI="$PI" -v BOXSIZE_C="$BOXSIZE_C" -v ALPHA="$ALPHA" -v BETA="$BETA" -v GAMMA="$GAMMA" 'BEGIN{ca=cos(ALPHA*PI/180.0); cb=cos(BETA*PI/180.0); cg=cos(GAMMA*PI/180.0); sg=sin(GAMMA*PI/180.0); print BOXSIZE_C*(ca-(cg*cb))/sg}'`
-            BOXSIZE_Z=`awk -v PI="$PI" -v BOXSIZE_C="$BOXSIZE_C" -v ALPHA="$ALPHA" -v BETA="$BETA" -v GAMMA="$GAMMA" 'BEGIN{ca=cos(ALPHA*PI/180.0); cb=cos(BETA*PI/180.0); cg=cos(GAMMA*PI/180.0); sg=sin(GAMMA*PI/180.0); print BOXSIZE_C*sqrt(1.0+2*ca*cb*cg-ca*ca-cb*cb-cg*cg)/sg}'`
-            #BOXSIZE_Z=`awk -v BOXSIZE_C="$BOXSIZE_C" -v BOXSIZE_XZ="$BOXSIZE_XZ" -v BOXSIZE_YZ="$BOXSIZE_YZ" 'BEGIN{print sqrt((BOXSIZE_C*BOXSIZE_C)-((BOXSIZE_XZ*BOXSIZE_XZ)+(BOXSIZE_YZ*BOXSIZE_YZ)))}'`
-            # Note: The two expressions for "BOXSIZE_Z" are algebraically equivalent.
-        else
-            BOXSIZE_X=$BOXSIZE_A
-            BOXSIZE_Y=$BOXSIZE_B
-            BOXSIZE_Z=$BOXSIZE_C
-            BOXSIZE_XY=0.0
-            BOXSIZE_XZ=0.0
-            BOXSIZE_YZ=0.0
-        fi
-        BOXSIZE_MINX=0.0
-        BOXSIZE_MINY=0.0
-        BOXSIZE_MINZ=0.0
-        BOXSIZE_MAXX=$BOXSIZE_X
-        BOXSIZE_MAXY=$BOXSIZE_Y
-        BOXSIZE_MAXZ=$BOXSIZE_Z
+        eval "$COORDS_VARS"
 
     # Contributing author for read DUMP: Otello M Roscioni.
     elif [ "$A" = "-dump" ]; then
@@ -738,75 +729,14 @@ while [ "$i" -lt "$ARGC" ]; do
             exit 8
         fi
 
-        # Reorder the last frame of a DUMP file, as the atoms are dumped randomly.
-        last=$(head -4 "$DUMP_FILE" | awk 'NR==4{print $1+9}')
-        tail -$last "$DUMP_FILE" | head -9 > "$tmp_dump"
-        tail -$last "$DUMP_FILE" | tail -n+10 | sort -n >> "$tmp_dump"
-
-        # Read the box
-        IFS=$CR
-        box=( $(head -8 "$tmp_dump" | awk 'NR>5{for (i=1;i<=NF;i++){printf "%g\n",$i}}') )
-
-        # Find the columns of: position, quaternion, velocity, and angular momentum.
-        pos=( $(sed -n '9p;9q' "$tmp_dump" | awk '{for(i=1; i<=NF; i++){if($i~/^[xyz]/){printf "%i\n",i-2} }}') )
-        # Quaternion order:
-	# (I,J,K,W) from "compute orient all property/atom quati quatj quatk quatw"
-	# (W,I,J,K) from "compute q      all property/atom quatw quati quatj quatk"
-	quat=( $(sed -n '9p;9q' "$tmp_dump" | awk '{for(i=1; i<=NF; i++){
-               if(                         $i~/^qw$/||$i~/^quatw$/||$i~/^c_q\[1\]$/||$i~/^c_orient\[4\]$/){qo[1]=i-2}
-               if($i~/^qi$/||$i~/^quati$/||$i~/^qx$/||$i~/^quatx$/||$i~/^c_q\[2\]$/||$i~/^c_orient\[1\]$/){qo[2]=i-2}
-               if($i~/^qj$/||$i~/^quatj$/||$i~/^qy$/||$i~/^quaty$/||$i~/^c_q\[3\]$/||$i~/^c_orient\[2\]$/){qo[3]=i-2}
-               if($i~/^qk$/||$i~/^quatk$/||$i~/^qz$/||$i~/^quatz$/||$i~/^c_q\[4\]$/||$i~/^c_orient\[3\]$/){qo[4]=i-2}
-               }}END{for(i in qo){printf "%i\n",qo[i]}}') )
-        vel=( $(sed -n '9p;9q' "$tmp_dump" | awk '{for(i=1; i<=NF; i++){if($i~/v[xyz]/){printf "%i\n",i-2} }}') )
-        angmom=( $(sed -n '9p;9q' "$tmp_dump" | awk '{for(i=1; i<=NF; i++){if($i~/angmom[xyz]/||$i~/AngularMomentum[XYZ]/){printf "%i\n",i-2} }}') )
-        IFS=$OIFS
-
-        # Orthorombic box.
-        if [ ${#box[@]} == 6 ]; then
-          BOXSIZE_MINX=${box[0]}
-          BOXSIZE_MAXX=${box[1]}
-          BOXSIZE_MINY=${box[2]}
-          BOXSIZE_MAXY=${box[3]}
-          BOXSIZE_MINZ=${box[4]}
-          BOXSIZE_MAXZ=${box[5]}
-        fi
-
-        # Triclinic box.
-        # For triclinic systems the first two columns of "ITEM: BOX BOUNDS" in 
-        # the dump describe a bounding box around the system, not the system 
-        # itself. See https://docs.lammps.org/dump.html and https://docs.lammps.org/Howto_triclinic.html
-        if [ ${#box[@]} == 9 ]; then
-          xtilt=( $(echo "0.0 ${box[2]} ${box[5]} $(bc -l<<<${box[2]}+${box[5]})"|xargs -n1|sort -n) )
-          ytilt=( $(echo "0.0 ${box[8]}"|xargs -n1|sort -n) )
-          BOXSIZE_MINX=$(echo ${box[0]}" "${xtilt[0]} |awk '{print $1-$2}')
-          BOXSIZE_MAXX=$(echo ${box[1]}" "${xtilt[3]} |awk '{print $1-$2}')
-          BOXSIZE_MINY=$(echo ${box[3]}" "${ytilt[0]} |awk '{print $1-$2}')
-          BOXSIZE_MAXY=$(echo ${box[4]}" "${ytilt[1]} |awk '{print $1-$2}')
-          BOXSIZE_MINZ=${box[6]}
-          BOXSIZE_MAXZ=${box[7]}
-          BOXSIZE_XY=${box[2]}
-          BOXSIZE_XZ=${box[5]}
-          BOXSIZE_YZ=${box[8]}
-          TRICLINIC="true"
-        fi
-
-        # Save the coordinates.
-        awk -v x=${pos[0]} -v y=${pos[1]} -v z=${pos[2]} 'NR>9{print $x" "$y" "$z}' "$tmp_dump" > "$tmp_atom_coords"
-
-        # Save the orientations. Make sure that the columns reserved for quaternions are not used to store velocities.
-        if [[ ${#quat[@]} == 4 ]]; then 
-           awk -v qw=${quat[0]} -v qx=${quat[1]} -v qy=${quat[2]} -v qz=${quat[3]} 'NR>9{print $qw" "$qx" "$qy" "$qz}' "$tmp_dump" > "$tmp_ellips_quat"
+        # Read the last frame of the DUMP file (sorted by atom-ID), including
+        # the box, and, if present, the quaternions and velocities.
+        # (The velocities are followed by the angular momenta, if present.)
+        if ! COORDS_VARS=`$PYTHON_COMMAND "${PY_SCR_DIR}/read_coords.py" -dump "$DUMP_FILE" -coords "$tmp_atom_coords" -quats "$tmp_ellips_quat" -velocities "$data_velocities"`; then
+            exit 8
         fi
+        eval "$COORDS_VARS"
 
-        # Save the velocities and, if present, angular momenta too.
-        if [[ ${#vel[@]} == 3 && ${#angmom[@]} == 0 ]]; then 
-           awk -v vx=${vel[0]} -v vy=${vel[1]} -v vz=${vel[2]} 'NR>9{print $1 " "$vx" "$vy" "$vz}' "$tmp_dump" > "$data_velocities"
-
-        elif [[ ${#vel[@]} == 3 && ${#angmom[@]} == 3 ]]; then 
-           awk -v vx=${vel[0]} -v vy=${vel[1]} -v vz=${vel[2]} -v ax=${angmom[0]} -v ay=${angmom[1]} -v az=${angmom[2]} 'NR>9{print $1 " "$vx" "$vy" "$vz" "$ax" "$ay" "$az}' "$tmp_dump" > "$data_velocities"
-        fi
-    
     elif [ "$A" = "-atomstyle" ] || [ "$A" = "-atom-style" ] || [ "$A" = "-atom_style" ]; then
         if [ "$i" -eq "$ARGC" ]; then
             echo "$SYNTAX_MSG" >&2
@@ -944,19 +874,46 @@ done
 
 
 
-# If checking is not disabled, then first check for common spelling errors.
+# If checking is not disabled, then also check for common spelling errors.
+# (These checks are carried out by lttree.py itself, after it has parsed
+#  the files, so that the files do not have to be parsed twice.
+#  Previously they were carried out by running $LTTREE_CHECK_COMMAND first.)
 
+LTTREE_ARGS="$TTREE_ARGS"
 if [ -n "$LTTREE_CHECK_COMMAND" ]; then
-    if ! eval $LTTREE_CHECK_COMMAND $TTREE_ARGS $LTTREE_CHECK_ARGS; then
-        exit 1
-    fi
+    LTTREE_ARGS="-check-syntax $LTTREE_CHECK_ARGS $TTREE_ARGS"
 fi
 
 #   --- Run ttree. ---
 #
 # 3, 2, 1, ...
 
-if ! eval $LTTREE_COMMAND $TTREE_ARGS; then
+if [ -n "$USE_PIPELINE" ]; then
+    # lttree_pipeline.py runs lttree.py, remove_duplicate_atoms.py,
+    # bonds_by_type.py, and the "By Type" steps below in a single process.
+    PIPELINE_ARGS="$CHECKFF -nbody-jobs $NBODY_JOBS -shell-vars pipeline_vars.tmp"
+    if [ -n "$SUBGRAPH_SCRIPT_ANGLES" ]; then
+        PIPELINE_ARGS="$PIPELINE_ARGS -angle-symmetry \"$SUBGRAPH_SCRIPT_ANGLES\""
+    fi
+    if [ -n "$SUBGRAPH_SCRIPT_DIHEDRALS" ]; then
+        PIPELINE_ARGS="$PIPELINE_ARGS -dihedral-symmetry \"$SUBGRAPH_SCRIPT_DIHEDRALS\""
+    fi
+    if [ -n "$SUBGRAPH_SCRIPT_IMPROPERS" ]; then
+        PIPELINE_ARGS="$PIPELINE_ARGS -improper-symmetry \"$SUBGRAPH_SCRIPT_IMPROPERS\""
+    fi
+    eval $LTTREE_PIPELINE_COMMAND $PIPELINE_ARGS $LTTREE_ARGS
+else
+    # (Also create an index for the "ttree_assignments.txt" file, so that
+    #  ttree_render.py does not have to read the entire file every time it
+    #  is invoked below.  See ttree_assignments_index.py)
+    eval $LTTREE_COMMAND -index-assignments $LTTREE_ARGS
+fi
+LTTREE_STATUS=$?
+if [ $LTTREE_STATUS -eq 3 ]; then
+    # (lttree.py found a mistake in the user's files while checking them.
+    #  Use the same exit status as when these checks were a separate step.)
+    exit 1
+elif [ $LTTREE_STATUS -ne 0 ]; then
     exit 2
 fi
 
@@ -981,7 +938,10 @@ echo "" >&2
 # Later, it will be convenient to create a version of this file
 # which only contains static counter variables
 # (ie. counter variables beginning with @, not $).
-awk '/@/ {print $0}' < ttree_assignments.txt > ttree_assignments_static.txt
+# (If USE_PIPELINE is set, lttree_pipeline.py has already created this file.)
+if [ -z "$USE_PIPELINE" ]; then
+    awk '/@/ {print $0}' < ttree_assignments.txt > ttree_assignments_static.txt
+fi
 
 
 
@@ -1041,7 +1001,9 @@ done
 IFS=$OIFS
 
 
-if [ -s "${data_atoms}" ]; then
+if [ -s "${data_atoms}" ] && [ -n "$USE_PIPELINE" ]; then
+    :  # (lttree_pipeline.py has already removed duplicate atoms)
+elif [ -s "${data_atoms}" ]; then
     if ! $PYTHON_COMMAND "${PY_SCR_DIR}/remove_duplicate_atoms.py" \
                                    < "${data_atoms}" \
                                    > "${data_atoms}.tmp"; then
@@ -1098,7 +1060,7 @@ fi
 # they effect the other data sections, and the ttree_assignments.txt file.)
 # -------------------------------------------------------
 
-if [ -s "${data_bond_list}.template" ]; then
+if [ -s "${data_bond_list}.template" ] && [ -z "$USE_PIPELINE" ]; then
 
     if [ ! -s "$data_bonds_by_type" ]; then
         echo "Error: You have a \"Data Bond List\", section somewhere"
@@ -1168,7 +1130,7 @@ if [ -s "${data_bond_list}.template" ]; then
     # names present in the .template file.  (We want to convert the file from
     # a .template format into an ordinary (numeric) LAMMPS data-section format.)
 
-    if ! $PYTHON_COMMAND "${PY_SCR_DIR}/ttree_render.py" \
+    if ! $PYTHON_COMMAND "${PY_SCR_DIR}/ttree_render.py" -index \
            ttree_assignments.txt \
            < "${data_bonds}.template" \
            > "$data_bonds"; then
@@ -1195,7 +1157,7 @@ FILE_angles_by_type2=""
 IFS=$(echo -en "\n\b")
 for FILE in `ls -v "$data_angles_by_type"*.template 2> /dev/null`; do
 
-    if [ ! -s "$FILE" ] || [ ! -s "$data_bonds" ]; then
+    if [ ! -s "$FILE" ] || [ ! -s "$data_bonds" ] || [ -n "$USE_PIPELINE" ]; then
         break;  # This handles with the special cases that occur when
                 # 1) There are no bonds in your system
                 # 2) "$data_angles_by_type"*.template matches nothing
@@ -1240,6 +1202,7 @@ for FILE in `ls -v "$data_angles_by_type"*.template 2> /dev/null`; do
             -bonds "${data_bonds}.template" \
             -nbodybytype "${FILE}" \
             $CHECKFF \
+            -nbody-jobs "$NBODY_JOBS" \
             -prefix '$/angle:bytype' > gen_angles.template.tmp; then
         exit 4
     fi
@@ -1263,28 +1226,29 @@ for FILE in `ls -v "$data_angles_by_type"*.template 2> /dev/null`; do
     # The next 2 lines extract the variable names from data_new.template.tmp
     # and instert them into the appropriate place in ttree_assignments.txt
     # (renumbering the relevant variable-assignments to avoid clashes).
+    # (The file is modified in place.  Only the lines in the "/angle" category,
+    #  and the lines which follow them, are rewritten.  The index of this file,
+    #  "ttree_assignments.txt.idx", is also updated, if present.)
     if ! $PYTHON_COMMAND "${PY_SCR_DIR}/nbody_fix_ttree_assignments.py" \
           '/angle' gen_angles.template.tmp \
-          < ttree_assignments.txt \
-          > ttree_assignments.tmp; then
+          ttree_assignments.txt; then
         exit 5
     fi
 
-    echo "(Rendering ttree_assignments.tmp file after angles added.)" >&2
+    echo "(Rendering ttree_assignments.txt file after angles added.)" >&2
 
     # ---- Re-build (render) the "$data_angles" file ----
     # Now substitute these variable values (assignments) into the variable
     # names present in the .template file.  (We want to convert the file from
     # a .template format into an ordinary (numeric) LAMMPS data-section format.)
-    if ! $PYTHON_COMMAND "${PY_SCR_DIR}/ttree_render.py" \
-           ttree_assignments.tmp \
+    if ! $PYTHON_COMMAND "${PY_SCR_DIR}/ttree_render.py" -index \
+           ttree_assignments.txt \
            < "${data_angles}.template" \
            > "$data_angles"; then
         exit 6
     fi
     echo "" >&2
 
-    mv -f ttree_assignments.tmp ttree_assignments.txt
     rm -f gen_angles.template.tmp new_angles.template.tmp
 done
 IFS=$OIFS
@@ -1297,7 +1261,7 @@ FILE_dihedrals_by_type2=""
 IFS=$(echo -en "\n\b")
 for FILE in `ls -v "$data_dihedrals_by_type"*.template 2> /dev/null`; do
 
-    if [ ! -s "$FILE" ] || [ ! -s "$data_bonds" ]; then
+    if [ ! -s "$FILE" ] || [ ! -s "$data_bonds" ] || [ -n "$USE_PIPELINE" ]; then
         break;  # This handles with the special cases that occur when
                 # 1) There are no bonds in your system
                 # 2) "$data_dihedrals_by_type"*.template matches nothing
@@ -1342,6 +1306,7 @@ for FILE in `ls -v "$data_dihedrals_by_type"*.template 2> /dev/null`; do
             -bonds "${data_bonds}.template" \
             -nbodybytype "${FILE}" \
             $CHECKFF \
+            -nbody-jobs "$NBODY_JOBS" \
             -prefix '$/dihedral:bytype' > gen_dihedrals.template.tmp; then
         exit 4
     fi
@@ -1365,28 +1330,29 @@ for FILE in `ls -v "$data_dihedrals_by_type"*.template 2> /dev/null`; do
     # The next 2 lines extract the variable names from data_new.template.tmp
     # and instert them into the appropriate place in ttree_assignments.txt
     # (renumbering the relevant variable-assignments to avoid clashes).
+    # (The file is modified in place.  Only the lines in the "/dihedral" category,
+    #  and the lines which follow them, are rewritten.  The index of this file,
+    #  "ttree_assignments.txt.idx", is also updated, if present.)
     if ! $PYTHON_COMMAND "${PY_SCR_DIR}/nbody_fix_ttree_assignments.py" \
           '/dihedral' gen_dihedrals.template.tmp \
-          < ttree_assignments.txt \
-          > ttree_assignments.tmp; then
+          ttree_assignments.txt; then
         exit 5
     fi
 
-    echo "(Rendering ttree_assignments.tmp file after dihedrals added.)" >&2
+    echo "(Rendering ttree_assignments.txt file after dihedrals added.)" >&2
 
     # ---- Re-build (render) the "$data_dihedrals" file ----
     # Now substitute these variable values (assignments) into the variable
     # names present in the .template file.  (We want to convert the file from
     # a .template format into an ordinary (numeric) LAMMPS data-section format.)
-    if ! $PYTHON_COMMAND "${PY_SCR_DIR}/ttree_render.py" \
-           ttree_assignments.tmp \
+    if ! $PYTHON_COMMAND "${PY_SCR_DIR}/ttree_render.py" -index \
+           ttree_assignments.txt \
            < "${data_dihedrals}.template" \
            > "$data_dihedrals"; then
         exit 6
     fi
     echo "" >&2
 
-    mv -f ttree_assignments.tmp ttree_assignments.txt
     rm -f gen_dihedrals.template.tmp new_dihedrals.template.tmp
 done
 IFS=$OIFS
@@ -1401,7 +1367,7 @@ FILE_impropers_by_type2=""
 IFS=$(echo -en "\n\b")
 for FILE in `ls -v "$data_impropers_by_type"*.template 2> /dev/null`; do
 
-    if [ ! -s "$FILE" ] || [ ! -s "$data_bonds" ]; then
+    if [ ! -s "$FILE" ] || [ ! -s "$data_bonds" ] || [ -n "$USE_PIPELINE" ]; then
         break;  # This handles with the special cases that occur when
                 # 1) There are no bonds in your system
                 # 2) "$data_impropers_by_type"*.template matches nothing
@@ -1445,6 +1411,7 @@ for FILE in `ls -v "$data_impropers_by_type"*.template 2> /dev/null`; do
             -atoms "${data_atoms}.template" \
             -bonds "${data_bonds}.template" \
             -nbodybytype "${FILE}" \
+            -nbody-jobs "$NBODY_JOBS" \
             -prefix '$/improper:bytype' > gen_impropers.template.tmp; then
         exit 4
     fi
@@ -1468,32 +1435,40 @@ for FILE in `ls -v "$data_impropers_by_type"*.template 2> /dev/null`; do
     # The next 2 lines extract the variable names from data_new.template.tmp
     # and instert them into the appropriate place in ttree_assignments.txt
     # (renumbering the relevant variable-assignments to avoid clashes).
+    # (The file is modified in place.  Only the lines in the "/improper" category,
+    #  and the lines which follow them, are rewritten.  The index of this file,
+    #  "ttree_assignments.txt.idx", is also updated, if present.)
     if ! $PYTHON_COMMAND "${PY_SCR_DIR}/nbody_fix_ttree_assignments.py" \
           '/improper' gen_impropers.template.tmp \
-          < ttree_assignments.txt \
-          > ttree_assignments.tmp; then
+          ttree_assignments.txt; then
         exit 5
     fi
 
-    echo "(Rendering ttree_assignments.tmp file after impropers added.)" >&2
+    echo "(Rendering ttree_assignments.txt file after impropers added.)" >&2
 
     # ---- Re-build (render) the "$data_impropers" file ----
     # Now substitute these variable values (assignments) into the variable
     # names present in the .template file.  (We want to convert the file from
     # a .template format into an ordinary (numeric) LAMMPS data-section format.)
-    if ! $PYTHON_COMMAND "${PY_SCR_DIR}/ttree_render.py" \
-           ttree_assignments.tmp \
+    if ! $PYTHON_COMMAND "${PY_SCR_DIR}/ttree_render.py" -index \
+           ttree_assignments.txt \
            < "${data_impropers}.template" \
            > "$data_impropers"; then
         exit 6
     fi
     echo "" >&2
 
-    mv -f ttree_assignments.tmp ttree_assignments.txt
     rm -f gen_impropers.template.tmp new_impropers.template.tmp
 done
 IFS=$OIFS
 
+if [ -n "$USE_PIPELINE" ] && [ -s pipeline_vars.tmp ]; then
+    # Load the variables (FILE_angles_by_type1, SUBGRAPH_SCRIPT_ANGLES, ...)
+    # which would have been set by the loops above.
+    . ./pipeline_vars.tmp
+    rm -f pipeline_vars.tmp
+fi
+
 
 
 # Find all the files created by lttree.py containing lines beginning with 
@@ -1540,7 +1515,7 @@ for file_name in $OUT_FILES_WITH_COEFF_COMMANDS; do
             # "ttree_assignments.txt" file, when substituting numbers for
             # variables.  This is a very big file and can take a while to read
             # so we don't do it unless it's necessary.
-            if ! $PYTHON_COMMAND "${PY_SCR_DIR}/ttree_render.py" \
+            if ! $PYTHON_COMMAND "${PY_SCR_DIR}/ttree_render.py" -index \
                  ttree_assignments.txt \
                  < "$file_name" \
                  > "$bn"; then
@@ -1552,7 +1527,7 @@ for file_name in $OUT_FILES_WITH_COEFF_COMMANDS; do
             # file, which will save a lot of time.  In that case we can use
             # "ttree_assignments_static.txt" instead which omits those lines
             # of text and is much faster to parse as a result.
-            if ! $PYTHON_COMMAND "${PY_SCR_DIR}/ttree_render.py" \
+            if ! $PYTHON_COMMAND "${PY_SCR_DIR}/ttree_render.py" -index \
                  ttree_assignments_static.txt \
                  < "$file_name" \
                  > "$bn"; then
@@ -1878,7 +1853,7 @@ if [ -s "$data_charge_by_bond" ]; then
     # Now substitute these variable values (assignments) into the variable
     # names present in the .template file.  (We want to convert the file from
     # a .template format into an ordinary (numeric) LAMMPS data-section format.)
-    if ! $PYTHON_COMMAND "${PY_SCR_DIR}/ttree_render.py" \
+    if ! $PYTHON_COMMAND "${PY_SCR_DIR}/ttree_render.py" -index \
          ttree_assignments.txt \
          < "${in_charges}.template" \
          >> "${in_charges}"; then
@@ -2033,6 +2008,9 @@ if [ -s "$data_boundary" ]; then
         exit 12
     fi
 
+    # (This replaces the box from the coordinate file, if any, including its
+    #  triclinic parameters.)
+    TRICLINIC=""
     BOXSIZE_XY=`awk '{if ($4=="xy") {xy=$1}} END{print xy}' < "$data_boundary"`
     BOXSIZE_XZ=`awk '{if ($5=="xz") {xz=$2}} END{print xz}' < "$data_boundary"`
     BOXSIZE_YZ=`awk '{if ($6=="yz") {yz=$3}} END{print yz}' < "$data_boundary"`
@@ -2064,7 +2042,8 @@ if [ -z "$BOXSIZE_MINX" ] || [ -z "$BOXSIZE_MAXX" ] || [ -z "$BOXSIZE_MINY" ] ||
         # Estimate the minimimum, maximum x,y,z values
         # from the coordinate data.
 
-        MINMAX_BOUNDS=`awk 'BEGIN{first=1}{if (NF>=3){x=$1; y=$2; z=$3; if (first) {first=0; xmin=x; xmax=x; ymin=y; ymax=y; zmin=z; zmax=z;} else {if (x<xmin) xmin=x; if (x>xmax) xmax=x; if (y<ymin) ymin=y; if (y>ymax) ymax=y; if (z<zmin) zmin=z; if (z>zmax) zmax=z;}}} END{print xmin" "xmax" "ymin" "ymax" "zmin" "zmax;}' < "$tmp_atom_coords"`
+        # (COORDS_BOUNDS was calculated by read_coords.py)
+        MINMAX_BOUNDS="$COORDS_BOUNDS"
 
         # ...and add a narrow margin (10%) around the boundaries:
         BOXSIZE_MINX=`echo $MINMAX_BOUNDS | awk '{margin=0.1; width=$2-$1; print $1-0.5*margin*width}'`
@@ -2290,7 +2269,7 @@ if [ -s "$data_ellipsoids" ]; then
     if [ -s "$tmp_ellips_quat" ]; then 
 
        NATOMS=`awk 'END{print NR}' "$data_ellipsoids"`
-       NATOMCRDS=`awk 'END{print NR}' "$tmp_ellips_quat"`
+       NATOMCRDS=$NUM_ATOM_COORDS
        if [ $NATOMS -ne $NATOMCRDS ]; then
            echo "Error: Number of atoms in coordinate file provided by user ($NATOMCRDS)" >&2
            echo "does not match the number of atoms generated in ttree file ($NATOMS)" >&2
@@ -2439,7 +2418,7 @@ if [ -s "$tmp_atom_coords" ]; then
     NATOMS=`awk 'BEGIN{n=0} /^\\\$\/atom:/{n++}END{print n}' < ttree_assignments.txt`
     NATOMS_SP=`awk 'BEGIN{n=0} /^\\\${\/atom:/{n++}END{print n}' < ttree_assignments.txt`
     NATOMS=$((NATOMS + NATOMS_SP))
-    NATOMCRDS=`awk '{if (NF>=3) natom+=1} END{print(natom)}' < "$tmp_atom_coords"`
+    NATOMCRDS=$NUM_ATOM_COORDS
     if [ $NATOMS -ne $NATOMCRDS ]; then
         echo "Error: Number of atoms in coordinate file provided by user ($NATOMCRDS)" >&2
         echo "does not match the number of atoms generated in ttree file ($NATOMS)" >&2
@@ -2540,6 +2519,9 @@ IFS=$OIFS
 
 # We no longer need the "ttree_assignments_static.txt" file.
 rm -f ttree_assignments_static.txt
+# ...nor the index files created by lttree.py and ttree_render.py
+#  (See ttree_assignments_index.py)
+rm -f ttree_assignments.txt.idx ttree_assignments_static.txt.idx
 
 
 
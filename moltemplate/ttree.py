@@ -47,6 +47,7 @@ import sys
 from collections import defaultdict
 import operator
 import random
+import bisect
 #import gc
 
 try:
@@ -65,8 +66,8 @@ except NameError:
 try:
     from .ttree_lex import TtreeShlex, SplitQuotedString, EscCharStrToChar, \
         SafelyEncodeString, RemoveOuterQuotes, MaxLenStr, HasWildcard, HasRE, \
-        InputError, ErrorLeader, OSrcLoc, TextBlock, VarRef, VarBinding, \
-        TemplateLexer
+        InputError, ErrorLeader, OSrcLoc, TextBlock, VarRef, VarNPtr, \
+        VarBinding, TemplateLexer
 except (ImportError, SystemError, ValueError):
     # not installed as a package
     from ttree_lex import *
@@ -211,6 +212,59 @@ class WriteFileCommand(Command):
         return WriteFileCommand(self.filename, tmpl_list, self.srcloc)
 
 
+class InstanceWriteFileCommand(WriteFileCommand):
+    """ InstanceWriteFileCommand
+
+    This is the version of a write() command stored in each instance
+    (InstanceObj) of a class.  To save memory, all of the instances share
+    the class's WriteFileCommand ("command").  The only data stored for each
+    instance are the VarBindings of the instance variables ('$' variables)
+    in the template ("bindings", in the order they appear in the template).
+    The VarRefs for this instance are created from them whenever "tmpl_list"
+    is accessed.  (Assigning a new "tmpl_list" gives this instance its own
+    private WriteFileCommand, which is not shared.)
+
+    """
+    __slots__ = ["command", "bindings"]
+
+    def __init__(self,
+                 command,
+                 bindings):
+        Command.__init__(self, command.srcloc)
+        self.filename = command.filename
+        self.command = command
+        self.bindings = bindings
+
+    @property
+    def tmpl_list(self):
+        if self.bindings is None:
+            return self.command.tmpl_list
+        tmpl_list = []
+        i = 0
+        for entry in self.command.tmpl_list:
+            if isinstance(entry, VarRef) and (entry.prefix[0] == '$'):
+                var_binding = self.bindings[i]
+                i += 1
+                entry = VarRef(entry.prefix,
+                               entry.descr_str,
+                               entry.suffix,
+                               entry.srcloc,
+                               var_binding,
+                               var_binding.nptr)
+            tmpl_list.append(entry)
+        return tmpl_list
+
+    @tmpl_list.setter
+    def tmpl_list(self, tmpl_list):
+        self.command = WriteFileCommand(self.filename,
+                                        tmpl_list,
+                                        self.srcloc)
+        self.bindings = None
+
+    def __copy__(self):
+        return WriteFileCommand(self.filename, self.tmpl_list, self.srcloc)
+
+
 class InstantiateCommand(Command):
     """ InstantiateCommand is a simple tuple-like datatype used to
     store pairs of names (strings, stored in self.name),
@@ -1757,6 +1811,72 @@ def DescrToCatLeafNodes(descr_str,
 
 
 
+def CompileCounterVarDescr(descr_str, dbg_loc):
+    """
+    Most of the $variables in the templates of a class are simple, such as
+    "$atom:H1", "$mol", or "$mol:..".  Instead of interpreting the descriptor
+    string every time the class is instantiated (using DescrToCatLeafNodes()),
+    this function translates it once into a "plan":
+       (cat_name, num_up, leaf_name)
+    The leaf node is located by climbing up "num_up" ancestors from the
+    instance which refers to it, followed by (if leaf_name is not None)
+    looking up the child with that name.  The category node is located using
+    FindCatNode().  (See ResolveCounterVarPlan().)
+    For any other kind of descriptor (for example, if it contains a category
+    path, '...', wildcards, or "query()"), this function returns None.
+    In that case, DescrToCatLeafNodes() should be used instead.
+
+    """
+    cat_name, cat_ptkns, leaf_ptkns = DescrToCatLeafPtkns(descr_str, dbg_loc)
+    if ((len(cat_ptkns) > 0) or (len(leaf_ptkns) == 0) or
+        HasWildcard(descr_str) or HasRE(descr_str)):
+        return None
+    num_up = 0
+    i = 0
+    while (i < len(leaf_ptkns)) and (leaf_ptkns[i] in ('.', '..')):
+        if leaf_ptkns[i] == '..':
+            num_up += 1
+        i += 1
+    if i == len(leaf_ptkns):
+        return (cat_name, num_up, None)
+    leaf_name = leaf_ptkns[i]
+    # (Note: If there is more than one token, DescrToCatLeafNodes() inserts
+    #  '...' at the beginning unless the first token begins with '.')
+    if ((i + 1 == len(leaf_ptkns)) and
+        (leaf_name not in ('', '...', 'query()'))):
+        return (cat_name, num_up, leaf_name)
+    return None
+
+
+
+def ResolveCounterVarPlan(plan, context_node):
+    """
+    Lookup the (cat_name, cat_node, leaf_node) corresponding to a plan created
+    by CompileCounterVarDescr(), relative to context_node (an InstanceObj).
+    Missing categories and leaf nodes are created (as they would be by
+    DescrToCatLeafNodes() with create_missing_nodes=True).  Returns None if
+    the path leads outside the tree.  (Let DescrToCatLeafNodes() report that.)
+
+    """
+    cat_name, num_up, leaf_name = plan
+    node = context_node
+    for i in range(0, num_up):
+        node = node.parent
+        if node is None:
+            return None
+    cat_node = FindCatNode(cat_name, context_node, None)
+    if cat_name not in cat_node.categories:
+        cat_node.categories[cat_name] = Category(cat_name)
+    if leaf_name is None:
+        return cat_name, cat_node, node
+    leaf_node = node.children.get(leaf_name)
+    if leaf_node is None:
+        leaf_node = InstanceObjBasic(leaf_name, node)
+        node.children[leaf_name] = leaf_node
+    return cat_name, cat_node, leaf_node
+
+
+
 def DescrToVarBinding(descr_str, context_node, dbg_loc):
     """ DescrToVarBinding() is identical to LookupVar(), but it has a name
     that is harder to remember.  See comment for LookupVar() below.
@@ -2026,7 +2146,8 @@ class StaticObj(object):
                  "instance_categories",
                  "instance_commands_push",
                  "instance_commands",
-                 "instance_commands_pop"]
+                 "instance_commands_pop",
+                 "instance_var_plans"]
 
     def __init__(self,
                  name='',
@@ -2079,6 +2200,10 @@ class StaticObj(object):
         self.instance_commands = []  # 2) then add this to InstanceObj.commands
         self.instance_commands_pop = []  # 3) finally add these commands
 
+        # The $variables in the instance commands, translated into a form
+        # which is faster to lookup.  (See CompileCounterVarDescr())
+        self.instance_var_plans = {}
+
     def DeleteSelf(self):
         for child in self.children.values():
             child.DeleteSelf()
@@ -3431,6 +3556,12 @@ def RandomSelect(entries, weights):
 
 
 
+# g_deletion_epoch is incremented whenever a node in the instance tree is
+# deleted.  InstanceObjBasic.IsDeleted() uses it to decide whether the
+# result it remembered from the last time it was invoked is still valid.
+g_deletion_epoch = 0
+
+
 class InstanceObjBasic(object):
     """ A simplified version of InstanceObj.
         See the documentation/comments for InstanceObj for more details.
@@ -3439,7 +3570,7 @@ class InstanceObjBasic(object):
 
     """
 
-    __slots__ = ["name", "parent"]
+    __slots__ = ["name", "parent", "undeleted_epoch"]
 
     def __init__(self,
                  name='',
@@ -3461,6 +3592,10 @@ class InstanceObjBasic(object):
 
         #self.deleted = False
 
+        # The value of g_deletion_epoch when IsDeleted() last found that
+        # neither this node, nor any of its ancestors, were deleted.
+        self.undeleted_epoch = -1
+
         # vb##self.var_bindings=None  # List of variables assigned to this object
         # vb##                        # or None (None takes up less space than an
         # vb##                        # empty list.)
@@ -3476,6 +3611,8 @@ class InstanceObjBasic(object):
 
     def DeleteSelf(self):
         # self.Dealloc()
+        global g_deletion_epoch
+        g_deletion_epoch += 1
         self.parent = self  # This condition (normally never true)
         # flags the node as "deleted".  (Nodes are never
         # actually deleted, just flagged.)
@@ -3489,14 +3626,29 @@ class InstanceObjBasic(object):
     def IsDeleted(self):
         # Return true if self.deleted == True  or  self.parent == self
         # for this node (or for any ancestor node).
+        #
+        # This function is invoked for every variable, many times, so the
+        # answer is remembered (in node.undeleted_epoch).  It remains valid
+        # until the next time a node is deleted (which increments
+        # g_deletion_epoch).  Once a node is deleted it is never restored,
+        # so only "False" answers need to be remembered.
+        epoch = g_deletion_epoch
+        if self.undeleted_epoch == epoch:
+            return False
+        visited = []
         node = self
-        while node.parent != None:
+        while node.parent is not None:
+            if node.undeleted_epoch == epoch:
+                break  # (all of this node's ancestors were checked already)
             if hasattr(node, 'deleted'):
                 if node.deleted:
                     return True
-            elif node.parent == node:
+            elif node.parent is node:
                 return True
+            visited.append(node)
             node = node.parent
+        for node in visited:
+            node.undeleted_epoch = epoch
         return False
 
     # def Dealloc(self):
@@ -3573,9 +3725,11 @@ class InstanceObj(InstanceObjBasic):
         # during instantiation
 
         # Stackable commands to carry out (first, before children)
-        self.commands_push = []
+        self.commands_push = ()
         # Stackable commands to carry out (last, after children)
-        self.commands_pop = []
+        self.commands_pop = ()
+        # (These are usually empty.  To save memory, they are stored as empty
+        #  tuples until a command is added to them.  See ProcessCommand().)
 
         self.srcloc_begin = None     # Keep track of location in user files
         self.srcloc_end = None     # (useful for error message reporting)
@@ -3839,6 +3993,8 @@ class InstanceObj(InstanceObjBasic):
         return out_str
 
     def DeleteSelf(self):
+        global g_deletion_epoch
+        g_deletion_epoch += 1
         self.deleted = True
 
     #  COMMENT1:       Don't get rid of pointers to yourself.  Knowing which
@@ -3897,7 +4053,7 @@ class InstanceObj(InstanceObjBasic):
         # in "self.instance_commands".
         for command in statobj.instance_commands_push:
             # self.commands.append(command)
-            self.ProcessCommand(command)
+            self.ProcessCommand(command, statobj.instance_var_plans)
 
         # Then deal with class parents
         for class_parent in statobj.class_parents:
@@ -3927,16 +4083,24 @@ class InstanceObj(InstanceObjBasic):
         # Deal with the "instance_commands",
         for command in statobj.instance_commands:
             # self.commands.append(command)
-            self.ProcessCommand(command)
+            self.ProcessCommand(command, statobj.instance_var_plans)
 
         # Finally deal with the "self.instance_commands_pop"
         # These commands should be carried out after all of the commands
         # in "self.instance_commands".
         for command in statobj.instance_commands_pop:
             # self.commands.append(command)
-            self.ProcessCommand(command)
+            self.ProcessCommand(command, statobj.instance_var_plans)
+
+    def ProcessCommand(self, command, var_plans=None):
+        """
+        Carry out a command (belonging to the StaticObj this object is an
+        instance of).  "var_plans" is an optional dictionary (belonging to
+        that StaticObj) which is used to store the result of
+        CompileCounterVarDescr() for each $variable, so that the descriptor
+        strings only need to be interpreted once per class (not per instance).
 
-    def ProcessCommand(self, command):
+        """
 
         if isinstance(command, ModCommand):
 
@@ -3969,8 +4133,10 @@ class InstanceObj(InstanceObjBasic):
                     command = mod_command.command.__copy__()
                     self.ProcessContextNodes(command)
                     if isinstance(command, PushCommand):
+                        instobj.commands_push = list(instobj.commands_push)
                         instobj.commands_push.append(command)
                     elif isinstance(mod_command.command, PopCommand):
+                        instobj.commands_pop = list(instobj.commands_pop)
                         instobj.commands_pop.insert(0, command)
                     else:
                         # I don't know if any other types commands will ever
@@ -3981,7 +4147,10 @@ class InstanceObj(InstanceObjBasic):
             return  # ends "if isinstance(command, ModCommand):"
 
         # Otherwise:
-        command = command.__copy__()
+        if not isinstance(command, WriteFileCommand):
+            command = command.__copy__()
+        # (WriteFileCommands are not copied.  Every instance shares the
+        #  class's template.  See InstanceWriteFileCommand.)
         self.ProcessContextNodes(command)
 
         if isinstance(command, InstantiateCommand):
@@ -4028,25 +4197,39 @@ class InstanceObj(InstanceObjBasic):
         elif isinstance(command, WriteFileCommand):
             #sys.stderr.write('  processing command \"'+str(command)+'\"\n')
 
-            self.commands.append(command)
+            # The VarBindings of the '$' variables in the template:
+            bindings = []
 
             for var_ref in command.tmpl_list:
                 # Process the VarRef entries in the tmpl_list,
                 #   (and check they have the correct prefix: either '$' or '@')
                 # Ignore other entries (for example, ignore TextBlocks).
+                # (Note: "var_ref" belongs to the class's template, which is
+                #  shared by all of its instances.  Do not modify it.)
 
                 if (isinstance(var_ref, VarRef) and (var_ref.prefix[0] == '$')):
 
                     if (var_ref.descr_str[:4] == 'mol:'):
                         pass
 
-                    var_ref.nptr.cat_name, var_ref.nptr.cat_node, var_ref.nptr.leaf_node = \
-                        DescrToCatLeafNodes(var_ref.descr_str,
-                                            self,
-                                            var_ref.srcloc,
-                                            True)
-
-                    categories = var_ref.nptr.cat_node.categories
+                    nodes = None
+                    if var_plans is not None:
+                        plan = var_plans.get(var_ref.descr_str, False)
+                        if plan is False:
+                            plan = CompileCounterVarDescr(var_ref.descr_str,
+                                                          var_ref.srcloc)
+                            var_plans[var_ref.descr_str] = plan
+                        if plan is not None:
+                            nodes = ResolveCounterVarPlan(plan, self)
+                    if nodes is None:
+                        nodes = DescrToCatLeafNodes(var_ref.descr_str,
+                                                    self,
+                                                    var_ref.srcloc,
+                                                    True)
+
+                    nptr = VarNPtr(*nodes)
+
+                    categories = nptr.cat_node.categories
 
                     # "categories" is a dictionary storing "Category" objects
                     # indexed by category names.
@@ -4057,7 +4240,7 @@ class InstanceObj(InstanceObjBasic):
                     # we instantiate, ie. before we build the tree of
                     # InstanceObjs.)
 
-                    category = categories[var_ref.nptr.cat_name]
+                    category = categories[nptr.cat_name]
                     # "category" is a Category object containing a
                     # dictionary of VarBinding objects, and an internal
                     # counter.
@@ -4073,8 +4256,8 @@ class InstanceObj(InstanceObjBasic):
                     # corresponds to this leaf node.
                     # If not found, then create one.
 
-                    if var_ref.nptr.leaf_node in var_bindings:
-                        var_binding = var_bindings[var_ref.nptr.leaf_node]
+                    if nptr.leaf_node in var_bindings:
+                        var_binding = var_bindings[nptr.leaf_node]
                         # "var_binding" stores the information for a variable,
                         # including pointers to all of the places the variable
                         # is rerefenced, the variable's (full) name, and value.
@@ -4091,7 +4274,7 @@ class InstanceObj(InstanceObjBasic):
                         var_binding.refs = [var_ref]
 
                         # keep track of the cat_node, cat_name, leaf_node:
-                        var_binding.nptr = var_ref.nptr
+                        var_binding.nptr = nptr
 
                         # "var_binding.full_name" stores a unique string like
                         #   '@/atom:Water/H' or '$/atom:water[1423]/H2',
@@ -4101,28 +4284,35 @@ class InstanceObj(InstanceObjBasic):
                         # one-to-one fashion) with the nodes they represent.
 
                         var_binding.full_name = var_ref.prefix[0] + \
-                            CanonicalDescrStr(var_ref.nptr.cat_name,
-                                              var_ref.nptr.cat_node,
-                                              var_ref.nptr.leaf_node,
+                            CanonicalDescrStr(nptr.cat_name,
+                                              nptr.cat_node,
+                                              nptr.leaf_node,
                                               var_ref.srcloc)
                         # (These names can always be generated later when needed
                         #  but it doesn't hurt to keep track of it here too.)
 
                         # Now add this binding to the other
                         # bindings in this category:
-                        var_bindings[var_ref.nptr.leaf_node] = var_binding
+                        var_bindings[nptr.leaf_node] = var_binding
 
                         # vb##
                         # var_ref.nptr.leaf_node.AddVarBinding(var_binding)
 
                         var_binding.category = category
 
-                    # It's convenient to add a pointer in the opposite direction
-                    # so that later if we find the var_ref, we can find its
-                    # binding and visa-versa. (Ie. two-way pointers)
-                    var_ref.binding = var_binding
+                    # (The VarRefs for this instance will point to this
+                    #  binding.  See InstanceWriteFileCommand.tmpl_list)
+                    bindings.append(var_binding)
 
-                    assert(var_ref.nptr.leaf_node in var_bindings)
+                    assert(nptr.leaf_node in var_bindings)
+
+            if len(bindings) == 0:
+                # (Templates which contain no instance variables look the same
+                #  in every instance.  Share the class's command directly.)
+                self.commands.append(command)
+            else:
+                self.commands.append(InstanceWriteFileCommand(command,
+                                                              tuple(bindings)))
 
         else:
             # Otherwise, we don't know what this command is yet.
@@ -4345,14 +4535,26 @@ def AssignVarOrderByCommand(command_list, prefix_filter):
     count = 0
     for command in command_list:
         if isinstance(command, WriteFileCommand):
-            tmpl_list = command.tmpl_list
+            instance_bindings = None
+            if (isinstance(command, InstanceWriteFileCommand) and
+                    (command.bindings is not None)):
+                # (Faster: Use the class's template and this instance's
+                #  bindings instead of creating new VarRefs for this instance.)
+                tmpl_list = command.command.tmpl_list
+                instance_bindings = iter(command.bindings)
+            else:
+                tmpl_list = command.tmpl_list
             for var_ref in tmpl_list:
                 if isinstance(var_ref, VarRef):
+                    var_binding = var_ref.binding
+                    if ((instance_bindings is not None) and
+                            (var_ref.prefix[0] == '$')):
+                        var_binding = next(instance_bindings)
                     if var_ref.prefix in prefix_filter:
                         count += 1
-                        if ((var_ref.binding.order is None) or
-                                (var_ref.binding.order > count)):
-                            var_ref.binding.order = count
+                        if ((var_binding.order is None) or
+                                (var_binding.order > count)):
+                            var_binding.order = count
 
 
 # def AssignVarOrderByFile(command_list, prefix_filter):
@@ -4403,10 +4605,85 @@ def AssignVarOrderByFile(context_node, prefix_filter, search_instance_commands=F
         AssignVarOrderByFile(child, prefix_filter, search_instance_commands)
 
 
+def _ReservedInts(reserved_values):
+    """
+    Convert the (category, value) pairs in "reserved_values" into a
+    dictionary which maps each category to a sorted list of the integers
+    which are reserved in that category.  (Values which are not integers,
+    or which are not written the way str() would write them, are omitted,
+    since these can never be equal to the value of an integer counter.)
+
+    """
+    reserved_ints = defaultdict(set)
+    for cat, value in reserved_values:
+        try:
+            n = int(value)
+        except ValueError:
+            continue
+        if str(n) == value:
+            reserved_ints[cat].add(n)
+    return dict((cat, sorted(ints)) for cat, ints in reserved_ints.items())
+
+
+def _NextCounterValues(cat, num_values, reserved_ints, reserved_values):
+    """
+    Increment the category's counter "num_values" times (skipping over
+    values which are reserved) and return a list containing the values
+    (converted to strings).  When the counter is an ordinary SimpleCounter
+    counting upwards by integers, the values are generated in bulk as a
+    series of contiguous ranges which lie between the reserved values.
+
+    """
+    counter = cat.counter
+    if not (isinstance(counter, SimpleCounter) and
+            (type(counter.n) is int) and
+            (type(counter.nincr) is int) and
+            (counter.nincr > 0)):
+        values = []
+        for i in range(0, num_values):
+            while True:
+                counter.incr()
+                value = str(counter.query())
+                if ((reserved_values is None) or
+                        ((cat, value) not in reserved_values)):
+                    break
+            values.append(value)
+        return values
+
+    n = counter.n
+    d = counter.nincr
+    reserved = reserved_ints.get(cat, [])
+    values = []
+    i = bisect.bisect_right(reserved, n)
+    while len(values) < num_values:
+        stop = n + d * (num_values - len(values))
+        j = bisect.bisect_right(reserved, stop, i)
+        for r in reserved[i:j]:
+            if (r - n) % d == 0:
+                values.extend(range(n + d, r, d))
+                n = r  # (skip over the reserved value)
+        values.extend(range(n + d, stop + 1, d))
+        n = stop
+        i = j
+    counter.n = n
+    return list(map(str, values))
+
+
+def _AssignCounterValues(cat, var_bindings, reserved_ints, reserved_values):
+    """ Assign the next values of the category's counter to "var_bindings" """
+    if len(var_bindings) == 0:
+        return
+    values = _NextCounterValues(cat, len(var_bindings),
+                                reserved_ints, reserved_values)
+    for var_binding, value in zip(var_bindings, values):
+        var_binding.value = value
+
+
 def AutoAssignVals(cat_node,
                    sort_variables,
                    reserved_values=None,
-                   ignore_prior_values=False):
+                   ignore_prior_values=False,
+                   reserved_ints=None):
     """
     This function automatically assigns values to all the variables
     belonging to all the categories in cat_node.categories.
@@ -4426,6 +4703,11 @@ def AutoAssignVals(cat_node,
         # (sometimes leaf nodes lack a 'categories' member, to save memory)
         return
 
+    if reserved_ints is None:
+        reserved_ints = {}
+        if reserved_values is not None:
+            reserved_ints = _ReservedInts(reserved_values)
+
     # Search the tree in a depth-first-search manner.
     # For each node, examine the "categories" associated with that node
     # (ie the list of variables whose counters lie within that node's scope).
@@ -4453,6 +4735,10 @@ def AutoAssignVals(cat_node,
             # we found it earlier when searching the tree.)
             var_bind_iter = iter(cat.bindings.items())
 
+        # The variables which need a value from this category's counter
+        # are collected (in order) and assigned all at once.
+        pending = []
+
         for leaf_node, var_binding in var_bind_iter:
 
             if ((var_binding.value is None) or ignore_prior_values):
@@ -4462,10 +4748,13 @@ def AutoAssignVals(cat_node,
                     # '__query__...' variables are not really variables.
                     # They are a mechanism to allow the user to query the
                     # category counter without incrementing it.
+                    # (So the counter must be up to date at this point.)
+                    _AssignCounterValues(cat, pending,
+                                         reserved_ints, reserved_values)
+                    pending = []
                     var_binding.value = str(cat.counter.query())
 
-                elif (HasWildcard(var_binding.full_name) or
-                      HasRE(var_binding.full_name)):
+                elif var_binding.is_pattern:
                     #   -- The wildcard hack ---
                     # Variables containing * or ? characters in their names
                     # are not allowed.  This is also true of regular
@@ -4474,31 +4763,25 @@ def AutoAssignVals(cat_node,
                     # path-expanded) string containing the * or ? or regex.
                     var_binding.value = var_binding.full_name
 
-                else:
+                elif ((not var_binding.nptr.leaf_node.IsDeleted()) and
+                      (len(var_binding.refs) > 0)):
 
-                    if ((not var_binding.nptr.leaf_node.IsDeleted()) and
-                        (len(var_binding.refs) > 0)):
+                    # For each (regular) variable, query this category's
+                    # counter (convert it to a string), and see if it is
+                    # already in use (in this category). If not, then set this
+                    # variable's value to the counter's value. Either way,
+                    # increment the counter.  (See _NextCounterValues())
+                    pending.append(var_binding)
 
-                        # For each (regular) variable, query this category's counter
-                        # (convert it to a string), and see if it is already in use
-                        # (in this category). If not, then set this variable's value
-                        # to the counter's value. Either way, increment the
-                        # counter.
-                        while True:
-                            cat.counter.incr()
-                            value = str(cat.counter.query())
-                            if ((reserved_values is None) or
-                                    ((cat, value) not in reserved_values)):
-                                break
-
-                        var_binding.value = value
+        _AssignCounterValues(cat, pending, reserved_ints, reserved_values)
 
     # Recursively invoke AssignVarValues() on all child nodes
     for child in cat_node.children.values():
         AutoAssignVals(child,
                        sort_variables,
                        reserved_values,
-                       ignore_prior_values)
+                       ignore_prior_values,
+                       reserved_ints)
 
 
 # Did the user ask us to reformat the output string?
@@ -4819,18 +5102,23 @@ def EraseTemplateFiles(command_list):
 #            out_file.close()
 
 
-def WriteVarBindingsFile(node):
+def WriteVarBindingsFile(node, out=None):
     """ Write out a single file which contains a list of all
     of the variables defined (regardless of which class they
     were defined in).  Next to each variable name is the corresponding
     information stored in that variable (a number) that variable.
+    (If "out" is specified, the text is written to that stream instead of
+     being appended to the "ttree_assignments.txt" file.)
 
     """
     if (not hasattr(node, 'categories')):
         # (sometimes leaf nodes lack a 'categories' member, to save memory)
         return
 
-    out = open('ttree_assignments.txt', 'a')
+    close_out = False
+    if out is None:
+        out = open('ttree_assignments.txt', 'a')
+        close_out = True
     for cat_name in node.categories:
         var_bindings = node.categories[cat_name].bindings
         for nd, var_binding in var_bindings.items():
@@ -4873,9 +5161,10 @@ def WriteVarBindingsFile(node):
                               #var_binding.value
                               SafelyEncodeString(var_binding.value)
                               + usage_example + '\n')
-    out.close()
     for child in node.children.values():
-        WriteVarBindingsFile(child)
+        WriteVarBindingsFile(child, out)
+    if close_out:
+        out.close()
 
 
 def CustomizeBindings(bindings,
@@ -5100,6 +5389,42 @@ class BasicUISettings(object):
         else:
             self.lex = lex
 
+    def CheckParsedTree(self, static_tree_root):
+        """
+        CheckParsedTree() is invoked by BasicUI() after the files have been
+        parsed, but before the classes and variables have been looked up.
+        Programs based on ttree can override this function to check the
+        write() and write_once() commands for mistakes (without having to
+        parse the files again).  By default, nothing is checked.
+
+        """
+        pass
+
+    def CheckStaticTree(self, static_tree_root, replace_var_pairs):
+        """
+        CheckStaticTree() is invoked by BasicUI() after the variables in the
+        static tree (the tree of class definitions) have been looked up,
+        but before the instance tree is built.  By default, nothing is checked.
+
+        """
+        pass
+
+    def PruneVars(self,
+                  static_tree_root,
+                  instance_tree_root,
+                  static_commands,
+                  instance_commands):
+        """
+        PruneVars() is invoked by BasicUI() after the trees have been built,
+        but before values are assigned to the variables.  Programs based on
+        ttree can override this function to delete variables (leaf nodes)
+        which are not needed.  (Deleted variables are not assigned values,
+        and lines in the templates which refer to them are omitted.)
+        By default, nothing is deleted.
+
+        """
+        pass
+
 
 def BasicUIParseArgs(argv, settings, main=False):
     """
@@ -5271,6 +5596,9 @@ def BasicUI(settings,
     static_tree_root.Parse(settings.lex)
     # gc.collect()
 
+    # Step 1b: Optionally, check the templates for simple mistakes.
+    settings.CheckParsedTree(static_tree_root)
+
     #sys.stderr.write('static = ' + str(static_tree_root) + '\n')
 
     # Step 2: Now that the static tree has been constructed, lookup
@@ -5307,6 +5635,9 @@ def BasicUI(settings,
     ReplaceVars(static_tree_root, replace_var_pairs,
                 search_instance_commands=True)
 
+    # Step 3d) Optionally, check the class definitions for mistakes.
+    settings.CheckStaticTree(static_tree_root, replace_var_pairs)
+
     sys.stderr.write(' done\nconstructing the tree of class definitions...')
     sys.stderr.write(' done\n\nclass_def_tree = ' +
                      str(static_tree_root) + '\n\n')
@@ -5348,6 +5679,13 @@ def BasicUI(settings,
     AssignVarOrderByFile(static_tree_root, '@', search_instance_commands=True)
     AssignVarOrderByCommand(instance_commands, '$')
 
+    # Step 7b: Optionally, discard variables which are not needed
+    #          (so that they will not be assigned values).
+    settings.PruneVars(static_tree_root,
+                       instance_tree_root,
+                       static_commands,
+                       instance_commands)
+
     # Step 8: Assign the variables.
     #         (If the user requested any customized variable bindings,
     #          load those now.)
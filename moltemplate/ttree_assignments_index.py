@@ -0,0 +1,430 @@
+# Author: Andrew Jewett (jewett.aij at g mail)
+# License: MIT License  (See LICENSE.md)
+# Copyright (c) 2013
+# All rights reserved.
+
+"""
+A binary index for the "ttree_assignments.txt" file, so that programs
+which only need the values of a few variables (such as ttree_render.py)
+do not have to read and parse the entire (potentially huge) file.
+
+The index is stored in a separate file (by default, the name of the
+assignments file followed by ".idx").  It does not contain any variable
+names or values.  Instead it contains a hash table storing the locations
+(byte offsets) of the lines in the original file (as well as a hash of the
+name of the variable on each line).  The index file is accessed using mmap,
+so only the portions of the files which are actually needed are read.
+
+The index also stores the size, modification time, and inode of the
+assignments file, as well as checksums of the beginning and end of the file.
+If any of these have changed, the index is ignored (see OpenAssignmentsIndex()).
+Index files are only created when requested (see WriteAssignmentsIndex()).
+lttree.py creates one after writing "ttree_assignments.txt" (if invoked with
+"-index-assignments"), nbody_fix_ttree_assignments.py updates it after
+modifying that file, and ttree_render.py creates one if invoked with "-index"
+(and if no up-to-date index exists).  It is up to the caller to delete them.
+
+"""
+
+import os
+import sys
+import re
+import mmap
+import struct
+import zlib
+from array import array
+
+try:
+    from .ttree_lex import SplitQuotedString
+except (ImportError, SystemError, ValueError):
+    # not installed as a package
+    from ttree_lex import SplitQuotedString
+
+
+g_index_magic = b'TTASIDX3'
+# header: magic, file size, mtime (ns), inode, crc32 (head), crc32 (tail),
+#         number of keys, number of slots
+g_index_header = struct.Struct('<8sQQQQQQQ')
+
+# The number of bytes at the beginning and end of the file to check
+g_checksum_size = 4096
+
+# Lines containing these characters (before the comment) are split using
+# SplitQuotedString().  (Other lines can be split using bytes.split().)
+g_special_chars = re.compile(b'[\'"\\\\\x0b]')
+
+
+def _ParseLine(line_bytes):
+    """
+    Split a line from the assignments file into a (name, value) pair
+    the same way ttree_render.ReadBindings() does.  Returns None if the line
+    does not contain a variable assignment.
+
+    """
+    tokens = SplitQuotedString(line_bytes.decode('utf-8').strip())
+    if len(tokens) < 2:
+        return None
+    return tokens[0], tokens[1]
+
+
+def _ParseName(line_bytes):
+    """
+    Return the name of the variable assigned on this line (encoded as bytes),
+    or None if the line does not contain a variable assignment.  (This is
+    equivalent to _ParseLine(), but it is much faster for typical lines,
+    which end in a comment, and contain no quotes or escape sequences.)
+
+    """
+    i_comment = line_bytes.find(b'#')
+    if i_comment == -1:
+        text = line_bytes
+    else:
+        text = line_bytes[:i_comment]
+    if g_special_chars.search(text) is None:
+        tokens = text.split()
+        if len(tokens) >= 2:
+            return tokens[0]
+        if i_comment == -1:
+            return None
+    pair = _ParseLine(line_bytes)
+    if pair is None:
+        return None
+    return pair[0].encode('utf-8')
+
+
+def _HashKey(name_bytes):
+    return zlib.crc32(name_bytes) & 0xffffffff
+
+
+def _ScanNames(f, i_begin, i_end):
+    """
+    Generate (offset, name, hash) tuples for the variables assigned on the
+    lines of the file "f" between byte offsets i_begin and i_end.
+
+    """
+    f.seek(i_begin)
+    offset = i_begin
+    for line in f:
+        if offset >= i_end:
+            break
+        name = _ParseName(line)
+        if name is not None:
+            yield offset, name, _HashKey(name)
+        offset += len(line)
+
+
+def _FileSignature(f):
+    """
+    Return the size, modification time, inode, and checksums of the
+    beginning and end of the file "f" (an open file in binary mode).
+
+    """
+    st = os.fstat(f.fileno())
+    size = st.st_size
+    f.seek(0)
+    crc_head = zlib.crc32(f.read(min(size, g_checksum_size))) & 0xffffffff
+    f.seek(max(size - g_checksum_size, 0))
+    crc_tail = zlib.crc32(f.read(g_checksum_size)) & 0xffffffff
+    return (size, st.st_mtime_ns, st.st_ino, crc_head, crc_tail)
+
+
+def _NumSlots(num_keys):
+    num_slots = 8
+    while num_slots < 2 * num_keys:
+        num_slots *= 2
+    return num_slots
+
+
+def _Place(slots, hashes, offset, h):
+    """ Add an entry to the hash table (for a variable not yet present). """
+    mask = len(slots) - 1
+    i = h & mask
+    while slots[i] != 0:
+        i = (i + 1) & mask
+    slots[i] = offset + 1   # (0 means "empty")
+    hashes[i] = h
+
+
+def _Remove(slots, hashes, offset, h):
+    """
+    Remove an entry from the hash table.  (The entries which follow it are
+    moved back if necessary, so that they can still be found.)
+
+    """
+    mask = len(slots) - 1
+    i = h & mask
+    while slots[i] != offset + 1:
+        i = (i + 1) & mask
+    j = i
+    while True:
+        j = (j + 1) & mask
+        if slots[j] == 0:
+            break
+        k = hashes[j] & mask   # (the slot where this entry "belongs")
+        if ((i < j) and (i < k <= j)) or ((j < i) and ((i < k) or (k <= j))):
+            continue  # (this entry can stay where it is)
+        slots[i] = slots[j]
+        hashes[i] = hashes[j]
+        i = j
+    slots[i] = 0
+
+
+def _WriteIndexFile(index_filename, signature, num_keys, slots, hashes):
+    tmp_filename = index_filename + '.tmp'
+    with open(tmp_filename, 'wb') as f:
+        f.write(g_index_header.pack(g_index_magic, *signature,
+                                    num_keys, len(slots)))
+        if sys.byteorder != 'little':
+            slots.byteswap()
+            hashes.byteswap()
+        slots.tofile(f)
+        hashes.tofile(f)
+    os.replace(tmp_filename, index_filename)
+
+
+def WriteAssignmentsIndex(bindings_filename, index_filename=None):
+    """
+    Create an index for the assignments file "bindings_filename".
+    (If "index_filename" is not specified, bindings_filename+'.idx' is used.)
+
+    """
+    if index_filename is None:
+        index_filename = bindings_filename + '.idx'
+
+    # Find the location of every variable assignment in the file.
+    # If the same variable is assigned more than once, the last one wins.
+    # (The signature is computed first.  If the file is modified while it is
+    #  being read, then the index will not be used.)
+    offset_of_name = {}
+    hash_of_name = {}
+    with open(bindings_filename, 'rb') as f:
+        signature = _FileSignature(f)
+        for offset, name, h in _ScanNames(f, 0, signature[0]):
+            offset_of_name[name] = offset
+            hash_of_name[name] = h
+
+    num_slots = _NumSlots(len(offset_of_name))
+    slots = array('Q', [0]) * num_slots
+    hashes = array('Q', [0]) * num_slots
+    for name, offset in offset_of_name.items():
+        _Place(slots, hashes, offset, hash_of_name[name])
+
+    _WriteIndexFile(index_filename, signature, len(offset_of_name),
+                    slots, hashes)
+
+
+class AssignmentsIndex(object):
+    """
+    A read-only dictionary-like object containing the variable bindings in
+    an assignments file (typically "ttree_assignments.txt"), which looks up
+    the value of each variable from the file (using its index) on demand.
+
+    """
+
+    def __init__(self, bindings_filename, index_filename=None):
+        if index_filename is None:
+            index_filename = bindings_filename + '.idx'
+        self.bindings_filename = bindings_filename
+        self.index_filename = index_filename
+        self.text = None   # (The assignments file is mapped when needed.)
+        self.f_bindings = open(bindings_filename, 'rb')
+        self.f_index = open(index_filename, 'rb')
+        try:
+            header = self.f_index.read(g_index_header.size)
+            if len(header) != g_index_header.size:
+                raise ValueError('truncated index file')
+            header = g_index_header.unpack(header)
+            if header[0] != g_index_magic:
+                raise ValueError('not an assignments index file')
+            self.signature = header[1:6]
+            self.size = self.signature[0]
+            self.num_keys, self.num_slots = header[6:8]
+            self.index = mmap.mmap(self.f_index.fileno(), 0,
+                                   access=mmap.ACCESS_READ)
+            if len(self.index) != (g_index_header.size +
+                                   16 * self.num_slots):
+                raise ValueError('truncated index file')
+        except Exception:
+            self.Close()
+            raise
+        self.table = memoryview(self.index)[g_index_header.size:]
+        if sys.byteorder == 'little':
+            self.table = self.table.cast('Q')
+        else:
+            table = array('Q', self.table.tobytes())
+            table.byteswap()
+            self.table.release()
+            self.table = table
+        self.slots = self.table[:self.num_slots]
+        self.hashes = self.table[self.num_slots:]
+        self.cache = {}
+
+    def Close(self):
+        # (memoryviews of the index must be released before closing it)
+        for name in ('slots', 'hashes', 'table'):
+            view = getattr(self, name, None)
+            if isinstance(view, memoryview):
+                view.release()
+            setattr(self, name, None)
+        for name in ('text', 'index'):
+            m = getattr(self, name, None)
+            if isinstance(m, mmap.mmap):
+                m.close()
+        self.f_bindings.close()
+        self.f_index.close()
+
+    def IsCurrent(self):
+        """
+        Return True if the assignments file has not changed since the index
+        was created.  (Its size, modification time, and inode are compared,
+        as well as the checksums of the beginning and end of the file.)
+
+        """
+        return _FileSignature(self.f_bindings) == self.signature
+
+    def _LineAt(self, offset):
+        if self.text is None:
+            if self.size > 0:
+                self.text = mmap.mmap(self.f_bindings.fileno(), 0,
+                                      access=mmap.ACCESS_READ)
+            else:
+                self.text = b''
+        i_end = self.text.find(b'\n', offset)
+        if i_end == -1:
+            i_end = len(self.text)
+        return _ParseLine(self.text[offset:i_end])
+
+    def Lookup(self, name):
+        """
+        Return the value assigned to variable "name" (or None if not found).
+
+        """
+        if name in self.cache:
+            return self.cache[name]
+        value = None
+        mask = self.num_slots - 1
+        h = _HashKey(name.encode('utf-8'))
+        i = h & mask
+        while self.slots[i] != 0:
+            if self.hashes[i] == h:
+                pair = self._LineAt(self.slots[i] - 1)
+                if pair[0] == name:
+                    value = pair[1]
+                    break
+            i = (i + 1) & mask
+        self.cache[name] = value
+        return value
+
+    def Update(self, i_begin, i_end, i_new_end):
+        """
+        Update the index file after the assignments file was modified by
+        replacing the text between byte offsets i_begin and i_end with new
+        text (which ends at i_new_end).  The text before i_begin must not have
+        changed, and the text after i_end must only have been moved.
+        (This index must have been up to date before the file was modified.)
+        Only the new lines are read.  The index is closed afterwards.
+
+        """
+        delta = i_new_end - i_end
+        old_slots = array('Q', self.slots.tobytes())
+        old_hashes = array('Q', self.hashes.tobytes())
+        num_keys = self.num_keys
+        moved = (i_end != self.size)
+        self.Close()
+
+        with open(self.bindings_filename, 'rb') as f:
+            signature = _FileSignature(f)
+            new_entries = list(_ScanNames(f, i_begin, i_new_end))
+
+            num_slots = _NumSlots(num_keys + len(new_entries))
+            if (not moved) and (num_slots == len(old_slots)):
+                # (None of the remaining entries have moved.  Usually the new
+                #  text was appended, or it replaced the end of the file.)
+                slots = old_slots
+                hashes = old_hashes
+                if i_begin < i_end:
+                    removed = [(slots[i] - 1, hashes[i])
+                               for i in range(0, num_slots)
+                               if slots[i] > i_begin]
+                    for offset, h in removed:
+                        _Remove(slots, hashes, offset, h)
+                    num_keys -= len(removed)
+            else:
+                slots = array('Q', [0]) * num_slots
+                hashes = array('Q', [0]) * num_slots
+                num_keys = 0
+                for i in range(0, len(old_slots)):
+                    if old_slots[i] == 0:
+                        continue
+                    offset = old_slots[i] - 1
+                    if offset >= i_end:
+                        offset += delta
+                    elif offset >= i_begin:
+                        continue  # (this line was removed)
+                    _Place(slots, hashes, offset, old_hashes[i])
+                    num_keys += 1
+
+            # Now add the new lines.  If a variable is assigned more than
+            # once, the last one wins (as in WriteAssignmentsIndex()).
+            mask = num_slots - 1
+            for offset, name, h in new_entries:
+                i = h & mask
+                while slots[i] != 0:
+                    if hashes[i] == h:
+                        f.seek(slots[i] - 1)
+                        if _ParseName(f.readline()) == name:
+                            break
+                    i = (i + 1) & mask
+                if slots[i] == 0:
+                    hashes[i] = h
+                    num_keys += 1
+                elif slots[i] - 1 > offset:
+                    continue
+                slots[i] = offset + 1
+
+        _WriteIndexFile(self.index_filename, signature, num_keys,
+                        slots, hashes)
+
+    def __len__(self):
+        return self.num_keys
+
+    def __contains__(self, name):
+        return self.Lookup(name) is not None
+
+    def __getitem__(self, name):
+        value = self.Lookup(name)
+        if value is None:
+            raise KeyError(name)
+        return value
+
+    def get(self, name, default=None):
+        value = self.Lookup(name)
+        if value is None:
+            return default
+        return value
+
+
+def OpenAssignmentsIndex(bindings_filename, create=False):
+    """
+    Return an AssignmentsIndex for the file "bindings_filename", if an
+    index file exists for it (and it is up to date).  Otherwise, if create=True
+    then (try to) create a new index file.  (The caller is responsible for
+    deleting it later.)  Returns None if this fails.
+
+    """
+    index_filename = bindings_filename + '.idx'
+    if os.path.exists(index_filename):
+        try:
+            assignments = AssignmentsIndex(bindings_filename, index_filename)
+            if assignments.IsCurrent():
+                return assignments
+            assignments.Close()
+        except (IOError, OSError, ValueError):
+            pass
+    if not create:
+        return None
+    try:
+        WriteAssignmentsIndex(bindings_filename, index_filename)
+        return AssignmentsIndex(bindings_filename, index_filename)
+    except (IOError, OSError, ValueError):
+        return None
@@ -41,6 +41,12 @@ except ImportError:
     except ImportError:
         from io import StringIO
 
+try:
+    from .ttree_template_cache import OpenTemplateCache
+except (ImportError, SystemError, ValueError):
+    # not installed as a package
+    from ttree_template_cache import OpenTemplateCache
+
 __all__ = ["TtreeShlex",
            "split",
            "LineLex",
@@ -509,12 +515,83 @@ class SrcLoc(object):
         self.lineno = lineno
 
 
+# Precompiled regular expressions used by SplitQuotedString()'s fast path,
+# indexed by the SplitQuotedString() arguments which define them.
+_g_split_quoted_string_regex = {}
+
+# The characters which str.split() (with no arguments) treats as whitespace
+_g_str_split_whitespace = ('\t\n\x0b\x0c\r\x1c\x1d\x1e\x1f \x85\xa0\u1680'
+                           '\u2000\u2001\u2002\u2003\u2004\u2005\u2006'
+                           '\u2007\u2008\u2009\u200a\u2028\u2029\u202f'
+                           '\u205f\u3000')
+
+
+def _SplitQuotedStringRegex(quotes, delimiters, escape, comment_char, endquote):
+    """
+    Return a regular expression which matches any character which requires
+    SplitQuotedString() to use its (slow) character-by-character parser,
+    as well as a regular expression that matches the tokens in strings which
+    contain none of those characters.  (If the delimiters are all whitespace,
+    the second regular expression is None, meaning that str.split() can be
+    used instead, as long as the string contains no other whitespace.)
+
+    """
+    key = (quotes, delimiters, escape, comment_char, endquote)
+    regex_pair = _g_split_quoted_string_regex.get(key)
+    if regex_pair is None:
+        special_chars = quotes + escape + comment_char
+        if endquote != None:
+            special_chars += endquote
+        if ((delimiters != '') and
+            all([c in _g_str_split_whitespace for c in delimiters])):
+            special_chars += ''.join([c for c in _g_str_split_whitespace
+                                      if c not in delimiters])
+            token_regex = None
+        elif delimiters == '':
+            token_regex = re.compile('.+', re.DOTALL)
+        else:
+            token_regex = re.compile('[^' + ''.join([re.escape(c) for c in
+                                                     delimiters]) + ']+')
+        if special_chars == '':
+            special_regex = re.compile('(?!)')  # (never matches)
+        else:
+            special_regex = re.compile('[' + ''.join([re.escape(c) for c in
+                                                      special_chars]) + ']')
+        regex_pair = (special_regex, token_regex)
+        _g_split_quoted_string_regex[key] = regex_pair
+    return regex_pair
+
+
 def SplitQuotedString(string,
                       quotes='\'\"',
                       delimiters=' \t\r\f\n',
                       escape='\\',
                       comment_char='#',
                       endquote=None):
+    # Fast path:  Most strings (for example, most lines in a "Data Atoms"
+    # file) contain no quotes, escape sequences, or comments.  Splitting
+    # these strings only requires searching for delimiters, which can be
+    # done by str.split() (or by the regular expression library).
+    special_regex, token_regex = _SplitQuotedStringRegex(quotes,
+                                                         delimiters,
+                                                         escape,
+                                                         comment_char,
+                                                         endquote)
+    if special_regex.search(string) is None:
+        if token_regex is None:
+            return string.split()
+        return token_regex.findall(string)
+    return _SplitQuotedStringSlow(string, quotes, delimiters, escape,
+                                  comment_char, endquote)
+
+
+def _SplitQuotedStringSlow(string,
+                           quotes='\'\"',
+                           delimiters=' \t\r\f\n',
+                           escape='\\',
+                           comment_char='#',
+                           endquote=None):
+    # Read the string one character at a time:
     tokens = []
     token = ''
     reading_token = True
@@ -1231,9 +1308,13 @@ class VarBinding(object):
     "self.refs" stores a list of VarRefs which mention the same variable
     from the various places inside various templates in the tree.
 
+    "self.is_pattern" is True if "full_name" contains wildcard characters
+    or a regular expression.  (It is updated whenever "full_name" changes.)
+
     """
 
-    __slots__ = ["full_name", "nptr", "value", "refs", "order", "category"]
+    __slots__ = ["_full_name", "is_pattern", "nptr", "value", "refs", "order",
+                 "category"]
 
     def __init__(self,
                  full_name='',
@@ -1249,6 +1330,15 @@ class VarBinding(object):
         self.order = order
         self.category = category
 
+    @property
+    def full_name(self):
+        return self._full_name
+
+    @full_name.setter
+    def full_name(self, full_name):
+        self._full_name = full_name
+        self.is_pattern = HasWildcard(full_name) or HasRE(full_name)
+
     def __lt__(self, x):
         return self.order < x.order
 
@@ -1740,9 +1830,34 @@ class TemplateLexer(TtreeShlex):
         self.source_triggers = set(['include', 'import'])
         self.source_triggers_x = set(['import'])
 
+        # Templates read from large files can be cached on disk.
+        # (See ttree_template_cache.py)
+        self.template_caches = {}  # (indexed by input stream)
+
     def GetSrcLoc(self):
         return OSrcLoc(self.infile, self.lineno)
 
+    def sourcehook(self, newfile):
+        (newfile, f) = TtreeShlex.sourcehook(self, newfile)
+        template_cache = OpenTemplateCache(f)
+        if template_cache is None:
+            return (newfile, f)
+        # If the file is cached, then read the entire file into memory.
+        # (This allows us to jump to any location in the file, which we
+        #  need to do when ReadTemplate() finds the template it is reading
+        #  in the cache.)
+        f.close()
+        newstream = StringIO(template_cache.text)
+        template_cache.text = None
+        self.template_caches[newstream] = template_cache
+        return (newfile, newstream)
+
+    def pop_source(self):
+        template_cache = self.template_caches.pop(self.instream, None)
+        if template_cache is not None:
+            template_cache.Save()
+        TtreeShlex.pop_source(self)
+
     def ReadTemplate(self,
                      simplify_output=False,
                      terminators='}',
@@ -1832,6 +1947,83 @@ class TemplateLexer(TtreeShlex):
         
         """
 
+        template_cache = self.template_caches.get(self.instream)
+        if (template_cache is None) or (len(self.pushback) > 0):
+            return list(self.ReadTemplateIter(simplify_output,
+                                              terminators,
+                                              remove_esc_preceeding,
+                                              var_terminators,
+                                              keep_terminal_char))
+
+        # Did we already read the template beginning at this location?
+        key = (self.infile, self.instream.tell(), self.lineno,
+               simplify_output, terminators, remove_esc_preceeding,
+               var_terminators, keep_terminal_char,
+               self.var_delim, self.var_open_paren, self.var_close_paren,
+               self.newline, self.comment_skip_var, self.escape,
+               self.whitespace)
+        cached = template_cache.Lookup(key)
+        if cached is not None:
+            tmpl_encoded, end_pos, end_lineno = cached
+            self.instream.seek(end_pos)
+            self.lineno = end_lineno
+            return TemplateLexer._DecodeTemplate(tmpl_encoded)
+
+        tmpl_list = list(self.ReadTemplateIter(simplify_output,
+                                               terminators,
+                                               remove_esc_preceeding,
+                                               var_terminators,
+                                               keep_terminal_char))
+        template_cache.Store(key, (TemplateLexer._EncodeTemplate(tmpl_list),
+                                   self.instream.tell(),
+                                   self.lineno))
+        return tmpl_list
+
+    @staticmethod
+    def _EncodeTemplate(tmpl_list):
+        """ Convert the list returned by ReadTemplate() into a list of strings
+        and tuples (which can be stored efficiently in the template cache). """
+        tmpl_encoded = []
+        for entry in tmpl_list:
+            if isinstance(entry, TextBlock):
+                entry = (entry.text, entry.srcloc.infile, entry.srcloc.lineno)
+            elif isinstance(entry, VarRef):
+                entry = (entry.prefix, entry.descr_str, entry.suffix,
+                         entry.srcloc.infile, entry.srcloc.lineno)
+            tmpl_encoded.append(entry)
+        return tmpl_encoded
+
+    @staticmethod
+    def _DecodeTemplate(tmpl_encoded):
+        """ The inverse of _EncodeTemplate().  (Note: The new OSrcLoc objects
+        are created in the same order that ReadTemplate() would create them.
+        This matters because the order effects how variables are numbered.) """
+        tmpl_list = []
+        for entry in tmpl_encoded:
+            if isinstance(entry, tuple):
+                if len(entry) == 3:
+                    entry = TextBlock(entry[0], OSrcLoc(entry[1], entry[2]))
+                else:
+                    entry = VarRef(entry[0], entry[1], entry[2],
+                                   OSrcLoc(entry[3], entry[4]))
+            tmpl_list.append(entry)
+        return tmpl_list
+
+    def ReadTemplateIter(self,
+                         simplify_output=False,
+                         terminators='}',
+                         remove_esc_preceeding='{\\',
+                         var_terminators='{}(),',
+                         keep_terminal_char=True):
+        """
+           ReadTemplateIter() is a generator version of ReadTemplate().
+        Instead of returning a list of text blocks and variables, it yields
+        them one at a time, as soon as they have been read.  This way,
+        the entire template does not need to be stored in memory at once.
+        (See ReadTemplate() for a description of the arguments.)
+
+        """
+
         #sys.stderr.write('    ReadTemplate('+terminators+') invoked at '+self.error_leader())
 
         # The main loop of the parser reads only one variable at time.
@@ -1847,9 +2039,8 @@ class TemplateLexer(TtreeShlex):
         # bracketed variable's name for example: "${var}"
         var_terminators += self.whitespace + self.newline + self.var_delim
 
-        tmpl_list = []  # List of alternating tuples of text_blocks and
-        # variable names (see format comment above)
-        # This list will be returned to the caller.
+        # (Alternating text_blocks and variable names (see format comment in
+        #  ReadTemplate()) are yielded to the caller as soon as they are read.)
 
         # sys.stderr.write('report_progress='+str(report_progress))
 
@@ -2050,10 +2241,10 @@ class TemplateLexer(TtreeShlex):
                 #                    (self.infile, self.lineno))] )
 
                 if simplify_output:
-                    tmpl_list.append(''.join(text_block_plist))
+                    yield ''.join(text_block_plist)
                 else:
-                    tmpl_list.append(TextBlock(''.join(text_block_plist),
-                                               OSrcLoc(prev_filename, prev_lineno)))
+                    yield TextBlock(''.join(text_block_plist),
+                                    OSrcLoc(prev_filename, prev_lineno))
                     #, OSrcLoc(self.infile, self.lineno)))
                 if not done_reading:
                     # The character that ended the text block
@@ -2106,10 +2297,10 @@ class TemplateLexer(TtreeShlex):
                 # tmpl_list.append( [[var_prefix, var_descr_str, var_suffix],
                 #                   (self.infile, self.lineno)] )
                 if simplify_output:
-                    tmpl_list.append(var_prefix + var_descr_str + var_suffix)
+                    yield var_prefix + var_descr_str + var_suffix
                 else:
-                    tmpl_list.append(VarRef(var_prefix, var_descr_str, var_suffix,
-                                            OSrcLoc(self.infile, self.lineno)))
+                    yield VarRef(var_prefix, var_descr_str, var_suffix,
+                                 OSrcLoc(self.infile, self.lineno))
 
                 # if report_progress:
                 #sys.stderr.write('  parsed variable '+var_prefix+var_descr_str+var_suffix+'\n')
@@ -2168,10 +2359,10 @@ class TemplateLexer(TtreeShlex):
                 #                   ((self.infile, self.lineno),
                 #                    (self.infile, self.lineno))] )
                 if simplify_output:
-                    tmpl_list.append(nextchar)
+                    yield nextchar
                 else:
-                    tmpl_list.append(TextBlock(nextchar,
-                                               OSrcLoc(self.infile, self.lineno)))
+                    yield TextBlock(nextchar,
+                                    OSrcLoc(self.infile, self.lineno))
                     #, OSrcLoc(self.infile, self.lineno)))
 
             if escaped_state:
@@ -2180,9 +2371,6 @@ class TemplateLexer(TtreeShlex):
                 if nextchar in self.escape:
                     escaped_state = True
 
-        #sys.stderr.write("*** TMPL_LIST0  = ***", tmpl_list)
-        return tmpl_list  # <- return value stored here
-
     def GetParenExpr(self, prepend_str='', left_paren='(', right_paren=')'):
         """ GetParenExpr() is useful for reading in strings
             with nested parenthesis and spaces.
@@ -126,6 +126,25 @@ def CopyMat(dest, source):
             dest[i][j] = source[i][j]
 
 
+def AffineInverse(dest, M):
+    """
+    Store the inverse of the affine transformation M (a 3x4 matrix) in "dest".
+    (When the inverse is composed with M, the result is the identity.)
+
+    """
+    (a, b, c), (d, e, f), (g, h, i) = [M[k][0:3] for k in range(0, 3)]
+    det = a * (e * i - f * h) - b * (d * i - f * g) + c * (d * h - e * g)
+    if det == 0.0:
+        raise InputError('Error: This coordinate transformation can not be inverted.\n'
+                         '       (Perhaps it contains a scale factor of 0?)\n')
+    L = [[(e * i - f * h) / det, (c * h - b * i) / det, (b * f - c * e) / det],
+         [(f * g - d * i) / det, (a * i - c * g) / det, (c * d - a * f) / det],
+         [(d * h - e * g) / det, (b * g - a * h) / det, (a * e - b * d) / det]]
+    for k in range(0, 3):
+        dest[k][0:3] = L[k]
+        dest[k][3] = -(L[k][0] * M[0][3] + L[k][1] * M[1][3] + L[k][2] * M[2][3])
+
+
 class AffineStack(object):
     """
     This class defines a matrix stack used to define compositions of affine
@@ -247,6 +266,50 @@ class AffineStack(object):
     def __len__(self):
         return 1 + len(self.stack)
 
+    @staticmethod
+    def CMCommandToCommand(transform_str,
+                           src_loc=OSrcLoc(),  # for debugging
+                           xcm=None):  # position of center of object
+        """
+        Convert a command which is carried out relative to the center-of-mass
+        (\"movecm(x,y,z)\", \"rotcm(angle,axisX,axisY,axisZ)\",
+         or \"scalecm(ratio)\") into an equivalent \"move()\", \"rot()\",
+        or \"scale()\" command (whose arguments depend on \"xcm\").
+
+        """
+        i_paren_open = transform_str.find('(')
+        i_paren_close = transform_str.find(')')
+        if i_paren_close == -1:
+            i_paren_close = len(transform_str)
+        name = transform_str[:i_paren_open]
+        args = transform_str[i_paren_open+1:i_paren_close].split(',')
+        if xcm is None:
+            raise InputError('Error near ' + ErrorLeader(src_loc.infile, src_loc.lineno) + ':\n'
+                             '       The \"' + name + '()\" command can not be used here.\n'
+                             '       (The center of mass of the object is not known.)\n')
+        xcm_args = [str(xcm[0]), str(xcm[1]), str(xcm[2])]
+        if name == 'movecm':
+            if (len(args) != 3):
+                raise InputError('Error near ' + ErrorLeader(src_loc.infile, src_loc.lineno) + ':\n'
+                                 '       Invalid command: \"' + transform_str + '\"\n'
+                                 '       This command requires 3 numerical arguments.')
+            return ('move(' + str(float(args[0]) - xcm[0]) + ',' +
+                    str(float(args[1]) - xcm[1]) + ',' +
+                    str(float(args[2]) - xcm[2]) + ')')
+        elif name == 'rotcm':
+            if (len(args) != 4):
+                raise InputError('Error near ' + ErrorLeader(src_loc.infile, src_loc.lineno) + ':\n'
+                                 '       Invalid command: \"' + transform_str + '\"\n'
+                                 '       This command requires 4 numerical arguments.')
+            return 'rot(' + ','.join(args + xcm_args) + ')'
+        else:
+            assert(name == 'scalecm')
+            if (len(args) != 1) and (len(args) != 3):
+                raise InputError('Error near ' + ErrorLeader(src_loc.infile, src_loc.lineno) + ':\n'
+                                 '       Invalid command: \"' + transform_str + '\"\n'
+                                 '       This command requires either 1 or 3 numerical arguments.')
+            return 'scale(' + ','.join(args + xcm_args) + ')'
+
     @staticmethod
     def CommandsToMatrix(text,  # text containing affine transformation commands
                          src_loc=OSrcLoc(),   # for debugging
@@ -259,6 +322,12 @@ class AffineStack(object):
 
         transform_commands = text.split(').')
         for transform_str in transform_commands:
+            if ((transform_str.find('movecm(') == 0) or
+                (transform_str.find('rotcm(') == 0) or
+                (transform_str.find('scalecm(') == 0)):
+                transform_str = AffineStack.CMCommandToCommand(transform_str,
+                                                               src_loc,
+                                                               xcm)
             if transform_str.find('move(') == 0:
                 i_paren_open = transform_str.find('(')
                 i_paren_close = transform_str.find(')')
@@ -275,22 +344,6 @@ class AffineStack(object):
                 AffineCompose(Mtmp, M, Mdest)
                 CopyMat(Mdest, Mtmp)
 
-            # # if transform_str.find('movecm(') == 0:
-            # #     assert(xcm != None)
-            # #     i_paren_open = transform_str.find('(')
-            # #     i_paren_close = transform_str.find(')')
-            # #     if i_paren_close == -1:
-            # #         i_paren_close = len(transform_str)
-            # #     args =transform_str[i_paren_open+1:i_paren_close].split(',')
-            # #     if (len(args) != 3):
-            # #         raise InputError('Error near '+ErrorLeader(src_loc.infile, src_loc.lineno)+':\n'
-            # #                          '       Invalid command: \"'+transform_str+'\"\n'
-            # #                          '       This command requires 3 numerical arguments.')
-            # #     M = [[1.0, 0.0, 0.0, float(args[0])-(xcm[0])],
-            # #         [0.0, 1.0, 0.0, float(args[1])-(xcm[1])],
-            # #          [0.0, 0.0, 1.0, float(args[2])-(xcm[2])]]
-            # #     AffineCompose(Mtmp, M, Mdest)
-            # #     CopyMat(Mdest, Mtmp)
 
             elif transform_str.find('move_rand(') == 0:
                 i_paren_open = transform_str.find('(')
@@ -466,37 +519,6 @@ class AffineStack(object):
                     AffineCompose(Mtmp, moveCentBack, Mdest)
                     CopyMat(Mdest, Mtmp)
 
-            # # elif transform_str.find('rotcm(') == 0:
-            # #     i_paren_open = transform_str.find('(')
-            # #     i_paren_close = transform_str.find(')')
-            # #     if i_paren_close == -1:
-            # #         i_paren_close = len(transform_str)
-            # #     args =transform_str[i_paren_open+1:i_paren_close].split(',')
-            # #     if (len(args) != 4):
-            # #         raise InputError('Error near '+ErrorLeader(src_loc.infile, src_loc.lineno)+':\n'
-            # #                          '       Invalid command: \"'+transform_str+'\"\n'
-            # #                          '       This command requires 4 numerical arguments.')
-            # #
-            # #     moveCMtoOrig = [[1.0, 0.0, 0.0, -xcm[0]],
-            # #                     [0.0, 1.0, 0.0, -xcm[1]],
-            # #                     [0.0, 0.0, 1.0, -xcm[2]]]
-            # #     AffineCompose(Mtmp, moveCMtoOrig, Mdest)
-            # #     CopyMat(Mdest, Mtmp)
-            # #     M[0][3] = 0.0#RotMatAXYZ() only modifies 3x3 submatrix of M
-            # #     M[1][3] = 0.0#The remaining final column must be zeroed by hand
-            # #     M[2][3] = 0.0
-            # #     RotMatAXYZ(M,
-            # #                float(args[0])*math.pi/180.0,
-            # #                float(args[1]),
-            # #                float(args[2]),
-            # #                float(args[3]))
-            # #     AffineCompose(Mtmp, M, Mdest)
-            # #     CopyMat(Mdest, Mtmp)
-            # #     moveCmBack = [[1.0, 0.0, 0.0, xcm[0]],
-            # #                   [0.0, 1.0, 0.0, xcm[1]],
-            # #                   [0.0, 0.0, 1.0, xcm[2]]]
-            # #     AffineCompose(Mtmp, moveCmBack, Mdest)
-            # #     CopyMat(Mdest, Mtmp)
 
             elif transform_str.find('rot_rand(') == 0:
                 i_paren_open = transform_str.find('(')
@@ -640,39 +662,6 @@ class AffineStack(object):
                 AffineCompose(Mtmp, M, Mdest)
                 CopyMat(Mdest, Mtmp)
 
-            # # elif transform_str.find('scalecm(') == 0:
-            # #     assert(xcm != None)
-            # #     i_paren_open = transform_str.find('(')
-            # #     i_paren_close = transform_str.find(')')
-            # #     if i_paren_close == -1:
-            # #         i_paren_close = len(transform_str)
-            # #     args =transform_str[i_paren_open+1:i_paren_close].split(',')
-            # #
-            # #     moveCMtoOrig = [[1.0, 0.0, 0.0, -xcm[0]],
-            # #                     [0.0, 1.0, 0.0, -xcm[1]],
-            # #                     [0.0, 0.0, 1.0, -xcm[2]]]
-            # #     AffineCompose(Mtmp, moveCMtoOrig, Mdest)
-            # #     CopyMat(Mdest, Mtmp)
-            # #
-            # #     M[0][3] = 0.0 #ScaleMat() only modifies 3x3 submatrix of M
-            # #     M[1][3] = 0.0 #The remaining final column must be zeroed by hand
-            # #     M[2][3] = 0.0
-            # #     if (len(args) == 1):
-            # #         ScaleMat(M, args[0])
-            # #     elif (len(args) == 3):
-            # #         ScaleMat(M, args)
-            # #     else:
-            # #         raise InputError('Error near '+ErrorLeader(src_loc.infile, src_loc.lineno)+':\n'
-            # #                          '       Invalid command: \"'+transform_str+'\"\n'
-            # #                          '       This command requires either 1 or 3 numerical arguments.')
-            # #
-            # #     AffineCompose(Mtmp, M, Mdest)
-            # #     CopyMat(Mdest, Mtmp)
-            # #     moveCmBack = [[1.0, 0.0, 0.0, xcm[0]],
-            # #                   [0.0, 1.0, 0.0, xcm[1]],
-            # #                   [0.0, 0.0, 1.0, xcm[2]]]
-            # #     AffineCompose(Mtmp, moveCmBack, Mdest)
-            # #     CopyMat(Mdest, Mtmp)
 
             #elif transform_str.find('read_xyz(') == 0:
             #    i_paren_open = transform_str.find('(')
@@ -777,6 +766,35 @@ class MultiAffineStack(object):
         else:
             self._Update()
 
+    def OuterMatrix(self, which_stack=None, right_not_left=True):
+        """
+        Return the product of all of the matrices which would be applied
+        after (ie. multiplied on the left of) a matrix pushed onto
+        \"which_stack\" by Push().  (Transformations which are carried out
+        later, relative to the center-of-mass, must take this into account.)
+
+        """
+        M = [[1.0, 0.0, 0.0, 0.0],
+             [0.0, 1.0, 0.0, 0.0],
+             [0.0, 0.0, 1.0, 0.0]]
+        if len(self.stacks) == 0:
+            return M
+        if which_stack == None:
+            target = self.stacks[-1]
+        else:
+            target = self.stack_lookup[which_stack]
+        Mtmp = [[1.0, 0.0, 0.0, 0.0],
+                [0.0, 1.0, 0.0, 0.0],
+                [0.0, 0.0, 1.0, 0.0]]
+        for stack in self.stacks:
+            if (stack is target) and (not right_not_left):
+                break
+            AffineCompose(Mtmp, M, stack.M)
+            CopyMat(M, Mtmp)
+            if stack is target:
+                break
+        return M
+
     def PushRight(self, M, which_stack=None):
         self.Push(M, which_stack, right_not_left=True)
 
@@ -8,11 +8,17 @@
 man_page_text = """
 Usage (example):
 
-ttree_render.py ttree_assignments.txt < file.template > file.rendered
+ttree_render.py [-index] ttree_assignments.txt < file.template > file.rendered
 
 The argument (ttree_assignments.txt) should be a 2-column file containing
 ttree-style variables (1st column), and their values (bindings, 2nd column).
 
+If the "-index" argument is given, an index file for ttree_assignments.txt
+(named "ttree_assignments.txt.idx") is created, unless an up-to-date index
+exists already.  (See ttree_assignments_index.py.)  This makes it faster to
+render other templates using the same file later.  (It is up to the caller
+to delete the index file afterwards.)
+
 This program reads a text file containing ttree-style variables,
 substitutes the corresponding values stored in ttree_assignments.txt,
 and prints out the new (rendered) text to the standard-out.
@@ -26,10 +32,12 @@ import gc
 try:
     from .ttree import ExtractFormattingCommands
     from .ttree_lex import SplitQuotedString, InputError, TemplateLexer
+    from .ttree_assignments_index import OpenAssignmentsIndex
 except (ImportError, SystemError, ValueError):
     # not installed as a package
     from ttree import ExtractFormattingCommands
     from ttree_lex import SplitQuotedString, InputError, TemplateLexer
+    from ttree_assignments_index import OpenAssignmentsIndex
 
 
 g_filename = __file__.split('/')[-1]
@@ -44,12 +52,139 @@ g_program_name = g_filename
 
 
 
+def ReadBindings(fbindings):
+    """
+    Read a 2-column file (or a list of lines) containing ttree-style
+    variable names and their values.  Returns a dictionary.
+
+    """
+    assignments = {}
+
+    for line in fbindings:
+        #tokens = lines.strip().split()
+        # like split but handles quotes
+        tokens = SplitQuotedString(line.strip())
+        if len(tokens) < 2:
+            continue
+        assignments[tokens[0]] = tokens[1]
+
+    return assignments
+
+
+def RenderTemplateIter(ftemplate, ftemplate_name, assignments):
+    """
+    Read a template (from the file stream "ftemplate"), and substitute the
+    values of the variables stored in the "assignments" dictionary.
+    This is a generator which yields the rendered text in pieces, as soon
+    as they are read, so the template is never stored in memory all at once.
+
+    """
+    lex = TemplateLexer(ftemplate, ftemplate_name)
+    lex.var_delim = '$@'
+
+    for entry in lex.ReadTemplateIter(simplify_output=True):
+        assert(isinstance(entry, str))
+
+        if ((len(entry) > 1) and (entry[0] in lex.var_delim)):
+
+            var_prefix = ''
+            var_suffix = ''
+            var_format = ''
+            if ((len(entry) >= 3) and
+                (entry[1] == '{') and
+                (entry[-1] == '}')):
+                var_prefix = '{'
+                var_suffix = '}'
+                entry = entry[0] + entry[2:-1]
+
+            if '.' in entry:
+                ic = entry.find('.')
+                var_name = entry[:ic]
+                var_format = entry[ic:]
+                if not var_format[0:7] in ('.ljust(', '.rjust('):
+                    var_name = entry
+                    var_format = ''
+            else:
+                var_name = entry
+                var_format = ''
+
+            if var_name not in assignments:
+                #COMMENTING OUT:
+                #raise(InputError('Error(' + g_program_name + ')'
+                #                 #' at '+ErrorLeader(var_ref.src_loc.infile,
+                #                 #                   var_ref.src_loc.lineno)+
+                #                 ' unknown variable:\n'
+                #                 '         \"' + var_name + '\"\n'))
+                # ...actually don't raise an error message:
+                # Actually there are some legitimate reaons this could occur.
+                # Some users want to put LAMMPS-style variables in the 
+                # write_once() {...} text blocks in their moltemplate files.
+                # Variables in both LAMMPS and moltemplate contain $ characters, 
+                # and this script gets confused.  Better to just ignore it
+                # when this happens instead of printing an error message.
+                # Just leave the text alone and print the variable name.
+                #
+                # Do this by substituting the variable's name as it's value:
+
+                var_value = entry[0] + var_prefix + var_name[1:] + var_suffix
+
+            else:
+                var_value = assignments[var_name]
+
+            format_fname, args = ExtractFormattingCommands(var_format)
+            if format_fname == 'ljust':
+                if len(args) == 1:
+                    var_value = var_value.ljust(int(args[0]))
+                else:
+                    var_value = var_value.ljust(int(args[0]), args[1])
+            elif format_fname == 'rjust':
+                if len(args) == 1:
+                    var_value = var_value.rjust(int(args[0]))
+                else:
+                    var_value = var_value.rjust(int(args[0]), args[1])
+            yield var_value
+        else:
+            yield entry
+
+
+def RenderTemplate(ftemplate, ftemplate_name, assignments):
+    """
+    Read a template (from the file stream "ftemplate"), and substitute the
+    values of the variables stored in the "assignments" dictionary.
+    Returns the rendered text as a string.
+
+    """
+    return ''.join(RenderTemplateIter(ftemplate, ftemplate_name, assignments))
+
+
+def WriteRenderedTemplate(ftemplate, ftemplate_name, assignments, fout,
+                          chunk_size=65536):
+    """
+    Render a template (see RenderTemplateIter()) and write the result to
+    the file stream "fout" in chunks of (roughly) "chunk_size" characters,
+    so that memory use does not grow with the size of the template.
+
+    """
+    chunk = []
+    chunk_len = 0
+    for text in RenderTemplateIter(ftemplate, ftemplate_name, assignments):
+        chunk.append(text)
+        chunk_len += len(text)
+        if chunk_len >= chunk_size:
+            fout.write(''.join(chunk))
+            chunk = []
+            chunk_len = 0
+    fout.write(''.join(chunk))
+
+
 def main():
     try:
-        if (len(sys.argv) < 2):
+        argv = [arg for arg in sys.argv if arg != '-index']
+        create_index = (len(argv) < len(sys.argv))
+        if (len(argv) < 2):
             raise InputError('Error running  \"' + g_program_name + '\"\n'
                              ' Typical usage:\n'
-                             ' ttree_render.py ttree_assignments.txt < file.template > file.rendered\n'
+                             ' ttree_render.py [-index] ttree_assignments.txt < file.template > file.rendered\n'
                              '\n'
                              '   Missing argument.\n'
                              '   Expected the name of a 2-column file containing\n'
@@ -57,104 +192,41 @@ def main():
                              '   (This is likely a programmer error.\n'
                              '    This script was not intended to be run by end users.)\n')
 
-        bindings_filename = sys.argv[1]
+        bindings_filename = argv[1]
         ftemplate = sys.stdin
         ftemplate_name = '__standard_input_for_ttree_render__'
-        if len(sys.argv) >= 3:
-            ftemplate_name = sys.argv[2]
+        if len(argv) >= 3:
+            ftemplate_name = argv[2]
             ftemplate = open(ftemplate_name, 'r')
 
 
-        fbindings = open(bindings_filename)
-        assignments = {}
-
-        #BasicUIReadBindingsStream(assignments, f, bindings_filename)
-
-        # The line above is robust but it uses far too much memory.
-        # This for loop below works for most cases.
-        for line in fbindings:
-            #tokens = lines.strip().split()
-            # like split but handles quotes
-            tokens = SplitQuotedString(line.strip())
-            if len(tokens) < 2:
-                continue
-            assignments[tokens[0]] = tokens[1]
-
-        fbindings.close()
-        gc.collect()
-       
-        lex = TemplateLexer(ftemplate, ftemplate_name)
-        lex.var_delim = '$@'
-
-        text_block_list = lex.ReadTemplate(simplify_output=True)
+        # Most templates only refer to a small fraction of the variables
+        # in the bindings file.  If possible, look up their values using
+        # an index file (see ttree_assignments_index.py), instead of
+        # reading the entire bindings file into memory.
+        # (Index files are only created if "-index" was requested.)
+        assignments = OpenAssignmentsIndex(bindings_filename,
+                                           create=create_index)
 
-        output = []
+        if assignments is None:
+            fbindings = open(bindings_filename)
 
-        for entry in text_block_list:
-            assert(isinstance(entry, str))
+            #BasicUIReadBindingsStream(assignments, f, bindings_filename)
 
-            if ((len(entry) > 1) and (entry[0] in lex.var_delim)):
+            # The line above is robust but it uses far too much memory.
+            # This for loop below works for most cases.
+            assignments = ReadBindings(fbindings)
 
-                var_prefix = ''
-                var_suffix = ''
-                var_format = ''
-                if ((len(entry) >= 3) and
-                    (entry[1] == '{') and
-                    (entry[-1] == '}')):
-                    var_prefix = '{'
-                    var_suffix = '}'
-                    entry = entry[0] + entry[2:-1]
-
-                if '.' in entry:
-                    ic = entry.find('.')
-                    var_name = entry[:ic]
-                    var_format = entry[ic:]
-                    if not var_format[0:7] in ('.ljust(', '.rjust('):
-                        var_name = entry
-                        var_format = ''
-                else:
-                    var_name = entry
-                    var_format = ''
-
-                if var_name not in assignments:
-                    #COMMENTING OUT:
-                    #raise(InputError('Error(' + g_program_name + ')'
-                    #                 #' at '+ErrorLeader(var_ref.src_loc.infile,
-                    #                 #                   var_ref.src_loc.lineno)+
-                    #                 ' unknown variable:\n'
-                    #                 '         \"' + var_name + '\"\n'))
-                    # ...actually don't raise an error message:
-                    # Actually there are some legitimate reaons this could occur.
-                    # Some users want to put LAMMPS-style variables in the 
-                    # write_once() {...} text blocks in their moltemplate files.
-                    # Variables in both LAMMPS and moltemplate contain $ characters, 
-                    # and this script gets confused.  Better to just ignore it
-                    # when this happens instead of printing an error message.
-                    # Just leave the text alone and print the variable name.
-                    #
-                    # Do this by substituting the variable's name as it's value:
-
-                    var_value = entry[0] + var_prefix + var_name[1:] + var_suffix
-
-                else:
-                    var_value = assignments[var_name]
-
-                format_fname, args = ExtractFormattingCommands(var_format)
-                if format_fname == 'ljust':
-                    if len(args) == 1:
-                        var_value = var_value.ljust(int(args[0]))
-                    else:
-                        var_value = var_value.ljust(int(args[0]), args[1])
-                elif format_fname == 'rjust':
-                    if len(args) == 1:
-                        var_value = var_value.rjust(int(args[0]))
-                    else:
-                        var_value = var_value.rjust(int(args[0]), args[1])
-                output.append(var_value)
-            else:
-                output += entry
+            fbindings.close()
+            gc.collect()
+       
+        WriteRenderedTemplate(ftemplate,
+                              ftemplate_name,
+                              assignments,
+                              sys.stdout)
 
-        sys.stdout.write(''.join(output))
+        if not isinstance(assignments, dict):
+            assignments.Close()
 
         # If we are not reading the file from sys.stdin, then close the file:
         if ftemplate_name == '__standard_input_for_ttree_render__':
@@ -0,0 +1,148 @@
+# Author: Andrew Jewett (jewett.aij at g mail)
+# License: MIT License  (See LICENSE.md)
+# Copyright (c) 2013
+# All rights reserved.
+
+"""
+A disk cache for the templates that TemplateLexer.ReadTemplate() reads from
+large files (such as the force-field files in the "force_fields" directory,
+which are imported by many different projects, but rarely change).
+
+Reading a template (the text in a write() or write_once() command)
+requires parsing the file one character at a time, which is slow.
+For large files, the results of each ReadTemplate() invocation are saved
+in a cache file (using the "marshal" module), indexed by the location in
+the file where the template begins.
+
+The cache is disabled by default.  To enable it, set the
+MOLTEMPLATE_CACHE_DIR environment variable to the name of the directory
+where the cache files should be stored.  There is one cache file for each
+(large) source file, whose name contains a checksum of the source file's
+location.  The cache file also stores a checksum of the source file's
+contents, as well as a checksum of the source code of the lexer
+(ttree_lex.py).  If either of them changes, the old entries are discarded,
+and the cache file is overwritten the next time it is saved.  (So the
+cache does not grow when a source file is modified repeatedly.)
+
+"""
+
+import os
+import sys
+import hashlib
+import marshal
+
+
+# Files smaller than this (number of bytes) are not worth caching.
+g_min_file_size = 65536
+
+g_lexer_checksum = None
+
+
+def _LexerChecksum():
+    """ A checksum of the code which generated the cached templates. """
+    global g_lexer_checksum
+    if g_lexer_checksum is None:
+        h = hashlib.sha1()
+        dirname = os.path.dirname(os.path.abspath(__file__))
+        for filename in ('ttree_lex.py', 'ttree_template_cache.py'):
+            with open(os.path.join(dirname, filename), 'rb') as f:
+                h.update(f.read())
+        h.update(sys.version.encode('utf-8'))
+        g_lexer_checksum = h.hexdigest()[:16]
+    return g_lexer_checksum
+
+
+def CacheDir():
+    """
+    Return the directory where the cache files are stored
+    (or None if caching has not been enabled).
+
+    """
+    cache_dir = os.environ.get('MOLTEMPLATE_CACHE_DIR')
+    if not cache_dir:
+        return None
+    return cache_dir
+
+
+class TemplateCache(object):
+    """
+    The cached templates for a single file.  Lookup() and Store() map
+    a key (describing where, and how, a template was read from the file)
+    to the result (the list of text blocks and variables, encoded as strings
+    and tuples) as well as the location in the file where the template ended.
+
+    """
+
+    def __init__(self, text, source_filename, cache_dir=None):
+        if cache_dir is None:
+            cache_dir = CacheDir()
+        path = os.path.abspath(source_filename).encode('utf-8')
+        self.filename = os.path.join(cache_dir,
+                                     'templates-' +
+                                     hashlib.sha1(path).hexdigest()[:16] +
+                                     '.dat')
+        # The cache file is only valid if the source file and lexer have
+        # not changed since it was written:
+        self.checksum = (_LexerChecksum() + '-' +
+                         hashlib.sha1(text.encode('utf-8')).hexdigest())
+        self.text = text
+        self.entries = None  # (loaded when needed)
+        self.modified = False
+
+    def _Load(self):
+        self.entries = {}
+        try:
+            with open(self.filename, 'rb') as f:
+                checksum, entries = marshal.load(f)
+            if checksum == self.checksum:
+                self.entries = entries
+        except Exception:
+            # (If the cache is missing or damaged, then start over)
+            pass
+
+    def Lookup(self, key):
+        if self.entries is None:
+            self._Load()
+        return self.entries.get(key)
+
+    def Store(self, key, value):
+        if self.entries is None:
+            self._Load()
+        self.entries[key] = value
+        self.modified = True
+
+    def Save(self):
+        """ Write the cache file (if anything new was added to it). """
+        if not self.modified:
+            return
+        try:
+            cache_dir = os.path.dirname(self.filename)
+            if not os.path.isdir(cache_dir):
+                os.makedirs(cache_dir)
+            tmp_filename = self.filename + '.' + str(os.getpid()) + '.tmp'
+            with open(tmp_filename, 'wb') as f:
+                marshal.dump((self.checksum, self.entries), f)
+            os.replace(tmp_filename, self.filename)
+            self.modified = False
+        except (IOError, OSError):
+            # Caching is optional.  Ignore read-only or full file systems.
+            pass
+
+
+def OpenTemplateCache(f):
+    """
+    Return a TemplateCache for the contents of "f" (a file which was just
+    opened), or None if this file should not be cached.  (In that case,
+    nothing is read from "f".  Otherwise the contents of the file are read,
+    and they are stored in the "text" member of the TemplateCache.)
+
+    """
+    cache_dir = CacheDir()
+    if cache_dir is None:
+        return None
+    try:
+        if os.fstat(f.fileno()).st_size < g_min_file_size:
+            return None
+    except (AttributeError, ValueError, OSError):
+        return None
+    return TemplateCache(f.read(), f.name, cache_dir)
@@ -91,6 +91,7 @@ setup(
         'lttree.py=moltemplate.lttree:main',
         'lttree_check.py=moltemplate.lttree_check:main',
         'lttree_postprocess.py=moltemplate.lttree_postprocess:main',
+        'lttree_pipeline.py=moltemplate.lttree_pipeline:main',
         'nbody_by_type.py=moltemplate.nbody_by_type:main',
         'nbody_fix_ttree_assignments.py=moltemplate.nbody_fix_ttree_assignments:main',
         'nbody_reorder_atoms.py=moltemplate.nbody_reorder_atoms:main',
@@ -98,6 +99,7 @@ setup(
         'postprocess_input_script.py=moltemplate.postprocess_input_script:main',
         'postprocess_coeffs.py=moltemplate.postprocess_coeffs:main',
         'raw2data.py=moltemplate.raw2data:main',
+        'read_coords.py=moltemplate.read_coords:main',
         'recenter_coords.py=moltemplate.recenter_coords:main',
         'remove_duplicate_atoms.py=moltemplate.remove_duplicate_atoms:main',
         'remove_duplicates_nbody.py=moltemplate.remove_duplicates_nbody:main',
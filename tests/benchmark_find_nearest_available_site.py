@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+
+# Compare the speed of genpoly_modify_lt.FreeSiteTree.FindNearest() (which
+# stores the vacant sites in a binary tree) with the original version
+# (_FindNearestAvailableSiteScan(), below) which scans the occupancy array
+# outward from the target site.  Modifications are placed one at a time in a
+# long polymer whose monomers are mostly occupied already (in long stretches),
+# so the original version must scan far from the target site.
+# (First, make sure both versions choose the same sites on random lattices.)
+#
+# Usage:
+#    python3 benchmark_find_nearest_available_site.py [N] [NUM_MODS]
+
+import sys
+import random
+import timeit
+from moltemplate.genpoly_modify_lt import FreeSiteTree
+
+
+def _FindNearestAvailableSiteScan(i, width, occupancy, is_periodic):
+    N = len(occupancy)
+    if is_periodic:
+        j_stop = N // 2
+    else:
+        j_stop = max(-width+N-i, i)
+    occupied = True
+    for j in range(0, j_stop):
+        occupied = True
+        for s in (-1, 1):
+            if i+s*j < 0:
+                continue
+            if i+s*j >= N:
+                continue
+            occupied = False
+            for d in range(0, width):
+                if not is_periodic:
+                    if i+s*j+d < 0:
+                        occupied = True
+                        continue
+                    if i+s*j+d >= N:
+                        occupied = True
+                        continue
+                if occupancy[(i+s*j+d) % N]:
+                    occupied = True
+                    break
+            if not occupied:
+                break
+        if not occupied:
+            break
+    if occupied:
+        return -1
+    else:
+        return i+s*j
+
+
+def PlaceScan(targets, width, occupancy, is_periodic):
+    N = len(occupancy)
+    locations = []
+    for i in targets:
+        J = _FindNearestAvailableSiteScan(i, width, occupancy, is_periodic)
+        if J != -1:
+            for d in range(0, width):
+                occupancy[(J+d) % N] = True
+        locations.append(J)
+    return locations
+
+
+def PlaceTree(targets, width, occupancy, is_periodic):
+    free_sites = FreeSiteTree(occupancy, is_periodic)
+    locations = []
+    for i in targets:
+        J = free_sites.FindNearest(i, width)
+        if J != -1:
+            free_sites.Occupy(J, width)
+        locations.append(J)
+    return locations
+
+
+random.seed(1)
+for trial in range(0, 2000):
+    N = random.randint(0, 40)
+    density = random.random()
+    occupancy = [random.random() < density for i in range(0, N)]
+    is_periodic = random.random() < 0.5
+    width = random.randint(0, 6)
+    if is_periodic and (width > N):
+        continue  # (an object can not overlap with itself)
+    targets = [random.randint(-5, N+5) for k in range(0, 8)]
+    assert (PlaceScan(targets, width, list(occupancy), is_periodic) ==
+            PlaceTree(targets, width, list(occupancy), is_periodic))
+
+N = 20000
+num_mods = 500
+if len(sys.argv) > 1:
+    N = int(sys.argv[1])
+if len(sys.argv) > 2:
+    num_mods = int(sys.argv[2])
+
+width = 5
+occupancy = [(i // 1000) % 4 != 0 for i in range(0, N)]
+targets = [random.randrange(N) for k in range(0, num_mods)]
+for is_periodic in (False, True):
+    assert (PlaceScan(targets, width, list(occupancy), is_periodic) ==
+            PlaceTree(targets, width, list(occupancy), is_periodic))
+    for name, func in (('scan', PlaceScan),
+                       ('FreeSiteTree', PlaceTree)):
+        t = min(timeit.repeat(lambda: func(targets, width,
+                                           list(occupancy), is_periodic),
+                              number=1, repeat=3))
+        sys.stdout.write('%-14s periodic=%-5s %8.3f sec  (N=%d, %d mods)\n' %
+                         (name, is_periodic, t, N, num_mods))
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+
+# Compare the speed of ttree.InstanceObjBasic.IsDeleted() (which remembers
+# its answer until the next node is deleted) with the original version
+# (_IsDeletedWalk(), below) which walks up the tree to the root every time.
+# The tree resembles a deeply nested system: a box of polymers, each
+# containing monomers (nested in groups), each containing atoms.
+# A few of the monomers are deleted.
+#
+# Usage:
+#    python3 benchmark_is_deleted.py [DEPTH] [NUM_REPEATS]
+
+import sys
+import timeit
+from moltemplate.ttree import InstanceObj, InstanceObjBasic
+
+
+def _IsDeletedWalk(node):
+    while node.parent != None:
+        if hasattr(node, 'deleted'):
+            if node.deleted:
+                return True
+        elif node.parent == node:
+            return True
+        node = node.parent
+    return False
+
+
+depth = 12
+num_repeats = 5
+if len(sys.argv) > 1:
+    depth = int(sys.argv[1])
+if len(sys.argv) > 2:
+    num_repeats = int(sys.argv[2])
+
+num_polymers = 20
+num_monomers = 50
+num_atoms = 20
+
+root = InstanceObj('', None)
+leaves = []
+monomers = []
+for i in range(num_polymers):
+    polymer = InstanceObj('polymer[' + str(i) + ']', root)
+    for j in range(num_monomers):
+        node = polymer
+        for k in range(depth):
+            node = InstanceObj('group', node)
+        monomers.append(node)
+        for k in range(num_atoms):
+            leaves.append(InstanceObjBasic('atom' + str(k), node))
+for monomer in monomers[::7]:
+    monomer.DeleteSelf()
+
+assert ([_IsDeletedWalk(leaf) for leaf in leaves] ==
+        [leaf.IsDeleted() for leaf in leaves])
+
+for name, func in (('_IsDeletedWalk', _IsDeletedWalk),
+                   ('IsDeleted', InstanceObjBasic.IsDeleted)):
+    t = min(timeit.repeat(lambda: [func(leaf) for leaf in leaves],
+                          number=num_repeats, repeat=3))
+    sys.stdout.write('%-16s %8.3f usec/node  (%d nodes, depth %d)\n' %
+                     (name, 1.0e6 * t / (num_repeats * len(leaves)),
+                      len(leaves), depth + 2))
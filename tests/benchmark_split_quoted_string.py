@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+
+# Compare the speed of ttree_lex.SplitQuotedString() (which uses a fast path
+# for lines without quotes, escape characters, or comments) with the
+# original character-by-character implementation (_SplitQuotedStringSlow()),
+# using the lines from the "Atoms" section of a LAMMPS data file.
+#
+# Usage:
+#    python3 benchmark_split_quoted_string.py [FILE.data] [NUM_REPEATS]
+
+import sys
+import os
+import timeit
+from moltemplate.ttree_lex import SplitQuotedString, _SplitQuotedStringSlow
+
+data_filename = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..',
+                             'examples', 'file_conversion_examples',
+                             'convert_LAMMPS_to_LT_examples',
+                             'cnad-cnt', 'cnad-cnt.data')
+num_repeats = 20
+if len(sys.argv) > 1:
+    data_filename = sys.argv[1]
+if len(sys.argv) > 2:
+    num_repeats = int(sys.argv[2])
+
+# Read the lines in the "Atoms" section
+lines = []
+in_atoms = False
+for line in open(data_filename, 'r'):
+    tokens = line.split()
+    if len(tokens) > 0 and tokens[0] == 'Atoms':
+        in_atoms = True
+    elif in_atoms and len(tokens) > 0:
+        if tokens[0][0].isalpha():
+            break
+        lines.append(line)
+# Include a few lines which need the slow path (comments, quotes, escapes)
+lines += ['1 2 1 0.0 1.0 2.0 3.0  # comment\n',
+          '$atom:a "@atom:b c" $mol:m 0.0\n',
+          '$atom:a\\ b @atom:c 0.0\n']
+
+for line in lines:
+    assert SplitQuotedString(line) == _SplitQuotedStringSlow(line)
+
+for name, func in (('_SplitQuotedStringSlow', _SplitQuotedStringSlow),
+                   ('SplitQuotedString', SplitQuotedString)):
+    t = min(timeit.repeat(lambda: [func(line) for line in lines],
+                          number=num_repeats, repeat=3))
+    sys.stdout.write('%-24s %8.3f usec/line  (%d lines)\n' %
+                     (name, 1.0e6 * t / (num_repeats * len(lines)), len(lines)))
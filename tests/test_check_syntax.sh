@@ -0,0 +1,107 @@
+#!/usr/bin/env bash
+
+# Make sure that moltemplate.sh detects common mistakes in the user's files
+# (using the "-check-syntax" argument of lttree.py), and that it exits with
+# status 1 when it finds one.  (Other errors cause it to exit with status 2.)
+
+WriteFiles() {
+  cat > typo.lt << "EOF"
+Mol {
+  write("Data Atom") {
+    $atom:a $mol:. @atom:A 0.0 0.0 0.0 0.0
+  }
+  write_once("Data Masses") {
+    @atom:A 1.0
+  }
+}
+mols = new Mol [2]
+EOF
+
+  cat > missing_pair_coeff.lt << "EOF"
+Mol {
+  write("Data Atoms") {
+    $atom:a $mol:. @atom:A 0.0 0.0 0.0 0.0
+  }
+  write_once("Data Masses") {
+    @atom:A 1.0
+  }
+}
+mols = new Mol [2]
+EOF
+
+  cat > good.lt << "EOF"
+Mol {
+  write("Data Atoms") {
+    $atom:a $mol:. @atom:A 0.0 0.0 0.0 0.0
+  }
+  write_once("In Settings") {
+    pair_coeff @atom:A @atom:A 0.1 1.0
+  }
+  write_once("Data Masses") {
+    @atom:A 1.0
+  }
+}
+mols = new Mol [2]
+EOF
+
+  # (The "Data Atoms" columns are not in the order used by atom_style "full".
+  #  This is not an error unless the user specifies that atom_style.)
+  cat > ellipsoids.lt << "EOF"
+Mol {
+  write("Data Atoms") {
+    $atom:a @atom:A 1 1.0 0.0 0.0 0.0
+  }
+  write_once("In Settings") {
+    pair_coeff @atom:A @atom:A 0.1 1.0
+  }
+  write_once("Data Masses") {
+    @atom:A 1.0
+  }
+}
+mols = new Mol [2]
+EOF
+
+  # (This error is not detected until the molecules are created.)
+  cp good.lt bad_instance.lt
+  echo "mols[5].move(1,0,0)" >> bad_instance.lt
+}
+
+test_check_syntax() {
+  cd tests/
+    mkdir test_check_syntax_tmp
+    cd test_check_syntax_tmp/
+      WriteFiles
+
+      moltemplate.sh typo.lt
+      assertEquals "typo: wrong exit status" "1" "$?"
+      moltemplate.sh -pipeline typo.lt
+      assertEquals "typo (-pipeline): wrong exit status" "1" "$?"
+      moltemplate.sh -nocheck typo.lt
+      assertEquals "typo (-nocheck): wrong exit status" "0" "$?"
+
+      moltemplate.sh missing_pair_coeff.lt
+      assertEquals "missing pair_coeff: wrong exit status" "1" "$?"
+
+      moltemplate.sh bad_instance.lt
+      assertEquals "bad instance: wrong exit status" "2" "$?"
+
+      moltemplate.sh ellipsoids.lt
+      assertEquals "no -atomstyle: wrong exit status" "0" "$?"
+      moltemplate.sh -pipeline ellipsoids.lt
+      assertEquals "no -atomstyle (-pipeline): wrong exit status" "0" "$?"
+      moltemplate.sh -atomstyle "atom-ID atom-type flag density x y z" ellipsoids.lt
+      assertEquals "-atomstyle (matching): wrong exit status" "0" "$?"
+      moltemplate.sh -atomstyle full ellipsoids.lt
+      assertEquals "-atomstyle full: wrong exit status" "1" "$?"
+
+      moltemplate.sh good.lt
+      assertEquals "good: wrong exit status" "0" "$?"
+      assertTrue "good.data file not created" "[ -s good.data ]"
+      NUM_ATOMS=`grep atoms good.data | awk '{print $1}'`
+      assertEquals "wrong number of atoms" "2" "$NUM_ATOMS"
+    cd ../
+    rm -rf test_check_syntax_tmp/
+  cd ../
+}
+
+. tests/shunit2/shunit2
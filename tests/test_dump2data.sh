@@ -0,0 +1,114 @@
+#!/usr/bin/env bash
+
+# Make sure that dump2data.py selects the correct snapshots from a dump file,
+# whether or not it uses an index of the snapshots in the file
+# (dump.lammpstrj.idx), and whether or not the snapshots are converted
+# in parallel (using "-jobs").
+
+WriteFiles() {
+  cat > orig.data << "EOF"
+LAMMPS data file
+
+4 atoms
+2 atom types
+
+0.0 10.0 xlo xhi
+0.0 10.0 ylo yhi
+0.0 10.0 zlo zhi
+
+Masses
+
+1 12.0
+2 1.0
+
+Atoms  # full
+
+1 1 1 -0.4 0.0 0.0 0.0
+2 1 2 0.1 1.0 0.0 0.0
+3 1 2 0.1 0.0 1.0 0.0
+4 1 2 0.2 0.0 0.0 1.0
+EOF
+
+  # (The atoms in each snapshot are deliberately out of order.)
+  for t in 0 100 200; do
+    echo "ITEM: TIMESTEP"
+    echo "$t"
+    echo "ITEM: NUMBER OF ATOMS"
+    echo "4"
+    echo "ITEM: BOX BOUNDS pp pp pp"
+    echo "0.0 10.0"
+    echo "0.0 10.0"
+    echo "0.0 10.0"
+    echo "ITEM: ATOMS id type x y z"
+    for i in 3 1 4 2; do
+      echo "$i $(( i == 1 ? 1 : 2 )) $i.$t 2.$t 3.$t"
+    done
+  done > dump.lammpstrj
+}
+
+# Print the coordinates of atom $2 from the data file $1
+Coords() {
+  extract_lammps_data.py Atoms < "$1" | awk -v id=$2 '{if ($1==id) {print $5" "$6" "$7}}'
+}
+
+test_dump2data() {
+  cd tests/
+    mkdir test_dump2data_tmp
+    cd test_dump2data_tmp/
+      WriteFiles
+
+      # Read the dump file from the standard input (without an index)
+      dump2data.py -last orig.data < dump.lammpstrj > last_stdin.data
+      assertEquals "dump2data.py failed" "0" "$?"
+      assertEquals "wrong coordinates (last snapshot)" "4.2 2.2 3.2" "`Coords last_stdin.data 4`"
+      assertEquals "wrong charge" "0.2" "`extract_lammps_data.py Atoms < last_stdin.data | awk '{if ($1==4) {print $4}}'`"
+      assertTrue "index file should not exist" "[ ! -e dump.lammpstrj.idx ]"
+
+      # Read the dump file using "-in" (which creates an index)
+      dump2data.py -last orig.data -in dump.lammpstrj > last_in.data
+      assertTrue "index file not created" "[ -s dump.lammpstrj.idx ]"
+      assertTrue "-in and stdin results differ" "cmp -s last_stdin.data last_in.data"
+      # ...and again (using the index)
+      dump2data.py -last orig.data -in dump.lammpstrj > last_idx.data
+      assertTrue "results differ using the index" "cmp -s last_stdin.data last_idx.data"
+
+      dump2data.py -t 100 orig.data -in dump.lammpstrj > t100.data
+      assertEquals "wrong coordinates (-t 100)" "1.1 2.1 3.1" "`Coords t100.data 1`"
+      dump2data.py -t 100 orig.data < dump.lammpstrj > t100_stdin.data
+      assertTrue "-t 100: results differ using the index" "cmp -s t100_stdin.data t100.data"
+
+      # Convert every snapshot, using 1 or 2 processes
+      mkdir jobs1 jobs2
+      cp orig.data jobs1/
+      cp orig.data jobs2/
+      cd jobs1/
+        dump2data.py -multi orig.data -in ../dump.lammpstrj
+        assertEquals "dump2data.py -multi failed" "0" "$?"
+      cd ../
+      cd jobs2/
+        dump2data.py -multi -jobs 2 orig.data -in ../dump.lammpstrj
+        assertEquals "dump2data.py -multi -jobs 2 failed" "0" "$?"
+      cd ../
+      assertEquals "wrong number of snapshots" "3" "`ls jobs1/orig.data.* | wc -l`"
+      assertTrue "-jobs 2 results differ" "diff -r jobs1 jobs2"
+      assertEquals "wrong coordinates (snapshot 1)" "2.0 2.0 3.0" "`Coords jobs1/orig.data.1 2`"
+      assertEquals "wrong coordinates (snapshot 3)" "2.2 2.2 3.2" "`Coords jobs1/orig.data.3 2`"
+      dump2data.py -xyz -jobs 2 -in dump.lammpstrj > jobs2.xyz
+      dump2data.py -xyz -in dump.lammpstrj > jobs1.xyz
+      assertTrue "-xyz -jobs 2 results differ" "cmp -s jobs1.xyz jobs2.xyz"
+
+      # Modify the dump file.  (The old index should no longer be used.)
+      sed -i 's/ 3.200$/ 7.200/' dump.lammpstrj
+      dump2data.py -last orig.data -in dump.lammpstrj > last_modified.data
+      assertEquals "the index was not updated" "4.2 2.2 7.2" "`Coords last_modified.data 4`"
+
+      rm -f dump.lammpstrj.idx
+      dump2data.py -no-index -last orig.data -in dump.lammpstrj > last_noidx.data
+      assertTrue "-no-index: results differ" "cmp -s last_modified.data last_noidx.data"
+      assertTrue "-no-index: index file created" "[ ! -e dump.lammpstrj.idx ]"
+    cd ../
+    rm -rf test_dump2data_tmp/
+  cd ../
+}
+
+. tests/shunit2/shunit2
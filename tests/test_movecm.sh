@@ -0,0 +1,67 @@
+#!/usr/bin/env bash
+
+# Make sure that the movecm(), rotcm(), and scalecm() commands move, rotate,
+# and scale molecules relative to their center of mass.
+# (Each molecule contains 2 atoms: an atom of mass 1 at x=0, and an atom of
+#  mass 3 at x=4.  So the center of mass is initially located at x=3.)
+
+test_movecm() {
+  cd tests/
+    mkdir test_movecm_tmp
+    cd test_movecm_tmp/
+      cat > system.lt << "EOF"
+Mol {
+  write("Data Atoms") {
+    $atom:a1 $mol:. @atom:A 0.0 0.0 0.0 0.0
+    $atom:a2 $mol:. @atom:B 0.0 4.0 0.0 0.0
+  }
+  write_once("Data Masses") {
+    @atom:A 1.0
+    @atom:B 3.0
+  }
+  write_once("In Settings") {
+    pair_coeff * * 0.1 1.0
+  }
+}
+
+Pair {
+  a = new Mol
+  b = new Mol.move(0,2,0)
+}
+
+m1 = new Mol.movecm(10,0,0)
+m2 = new Mol.rotcm(180,0,0,1)
+m3 = new Mol.scalecm(2)
+m4 = new Mol.move(0,5,0).movecm(0,0,0)
+pair = new Pair.movecm(0,0,10)
+EOF
+
+      moltemplate.sh system.lt
+      assertEquals "moltemplate.sh failed" "0" "$?"
+      assertTrue "system.data file not created" "[ -s system.data ]"
+
+      extract_lammps_data.py Atoms < system.data | sort -g -k 1 | awk '
+        function r(x) {x = sprintf("%.6f", x); if (x == "-0.000000") {x = "0.000000"}; return x}
+        {print r($5) " " r($6) " " r($7)}' > coords.txt
+
+      cat > coords_expected.txt << "EOF"
+7.000000 0.000000 0.000000
+11.000000 0.000000 0.000000
+6.000000 0.000000 0.000000
+2.000000 0.000000 0.000000
+-3.000000 0.000000 0.000000
+5.000000 0.000000 0.000000
+-3.000000 0.000000 0.000000
+1.000000 0.000000 0.000000
+-3.000000 -1.000000 10.000000
+1.000000 -1.000000 10.000000
+-3.000000 1.000000 10.000000
+1.000000 1.000000 10.000000
+EOF
+      assertTrue "incorrect coordinates" "diff coords_expected.txt coords.txt"
+    cd ../
+    rm -rf test_movecm_tmp/
+  cd ../
+}
+
+. tests/shunit2/shunit2
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+
+# Make sure that nbody_fix_ttree_assignments.FixTtreeAssignmentsFile()
+# (which modifies a ttree_assignments.txt file) produces the same result as
+# FixTtreeAssignments() (which modifies a list of lines), that the file is
+# only rewritten when necessary, and that the original file is never left
+# partially modified.
+
+import os
+import tempfile
+from moltemplate.nbody_fix_ttree_assignments import \
+    FixTtreeAssignments, FixTtreeAssignmentsFile
+
+lines_atoms = ['$atom:a1  1\n', '$atom:a2  2\n', '$atom:a3  3\n']
+lines_angles = ['$/angle:a1_a2_a3  1\n', '"$/angle:a 2"  2\n']
+lines_angles_end = ['$/angle:a1_a2_a3  1\n', '$/angle:a3_a2_a1  2\n']
+lines_bonds = ['$bond:b1  1\n', '$bond:b2  2\n']
+lines_generated = ['$/angle:bytype1 $atom:a3 $atom:a2 $atom:a1\n',
+                   '\n',
+                   '$/angle:bytype2 $atom:a2 $atom:a1 $atom:a3\n']
+
+tmp_dir = tempfile.mkdtemp()
+filename = os.path.join(tmp_dir, 'ttree_assignments.txt')
+
+# (If the category is missing or at the end, the file is modified in place.
+#  Otherwise it is replaced by a new file.)
+for lines_bindings, in_place in \
+        ((lines_atoms + lines_bonds, True),                      # missing
+         (lines_atoms + lines_angles + lines_bonds, False),      # middle
+         (lines_atoms + lines_bonds + lines_angles_end, True)):  # end
+    with open(filename, 'w') as f:
+        f.write(''.join(lines_bindings))
+    os.chmod(filename, 0o644)
+    inode = os.stat(filename).st_ino
+    lines_out, assignments_expected = FixTtreeAssignments('angle',
+                                                          lines_generated,
+                                                          lines_bindings)
+    assignments = FixTtreeAssignmentsFile('angle', lines_generated, filename)
+    assert assignments == assignments_expected
+    with open(filename, 'r') as f:
+        assert f.read() == ''.join(lines_out)
+    assert (os.stat(filename).st_mode & 0o777) == 0o644
+    assert os.listdir(tmp_dir) == ['ttree_assignments.txt']
+    assert (os.stat(filename).st_ino == inode) == in_place
+
+
+# If an error occurs, the original file should be left unmodified.
+def _LinesWithError():
+    yield lines_generated[0]
+    raise ValueError('(deliberate error)')
+
+for lines_bindings in (lines_atoms + lines_bonds,
+                       lines_atoms + lines_angles + lines_bonds,
+                       lines_atoms + lines_bonds + lines_angles_end):
+    with open(filename, 'w') as f:
+        f.write(''.join(lines_bindings))
+    try:
+        FixTtreeAssignmentsFile('angle', _LinesWithError(), filename)
+        assert False
+    except ValueError:
+        pass
+    with open(filename, 'r') as f:
+        assert f.read() == ''.join(lines_bindings)
+    assert os.listdir(tmp_dir) == ['ttree_assignments.txt']
+
+os.remove(filename)
+os.rmdir(tmp_dir)
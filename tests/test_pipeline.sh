@@ -0,0 +1,33 @@
+#!/usr/bin/env bash
+
+# Make sure that "moltemplate.sh -pipeline" (which runs lttree_pipeline.py)
+# creates the same files as the ordinary version of moltemplate.sh.
+
+test_pipeline() {
+  cd tests/
+    for CHECKFF in "" "-checkff"; do
+      mkdir test_pipeline_tmp
+      cd test_pipeline_tmp/
+        cp -r ../../examples/all_atom/force_field_OPLSAA/butane shell
+        cp -r ../../examples/all_atom/force_field_OPLSAA/butane pipeline
+        cd shell/moltemplate_files/
+          moltemplate.sh $CHECKFF system.lt
+          assertEquals "moltemplate.sh $CHECKFF failed" "0" "$?"
+        cd ../../
+        cd pipeline/moltemplate_files/
+          moltemplate.sh -pipeline $CHECKFF system.lt
+          assertEquals "moltemplate.sh -pipeline $CHECKFF failed" "0" "$?"
+        cd ../../
+        assertTrue "system.data file not created" "[ -s pipeline/moltemplate_files/system.data ]"
+        for FILE in system.data system.in.init system.in.settings system.in.charges; do
+          assertTrue "-pipeline $CHECKFF: $FILE differs" "cmp -s shell/moltemplate_files/$FILE pipeline/moltemplate_files/$FILE"
+        done
+        NUM_DIHEDRALS=`grep dihedrals pipeline/moltemplate_files/system.data | awk '{print $1}'`
+        assertTrue "system.data missing dihedrals" "[ $NUM_DIHEDRALS -gt 0 ]"
+      cd ../
+      rm -rf test_pipeline_tmp/
+    done
+  cd ../
+}
+
+. tests/shunit2/shunit2
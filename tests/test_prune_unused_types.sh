@@ -0,0 +1,33 @@
+#!/usr/bin/env bash
+
+test_prune_unused_types() {
+  cd tests/
+    cp -r test_prune_unused_types_files test_prune_unused_types_tmp
+    cd test_prune_unused_types_tmp/
+      moltemplate.sh -prune-unused-types system.lt
+      assertTrue "system.data file not created" "[ -s system.data ]"
+      assertTrue "system.in.settings file not created" "[ -s system.in.settings ]"
+
+      # Atom type D and angle type CCC are never used, so they are discarded.
+      NUM_ATOM_TYPES=`grep "atom types" system.data | awk '{print $1}'`
+      assertEquals "wrong number of atom types" "3" "$NUM_ATOM_TYPES"
+      NUM_ANGLE_TYPES=`grep "angle types" system.data | awk '{print $1}'`
+      assertEquals "wrong number of angle types" "1" "$NUM_ANGLE_TYPES"
+      NUM_ANGLES=`grep " angles" system.data | awk '{print $1}'`
+      assertEquals "wrong number of angles" "2" "$NUM_ANGLES"
+      assertTrue "pair_coeff of an unused type was not discarded" "! grep -q 'pair_coeff 4 4' system.in.settings"
+      assertTrue "angle_coeff of an unused type was not discarded" "! grep -q 'angle_coeff 2' system.in.settings"
+
+      # Atom type C and bond type CC are referred to by other commands in
+      # the "In Settings" section, so they must be kept (along with those
+      # commands).
+      assertTrue "group command was discarded" "grep -q '^group solute type 1 3$' system.in.settings"
+      assertTrue "fix shake command was discarded" "grep -q '^fix fxShake solute shake 0.0001 10 0 b 1 2$' system.in.settings"
+      assertTrue "pair_coeff of a referenced type was discarded" "grep -q 'pair_coeff 3 3' system.in.settings"
+      assertTrue "bond_coeff of a referenced type was discarded" "grep -q 'bond_coeff 2' system.in.settings"
+    cd ../
+    rm -rf test_prune_unused_types_tmp/
+  cd ../
+}
+
+. tests/shunit2/shunit2
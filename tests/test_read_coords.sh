@@ -0,0 +1,158 @@
+#!/usr/bin/env bash
+
+# Make sure that the coordinates (and periodic boundary box) are read
+# correctly from the files supplied to moltemplate.sh using the "-raw",
+# "-xyz", "-pdb", and "-dump" arguments (including triclinic boxes).
+# (See read_coords.py)
+
+WriteFiles() {
+  cat > system.lt << "EOF"
+Mol {
+  write("Data Atoms") {
+    $atom:a $mol:. @atom:A 0.0 0.0 0.0 0.0
+  }
+  write_once("Data Masses") {
+    @atom:A 1.0
+  }
+  write_once("In Settings") {
+    pair_coeff * * 0.1 1.0
+  }
+}
+mols = new Mol [3]
+EOF
+
+  cat > coords.raw << "EOF"
+# x y z
+1.5 -2.25 3.0
+4.125 5.0 -6.5
+
+7.0 8.0 9.75
+EOF
+
+  cat > coords.xyz << "EOF"
+3
+a comment line
+C 1.5 -2.25 3.0
+C 4.125 5.0 -6.5
+C 7.0 8.0 9.75
+EOF
+
+  echo "CRYST1   40.000   45.500   50.250  90.00  90.00  90.00 P 1           1" > ortho.pdb
+  echo "CRYST1   40.000   45.500   50.250  80.00 100.00 110.50 P 1           1" > tric.pdb
+  for FILE in ortho.pdb tric.pdb; do
+    cat >> $FILE << "EOF"
+ATOM      1  C   MOL A   1       1.500  -2.250   3.000  1.00  0.00           C
+ATOM      2  C   MOL A   2       4.125   5.000  -6.500  1.00  0.00           C
+HETATM    3  C   MOL A   3       7.000   8.000   9.750  1.00  0.00           C
+END
+EOF
+  done
+
+  # (Only the last snapshot is used.  The atoms are not in order.)
+  for t in 0 100; do
+    cat << EOF
+ITEM: TIMESTEP
+$t
+ITEM: NUMBER OF ATOMS
+3
+ITEM: BOX BOUNDS pp pp pp
+-10.0 20.0
+-10 20.5
+-1.0e1 30.25
+ITEM: ATOMS id type x y z
+3 1 7.0 8.0 9.75
+1 1 1.5 -2.25 3.$t
+2 1 4.125 5.0 -6.5
+EOF
+  done > ortho.dump
+  sed -e 's/^ITEM: BOX BOUNDS pp pp pp$/ITEM: BOX BOUNDS xy xz yz pp pp pp/' \
+      -e 's/^-10.0 20.0$/-2.5 52.25 1.5/' \
+      -e 's/^-10 20.5$/-1.0e+00 48.0 -3.25/' \
+      -e 's/^-1.0e1 30.25$/0.0 60.125 2.0/' < ortho.dump > tric.dump
+}
+
+# Run moltemplate.sh with the arguments "$@" in a new directory, and print
+# the boundary box and the coordinates of the atoms (sorted by atom-ID).
+RunMoltemplate() {
+  DIR=run`echo "$@" | tr ' .' '__'`
+  mkdir $DIR
+  cp system.lt "$2" $DIR/
+  cd $DIR/
+    moltemplate.sh "$@" system.lt > moltemplate.log 2>&1
+    assertEquals "moltemplate.sh $* failed" "0" "$?"
+    grep "lo [xyz]hi\|xy xz yz" system.data
+    extract_lammps_data.py Atoms < system.data | sort -g -k 1 | awk '{print $5" "$6" "$7}'
+  cd ../
+}
+
+test_read_coords() {
+  cd tests/
+    mkdir test_read_coords_tmp
+    cd test_read_coords_tmp/
+      WriteFiles
+
+      # (Without a boundary box, one is chosen which encloses the atoms.)
+      assertEquals "-raw: incorrect output" "\
+1.225 7.275 xlo xhi
+-2.7625 8.5125 ylo yhi
+-7.3125 10.5625 zlo zhi
+1.5 -2.25 3.0
+4.125 5.0 -6.5
+7.0 8.0 9.75" "`RunMoltemplate -raw coords.raw`"
+
+      assertEquals "-xyz: incorrect output" "\
+1.225 7.275 xlo xhi
+-2.7625 8.5125 ylo yhi
+-7.3125 10.5625 zlo zhi
+1.5 -2.25 3.0
+4.125 5.0 -6.5
+7.0 8.0 9.75" "`RunMoltemplate -xyz coords.xyz`"
+
+      assertEquals "-pdb (orthorhombic): incorrect output" "\
+0.0   40.000 xlo xhi
+0.0   45.500 ylo yhi
+0.0   50.250 zlo zhi
+1.500 -2.250 3.000
+4.125 5.000 -6.500
+7.000 8.000 9.750" "`RunMoltemplate -pdb ortho.pdb`"
+
+      assertEquals "-pdb (triclinic): incorrect output" "\
+0.0   40.000 xlo xhi
+0.0 42.6186 ylo yhi
+0.0 49.115 zlo zhi
+-15.9344 -8.72582 6.05332 xy xz yz
+1.500 -2.250 3.000
+4.125 5.000 -6.500
+7.000 8.000 9.750" "`RunMoltemplate -pdb tric.pdb`"
+
+      assertEquals "-dump (orthorhombic): incorrect output" "\
+-10 20 xlo xhi
+-10 20.5 ylo yhi
+-10 30.25 zlo zhi
+1.5 -2.25 3.100
+4.125 5.0 -6.5
+7.0 8.0 9.75" "`RunMoltemplate -dump ortho.dump`"
+
+      # (The "BOX BOUNDS" in triclinic dump files enclose the entire box.
+      #  They must be converted into xlo, xhi, ylo, yhi, ... )
+      assertEquals "-dump (triclinic): incorrect output" "\
+0.75 50.75 xlo xhi
+-1 46 ylo yhi
+0 60.125 zlo zhi
+1.5 -3.25 2 xy xz yz
+1.5 -2.25 3.100
+4.125 5.0 -6.5
+7.0 8.0 9.75" "`RunMoltemplate -dump tric.dump`"
+
+      # read_coords.py can also be run directly:
+      read_coords.py -xyz coords.xyz -coords coords.dat > coords_vars.sh
+      assertEquals "read_coords.py failed" "0" "$?"
+      . ./coords_vars.sh
+      assertEquals "read_coords.py: wrong number of atoms" "3" "$NUM_ATOM_COORDS"
+      assertEquals "read_coords.py: wrong coordinates" "4.125 5.0 -6.5" "`awk '{if (NR==2) {print $1" "$2" "$3}}' coords.dat`"
+    cd ../
+    rm -rf test_read_coords_tmp/
+  cd ../
+}
+
+. tests/shunit2/shunit2
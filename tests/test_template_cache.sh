@@ -0,0 +1,67 @@
+#!/usr/bin/env bash
+
+# Make sure that the output of moltemplate.sh does not depend on whether
+# the templates in (large) files were read from the cache, and that a cache
+# entry is no longer used once the corresponding file has been modified.
+# (See ttree_template_cache.py)
+
+RunButane() {
+  if [ ! -d butane_$1 ]; then
+    cp -r ../../examples/all_atom/force_field_OPLSAA/butane butane_$1
+  fi
+  if [ -n "$2" ]; then
+    cp "$2" butane_$1/moltemplate_files/
+  fi
+  cd butane_$1/moltemplate_files/
+    moltemplate.sh system.lt
+    assertEquals "moltemplate.sh failed ($1)" "0" "$?"
+  cd ../../
+}
+
+SameOutput() {
+  for FILE in system.data system.in.init system.in.settings system.in.charges; do
+    if ! cmp -s butane_$1/moltemplate_files/$FILE butane_$2/moltemplate_files/$FILE; then
+      return 1
+    fi
+  done
+  return 0
+}
+
+test_template_cache() {
+  cd tests/
+    mkdir test_template_cache_tmp
+    cd test_template_cache_tmp/
+      # The cache is disabled unless MOLTEMPLATE_CACHE_DIR is set.
+      unset MOLTEMPLATE_CACHE_DIR
+      RunButane nocache
+      export MOLTEMPLATE_CACHE_DIR="$PWD/cache"
+      RunButane cold
+      assertTrue "cache not created" "[ -d cache ]"
+      NUM_CACHE_FILES=`ls cache | wc -l`
+      assertTrue "no cache files created" "[ $NUM_CACHE_FILES -gt 0 ]"
+      RunButane warm
+      assertTrue "cold and uncached runs differ" "SameOutput nocache cold"
+      assertTrue "warm and uncached runs differ" "SameOutput nocache warm"
+      assertEquals "warm run created new cache files" "$NUM_CACHE_FILES" `ls cache | wc -l`
+
+      # Now use a local copy of oplsaa2024.lt, and then modify it.
+      FF_FILE=`python -c "import os, moltemplate; print(os.path.join(os.path.dirname(moltemplate.__file__), 'force_fields', 'oplsaa2024.lt'))"`
+      cp "$FF_FILE" oplsaa2024.lt
+      RunButane local oplsaa2024.lt
+      assertTrue "output differs when using a local copy" "SameOutput nocache local"
+      NUM_CACHE_FILES=`ls cache | wc -l`
+      sed -i 's/^\(    @atom:57 *\)12.011$/\112.5/' oplsaa2024.lt
+      RunButane local oplsaa2024.lt
+      assertTrue "the modified file was not used" "grep -q ' 12.5 *# 57_' butane_local/moltemplate_files/system.data"
+      assertFalse "the modified file was not used" "SameOutput nocache local"
+      unset MOLTEMPLATE_CACHE_DIR
+      RunButane modified_nocache oplsaa2024.lt
+      assertTrue "cached and uncached runs differ" "SameOutput modified_nocache local"
+      # (The entry for the old version of the file should have been replaced.)
+      assertEquals "stale cache file not removed" "$NUM_CACHE_FILES" `ls cache | wc -l`
+    cd ../
+    rm -rf test_template_cache_tmp/
+  cd ../
+}
+
+. tests/shunit2/shunit2
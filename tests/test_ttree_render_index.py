@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+
+# Make sure that ttree_render.py only creates an index file for
+# ttree_assignments.txt when it is invoked with "-index", that the rendered
+# templates are the same with or without the index, and that the index is
+# not used after the contents of ttree_assignments.txt have changed.
+# (even if the size and modification time of the file are the same)
+# Also make sure that nbody_fix_ttree_assignments.py updates the index
+# correctly after it modifies ttree_assignments.txt.
+
+import os
+import sys
+import shutil
+import tempfile
+import subprocess
+import moltemplate
+from moltemplate.ttree_render import ReadBindings
+from moltemplate.ttree_assignments_index import OpenAssignmentsIndex
+from moltemplate.nbody_fix_ttree_assignments import FixTtreeAssignmentsFile
+
+ttree_render = os.path.join(os.path.dirname(moltemplate.__file__),
+                            'ttree_render.py')
+tmp_dir = tempfile.mkdtemp()
+bindings_filename = os.path.join(tmp_dir, 'ttree_assignments.txt')
+index_filename = bindings_filename + '.idx'
+template = ('$atom:a1 $atom:a2 @atom:C\n'
+            '$bond:b1 $atom:a2 $atom:a1\n')
+
+
+def Render(args):
+    return subprocess.run([sys.executable, ttree_render] + args +
+                          [bindings_filename],
+                          input=template, capture_output=True, text=True,
+                          check=True).stdout
+
+
+with open(bindings_filename, 'w') as f:
+    f.write('$atom:a1 1\n$atom:a2 2\n@atom:C 3\n$bond:b1 4\n')
+
+assert Render([]) == '1 2 3\n4 2 1\n'
+assert not os.path.exists(index_filename)
+
+assert Render(['-index']) == '1 2 3\n4 2 1\n'
+assert os.path.exists(index_filename)
+assert Render([]) == '1 2 3\n4 2 1\n'   # (uses the existing index)
+
+# Change the contents of the file without changing its size or mtime
+st = os.stat(bindings_filename)
+with open(bindings_filename, 'w') as f:
+    f.write('$atom:a1 5\n$atom:a2 6\n@atom:C 7\n$bond:b1 8\n')
+os.utime(bindings_filename, ns=(st.st_atime_ns, st.st_mtime_ns))
+assert Render([]) == '5 6 7\n8 6 5\n'
+assert Render(['-index']) == '5 6 7\n8 6 5\n'
+assert Render([]) == '5 6 7\n8 6 5\n'
+
+
+# Compare the index with the contents of the file
+def CheckIndex():
+    with open(bindings_filename) as f:
+        assignments_expected = ReadBindings(f)
+    assignments = OpenAssignmentsIndex(bindings_filename)
+    assert assignments is not None   # (the index should be up to date)
+    assert len(assignments) == len(assignments_expected)
+    for name, value in assignments_expected.items():
+        assert assignments[name] == value
+    assert assignments.get('$angle:missing') is None
+    assignments.Close()
+
+lines_atoms = ['$atom:a%d   %d       #system.lt:%d\n' % (i, i, i)
+               for i in range(1, 40)]
+lines_atoms.append('"$atom:a 40"   40       #(a quoted name)\n')
+lines_atoms.append('# (a comment)\n')
+lines_angles = ['$/angle:a%d   %d       #system.lt:7\n' % (i, i)
+                for i in range(1, 4)]
+lines_bonds = ['$bond:b%d   %d\n' % (i, i) for i in range(1, 30)]
+lines_generated = ['$/angle:bytype%d $atom:a1 $atom:a2 $atom:a3\n' % i
+                   for i in range(1, 60)]
+for lines_bindings in (lines_atoms + lines_bonds,                 # missing
+                       lines_atoms + lines_angles + lines_bonds,  # middle
+                       lines_atoms + lines_bonds + lines_angles): # end
+    with open(bindings_filename, 'w') as f:
+        f.write(''.join(lines_bindings))
+    assert Render(['-index']) == '1 2 @atom:C\n1 2 1\n'  # (creates the index)
+    CheckIndex()
+    FixTtreeAssignmentsFile('angle', lines_generated, bindings_filename)
+    CheckIndex()
+    # (Once more, so that the index must be enlarged)
+    FixTtreeAssignmentsFile('angle', lines_generated * 10, bindings_filename)
+    CheckIndex()
+    # (...and again, so that entries must be removed from the index)
+    FixTtreeAssignmentsFile('angle', lines_generated[:5], bindings_filename)
+    CheckIndex()
+
+shutil.rmtree(tmp_dir)